@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+Exercise the guarded Bedrock client against a stub bedrock-runtime that
+injects throttles (a server-side capacity limit), latency and an outage
+window: success rate, throttles hit and latency for unguarded calls vs the
+token bucket + jittered retries, fail-fast behaviour of the circuit breaker,
+and a ChatBedrock round trip through the guarded client
+"""
+
+import argparse
+import io
+import json
+import math
+import random
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from botocore.exceptions import ClientError
+
+# Add src directory to path
+sys.path.append('src')
+
+from bedrock_client import BedrockSettings, BedrockUnavailableError, CircuitBreaker, GuardedBedrockClient
+
+
+class StubBedrockRuntime:
+    """
+    bedrock-runtime stand-in: admits `capacity` requests/s (burst `burst`),
+    throttles the rest, answers admitted calls after a lognormal latency and
+    returns ServiceUnavailableException while an outage is active
+    """
+
+    def __init__(self, capacity, burst, median_ms, sigma=0.3, seed=0):
+        self.capacity = capacity
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.median_ms = median_ms
+        self.sigma = sigma
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.outage_until = 0.0
+        self.calls = self.throttled = self.unavailable = 0
+
+    def start_outage(self, seconds):
+        self.outage_until = time.monotonic() + seconds
+
+    @staticmethod
+    def error(code, operation="InvokeModel"):
+        return ClientError({"Error": {"Code": code, "Message": code}}, operation)
+
+    def invoke_model(self, **kwargs):
+        with self.lock:
+            self.calls += 1
+            now = time.monotonic()
+            if now < self.outage_until:
+                self.unavailable += 1
+                raise self.error("ServiceUnavailableException")
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.capacity)
+            self.updated = now
+            admitted = self.tokens >= 1
+            if admitted:
+                self.tokens -= 1
+            else:
+                self.throttled += 1
+            latency = self.median_ms * math.exp(self.random.gauss(0, self.sigma)) / 1000
+        if not admitted:
+            time.sleep(0.02)
+            raise self.error("ThrottlingException")
+        time.sleep(latency)
+        body = {"content": [{"type": "text", "text": "stub reply"}], "stop_reason": "end_turn"}
+        return {"body": io.BytesIO(json.dumps(body).encode("utf-8")), "ResponseMetadata": {"HTTPHeaders": {}}}
+
+
+def summarize(latencies):
+    ordered = sorted(latencies)
+    if not ordered:
+        return 0.0, 0.0, 0.0
+    return (statistics.median(ordered), ordered[int(0.95 * (len(ordered) - 1))], ordered[int(0.99 * (len(ordered) - 1))])
+
+
+def run_burst(client, requests, concurrency):
+    """Fire `requests` calls from `concurrency` threads; (ok, failed, latencies ms, wall s)"""
+    latencies, outcomes = [], []
+    lock = threading.Lock()
+
+    def one(_):
+        start = time.perf_counter()
+        try:
+            client.invoke_model(modelId="stub", body="{}")
+            ok = True
+        except (ClientError, BedrockUnavailableError):
+            ok = False
+        with lock:
+            latencies.append((time.perf_counter() - start) * 1000)
+            outcomes.append(ok)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, range(requests)))
+    return sum(outcomes), len(outcomes) - sum(outcomes), latencies, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Guarded Bedrock client benchmark (stub runtime)")
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--capacity", type=float, default=20.0, help="Stub requests/s before throttling")
+    parser.add_argument("--median-ms", type=float, default=150.0, help="Stub latency median")
+    args = parser.parse_args()
+
+    settings = BedrockSettings(rate=args.capacity * 1.5, burst=int(args.capacity), call_deadline=25.0,
+                               max_retries=4, breaker_failures=50, breaker_cooldown=2.0)
+
+    print("🚀 Guarded Bedrock Client Benchmark (stub runtime)")
+    print("=" * 78)
+    print(f"📦 {args.requests} calls from {args.concurrency} threads; stub capacity {args.capacity:.0f}/s, "
+          f"median latency {args.median_ms:.0f} ms")
+    print("-" * 78)
+    print(f"{'burst':<22}{'ok':>6}{'failed':>8}{'throttled':>11}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'wall s':>9}")
+    for name in ("unguarded", "guarded"):
+        stub = StubBedrockRuntime(args.capacity, int(args.capacity), args.median_ms)
+        client = stub if name == "unguarded" else GuardedBedrockClient(stub, settings)
+        ok, failed, latencies, wall = run_burst(client, args.requests, args.concurrency)
+        p50, p95, p99 = summarize(latencies)
+        print(f"{name:<22}{ok:>6}{failed:>8}{stub.throttled:>11}{p50:>9.0f}{p95:>9.0f}{p99:>9.0f}{wall:>9.2f}")
+        if name == "guarded":
+            assert max(latencies) < settings.call_deadline * 1000, "call exceeded its deadline"
+
+    print("-" * 78)
+    stub = StubBedrockRuntime(1000, 1000, args.median_ms)
+    client = GuardedBedrockClient(stub, settings._replace(max_retries=1),
+                                  breaker=CircuitBreaker(failure_threshold=5, cooldown=1.0))
+    stub.start_outage(1.5)
+    ok, failed, latencies, _ = run_burst(client, 60, 4)
+    stub_calls = stub.calls
+    print(f"🔌 Outage: {failed} of {ok + failed} calls shed, {stub_calls} reached the stub, "
+          f"p50 {summarize(latencies)[0]:.1f} ms (fail fast while the breaker is open)")
+    try:
+        client.invoke_model(modelId="stub", body="{}")
+    except BedrockUnavailableError as e:
+        print(f"   user sees: \"{e.user_message}\"")
+    time.sleep(1.6)
+    client.invoke_model(modelId="stub", body="{}")
+    print(f"   after the outage: breaker {client.breaker.state} (probe call succeeded)")
+    assert client.breaker.state == CircuitBreaker.CLOSED
+
+    try:
+        from langchain_aws import ChatBedrock
+    except ImportError:
+        ChatBedrock = None
+    if ChatBedrock is not None:
+        print("-" * 78)
+        stub = StubBedrockRuntime(args.capacity, int(args.capacity), 10)
+        llm = ChatBedrock(model_id="anthropic.claude-3-5-sonnet-20240620-v1:0", region_name=settings.region,
+                          client=GuardedBedrockClient(stub, settings), model_kwargs={"temperature": 0.0})
+        reply = llm.invoke("hello")
+        print(f"🤖 ChatBedrock via guarded client: {reply.content!r}")
+    print("=" * 78)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Benchmark the interned integer biospecimen ID representation against the
+comma-separated text it replaces: SQLite dedup on text vs the integer group
+key, distinct-biospecimen counting and set intersection on synthetic VIALS data
+"""
+
+import argparse
+import statistics
+import sys
+import time
+
+import numpy as np
+
+# Add src directory to path
+sys.path.append('src')
+
+from vials.columnar import ColumnarVials
+from vials.compiler import Predicate
+from vials.engine import VialsEngine
+from vials.ids import split_ids
+from vials.synthetic import generate_rows
+
+FILTERS = {
+    "pbmc": [Predicate("specimen_type", "in", ("PBMC",))],
+    "female": [Predicate("sex", "in", ("Female",))],
+    "female_serum_plasma": [Predicate("sex", "in", ("Female",)), Predicate("specimen_type", "in", ("Serum", "Plasma"))],
+    "all_rows": [],
+}
+
+# Pairs of filters whose biospecimen sets are intersected
+INTERSECTIONS = {
+    "pbmc & female": ("pbmc", "female"),
+    "all_rows & pbmc": ("all_rows", "pbmc"),
+}
+
+DEDUP_SQL = (
+    "SELECT COUNT(*) FROM (SELECT DISTINCT study_id, subject_id, visit_number, vials_count, {key} "
+    "FROM VIALS{where})"
+)
+
+
+def timed(fn, repeats):
+    timings = []
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        result = fn()
+        timings.append((time.perf_counter() - t0) * 1000)
+    return statistics.median(timings), result
+
+
+def where_sql(predicates):
+    if not predicates:
+        return "", []
+    clauses = [f"{predicate.column} IN ({', '.join('?' for _ in predicate.value)})" for predicate in predicates]
+    return " WHERE " + " AND ".join(clauses), [value for predicate in predicates for value in predicate.value]
+
+
+def text_distinct(texts):
+    """Baseline: split every biospecimen_ids string into a Python set"""
+    ids = set()
+    for text in texts:
+        ids.update(split_ids(text))
+    return ids
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Interned biospecimen ID benchmark")
+    parser.add_argument("--rows", type=int, default=300_000)
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    print("🚀 Biospecimen ID Representation Benchmark")
+    print("=" * 78)
+    engine = VialsEngine()
+    engine.load_rows(generate_rows(args.rows))
+    engine.finalize()
+    store = ColumnarVials.from_engine(engine)
+    index = store.biospecimen_ids
+    text_bytes = engine.conn.execute("SELECT SUM(LENGTH(biospecimen_ids)) FROM VIALS").fetchone()[0]
+
+    print(f"📦 Rows: {engine.row_count:,}   groups: {index.group_count:,}   biospecimens: {index.id_count:,}")
+    print(f"   biospecimen_ids text per row: {text_bytes / 1e6:8.1f} MB")
+    print(f"   group codes + CSR index:      {(store.group_codes.nbytes + index.memory_bytes()) / 1e6:8.1f} MB")
+    print("-" * 78)
+    print(f"{'SQLite dedup (DISTINCT)':<34}{'text ms':>12}{'integer ms':>12}{'speedup':>10}{'groups':>10}")
+    for name, predicates in FILTERS.items():
+        where, params = where_sql(predicates)
+        text_ms, text_result = timed(lambda: engine.query(DEDUP_SQL.format(key="biospecimen_ids", where=where), params),
+                                     args.repeats)
+        int_ms, int_result = timed(lambda: engine.query(DEDUP_SQL.format(key="biospecimen_group", where=where), params),
+                                   args.repeats)
+        assert text_result["rows"] == int_result["rows"], name
+        print(f"{name:<34}{text_ms:>12.2f}{int_ms:>12.2f}{text_ms / int_ms:>9.1f}x{int_result['rows'][0][0]:>10,}")
+
+    groups = {}
+    texts = {}
+    for name, predicates in FILTERS.items():
+        rows = store.filter_rows(predicates) if predicates else np.arange(store.n_rows)
+        groups[name] = np.unique(store.group_codes[rows])
+        texts[name] = [text for (text,) in engine.conn.execute(
+            f"SELECT biospecimen_ids FROM VIALS{where_sql(predicates)[0]}", where_sql(predicates)[1])]
+
+    print("-" * 78)
+    print(f"{'distinct biospecimens':<34}{'set ms':>12}{'CSR ms':>12}{'speedup':>10}{'ids':>10}")
+    for name in FILTERS:
+        text_ms, text_ids = timed(lambda: text_distinct(texts[name]), args.repeats)
+        csr_ms, count = timed(lambda: index.count_distinct(groups[name]), args.repeats)
+        assert len(text_ids) == count, name
+        print(f"{name:<34}{text_ms:>12.2f}{csr_ms:>12.2f}{text_ms / csr_ms:>9.1f}x{count:>10,}")
+
+    print("-" * 78)
+    print(f"{'intersection':<34}{'set ms':>12}{'bitmap ms':>12}{'speedup':>10}{'ids':>10}")
+    for name, (left, right) in INTERSECTIONS.items():
+        text_ms, text_ids = timed(lambda: text_distinct(texts[left]) & text_distinct(texts[right]), args.repeats)
+        csr_ms, dense = timed(lambda: index.intersect(groups[left], groups[right]), args.repeats)
+        assert text_ids == set(index.to_strings(dense)), name
+        print(f"{name:<34}{text_ms:>12.2f}{csr_ms:>12.2f}{text_ms / csr_ms:>9.1f}x{len(dense):>10,}")
+    print("=" * 78)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Benchmark the columnar bitmap store against the SQLite row engine:
+memory footprint and multi-criteria filter / count latency on synthetic VIALS data
+"""
+
+import argparse
+import statistics
+import sys
+import time
+
+# Add src directory to path
+sys.path.append('src')
+
+from vials.columnar import ColumnarVials
+from vials.compiler import Predicate, compile_organize_state, predicate_sql
+from vials.engine import VialsEngine
+from vials.synthetic import ARMS, RACES, STUDY_IDS, generate_rows
+
+FILTERS = {
+    "pbmc_female": [Predicate("specimen_type", "in", ("PBMC",)), Predicate("sex", "in", ("Female",))],
+    "serum_v01_placebo_avail": [
+        Predicate("specimen_type", "in", ("Serum",)), Predicate("visit_number", "in", ("01",)),
+        Predicate("arm", "in", (ARMS[-1],)), Predicate("status", "in", ("Available",)),
+    ],
+    "race_or_consent_age": [
+        Predicate("race", "in", tuple(RACES[1:3])), Predicate("consent_future_use_genetic_testing", "in", ("Yes",)),
+        Predicate("age", "between", (40, 65)),
+    ],
+    "studies_or_specimens": [
+        Predicate("study_id", "in", tuple(STUDY_IDS[:5])), Predicate("specimen_type", "in", ("Plasma", "Serum", "PBMC")),
+    ],
+}
+
+STATES = {
+    "pbmc_female_3_per_subject": {"eligibility_criteria": {
+        "specimen_type": {"value": "PBMC"}, "sex": {"value": "Female"}, "minimum_vials_per_subject": {"value": 3},
+    }},
+    "serum_all_visits_01_02_03": {"eligibility_criteria": {
+        "specimen_type": {"value": "Serum"}, "visit_number": {"value": "Visits 01, 02, 03"},
+    }},
+    "plasma_adults_2_per_visit_arm": {"eligibility_criteria": {
+        "specimen_type": {"value": "Plasma"}, "age": {"value": "18-64"},
+        "minimum_vials_per_subject_visit_arm": {"value": 2},
+    }},
+}
+
+
+def timed(fn, repeats):
+    timings = []
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        result = fn()
+        timings.append((time.perf_counter() - t0) * 1000)
+    return statistics.median(timings), result
+
+
+def sqlite_bytes(engine):
+    page_size = engine.conn.execute("PRAGMA page_size").fetchone()[0]
+    page_count = engine.conn.execute("PRAGMA page_count").fetchone()[0]
+    return page_size * page_count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Columnar store vs row engine benchmark")
+    parser.add_argument("--rows", type=int, default=300_000)
+    parser.add_argument("--repeats", type=int, default=10)
+    args = parser.parse_args()
+
+    print("🚀 Columnar Store Benchmark")
+    print("=" * 78)
+    engine = VialsEngine()
+    start = time.perf_counter()
+    engine.load_rows(generate_rows(args.rows))
+    engine.finalize()
+    engine_seconds = time.perf_counter() - start
+    store = ColumnarVials.from_engine(engine)
+
+    print(f"📦 Rows: {engine.row_count:,}")
+    print(f"   row engine (SQLite + indexes + dedup table): {sqlite_bytes(engine) / 1e6:8.1f} MB   load {engine_seconds:.2f}s")
+    status = store.get_status()
+    print(f"   columnar (codes + numerics + {status['bitmaps']} bitmaps):   {status['memory_bytes'] / 1e6:8.1f} MB"
+          f"   build {status['build_seconds']:.2f}s")
+    print("-" * 78)
+    print(f"{'filter (COUNT of matching rows)':<34}{'sqlite ms':>12}{'bitmap ms':>12}{'speedup':>10}{'rows':>10}")
+    for name, predicates in FILTERS.items():
+        clauses, params = zip(*(predicate_sql(predicate) for predicate in predicates))
+        sql = f"SELECT COUNT(*) FROM VIALS WHERE {' AND '.join(clauses)}"
+        flat_params = [value for values in params for value in values]
+        sqlite_ms, result = timed(lambda: engine.query(sql, flat_params), args.repeats)
+        columnar_ms, rows = timed(lambda: store.filter_rows(predicates), args.repeats)
+        assert result["rows"][0][0] == len(rows), name
+        print(f"{name:<34}{sqlite_ms:>12.2f}{columnar_ms:>12.2f}{sqlite_ms / columnar_ms:>9.1f}x{len(rows):>10,}")
+
+    print("-" * 78)
+    print(f"{'dedup count by study':<34}{'sqlite ms':>12}{'columnar ms':>12}{'speedup':>10}{'studies':>10}")
+    for name, state in STATES.items():
+        compiled = compile_organize_state(state)
+        sqlite_ms, result = timed(lambda: engine.query(compiled.sql, compiled.params, max_rows=1000), args.repeats)
+        columnar_ms, rows = timed(lambda: store.execute_compiled(compiled), args.repeats)
+        expected = [dict(zip(result["columns"], row)) for row in result["rows"]]
+        assert rows == expected, name
+        print(f"{name:<34}{sqlite_ms:>12.2f}{columnar_ms:>12.2f}{sqlite_ms / columnar_ms:>9.1f}x{len(rows):>10}")
+    print("=" * 78)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+"""
+Clients polling GET /sessions/{id} through lambda_function's handler, as
+index.html does when a session is reopened: without a local copy (full
+response every time), with If-None-Match only (304 when nothing changed,
+else the full response), and with If-None-Match plus ?since=<last
+timestamp> (304, or only the new messages). Before each poll a session
+gets a new turn with probability --change, so most polls find nothing new.
+
+DynamoDB requests and read units are counted on the in-process table of
+bench_history_format.py. Polls are served without the session cache (a
+container that did not write the session), unless --session-cache keeps it
+on as in the writing container (every poll revalidates, see
+bench_session_cache.next_request). Bytes are the response bodies as sent
+with Accept-Encoding: gzip. Every client's copy is checked against what
+was written.
+
+    python benchmarks/bench_conditional_get.py --sessions 100 --polls 20
+"""
+
+import argparse
+import base64
+import gzip
+import json
+import os
+import random
+import statistics
+import sys
+import time
+
+# Add src directory to path
+sys.path.append('src')
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import lambda_function
+from bench_history_format import RecordingResource, assistant_answer
+from bench_session_cache import next_request
+from dynamodb_manager import DynamoDBManager
+from session_cache import SessionCache
+from storage_backends import DynamoDBBackend
+
+PAGE = 50
+
+
+class Client:
+    """One browser's copy of a session: {etag, count, messages} as kept by index.html"""
+
+    def __init__(self, mode):
+        self.mode = mode
+        self.etag = None
+        self.count = 0
+        self.messages = []
+
+    def request(self, session_id):
+        headers, query = {'Accept-Encoding': 'gzip, deflate'}, None
+        if self.mode != "full" and self.etag:
+            headers['If-None-Match'] = self.etag
+            if self.mode == "since" and self.messages:
+                query = {'since': self.messages[-1]['timestamp']}
+        return {'httpMethod': 'GET', 'resource': '/sessions/{session_id}', 'path': f'/sessions/{session_id}',
+                'pathParameters': {'session_id': session_id}, 'headers': headers, 'queryStringParameters': query}
+
+    def apply(self, response):
+        """Update the copy from a response; False if a delta did not line up (full reload needed)"""
+        if response['statusCode'] == 304:
+            return True
+        body = response['body']
+        if response.get('isBase64Encoded'):
+            body = gzip.decompress(base64.b64decode(body))
+        data = json.loads(body)
+        count = int(data['session'].get('message_count', 0))
+        if 'since' in data:
+            if self.count + len(data['chat_history']) != count:
+                return False
+            self.messages = (self.messages + data['chat_history'])[-PAGE:]
+        else:
+            self.messages = data['chat_history']
+        self.etag, self.count = response['headers'].get('ETag'), count
+        return True
+
+
+def wire_bytes(response):
+    body = response.get('body') or ''
+    return len(base64.b64decode(body)) if response.get('isBase64Encoded') else len(body.encode('utf-8'))
+
+
+def run(mode, args):
+    resource = RecordingResource()
+    manager = DynamoDBManager(DynamoDBBackend(resource, "sessions", "history"))
+    if not args.session_cache:
+        manager.cache = SessionCache(max_sessions=0)
+    lambda_function.db_manager = manager
+    rng = random.Random(args.seed)
+    sessions, expected = [], {}
+    for number in range(args.sessions):
+        session_id = manager.create_session(metadata={"bench": number})
+        sessions.append(session_id)
+        expected[session_id] = []
+        for turn in range(args.turns):
+            request, response = f"question {turn}", assistant_answer(rng)
+            manager.add_chat_turn(session_id, request, response, {"intent_type": "NEW_QUERY"}, duration_ms=900)
+            expected[session_id] += [request, response]
+    clients = {session_id: Client(mode) for session_id in sessions}
+    for session_id, client in clients.items():
+        next_request([manager])
+        client.apply(lambda_function.lambda_handler(client.request(session_id), None))
+    for table in resource.tables.values():
+        table.requests = table.queries = 0
+        table.read_units = 0.0
+
+    timings, sent, not_modified, reloads, wrong = [], 0, 0, 0, 0
+    for poll in range(args.polls):
+        for session_id in sessions:
+            if rng.random() < args.change:
+                request, response = f"question {args.turns + poll}", assistant_answer(rng)
+                manager.add_chat_turn(session_id, request, response, {"intent_type": "NEW_QUERY"}, duration_ms=900)
+                expected[session_id] += [request, response]
+            client = clients[session_id]
+            next_request([manager])
+            started = time.perf_counter()
+            response = lambda_function.lambda_handler(client.request(session_id), None)
+            timings.append((time.perf_counter() - started) * 1e6)
+            sent += wire_bytes(response)
+            not_modified += response['statusCode'] == 304
+            if not client.apply(response):
+                reloads += 1
+                client.etag = None
+                response = lambda_function.lambda_handler(client.request(session_id), None)
+                sent += wire_bytes(response)
+                client.apply(response)
+            wrong += [message['content'] for message in client.messages] != expected[session_id][-PAGE:]
+
+    polls = args.sessions * args.polls
+    timings.sort()
+    return {
+        "bytes": sent / polls,
+        "history_reads": resource.tables["history"].queries / polls,
+        "requests": sum(table.requests for table in resource.tables.values()) / polls,
+        "read_units": sum(table.read_units for table in resource.tables.values()) / polls,
+        "p50_us": statistics.median(timings),
+        "p95_us": timings[int(0.95 * (len(timings) - 1))],
+        "not_modified": not_modified / polls,
+        "reloads": reloads,
+        "wrong": wrong,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Conditional GET / delta sync benchmark")
+    parser.add_argument("--sessions", type=int, default=100)
+    parser.add_argument("--turns", type=int, default=10, help="Turns per session before polling")
+    parser.add_argument("--polls", type=int, default=20, help="Polls per session")
+    parser.add_argument("--change", type=float, default=0.2, help="Chance a session has a new turn before a poll")
+    parser.add_argument("--session-cache", action="store_true", help="Serve polls from the writing container's cache")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    modes = (("full", "full"), ("If-None-Match", "etag"), ("+ ?since=", "since"))
+    results = {mode: run(mode, args) for _, mode in modes}
+
+    print("🚀 Conditional GET Benchmark")
+    print("=" * 78)
+    print(f"📦 {args.sessions} sessions of {args.turns} turns, {args.polls} polls each, "
+          f"{args.change:.0%} find a new turn, session cache {'on' if args.session_cache else 'off'}")
+    print("-" * 78)
+    print(f"{'per poll':<24}" + "".join(f"{label:>18}" for label, _ in modes))
+    for label, key, fmt in (("bytes sent (gzip)", "bytes", "{:,.0f}"),
+                            ("history Query", "history_reads", "{:.2f}"),
+                            ("all requests (w/ writes)", "requests", "{:.2f}"),
+                            ("RCU", "read_units", "{:.2f}"),
+                            ("304 Not Modified", "not_modified", "{:.0%}"),
+                            ("handler p50 µs", "p50_us", "{:,.0f}"),
+                            ("handler p95 µs", "p95_us", "{:,.0f}")):
+        print(f"{label:<24}" + "".join(f"{fmt.format(results[mode][key]):>18}" for _, mode in modes))
+    print(f"{'reloads / wrong copies':<24}" + "".join(
+        f"{results[mode]['reloads']:>13} / {results[mode]['wrong']}" for _, mode in modes))
+    print("=" * 78)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Benchmark count-cube build time, memory and query latency at 1M / 10M VIALS rows
+"""
+
+import argparse
+import random
+import resource
+import statistics
+import sys
+import time
+import tracemalloc
+
+# Add src directory to path
+sys.path.append('src')
+
+from vials.cube import CountCube
+from vials.synthetic import STUDY_IDS, SPECIMEN_TYPES, ARMS, SEXES, VISITS
+
+
+def generate_groups(n_rows, seed=11):
+    """
+    Yield deduplicated biospecimen groups for n_rows VIALS rows (each group
+    stands for 1-2 assay rows), with only the columns the cube needs.
+    """
+    rng = random.Random(seed)
+    rows = 0
+    subject = 0
+    while rows < n_rows:
+        subject += 1
+        study_id = STUDY_IDS[subject % len(STUDY_IDS)]
+        subject_fields = {
+            "study_id": study_id, "subject_id": f"S{subject:08d}", "arm": rng.choice(ARMS),
+            "sex": rng.choice(SEXES), "age": rng.randint(18, 85),
+        }
+        for visit_number, _, _ in VISITS[:rng.randint(3, len(VISITS))]:
+            for specimen_type in rng.sample(SPECIMEN_TYPES, rng.randint(1, 3)):
+                group = dict(subject_fields)
+                group["visit_number"] = visit_number
+                group["specimen_type"] = specimen_type
+                group["vials_count"] = rng.randint(1, 8)
+                rows += rng.randint(1, 2)
+                yield group
+                if rows >= n_rows:
+                    return
+
+
+QUERIES = {
+    "pbmc_female": {"specimen_type": ("PBMC",), "sex": ("Female",)},
+    "serum_v01_placebo": {"specimen_type": ("Serum",), "visit_number": ("01",), "arm": ("Arm 4: Placebo",)},
+    "one_study_adults": {"study_id": (STUDY_IDS[3],), "age_band": ("18-44", "45-64", "65+")},
+    "everything": {},
+}
+
+
+def bench(n_rows, trace_memory):
+    if trace_memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    cube = CountCube.build(generate_groups(n_rows))
+    build_seconds = time.perf_counter() - start
+    peak = None
+    if trace_memory:
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    status = cube.get_status()
+    print(f"📦 {n_rows:,} rows -> {status['groups']:,} groups, {status['cells']:,} cells, {status['subjects']:,} subjects")
+    print(f"   build: {build_seconds:.2f}s (incl. generation)   cube arrays: {status['memory_bytes'] / 1e6:.1f} MB"
+          + (f"   build peak: {peak / 1e6:.1f} MB" if peak else ""))
+    for name, filters in QUERIES.items():
+        timings = []
+        for _ in range(50):
+            t0 = time.perf_counter()
+            cube.counts_by_study(filters)
+            timings.append((time.perf_counter() - t0) * 1e6)
+        print(f"   {name:<22} p50 {statistics.median(timings):>10.1f} µs")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Count cube benchmark")
+    parser.add_argument("--rows", type=int, nargs="+", default=[1_000_000, 10_000_000])
+    parser.add_argument("--trace-memory", action="store_true", help="Track peak Python allocations during build (slower)")
+    args = parser.parse_args()
+
+    print("🚀 Count Cube Benchmark")
+    print("=" * 70)
+    for n_rows in args.rows:
+        bench(n_rows, args.trace_memory)
+    print(f"🧠 Max RSS: {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f} MB")
+    print("=" * 70)
+
+
+if __name__ == "__main__":
+    main()
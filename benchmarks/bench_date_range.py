@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Benchmark date-window queries: per-row STR_TO_DATE parsing of collection_date
+against the epoch-day column parsed at ingestion (SQLite B-tree range scan)
+and the columnar sorted range index, on synthetic VIALS data
+"""
+
+import argparse
+import statistics
+import sys
+import time
+
+import numpy as np
+
+# Add src directory to path
+sys.path.append('src')
+
+from vials.columnar import ColumnarVials, unpack_bitmap
+from vials.compiler import Predicate
+from vials.engine import VialsEngine
+from vials.synthetic import generate_rows
+
+# (start, end) ISO bounds; None = open
+WINDOWS = {
+    "one_week": ("2019-03-04", "2019-03-10"),
+    "one_month": ("2020-06-01", "2020-06-30"),
+    "one_year": ("2021-01-01", "2021-12-31"),
+    "before_2019": (None, "2018-12-31"),
+}
+
+STRING_SQL = "SELECT COUNT(*), SUM(vials_count) FROM {table} WHERE STR_TO_DATE(collection_date, '%d-%b-%y') {window}"
+EPOCH_SQL = "SELECT COUNT(*), SUM(vials_count) FROM {table} WHERE collection_day {window}"
+
+
+def timed(fn, repeats):
+    timings = []
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        result = fn()
+        timings.append((time.perf_counter() - t0) * 1000)
+    return statistics.median(timings), result
+
+
+def window_sql(start, end, wrap=""):
+    """BETWEEN / >= / <= clause with parameters, optionally wrapping each bound in a function"""
+    bound = f"{wrap}(?)" if wrap else "?"
+    if start and end:
+        return f"BETWEEN {bound} AND {bound}", [start, end]
+    if start:
+        return f">= {bound}", [start]
+    return f"<= {bound}", [end]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Date-window query benchmark")
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    print("🚀 Date Range Benchmark")
+    print("=" * 78)
+    engine = VialsEngine()
+    engine.load_rows(generate_rows(args.rows))
+    engine.finalize()
+    store = ColumnarVials.from_engine(engine)
+    index = store.range_indexes["collection_day"]
+    print(f"📦 Rows: {engine.row_count:,}   range index: {index.nbytes / 1e6:.1f} MB")
+
+    for table in ("VIALS", "unique_biospecimens"):
+        print("-" * 78)
+        print(f"{table + ' (SQLite)':<34}{'string ms':>12}{'epoch ms':>12}{'speedup':>10}{'rows':>10}")
+        for name, (start, end) in WINDOWS.items():
+            string_window, params = window_sql(start, end)
+            epoch_window, _ = window_sql(start, end, wrap="EPOCH_DAY")
+            string_ms, string_result = timed(
+                lambda: engine.query(STRING_SQL.format(table=table, window=string_window), params), args.repeats)
+            epoch_ms, epoch_result = timed(
+                lambda: engine.query(EPOCH_SQL.format(table=table, window=epoch_window), params), args.repeats)
+            assert string_result["rows"] == epoch_result["rows"], name
+            print(f"{name:<34}{string_ms:>12.2f}{epoch_ms:>12.2f}{string_ms / epoch_ms:>9.1f}x"
+                  f"{epoch_result['rows'][0][0]:>10,}")
+
+    print("-" * 78)
+    print(f"{'columnar (matching rows)':<34}{'string ms':>12}{'index ms':>12}{'speedup':>10}{'rows':>10}")
+    for name, (start, end) in WINDOWS.items():
+        predicate = Predicate("collection_date", "between", (start, end))
+        string_window, params = window_sql(start, end)
+        string_ms, result = timed(
+            lambda: engine.query(f"SELECT COUNT(*) FROM VIALS WHERE STR_TO_DATE(collection_date, '%d-%b-%y') "
+                                 f"{string_window}", params), args.repeats)
+        index_ms, bitmap = timed(lambda: store.predicate_bitmap(predicate), args.repeats)
+        matched = int(np.count_nonzero(unpack_bitmap(bitmap, store.n_rows)))
+        assert result["rows"][0][0] == matched, name
+        print(f"{name:<34}{string_ms:>12.2f}{index_ms:>12.2f}{string_ms / index_ms:>9.1f}x{matched:>10,}")
+    print("=" * 78)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,301 @@
+#!/usr/bin/env python3
+"""
+History item size and read cost, version 1 (full attribute names, metadata
+on every message, plain content) vs the compact version 2 format vs version
+3 turn items (one item per user/assistant exchange) of history_format.py,
+over synthetic conversations whose assistant answers include study tables:
+DynamoDB bytes and WCU per turn, items and RCU per 20-message history page,
+client-side read latency (wire JSON -> items -> messages), and the DynamoDB
+requests DynamoDBBackend makes per turn written and per page read (counted
+on an in-process table). With DYNAMODB_ENDPOINT_URL set, get_chat_history
+latency is also measured against DynamoDB Local.
+
+    python benchmarks/bench_history_format.py --turns 2000
+"""
+
+import argparse
+import base64
+import contextlib
+import json
+import math
+import os
+import random
+import statistics
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from boto3.dynamodb.types import Binary, TypeDeserializer, TypeSerializer
+
+# Add src directory to path
+sys.path.append('src')
+
+from history_format import decode_messages, encode_messages
+from storage_backends import DynamoDBBackend
+
+VERSIONS = (1, 2, 3)
+
+STUDIES = ["ACTG 5257", "HPTN 083", "IMPAACT 2010", "MTN-025", "HVTN 706", "A5332 REPRIEVE", "P1093", "CAPRISA 008"]
+SPECIMENS = ["Plasma", "Serum", "PBMC", "Urine", "Nasal swab", "CSF"]
+USER_MESSAGES = ["I need plasma samples from female subjects", "Only visits 1 and 2 instead",
+                 "Switch to serum instead", "Also restrict it to males", "What are your hours?"]
+
+
+def assistant_answer(rng):
+    """Short reply, or a summary with a markdown study table (the large answers)"""
+    if rng.random() < 0.3:
+        return "I've updated the criteria. Would you like to narrow it down further by visit or age?"
+    rows = [f"| {rng.choice(STUDIES)} | {rng.choice(SPECIMENS)} | {rng.randint(1, 400):,} | {rng.randint(1, 120)} |"
+            for _ in range(rng.randint(8, 40))]
+    return ("Here are the matching vials grouped by study:\n\n| Study | Specimen | Vials | Subjects |\n"
+            "|---|---|---|---|\n" + "\n".join(rows) +
+            "\n\nCounts are unique biospecimens (aliquots of the same draw are counted once).")
+
+
+def build_turns(count, seed):
+    rng = random.Random(seed)
+    start = datetime(2024, 1, 1)
+    turns = []
+    for index in range(count):
+        timestamp = start + timedelta(seconds=index * 30)
+        metadata = {"workflow_path": ["intent_recognizer", "condition_organizer", "new_query_agent"],
+                    "intent_type": "NEW_QUERY", "final_agent": "new_query_agent"}
+        turns.append([{
+            "session_id": f"session-{index // 10:05d}",
+            "timestamp": (timestamp + timedelta(microseconds=offset)).isoformat(timespec="microseconds"),
+            "message_id": str(uuid.uuid4()),
+            "role": role,
+            "content": content,
+            "metadata": metadata,
+        } for offset, (role, content) in enumerate([("user", rng.choice(USER_MESSAGES)),
+                                                    ("assistant", assistant_answer(rng))])])
+    return turns
+
+
+def attribute_size(value):
+    """DynamoDB's item size accounting (approximate for numbers)"""
+    if isinstance(value, str):
+        return len(value.encode("utf-8"))
+    if isinstance(value, (bytes, bytearray, Binary)):
+        return len(bytes(getattr(value, "value", value)))
+    if isinstance(value, bool) or value is None:
+        return 1
+    if isinstance(value, (int, float)):
+        return len(str(value).lstrip("-").replace(".", "")) // 2 + 2
+    if isinstance(value, dict):
+        return 3 + sum(len(key.encode("utf-8")) + attribute_size(item) for key, item in value.items())
+    if isinstance(value, (list, tuple)):
+        return 3 + sum(1 + attribute_size(item) for item in value)
+    raise TypeError(type(value))
+
+
+def item_size(item):
+    return sum(len(key.encode("utf-8")) + attribute_size(value) for key, value in item.items())
+
+
+class RecordingTable:
+    """Just enough of a boto3 Table for DynamoDBBackend, counting the requests it makes"""
+
+    def __init__(self, key):
+        self.key = key
+        self.items = {}
+        self.requests = 0
+        self.queries = 0
+        self.read_units = 0.0
+
+    def _read(self, items):
+        # Eventually consistent reads: 0.5 RCU per 4 KB returned, at least 0.5
+        self.read_units += max(1, math.ceil(sum(item_size(item) for item in items) / 4096)) * 0.5
+
+    def put_item(self, Item):
+        self.requests += 1
+        self.items[tuple(Item[name] for name in self.key)] = dict(Item)
+
+    def update_item(self, Key, UpdateExpression, ExpressionAttributeValues, ExpressionAttributeNames=None, **_):
+        # The SET ... [ADD counter] expressions DynamoDBBackend writes
+        self.requests += 1
+        item = self.items.setdefault(tuple(Key[name] for name in self.key), dict(Key))
+        names = ExpressionAttributeNames or {}
+        assignments, _, counter = UpdateExpression.partition(" ADD ")
+        for assignment in assignments[len("SET "):].split(", "):
+            name, value = assignment.split(" = ")
+            item[names.get(name, name)] = ExpressionAttributeValues[value]
+        if counter:
+            name, value = counter.split()
+            item[name] = item.get(name, 0) + ExpressionAttributeValues[value]
+
+    def get_item(self, Key, ProjectionExpression=None, **_):
+        self.requests += 1
+        item = self.items.get(tuple(Key[name] for name in self.key))
+        if item and ProjectionExpression:
+            item = {name: item[name] for name in ProjectionExpression.split(", ") if name in item}
+        self._read([item] if item else [])
+        return {'Item': item} if item else {}
+
+    @contextlib.contextmanager
+    def batch_writer(self):
+        pending = []
+
+        class Batch:
+            def put_item(self, Item):
+                pending.append(Item)
+        yield Batch()
+        self.requests += math.ceil(len(pending) / 25) - len(pending)  # BatchWriteItem: up to 25 puts per request
+        for item in pending:
+            self.put_item(item)
+
+    def query(self, ExpressionAttributeValues, Limit=None, ExclusiveStartKey=None, ScanIndexForward=True, **_):
+        self.requests += 1
+        self.queries += 1
+        session_id = ExpressionAttributeValues[':session_id']
+        since = ExpressionAttributeValues.get(':since')  # '#timestamp >= :since'
+        keys = sorted((key for key in self.items if key[0] == session_id and (since is None or key[1] >= since)),
+                      reverse=not ScanIndexForward)
+        if ExclusiveStartKey:
+            keys = keys[keys.index((session_id, ExclusiveStartKey['timestamp'])) + 1:]
+        response = {'Items': [self.items[key] for key in keys[:Limit]]}
+        self._read(response['Items'])
+        if Limit and len(keys) > Limit:
+            response['LastEvaluatedKey'] = {'session_id': session_id, 'timestamp': keys[Limit - 1][1]}
+        return response
+
+
+class RecordingResource:
+    def __init__(self):
+        self.tables = {'sessions': RecordingTable(('session_id',)),
+                       'history': RecordingTable(('session_id', 'timestamp'))}
+
+    def Table(self, name):
+        return self.tables[name]
+
+
+def count_requests(turns, version, page):
+    """DynamoDB requests per turn written and per history page read, through DynamoDBBackend"""
+    resource = RecordingResource()
+    backend = DynamoDBBackend(resource, 'sessions', 'history', item_version=version)
+    for turn in turns:
+        backend.add_messages(turn[0]["session_id"], turn, turn[-1]["timestamp"],
+                             session_fields={'last_message_at': turn[-1]["timestamp"]})
+    writes = sum(table.requests for table in resource.tables.values()) / len(turns)
+    sessions = sorted({turn[0]["session_id"] for turn in turns})
+    history = resource.tables['history']
+    history.requests = 0
+    for session_id in sessions:
+        assert len(backend.get_history(session_id, page)) == min(page, 2 * sum(
+            turn[0]["session_id"] == session_id for turn in turns))
+    return writes, history.requests / len(sessions)
+
+
+def measure_format(turns, version, threshold, page):
+    stored_turns = [encode_messages(turn, version, threshold) for turn in turns]
+    sizes = [[item_size(item) for item in stored] for stored in stored_turns]
+    serializer, deserializer = TypeSerializer(), TypeDeserializer()
+
+    # Wire JSON of 20-message history pages, as the Query response body arrives
+    items = [item for stored in stored_turns for item in stored]
+    per_page = page // 2 if version >= 3 else page
+    pages = []
+    for first in range(0, len(items) - per_page + 1, per_page):
+        chunk = items[first:first + per_page]
+        wire = {"Items": [{key: serializer.serialize(value) for key, value in item.items()} for item in chunk]}
+        pages.append((json.dumps(wire, default=lambda b: base64.b64encode(b).decode()),
+                      sum(item_size(item) for item in chunk)))
+
+    timings = []
+    for body, _ in pages:
+        started = time.perf_counter()
+        raw = json.loads(body)["Items"]
+        decoded = [{key: deserializer.deserialize(value) if "B" not in value
+                    else Binary(base64.b64decode(value["B"])) for key, value in item.items()}
+                   for item in raw]
+        decode_messages(decoded)
+        timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+    write_requests, read_requests = count_requests(turns, version, page)
+    return {
+        "items_per_turn": statistics.mean(len(turn) for turn in sizes),
+        "items_per_page": per_page,
+        "write_requests": write_requests,
+        "read_requests": read_requests,
+        "bytes_per_turn": statistics.mean(sum(turn) for turn in sizes),
+        "largest_item": max(max(turn) for turn in sizes),
+        "wcu_per_turn": statistics.mean(sum(math.ceil(size / 1024) for size in turn) for turn in sizes),
+        # Eventually consistent Query: 0.5 RCU per 4 KB of returned items
+        "rcu_per_page": statistics.mean(math.ceil(size / 4096) * 0.5 for _, size in pages),
+        "wire_kb_per_page": statistics.mean(len(body) for body, _ in pages) / 1024,
+        "read_p50_ms": statistics.median(timings),
+        "read_p95_ms": timings[int(0.95 * (len(timings) - 1))],
+    }
+
+
+def measure_dynamodb_local(turns, version, page, repeats):
+    """get_history p50/p95 ms against DynamoDB Local"""
+    import boto3
+    from storage_backends import DynamoDBBackend
+
+    resource = boto3.resource("dynamodb", endpoint_url=os.environ["DYNAMODB_ENDPOINT_URL"])
+    names = []
+    for name, keys in (("bench-sessions", [("session_id", "HASH")]),
+                       ("bench-history", [("session_id", "HASH"), ("timestamp", "RANGE")])):
+        table = resource.create_table(
+            TableName=f"{name}-{uuid.uuid4().hex[:8]}", BillingMode="PAY_PER_REQUEST",
+            KeySchema=[{"AttributeName": key, "KeyType": kind} for key, kind in keys],
+            AttributeDefinitions=[{"AttributeName": key, "AttributeType": "S"} for key, _ in keys])
+        table.wait_until_exists()
+        names.append(table.name)
+    backend = DynamoDBBackend(resource, *names, item_version=version)
+    for turn in turns:
+        backend.add_messages(turn[0]["session_id"], turn, turn[-1]["timestamp"])
+    sessions = sorted({turn[0]["session_id"] for turn in turns})
+    timings = []
+    for index in range(repeats):
+        started = time.perf_counter()
+        backend.get_history(sessions[index % len(sessions)], page)
+        timings.append((time.perf_counter() - started) * 1000)
+    for name in names:
+        resource.Table(name).delete()
+    timings.sort()
+    return statistics.median(timings), timings[int(0.95 * (len(timings) - 1))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="History item format benchmark")
+    parser.add_argument("--turns", type=int, default=2000)
+    parser.add_argument("--threshold", type=int, default=1024, help="Compression threshold (bytes)")
+    parser.add_argument("--page", type=int, default=20, help="Messages per history read")
+    parser.add_argument("--repeats", type=int, default=200, help="DynamoDB Local reads per format")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    turns = build_turns(args.turns, args.seed)
+    results = {version: measure_format(turns, version, args.threshold, args.page) for version in VERSIONS}
+
+    print("🚀 History Item Format Benchmark")
+    print("=" * 78)
+    print(f"📦 {args.turns} turns (user + assistant), 70% of answers carry a study table; "
+          f"compression above {args.threshold} bytes; {args.page}-message pages")
+    print("-" * 78)
+    rows = [("items / turn", "items_per_turn", "{:.0f}"), ("items / history page", "items_per_page", "{:.0f}"),
+            ("write requests / turn", "write_requests", "{:.2f}"), ("query requests / page", "read_requests", "{:.2f}"),
+            ("bytes / turn", "bytes_per_turn", "{:,.0f}"), ("largest item (bytes)", "largest_item", "{:,.0f}"),
+            ("WCU / turn", "wcu_per_turn", "{:.2f}"), ("RCU / history page", "rcu_per_page", "{:.2f}"),
+            ("wire KB / page", "wire_kb_per_page", "{:.1f}"), ("read p50 ms (client)", "read_p50_ms", "{:.3f}"),
+            ("read p95 ms (client)", "read_p95_ms", "{:.3f}")]
+    print(f"{'':<24}{'v1 (before)':>12}{'v2 (compact)':>13}{'v3 (turns)':>12}{'v3 vs v1':>10}{'v3 vs v2':>10}")
+    for label, key, fmt in rows:
+        values = [results[version][key] for version in VERSIONS]
+        changes = [f"{(values[2] - base) / base * 100:+.0f}%" if base else "" for base in values[:2]]
+        print(f"{label:<24}{fmt.format(values[0]):>12}{fmt.format(values[1]):>13}{fmt.format(values[2]):>12}"
+              f"{changes[0]:>10}{changes[1]:>10}")
+
+    if os.environ.get("DYNAMODB_ENDPOINT_URL"):
+        print("-" * 78)
+        for version in VERSIONS:
+            p50, p95 = measure_dynamodb_local(turns, version, args.page, args.repeats)
+            print(f"🗄️ DynamoDB Local get_history v{version}: p50 {p50:.2f} ms, p95 {p95:.2f} ms")
+    print("=" * 78)
+
+
+if __name__ == "__main__":
+    main()
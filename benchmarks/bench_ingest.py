@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+Benchmark the streaming VIALS ingestion pipeline: CSV -> study-partitioned
+Parquet throughput, output size, and engine cold-start load from CSV vs Parquet
+"""
+
+import argparse
+import csv
+import os
+import sys
+import tempfile
+import time
+
+# Add src directory to path
+sys.path.append('src')
+
+from vials.engine import VialsEngine
+from vials.ingest import ingest_csv
+from vials.schema import COLUMN_NAMES
+from vials.synthetic import generate_rows
+
+
+def directory_bytes(path):
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="VIALS ingestion benchmark")
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--chunk-rows", type=int, default=50_000)
+    args = parser.parse_args()
+
+    print("🚀 VIALS Ingestion Benchmark")
+    print("=" * 70)
+    with tempfile.TemporaryDirectory() as workdir:
+        csv_path = os.path.join(workdir, "vials.csv")
+        with open(csv_path, "w", newline="", encoding="utf-8") as handle:
+            writer = csv.DictWriter(handle, fieldnames=COLUMN_NAMES)
+            writer.writeheader()
+            for row in generate_rows(args.rows):
+                writer.writerow({name: row.get(name) for name in COLUMN_NAMES})
+
+        out_dir = os.path.join(workdir, "vials_parquet")
+        stats = ingest_csv([csv_path], out_dir, chunk_rows=args.chunk_rows)
+        print("-" * 70)
+        print(f"📥 Ingest: {stats.rows:,} rows in {stats.seconds:.2f}s ({stats.rows_per_second:,.0f} rows/s)")
+        print(f"   chunk {args.chunk_rows:,} rows   batches {stats.batches}   row groups {stats.row_groups}"
+              f"   peak RSS {stats.peak_rss_mb:.0f} MB")
+        print(f"   CSV {os.path.getsize(csv_path) / 1e6:.1f} MB -> Parquet {directory_bytes(out_dir) / 1e6:.1f} MB"
+              f" ({stats.partitions} study partitions)")
+
+        print("-" * 70)
+        print(f"{'cold start (load rows)':<30}{'seconds':>10}{'rows/s':>14}")
+        for name, path in (("csv", csv_path), ("parquet", out_dir)):
+            engine = VialsEngine()
+            start = time.perf_counter()
+            engine.load_csv(path) if name == "csv" else engine.load_parquet(path)
+            seconds = time.perf_counter() - start
+            print(f"{name:<30}{seconds:>10.2f}{engine.row_count / seconds:>14,.0f}")
+    print("=" * 70)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Benchmark JSON extraction from LLM output on adversarial inputs
+Compares the previous regex-based extraction with the incremental extractor
+"""
+
+import json
+import re
+import sys
+import time
+
+# Add src directory to path
+sys.path.append('src')
+
+from json_extractor import IncrementalJSONExtractor, extract_first_json
+
+ORGANIZE_STATE = {
+    "eligibility_criteria": {
+        "specimen_type": {"value": "PBMC", "state": "new", "previous_value": None,
+                          "modification_source": "Need PBMC\nfrom the study"},
+        "sex": {"value": "female", "state": "new", "previous_value": None,
+                "modification_source": "female subjects"},
+    },
+    "selection_requirements": {"quantity_limits": {}, "prioritization_rules": []},
+    "metadata": {"removed_fields": []}
+}
+
+
+def regex_extract(response):
+    """Previous greedy regex extraction (extract_JSON_from_response_Langchain)"""
+    code_block = re.search(r"```json(.*?)```", response, flags=re.DOTALL | re.IGNORECASE)
+    if code_block:
+        candidate = code_block.group(1).strip()
+    else:
+        brace_match = re.search(r"\{.*\}", response, flags=re.DOTALL)
+        if not brace_match:
+            return {}
+        candidate = brace_match.group(0)
+    candidate = re.sub(
+        r'"(?:[^"\\]|\\.)*"',
+        lambda match: match.group(0).replace("\n", "\\n"),
+        candidate,
+        flags=re.DOTALL
+    )
+    try:
+        return json.loads(candidate)
+    except json.JSONDecodeError:
+        return {}
+
+
+def build_cases():
+    """Adversarial inputs: large, unbalanced and fence-heavy"""
+    payload = json.dumps(ORGANIZE_STATE, indent=2).replace("\\n", "\n")
+    large_state = dict(ORGANIZE_STATE)
+    large_state["notes"] = ["study row " * 20] * 5000
+    return {
+        "plain": payload,
+        "fenced_with_prose": "Here is the result:\n```json\n" + payload + "\n```\nLet me know.",
+        "large_object": json.dumps(large_state),
+        "trailing_prose_braces": payload + "\n" + "Note: {see above} " * 20000,
+        "unbalanced_open": "{ " * 50000 + payload,
+        "fence_heavy": "```\ncode\n```\n" * 20000 + "```json\n" + payload + "\n```",
+        "brace_storm_no_close": "{x " * 20000,
+        "unterminated_string": '{"a": "' + "x" * 500000,
+    }
+
+
+def chunked(text, size):
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+def time_call(fn, repeats):
+    start = time.perf_counter()
+    for _ in range(repeats):
+        result = fn()
+    return (time.perf_counter() - start) / repeats * 1000, result
+
+
+def main():
+    print("🚀 JSON Extraction Benchmark")
+    print("=" * 78)
+    print(f"{'case':<24}{'size':>10}{'regex ms':>12}{'incr ms':>12}{'stream ms':>12}{'found':>8}")
+    for name, text in build_cases().items():
+        repeats = 3 if len(text) > 100_000 else 50
+        regex_ms, _ = time_call(lambda: regex_extract(text), repeats)
+        incr_ms, found = time_call(lambda: extract_first_json(text), repeats)
+
+        def stream():
+            extractor = IncrementalJSONExtractor(max_objects=1)
+            for piece in chunked(text, 64):
+                if extractor.feed(piece):
+                    break
+            return extractor.first()
+
+        stream_ms, _ = time_call(stream, repeats)
+        print(f"{name:<24}{len(text):>10}{regex_ms:>12.2f}{incr_ms:>12.2f}{stream_ms:>12.2f}{str(found is not None):>8}")
+    print("=" * 78)
+
+
+if __name__ == "__main__":
+    main()
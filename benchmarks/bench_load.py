@@ -0,0 +1,420 @@
+#!/usr/bin/env python3
+"""
+Load test the chat API end to end: concurrent synthetic sessions (intent mix
+plus multi-turn ADJUST_FILTER chains) driven through lambda_handler with
+synthetic API Gateway events, or through local_server over HTTP. Runs on the
+fake LLM backend and local DynamoDB (DYNAMODB_ENDPOINT_URL, or the in-memory
+fallback), reports throughput and p50/p95/p99 per route, per intent and per
+graph node, writes the results as JSON and exits non-zero when a regression
+threshold is exceeded.
+
+    python benchmarks/bench_load.py --sessions 40 --concurrency 8 --output load.json
+    python benchmarks/bench_load.py --baseline load.json --thresholds benchmarks/data/load_thresholds.json
+    python benchmarks/bench_load.py --target http --url http://localhost:5000
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import random
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+# Add src directory to path
+sys.path.append('src')
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+
+# Messages per intent; the fake LLM's intent rules route each list to its intent
+MESSAGES = {
+    "NEW_QUERY": [
+        "I need plasma samples from female subjects",
+        "Find PBMC vials for visits 1 and 2",
+        "Show serum specimens from subjects aged 18-45",
+        "Which studies have urine samples collected in 2020?",
+        "Looking for nasal swab specimens from male subjects",
+    ],
+    "ADJUST_FILTER": [
+        "Only visits 1 and 2 instead",
+        "Switch to serum instead",
+        "Also restrict it to males",
+        "Narrow it to at least 2 vials per subject",
+        "Change the age range to ages 30-60",
+        "Remove the visit restriction and only keep females",
+    ],
+    "GENERAL": [
+        "What are your hours?",
+        "How do I contact the biorepository team?",
+        "Where can I read the sharing policy?",
+    ],
+    "OTHER": [
+        "Tell me a joke",
+        "Good morning!",
+        "Thanks a lot",
+    ],
+}
+
+# Share of sessions that open with a NEW_QUERY, and the GENERAL / OTHER turn rates
+DEFAULT_MIX = {"query_sessions": 0.7, "general": 0.2, "other": 0.1}
+
+
+def percentiles(values):
+    """count/avg/p50/p95/p99/max of a list of ms timings"""
+    ordered = sorted(values)
+    if not ordered:
+        return {"count": 0}
+    pick = lambda q: round(ordered[int(q * (len(ordered) - 1))], 2)
+    return {"count": len(ordered), "avg": round(sum(ordered) / len(ordered), 2),
+            "p50": pick(0.50), "p95": pick(0.95), "p99": pick(0.99), "max": round(ordered[-1], 2)}
+
+
+def build_sessions(count, max_adjust, mix, seed):
+    """
+    Per session, the list of (expected intent, message) turns: query sessions
+    open with a NEW_QUERY followed by an ADJUST_FILTER chain, with GENERAL /
+    OTHER turns mixed in at the configured rates; the rest are off-topic only
+    """
+    rng = random.Random(seed)
+    sessions = []
+    for _ in range(count):
+        turns = []
+        if rng.random() < mix["query_sessions"]:
+            turns.append(("NEW_QUERY", rng.choice(MESSAGES["NEW_QUERY"])))
+            for _ in range(rng.randint(0, max_adjust)):
+                turns.append(("ADJUST_FILTER", rng.choice(MESSAGES["ADJUST_FILTER"])))
+            for intent in ("GENERAL", "OTHER"):
+                if rng.random() < mix[intent.lower()]:
+                    turns.insert(rng.randint(0, len(turns)), (intent, rng.choice(MESSAGES[intent])))
+        else:
+            weights = [mix["general"], mix["other"]]
+            for intent in rng.choices(["GENERAL", "OTHER"], weights=weights, k=rng.randint(1, 2)):
+                turns.append((intent, rng.choice(MESSAGES[intent])))
+        sessions.append(turns)
+    return sessions
+
+
+class LambdaClient:
+    """Calls lambda_handler in-process with synthetic API Gateway proxy events"""
+
+    name = "lambda"
+
+    def __init__(self):
+        from lambda_function import lambda_handler
+        self.handler = lambda_handler
+
+    def request(self, method, resource, body=None, session_id=None):
+        event = {
+            "httpMethod": method,
+            "resource": resource,
+            "path": resource.replace("{session_id}", session_id or ""),
+            "pathParameters": {"session_id": session_id} if session_id else None,
+            "queryStringParameters": None,
+            "headers": {"User-Agent": "bench_load", "Content-Type": "application/json"},
+            "requestContext": {"identity": {"sourceIp": "127.0.0.1"}},
+            "body": json.dumps(body) if body is not None else None,
+        }
+        response = self.handler(event, None)
+        return response["statusCode"], json.loads(response["body"] or "null")
+
+    def node_metrics(self):
+        from metrics import metrics
+        return metrics.snapshot()
+
+    def reset_metrics(self):
+        from metrics import metrics
+        metrics.reset()
+
+
+class HttpClient:
+    """Calls a running local_server over HTTP"""
+
+    name = "http"
+
+    def __init__(self, url, timeout):
+        self.url = url.rstrip("/")
+        self.timeout = timeout
+        self.baseline = {}
+
+    def request(self, method, resource, body=None, session_id=None):
+        path = resource.replace("{session_id}", session_id or "")
+        data = json.dumps(body).encode("utf-8") if body is not None else None
+        request = urllib.request.Request(self.url + path, data=data, method=method,
+                                         headers={"Content-Type": "application/json"})
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                return response.status, json.loads(response.read() or b"null")
+        except urllib.error.HTTPError as e:
+            return e.code, None
+
+    def node_metrics(self):
+        status, health = self.request("GET", "/health")
+        return (health or {}).get("metrics", {}) if status == 200 else {}
+
+    def reset_metrics(self):
+        # The server's series are cumulative: subtract the counts seen before the run (percentiles still
+        # cover the server's whole observation window, so start a fresh server for comparable node numbers)
+        self.baseline = {name: series.get("count", 0)
+                         for name, series in self.node_metrics().get("observations", {}).items()}
+
+
+class LoadRun:
+    """Collects per-route / per-intent timings and errors from the worker threads"""
+
+    def __init__(self, client):
+        self.client = client
+        self.lock = threading.Lock()
+        self.timings = defaultdict(list)
+        self.intents = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.misrouted = 0
+
+    def call(self, route, method, resource, body=None, session_id=None):
+        start = time.perf_counter()
+        try:
+            status, payload = self.client.request(method, resource, body, session_id)
+        except Exception as e:
+            status, payload = 599, {"error": str(e)}
+        elapsed = (time.perf_counter() - start) * 1000
+        with self.lock:
+            self.timings[route].append(elapsed)
+            if status >= 400:
+                self.errors[route] += 1
+        return status, payload, elapsed
+
+    def run_session(self, turns, delete):
+        session_id = None
+        for expected, message in turns:
+            # A fresh key per turn, like index.html: repeated messages are new turns, not retries
+            body = {"message": message, "session_id": session_id, "idempotency_key": str(uuid.uuid4())}
+            status, payload, elapsed = self.call("POST /chat", "POST", "/chat", body)
+            if status != 200 or not payload:
+                return
+            session_id = payload.get("session_id")
+            with self.lock:
+                self.intents[expected].append(elapsed)
+                if payload.get("intent_type") != expected:
+                    self.misrouted += 1
+        self.call("GET /sessions", "GET", "/sessions")
+        self.call("GET /sessions/{session_id}", "GET", "/sessions/{session_id}", session_id=session_id)
+        if delete:
+            self.call("DELETE /sessions/{session_id}", "DELETE", "/sessions/{session_id}", session_id=session_id)
+
+
+def node_summary(snapshot, baseline=None):
+    """Per-node p50/p95/p99 from the node.<name>_ms metric series"""
+    nodes = {}
+    for name, series in snapshot.get("observations", {}).items():
+        if name.startswith("node.") and name.endswith("_ms"):
+            series = dict(series)
+            if baseline:
+                series["count"] -= baseline.get(name, 0)
+            nodes[name[len("node."):-len("_ms")]] = series
+    return nodes
+
+
+def model_summary(snapshot):
+    """Per-node LLM calls, tokens and estimated cost from the llm.<node>.* counters (model registry)"""
+    usage = defaultdict(dict)
+    metered = {name[len("llm."):-len("_ms")] for name in snapshot.get("observations", {})
+               if name.startswith("llm.") and name.endswith("_ms")}
+    for name, value in snapshot.get("counters", {}).items():
+        parts = name.split(".")
+        if len(parts) == 3 and parts[0] == "llm" and parts[1] in metered and parts[2] in ("calls", "input_tokens", "output_tokens", "cost_usd"):
+            usage[parts[1]][parts[2]] = round(value, 6)
+    return dict(usage)
+
+
+def speculation_summary(snapshot):
+    """Hit rate, latency saved and wasted tokens of speculative condition_organizer runs"""
+    counters = snapshot.get("counters", {})
+    if not counters.get("speculation.started"):
+        return {}
+    hits, misses = counters.get("speculation.hits", 0), counters.get("speculation.misses", 0)
+    return {
+        "started": int(counters["speculation.started"]),
+        "hit_rate": round(hits / (hits + misses), 3) if hits + misses else 0.0,
+        "saved_ms": snapshot.get("observations", {}).get("speculation.saved_ms", {"count": 0}),
+        "wasted_input_tokens": int(counters.get("speculation.wasted_input_tokens", 0)),
+        "wasted_output_tokens": int(counters.get("speculation.wasted_output_tokens", 0)),
+        "wasted_cost_usd": round(counters.get("speculation.wasted_cost_usd", 0.0), 6),
+    }
+
+
+def check_thresholds(results, thresholds, baseline):
+    """Failure messages for absolute limits and for p50/p95/p99 regressions against a baseline run"""
+    failures = []
+    if results["throughput_rps"] < thresholds.get("min_throughput_rps", 0):
+        failures.append(f"throughput {results['throughput_rps']:.2f} rps < {thresholds['min_throughput_rps']}")
+    if results["error_rate"] > thresholds.get("max_error_rate", 1.0):
+        failures.append(f"error rate {results['error_rate']:.3f} > {thresholds['max_error_rate']}")
+    if results["misroute_rate"] > thresholds.get("max_misroute_rate", 1.0):
+        failures.append(f"misroute rate {results['misroute_rate']:.3f} > {thresholds['max_misroute_rate']}")
+    for section in ("routes", "intents", "nodes"):
+        for name, limits in thresholds.get(section, {}).items():
+            series = results[section].get(name)
+            for key, limit in limits.items():
+                stat = key.replace("_ms", "")
+                if series and stat in series and series[stat] > limit:
+                    failures.append(f"{section} {name} {stat} {series[stat]:.1f} ms > {limit} ms")
+
+    if baseline:
+        allowed = thresholds.get("max_regression", 0.25)
+        floor_ms = thresholds.get("regression_floor_ms", 5.0)
+        for section in ("routes", "intents", "nodes"):
+            for name, series in results[section].items():
+                before = baseline.get(section, {}).get(name)
+                if not before:
+                    continue
+                for stat in ("p50", "p95", "p99"):
+                    if stat in series and stat in before and \
+                            series[stat] > before[stat] * (1 + allowed) + floor_ms:
+                        failures.append(f"{section} {name} {stat} regressed {before[stat]:.1f} -> "
+                                        f"{series[stat]:.1f} ms (> {allowed:.0%})")
+        if results["throughput_rps"] < baseline.get("throughput_rps", 0) * (1 - allowed):
+            failures.append(f"throughput regressed {baseline['throughput_rps']:.2f} -> "
+                            f"{results['throughput_rps']:.2f} rps (> {allowed:.0%})")
+    return failures
+
+
+def print_table(title, rows):
+    print("-" * 78)
+    print(f"{title:<36}{'count':>7}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'max ms':>9}")
+    for name, series in rows.items():
+        if series.get("count"):
+            print(f"{name:<36}{series['count']:>7}{series['p50']:>9.1f}{series['p95']:>9.1f}"
+                  f"{series['p99']:>9.1f}{series.get('max', series['p99']):>9.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Chat API load test")
+    parser.add_argument("--target", choices=["lambda", "http"], default="lambda")
+    parser.add_argument("--url", default="http://localhost:5000", help="local_server base URL (--target http)")
+    parser.add_argument("--sessions", type=int, default=40)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--max-adjust", type=int, default=4, help="Longest ADJUST_FILTER chain per session")
+    parser.add_argument("--mix", default=None,
+                        help='JSON overriding the session mix, e.g. \'{"query_sessions": 0.9, "general": 0.1}\'')
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--warmup", type=int, default=2, help="Sessions run before measuring")
+    parser.add_argument("--delete", action="store_true", help="DELETE each session after it finishes")
+    parser.add_argument("--fake-config", default=os.path.join(DATA_DIR, "load_fake_llm.json"))
+    parser.add_argument("--latency-scale", type=float, default=0.1, help="FAKE_LLM_LATENCY_SCALE")
+    parser.add_argument("--timeout", type=float, default=60.0, help="HTTP request timeout (s)")
+    parser.add_argument("--output", help="Write results JSON here")
+    parser.add_argument("--baseline", help="Previous results JSON to compare against")
+    parser.add_argument("--thresholds", help="Thresholds JSON (absolute limits and max_regression)")
+    parser.add_argument("--speculative", action="store_true",
+                        help="Run condition_organizer speculatively alongside intent recognition (lambda target)")
+    parser.add_argument("--verbose", action="store_true", help="Keep the application's logging")
+    args = parser.parse_args()
+
+    # In-process target: offline LLM (unless LLM_BACKEND is already set, e.g. replay) and local DynamoDB
+    os.environ.setdefault("LLM_BACKEND", "fake")
+    os.environ.setdefault("FAKE_LLM_CONFIG", args.fake_config)
+    os.environ["FAKE_LLM_LATENCY_SCALE"] = str(args.latency_scale)
+    os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+    if args.speculative:
+        os.environ["SPECULATIVE_ORGANIZER"] = "1"
+    mix = dict(DEFAULT_MIX, **json.loads(args.mix)) if args.mix else DEFAULT_MIX
+
+    print("🚀 Chat API Load Test")
+    print("=" * 78)
+    quiet = contextlib.redirect_stdout(sys.stdout if args.verbose else open(os.devnull, "w"))
+    with quiet:
+        client = LambdaClient() if args.target == "lambda" else HttpClient(args.url, args.timeout)
+    sessions = build_sessions(args.sessions, args.max_adjust, mix, args.seed)
+    turns = sum(len(session) for session in sessions)
+    print(f"🎯 Target: {client.name}   sessions: {len(sessions)}   chat turns: {turns}   "
+          f"concurrency: {args.concurrency}")
+    print(f"🤖 LLM backend: {os.environ['LLM_BACKEND']} (latency scale {args.latency_scale}"
+          f"{', speculative organizer' if args.speculative else ''})   "
+          f"DynamoDB: {os.environ.get('DYNAMODB_ENDPOINT_URL') or 'in-memory local fallback'}")
+
+    with quiet:
+        warmup = LoadRun(client)
+        for session in build_sessions(args.warmup, args.max_adjust, mix, args.seed + 1):
+            warmup.run_session(session, delete=True)
+        client.reset_metrics()
+
+        run = LoadRun(client)
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            for future in [pool.submit(run.run_session, session, args.delete) for session in sessions]:
+                future.result()
+        wall = time.perf_counter() - start
+        snapshot = client.node_metrics()
+
+    requests = sum(len(values) for values in run.timings.values())
+    errors = sum(run.errors.values())
+    chat_turns = len(run.timings["POST /chat"])
+    results = {
+        "target": client.name,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "config": {"sessions": args.sessions, "concurrency": args.concurrency, "max_adjust": args.max_adjust,
+                   "mix": mix, "seed": args.seed, "llm_backend": os.environ["LLM_BACKEND"],
+                   "latency_scale": args.latency_scale},
+        "wall_seconds": round(wall, 3),
+        "requests": requests,
+        "throughput_rps": round(requests / wall, 3),
+        "chat_turns_per_second": round(chat_turns / wall, 3),
+        "error_rate": round(errors / requests, 4) if requests else 0.0,
+        "misroute_rate": round(run.misrouted / chat_turns, 4) if chat_turns else 0.0,
+        "routes": {route: dict(percentiles(values), errors=run.errors[route]) for route, values in run.timings.items()},
+        "intents": {intent: percentiles(values) for intent, values in run.intents.items()},
+        "nodes": node_summary(snapshot, getattr(client, "baseline", None)),
+        "models": model_summary(snapshot),
+        "speculation": speculation_summary(snapshot),
+    }
+
+    print(f"⚡ {requests} requests in {wall:.2f}s: {results['throughput_rps']:.1f} req/s, "
+          f"{results['chat_turns_per_second']:.1f} chat turns/s   errors: {errors}   misrouted: {run.misrouted}")
+    print_table("route", results["routes"])
+    print_table("POST /chat by intent", results["intents"])
+    print_table("graph node", results["nodes"])
+    if results["models"]:
+        print("-" * 78)
+        print(f"{'LLM usage by node':<36}{'calls':>7}{'in tok':>10}{'out tok':>10}{'est. USD':>12}")
+        for node, usage in results["models"].items():
+            print(f"{node:<36}{usage.get('calls', 0):>7.0f}{usage.get('input_tokens', 0):>10,.0f}"
+                  f"{usage.get('output_tokens', 0):>10,.0f}{usage.get('cost_usd', 0):>12.4f}")
+    speculation = results["speculation"]
+    if speculation:
+        print("-" * 78)
+        saved = speculation["saved_ms"]
+        print(f"🔮 Speculation: {speculation['started']} started, hit rate {speculation['hit_rate']:.0%}, "
+              f"saved p50 {saved.get('p50', 0):.0f} ms per hit, wasted {speculation['wasted_input_tokens']:,} in / "
+              f"{speculation['wasted_output_tokens']:,} out tokens (${speculation['wasted_cost_usd']:.4f})")
+    print("=" * 78)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as handle:
+            json.dump(results, handle, indent=2, sort_keys=True)
+        print(f"💾 Results written to {args.output}")
+
+    thresholds = {}
+    if args.thresholds:
+        with open(args.thresholds, encoding="utf-8") as handle:
+            thresholds = json.load(handle)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as handle:
+            baseline = json.load(handle)
+    failures = check_thresholds(results, thresholds, baseline)
+    if args.thresholds or args.baseline:
+        if failures:
+            print(f"❌ {len(failures)} threshold(s) exceeded:")
+            for failure in failures:
+                print(f"   {failure}")
+            sys.exit(1)
+        print("✅ All thresholds met")
+
+
+if __name__ == "__main__":
+    main()
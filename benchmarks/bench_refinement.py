@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Benchmark incremental ADJUST_FILTER evaluation: refinement chains of 5-10 turns,
+each turn re-evaluated from scratch vs narrowed from the previous candidate rows
+"""
+
+import argparse
+import sys
+import time
+
+# Add src directory to path
+sys.path.append('src')
+
+from vials.columnar import ColumnarVials
+from vials.compiler import compile_organize_state
+from vials.refinement import RefinementStore
+from vials.synthetic import STUDY_IDS, generate_rows
+
+CHAINS = {
+    "narrowing_8_turns": [
+        {"specimen_type": "Serum, Plasma, PBMC"},
+        {"specimen_type": "Serum, Plasma, PBMC", "age": "18-80"},
+        {"specimen_type": "Serum, Plasma, PBMC", "age": "18-80", "sex": "female"},
+        {"specimen_type": "Serum, Plasma", "age": "18-80", "sex": "female"},
+        {"specimen_type": "Serum, Plasma", "age": "18-80", "sex": "female", "study_id": STUDY_IDS[:6]},
+        {"specimen_type": "Serum, Plasma", "age": "18-64", "sex": "female", "study_id": STUDY_IDS[:6]},
+        {"specimen_type": "Serum", "age": "18-64", "sex": "female", "study_id": STUDY_IDS[:6], "status": "Available"},
+        {"specimen_type": "Serum", "age": "30-64", "sex": "female", "study_id": STUDY_IDS[:3], "status": "Available"},
+    ],
+    "widen_midway_10_turns": [
+        {"specimen_type": "Serum, Plasma"},
+        {"specimen_type": "Serum, Plasma", "age": "18-45"},
+        {"specimen_type": "Serum, Plasma", "age": "18-45", "arm": "Arm 4: Placebo"},
+        {"specimen_type": "Serum", "age": "18-45", "arm": "Arm 4: Placebo"},
+        {"specimen_type": "Serum", "age": "18-64", "arm": "Arm 4: Placebo"},  # widened
+        {"specimen_type": "Serum", "age": "18-64", "arm": "Arm 4: Placebo", "sex": "male"},
+        {"specimen_type": "Serum", "age": "18-64", "arm": "Arm 4: Placebo", "sex": "male", "race": "White"},
+        {"specimen_type": "Serum", "age": "18-64", "sex": "male", "race": "White"},  # arm removed
+        {"specimen_type": "Serum", "age": "18-64", "sex": "male", "race": "White", "status": "Available"},
+        {"specimen_type": "Serum", "age": "40-64", "sex": "male", "race": "White", "status": "Available"},
+    ],
+    "group_rules_6_turns": [
+        {"specimen_type": "PBMC, Serum", "minimum_vials_per_subject": 3},
+        {"specimen_type": "PBMC, Serum", "minimum_vials_per_subject": 3, "sex": "female"},
+        {"specimen_type": "PBMC", "minimum_vials_per_subject": 3, "sex": "female"},
+        {"specimen_type": "PBMC", "minimum_vials_per_subject": 3, "sex": "female", "visit_number": "Visits 01, 02"},
+        {"specimen_type": "PBMC", "minimum_vials_per_subject": 5, "sex": "female", "visit_number": "Visits 01, 02"},
+        {"specimen_type": "PBMC", "minimum_vials_per_subject": 5, "sex": "female", "visit_number": "Visits 01, 02",
+         "age": "18-50"},
+    ],
+}
+
+
+def compile_turn(criteria):
+    return compile_organize_state({"eligibility_criteria": {name: {"value": value} for name, value in criteria.items()}})
+
+
+def run_full(store, compiled):
+    t0 = time.perf_counter()
+    result = store.counts_for_rows(store.filter_rows(compiled.predicates), compiled)
+    return result, (time.perf_counter() - t0) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Refinement chain benchmark")
+    parser.add_argument("--rows", type=int, default=300_000)
+    args = parser.parse_args()
+
+    print("🚀 Refinement Chain Benchmark")
+    print("=" * 78)
+    store = ColumnarVials.from_rows(generate_rows(args.rows))
+    print(f"📦 Rows: {store.n_rows:,}  columnar build: {store.build_seconds:.1f}s")
+
+    for name, chain in CHAINS.items():
+        refinement = RefinementStore()
+        print("-" * 78)
+        print(f"🔗 {name}")
+        print(f"   {'turn':<6}{'route':<10}{'full ms':>10}{'incremental ms':>16}{'candidates':>18}{'memory':>12}")
+        full_total = incremental_total = 0.0
+        for turn, criteria in enumerate(chain, start=1):
+            compiled = compile_turn(criteria)
+            expected, full_ms = run_full(store, compiled)
+            t0 = time.perf_counter()
+            result, route = refinement.evaluate(name, compiled, store, "bench")
+            incremental_ms = (time.perf_counter() - t0) * 1000
+            assert result == expected, (name, turn)
+            candidate = refinement.get(name)
+            full_total += full_ms
+            incremental_total += incremental_ms
+            print(f"   {turn:<6}{route:<10}{full_ms:>10.2f}{incremental_ms:>16.2f}"
+                  f"{len(candidate.members()):>11,} {candidate.level:<6}{candidate.nbytes / 1024:>10.1f}KB")
+        print(f"   total  full {full_total:.1f} ms  incremental {incremental_total:.1f} ms  "
+              f"({full_total / incremental_total:.1f}x)")
+    print("=" * 78)
+
+
+if __name__ == "__main__":
+    main()
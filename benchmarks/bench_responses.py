@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Response serialization and compression for the session APIs: the
+GET /sessions/{id} body (session item + 50 messages as read from DynamoDB,
+Decimal numbers included) and GET /sessions (20 session items), encoded
+with the previous `json.dumps`, stdlib json through responses.py's
+DynamoDB-aware hook, and orjson when installed; then the payload size and
+time of gzip and br (when brotli is installed) above the threshold.
+
+    python benchmarks/bench_responses.py --repeats 500
+"""
+
+import argparse
+import gzip
+import json
+import os
+import statistics
+import sys
+import time
+from decimal import Decimal
+
+# Add src directory to path
+sys.path.append('src')
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import responses
+from bench_history_format import build_turns
+
+
+def session_item(session_id, count):
+    return {'session_id': session_id, 'created_at': '2024-01-01T00:00:00', 'updated_at': '2024-01-01T00:25:00',
+            'message_count': Decimal(count), 'expires_at': Decimal(1735689600),
+            'metadata': {'user_agent': 'Mozilla/5.0', 'source_ip': '203.0.113.7'}}
+
+
+def session_payload(turns, page):
+    messages = [dict(message, metadata=dict(message['metadata'], duration_ms=Decimal(1840)))
+                for turn in turns for message in turn][-page:]
+    return {'session': session_item(messages[0]['session_id'], len(messages)), 'chat_history': messages,
+            'message_count': len(messages)}
+
+
+def list_payload(count):
+    sessions = [session_item(f"session-{index:05d}", 2 * index) for index in range(count)]
+    return {'sessions': sessions, 'count': len(sessions)}
+
+
+def timed(operation, repeats):
+    timings = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        result = operation()
+        timings.append((time.perf_counter() - started) * 1e6)
+    timings.sort()
+    return result, statistics.median(timings), timings[int(0.95 * (len(timings) - 1))]
+
+
+def stdlib_dumps(payload):
+    return json.dumps(payload, default=responses._default, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Response serialization benchmark")
+    parser.add_argument("--page", type=int, default=50, help="Messages in the session response")
+    parser.add_argument("--repeats", type=int, default=500)
+    args = parser.parse_args()
+
+    payloads = {"GET /sessions/{id}": session_payload(build_turns(args.page, 7), args.page),
+                "GET /sessions": list_payload(20)}
+
+    print("🚀 Response Serialization Benchmark")
+    print("=" * 78)
+    print(f"📦 JSON encoder: {responses.get_status()['json_encoder']}; compression: "
+          f"{', '.join(responses.get_status()['encodings'])}; threshold {responses.COMPRESS_THRESHOLD} bytes")
+    for name, payload in payloads.items():
+        print("-" * 78)
+        print(f"📊 {name}")
+        try:
+            json.dumps(payload)
+            print("   json.dumps (before): ok")
+        except TypeError as e:
+            print(f"   json.dumps (before): ❌ {e}")
+        encoders = [("json + default=str", lambda: json.dumps(payload, default=str).encode("utf-8")),
+                    ("json + DynamoDB hook", lambda: stdlib_dumps(payload))]
+        if responses.orjson is not None:
+            encoders.append(("orjson + DynamoDB hook", lambda: responses.dumps(payload)))
+        print(f"{'encoder':<28}{'bytes':>10}{'p50 µs':>10}{'p95 µs':>10}")
+        for label, encode in encoders:
+            body, p50, p95 = timed(encode, args.repeats)
+            print(f"{label:<28}{len(body):>10,}{p50:>10,.0f}{p95:>10,.0f}")
+
+        body = responses.dumps(payload)
+        compressors = [("identity", lambda: body),
+                       (f"gzip -{responses.GZIP_LEVEL}", lambda: gzip.compress(body, responses.GZIP_LEVEL))]
+        if responses.brotli is not None:
+            compressors.append((f"br q{responses.BROTLI_QUALITY}",
+                                lambda: responses.brotli.compress(body, quality=responses.BROTLI_QUALITY)))
+        print(f"{'encoding':<28}{'bytes':>10}{'p50 µs':>10}{'p95 µs':>10}{'ratio':>10}")
+        for label, compress in compressors:
+            compressed, p50, p95 = timed(compress, args.repeats)
+            print(f"{label:<28}{len(compressed):>10,}{p50:>10,.0f}{p95:>10,.0f}{len(compressed) / len(body):>10.2f}")
+        _, p50, p95 = timed(lambda: responses.lambda_response(
+            {'statusCode': 200, 'headers': {}, 'body': payload},
+            {'headers': {'Accept-Encoding': 'gzip, deflate, br'}}), args.repeats)
+        print(f"{'lambda_response (total)':<28}{'':>10}{p50:>10,.0f}{p95:>10,.0f}")
+    print("=" * 78)
+
+
+if __name__ == "__main__":
+    main()
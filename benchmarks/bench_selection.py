@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Benchmark the vectorized selection engine on 1M eligible VIALS rows
+("select 10 subjects with 3 vials each" style requests)
+"""
+
+import argparse
+import statistics
+import sys
+import time
+
+import numpy as np
+
+# Add src directory to path
+sys.path.append('src')
+
+from vials.columnar import ColumnarVials, DictionaryColumn
+from vials.ids import BiospecimenIdIndex
+from vials.selection import SelectionEngine
+from vials.synthetic import ARMS, STUDY_IDS, VISITS
+
+REQUESTS = {
+    "10_subjects_3_vials_each": {
+        "quantity_limits": {"subjects": {"value": 10}, "vials_per_subject": {"value": 3}},
+        "prioritization_rules": [],
+    },
+    "10_subjects_most_aliquots": {
+        "quantity_limits": {"subjects": {"value": 10}, "vials_per_subject": {"value": 3}},
+        "prioritization_rules": [{"priority": 1, "rule": "Number of aliquots available", "direction": "highest"}],
+    },
+    "25_subjects_titer_then_recent": {
+        "quantity_limits": {"subjects": {"value": 25}, "aliquots_per_participant_timepoint": {"value": 2}},
+        "prioritization_rules": [
+            {"priority": 1, "rule": "HAI titer at Visit 03", "direction": "highest"},
+            {"priority": 2, "rule": "Most recent collection date", "direction": "latest"},
+        ],
+    },
+    "4_per_subject_visit_arm_all": {
+        "quantity_limits": {"vials_per_subject_visit_arm": {"value": 4}},
+        "prioritization_rules": [],
+    },
+}
+
+
+def build_store(n_rows, seed=5):
+    """Columnar store of n_rows eligible rows, generated directly as arrays"""
+    rng = np.random.default_rng(seed)
+    assays = rng.integers(1, 3, size=n_rows)  # 1-2 assay rows per biospecimen group
+    n_groups = int(np.searchsorted(np.cumsum(assays), n_rows)) + 1
+    group_of_row = np.repeat(np.arange(n_groups), assays[:n_groups])[:n_rows]
+    groups_per_subject = 12
+    subject_of_group = np.arange(n_groups) // groups_per_subject
+    n_subjects = int(subject_of_group[-1]) + 1
+
+    vials = rng.integers(1, 9, size=n_groups)
+    offsets = np.concatenate([[0], np.cumsum(vials)])
+    ids = [",".join(f"BS{number:09d}" for number in range(offsets[g], offsets[g + 1])) for g in range(n_groups)]
+    dates = [f"{day:02d}-{month}-{year}" for year in ("20", "21", "22") for month in ("Jan", "Apr", "Jul", "Oct")
+             for day in (3, 17)]
+
+    store = ColumnarVials()
+    store.n_rows = n_rows
+    text = {
+        "subject_id": ([f"S{number:07d}" for number in range(n_subjects)], subject_of_group[group_of_row]),
+        "study_id": (STUDY_IDS, (subject_of_group % len(STUDY_IDS))[group_of_row]),
+        "visit_number": ([visit[0] for visit in VISITS], (np.arange(n_groups) % len(VISITS))[group_of_row]),
+        "arm": (ARMS, (subject_of_group % len(ARMS))[group_of_row]),
+        "collection_date": (dates, rng.integers(0, len(dates), size=n_groups)[group_of_row]),
+    }
+    for name, (values, codes) in text.items():
+        store.text_columns[name] = DictionaryColumn(values, codes.astype(np.int32))
+    store.numeric_columns["vials_count"] = vials[group_of_row].astype(np.int32)
+    store.numeric_columns["age"] = rng.integers(18, 86, size=n_subjects)[subject_of_group][group_of_row].astype(np.int32)
+    store.numeric_columns["numeric_results"] = (2.0 ** rng.integers(3, 12, size=n_rows)).astype(np.float32)
+    store.group_codes = group_of_row.astype(np.int32)
+    store.biospecimen_ids = BiospecimenIdIndex.from_values(ids, keep_lookup=False)
+    store.build_range_indexes()
+    store.build_group_index()
+    return store, n_groups, n_subjects
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Selection engine benchmark")
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    print("🚀 Selection Engine Benchmark")
+    print("=" * 78)
+    start = time.perf_counter()
+    store, n_groups, n_subjects = build_store(args.rows)
+    print(f"📦 {args.rows:,} eligible rows, {n_groups:,} biospecimen groups, {n_subjects:,} subjects "
+          f"(generated in {time.perf_counter() - start:.1f}s)")
+
+    rows = np.arange(args.rows)
+    dedup_timings = []
+    for _ in range(args.repeats):
+        t0 = time.perf_counter()
+        groups = store.unique_groups(rows)
+        dedup_timings.append((time.perf_counter() - t0) * 1000)
+    print(f"   dedup to groups: {statistics.median(dedup_timings):.1f} ms")
+    print("-" * 78)
+    print(f"{'request':<32}{'p50 ms':>10}{'subjects':>10}{'vials':>10}  first ids")
+    engine = SelectionEngine(store)
+    for name, requirements in REQUESTS.items():
+        timings = []
+        for _ in range(args.repeats):
+            t0 = time.perf_counter()
+            result = engine.select(rows, groups, requirements)
+            timings.append((time.perf_counter() - t0) * 1000)
+        print(f"{name:<32}{statistics.median(timings):>10.1f}{len(result.subjects):>10,}{result.vials_selected:>10,}"
+              f"  {', '.join(result.biospecimen_ids[:2])}")
+    print("=" * 78)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+"""
+Throughput of local_server in prod mode (pre-forked workers) for workers=1
+vs workers=N: starts `SERVER_MODE=prod python local_server.py` per worker
+count on the fake LLM, drives concurrent chat sessions over HTTP and
+reports chat turns/s, p50/p95/p99, startup time and memory (PSS, so pages
+shared copy-on-write after the preload are counted once). Finally sends
+SIGTERM while chats are in flight and checks they all drain.
+
+    python benchmarks/bench_server.py --workers 1 4 --sessions 60 --concurrency 16
+"""
+
+import argparse
+import contextlib
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from bench_load import DATA_DIR, DEFAULT_MIX, HttpClient, LoadRun, build_sessions, percentiles
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def process_tree(pid):
+    """pid plus its descendants (Linux /proc)"""
+    pids = [pid]
+    for child in pids:
+        for task in os.listdir(f"/proc/{child}/task") if os.path.exists(f"/proc/{child}/task") else []:
+            with contextlib.suppress(OSError), open(f"/proc/{child}/task/{task}/children") as handle:
+                pids.extend(int(value) for value in handle.read().split())
+    return pids
+
+
+def pss_mb(pid):
+    """Proportional set size of the server (master + workers) in MB, None where /proc is unavailable"""
+    total = 0
+    try:
+        for member in process_tree(pid):
+            with open(f"/proc/{member}/smaps_rollup") as handle:
+                for line in handle:
+                    if line.startswith("Pss:"):
+                        total += int(line.split()[1])
+    except OSError:
+        return None
+    return total / 1024
+
+
+class Server:
+    """local_server in prod mode as a subprocess"""
+
+    def __init__(self, workers, port, env, verbose):
+        self.url = f"http://127.0.0.1:{port}"
+        self.log = None if verbose else tempfile.TemporaryFile()
+        env = dict(env, SERVER_MODE="prod", SERVER_WORKERS=str(workers), SERVER_PORT=str(port),
+                   SERVER_HOST="127.0.0.1")
+        started = time.perf_counter()
+        self.process = subprocess.Popen([sys.executable, "local_server.py"], cwd=ROOT, env=env,
+                                        stdout=self.log, stderr=subprocess.STDOUT)
+        self.wait_ready(workers)
+        self.startup_seconds = time.perf_counter() - started
+
+    def wait_ready(self, workers, timeout=120):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f"server exited with {self.process.returncode}{self.tail()}")
+            with contextlib.suppress(OSError):
+                with urllib.request.urlopen(self.url + "/health", timeout=2) as response:
+                    if response.status == 200 and len(process_tree(self.process.pid)) > workers:
+                        return
+            time.sleep(0.25)
+        raise RuntimeError(f"server not ready after {timeout}s{self.tail()}")
+
+    def tail(self):
+        if self.log is None:
+            return ""
+        self.log.seek(0)
+        return ":\n" + self.log.read().decode("utf-8", "replace")[-2000:]
+
+    def stop(self, timeout=60):
+        if self.process.poll() is None:
+            self.process.send_signal(signal.SIGTERM)
+        with contextlib.suppress(subprocess.TimeoutExpired):
+            return self.process.wait(timeout)
+        self.process.kill()
+        return self.process.wait()
+
+
+def run_chats(run, turns):
+    """One session's chat turns (session routes are left out: they depend on shared DynamoDB)"""
+    session_id = None
+    for expected, message in turns:
+        body = {"message": message, "session_id": session_id, "idempotency_key": str(uuid.uuid4())}
+        status, payload, elapsed = run.call("POST /chat", "POST", "/chat", body)
+        if status != 200 or not payload:
+            return
+        session_id = payload.get("session_id")
+        with run.lock:
+            run.intents[expected].append(elapsed)
+
+
+def measure(server, sessions, concurrency, timeout):
+    client = HttpClient(server.url, timeout)
+    for turns in sessions[:2]:
+        run_chats(LoadRun(client), turns)
+
+    run = LoadRun(client)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for future in [pool.submit(run_chats, run, turns) for turns in sessions]:
+            future.result()
+    wall = time.perf_counter() - start
+    timings = run.timings["POST /chat"]
+    return dict(percentiles(timings), turns_per_second=len(timings) / wall, errors=run.errors["POST /chat"])
+
+
+def drain_check(server, concurrency, timeout):
+    """SIGTERM with `concurrency` chats in flight; (completed with 200, sent, exit code)"""
+    client = HttpClient(server.url, timeout)
+    statuses = []
+    lock = threading.Lock()
+
+    def one(index):
+        body = {"message": "I need plasma samples from female subjects", "idempotency_key": str(uuid.uuid4())}
+        try:
+            status, _ = client.request("POST", "/chat", body)
+        except Exception:
+            status = 599
+        with lock:
+            statuses.append(status)
+
+    threads = [threading.Thread(target=one, args=(index,)) for index in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    # Chats take seconds at this latency scale: all are accepted and still running when the signal lands
+    time.sleep(0.5)
+    server.process.send_signal(signal.SIGTERM)
+    for thread in threads:
+        thread.join()
+    return statuses.count(200), concurrency, server.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prefork server throughput benchmark")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4])
+    parser.add_argument("--sessions", type=int, default=60)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--max-adjust", type=int, default=4)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--port", type=int, default=5077)
+    parser.add_argument("--fake-config", default=os.path.join(DATA_DIR, "load_fake_llm.json"))
+    parser.add_argument("--latency-scale", type=float, default=0.1, help="FAKE_LLM_LATENCY_SCALE")
+    parser.add_argument("--timeout", type=float, default=60.0, help="HTTP request timeout (s)")
+    parser.add_argument("--verbose", action="store_true", help="Show the server's logging")
+    args = parser.parse_args()
+
+    env = dict(os.environ, LLM_BACKEND=os.environ.get("LLM_BACKEND", "fake"), FAKE_LLM_CONFIG=args.fake_config,
+               FAKE_LLM_LATENCY_SCALE=str(args.latency_scale),
+               AWS_DEFAULT_REGION=os.environ.get("AWS_DEFAULT_REGION", "us-east-1"))
+    sessions = build_sessions(args.sessions, args.max_adjust, DEFAULT_MIX, args.seed)
+
+    print("🚀 Prefork Server Throughput Benchmark")
+    print("=" * 78)
+    print(f"📦 {len(sessions)} sessions, {sum(len(turns) for turns in sessions)} chat turns, "
+          f"{args.concurrency} concurrent clients; fake LLM latency scale {args.latency_scale}; "
+          f"{os.cpu_count()} CPU(s)")
+    print("-" * 78)
+    print(f"{'workers':<9}{'turns/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'errors':>8}"
+          f"{'startup s':>11}{'PSS MB':>9}")
+    results = {}
+    for workers in args.workers:
+        server = Server(workers, args.port, env, args.verbose)
+        try:
+            result = measure(server, sessions, args.concurrency, args.timeout)
+            memory = pss_mb(server.process.pid)
+        finally:
+            server.stop()
+        results[workers] = result
+        memory_text = f"{memory:>9.0f}" if memory is not None else f"{'n/a':>9}"
+        print(f"{workers:<9}{result['turns_per_second']:>9.1f}{result['p50']:>9.0f}{result['p95']:>9.0f}"
+              f"{result['p99']:>9.0f}{result['errors']:>8}{server.startup_seconds:>11.1f}{memory_text}")
+
+    print("-" * 78)
+    if len(results) > 1:
+        low, high = min(results), max(results)
+        speedup = results[high]["turns_per_second"] / results[low]["turns_per_second"]
+        print(f"⚡ workers={high} vs workers={low}: {speedup:.2f}x chat throughput")
+
+    server = Server(max(args.workers), args.port, dict(env, FAKE_LLM_LATENCY_SCALE="0.5"), args.verbose)
+    completed, sent, exit_code = drain_check(server, args.concurrency, args.timeout)
+    print(f"🛑 SIGTERM with {sent} chats in flight: {completed} completed, server exited with {exit_code}")
+    print("=" * 78)
+    if completed != sent:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
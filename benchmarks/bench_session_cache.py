@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+Multi-turn conversations through DynamoDBManager with the session cache off
+and on. Each turn reads the last 20 messages and writes the exchange, as
+lambda_function.run_chat_turn does; every few turns the session is also
+fetched like GET /sessions/{id}; answers are the study-table replies of
+bench_history_format.py. Two "containers" (managers with their own
+cache) share the storage, and a session moves to the other container with
+probability 1 - affinity, so stale entries are exercised and every history
+returned is checked against what was written.
+
+DynamoDB requests are counted on the in-process table of
+bench_history_format.py (requests and read units); latency is measured on
+SQLite (WAL file).
+
+    python benchmarks/bench_session_cache.py --sessions 200 --turns 12
+"""
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+# Add src directory to path
+sys.path.append('src')
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from bench_history_format import RecordingResource, assistant_answer
+from dynamodb_manager import DynamoDBManager
+from metrics import metrics
+from session_cache import SessionCache
+from storage_backends import DynamoDBBackend, SQLiteBackend
+
+
+def make_managers(kind, containers, cached, directory):
+    if kind == "dynamodb":
+        resource = RecordingResource()
+        backends = [DynamoDBBackend(resource, "sessions", "history") for _ in range(containers)]
+    else:
+        path = os.path.join(directory, f"cache-{cached}.sqlite3")
+        backends = [SQLiteBackend(path) for _ in range(containers)]
+        resource = None
+    managers = [DynamoDBManager(backend) for backend in backends]
+    for manager in managers:
+        manager.cache = SessionCache(max_sessions=256 if cached else 0, trust_seconds=60)
+    return managers, resource
+
+
+def next_request(managers):
+    """Requests arrive seconds apart in production: nothing checked by an earlier request is trusted"""
+    for manager in managers:
+        for entry in manager.cache.entries.values():
+            entry.checked_at = float("-inf")
+
+
+def run(kind, cached, args, directory):
+    managers, resource = make_managers(kind, args.containers, cached, directory)
+    rng = random.Random(args.seed)
+    metrics.reset()
+    placement, expected = {}, {}
+    timings, wrong = [], 0
+    sessions = []
+    for number in range(args.sessions):
+        home = rng.randrange(len(managers))
+        session_id = managers[home].create_session(metadata={"bench": number})
+        sessions.append(session_id)
+        placement[session_id] = home
+        expected[session_id] = []
+    if resource is not None:
+        for table in resource.tables.values():
+            table.requests = table.queries = 0
+            table.read_units = 0.0
+    history_table = resource.tables["history"] if resource is not None else None
+
+    for turn in range(args.turns):
+        for session_id in sessions:
+            if rng.random() > args.affinity:
+                placement[session_id] = (placement[session_id] + 1) % len(managers)
+            manager = managers[placement[session_id]]
+            request, response = f"question {turn} for {session_id[:8]}", assistant_answer(rng)
+            next_request(managers)
+            started = time.perf_counter()
+            history = manager.get_chat_history(session_id, limit=20)
+            manager.add_chat_turn(session_id, request, response, {"intent_type": "NEW_QUERY"}, duration_ms=900)
+            timings.append((time.perf_counter() - started) * 1e6)
+            if turn % args.view_every == 0:
+                next_request(managers)
+                manager.get_session(session_id)
+                manager.get_chat_history(session_id, limit=50)
+            wrong += [message["content"] for message in history] != expected[session_id][-20:]
+            expected[session_id] += [request, response]
+
+    turns = args.sessions * args.turns
+    timings.sort()
+    result = {
+        "p50_us": statistics.median(timings),
+        "p95_us": timings[int(0.95 * (len(timings) - 1))],
+        "hit_rate": metrics.ratio("session_cache.hits", "session_cache.misses") if cached else 0.0,
+        "stale": metrics.snapshot().get("counters", {}).get("session_cache.stale", 0),
+        "wrong": wrong,
+    }
+    if resource is not None:
+        result["history_reads"] = history_table.queries / turns
+        result["session_reads"] = resource.tables["sessions"].requests / turns
+        result["read_units"] = sum(table.read_units for table in resource.tables.values()) / turns
+        result["requests"] = sum(table.requests for table in resource.tables.values()) / turns
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Session cache multi-turn benchmark")
+    parser.add_argument("--sessions", type=int, default=200)
+    parser.add_argument("--turns", type=int, default=12, help="Turns per session")
+    parser.add_argument("--containers", type=int, default=2)
+    parser.add_argument("--affinity", type=float, default=0.9, help="Chance a turn stays on the same container")
+    parser.add_argument("--view-every", type=int, default=4, help="GET /sessions/{id} every N turns")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for kind in ("dynamodb", "sqlite"):
+            for cached in (False, True):
+                results[kind, cached] = run(kind, cached, args, directory)
+
+    print("🚀 Session Cache Benchmark")
+    print("=" * 78)
+    print(f"📦 {args.sessions} sessions x {args.turns} turns on {args.containers} containers, "
+          f"affinity {args.affinity:.0%}, session view every {args.view_every} turns")
+    print("-" * 78)
+    off, on = results["dynamodb", False], results["dynamodb", True]
+    print(f"{'dynamodb (counted)':<30}{'cache off':>14}{'cache on':>14}{'change':>10}")
+    for label, key, fmt in (("history Query / turn", "history_reads", "{:.2f}"),
+                            ("session requests / turn", "session_reads", "{:.2f}"),
+                            ("all requests / turn", "requests", "{:.2f}"),
+                            ("RCU / turn", "read_units", "{:.2f}"),
+                            ("hit rate", "hit_rate", "{:.1%}"),
+                            ("stale entries dropped", "stale", "{:,.0f}"),
+                            ("wrong histories", "wrong", "{:,.0f}")):
+        change = f"{(on[key] - off[key]) / off[key] * 100:+.0f}%" if off[key] and key != "hit_rate" else ""
+        print(f"{label:<30}{fmt.format(off[key]):>14}{fmt.format(on[key]):>14}{change:>10}")
+    print("-" * 78)
+    off, on = results["sqlite", False], results["sqlite", True]
+    print(f"{'sqlite (WAL)':<30}{'cache off':>14}{'cache on':>14}{'change':>10}")
+    for label, key in (("chat turn p50 µs", "p50_us"), ("chat turn p95 µs", "p95_us")):
+        print(f"{label:<30}{off[key]:>14,.0f}{on[key]:>14,.0f}{(on[key] - off[key]) / off[key] * 100:>+9.0f}%")
+    print(f"{'hit rate / wrong histories':<30}{'':>14}{on['hit_rate']:>13.1%} / {on['wrong']}")
+    print("=" * 78)
+
+
+if __name__ == "__main__":
+    main()
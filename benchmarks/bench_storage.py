@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""
+Chat storage backends at 1k / 100k / 1M stored messages: bulk load rate,
+history reads (latest 20 messages of a random session), turn writes (user +
+assistant message and a session update) and list_sessions, for the
+previous dict fallback (re-sorts on every read), the memory backend, SQLite
+(WAL file) and, when DYNAMODB_ENDPOINT_URL is set, DynamoDB Local.
+
+    python benchmarks/bench_storage.py --sizes 1000 100000 1000000
+"""
+
+import argparse
+import gc
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta
+
+# Add src directory to path
+sys.path.append('src')
+
+from storage_backends import MemoryBackend, SQLiteBackend, StorageBackend
+
+SAMPLE_MESSAGES = [
+    "I need plasma samples from female subjects",
+    "Only visits 1 and 2 instead",
+    "Here are the matching vials grouped by study: 1,204 plasma vials from 311 female subjects across 6 studies.",
+    "Switch to serum instead",
+    "I've updated the criteria: serum, female, visits 1-2. 842 vials from 207 subjects match.",
+]
+
+
+class LegacyDicts(StorageBackend):
+    """The dict fallback DynamoDBManager used before the backends: sorts on every history read and listing"""
+
+    name = "legacy dicts"
+
+    def __init__(self):
+        self.sessions = {}
+        self.messages = {}
+
+    def create_session(self, item):
+        self.sessions[item['session_id']] = item
+
+    def update_session(self, session_id, fields):
+        if session_id in self.sessions:
+            self.sessions[session_id].update(fields)
+
+    def add_messages(self, session_id, items, updated_at, session_fields=None):
+        self.messages.setdefault(session_id, []).extend(items)
+        if session_id in self.sessions:
+            self.sessions[session_id].update(session_fields or {})
+            self.sessions[session_id]['message_count'] = len(self.messages[session_id])
+
+    def get_history(self, session_id, limit):
+        messages = self.messages.get(session_id, [])
+        messages.sort(key=lambda x: x['timestamp'])
+        return messages[-limit:] if limit > 0 else messages
+
+    def list_sessions(self, limit):
+        sessions = list(self.sessions.values())
+        sessions.sort(key=lambda x: x['updated_at'], reverse=True)
+        return sessions[:limit]
+
+
+def session_item(session_id, timestamp):
+    return {'session_id': session_id, 'created_at': timestamp, 'updated_at': timestamp, 'message_count': 0,
+            'metadata': {'source_ip': '127.0.0.1'}}
+
+
+def message_items(session_id, start, count):
+    return [{
+        'session_id': session_id,
+        'timestamp': (start + timedelta(microseconds=index)).isoformat(timespec='microseconds'),
+        'message_id': str(uuid.uuid4()),
+        'role': 'user' if index % 2 == 0 else 'assistant',
+        'content': SAMPLE_MESSAGES[index % len(SAMPLE_MESSAGES)],
+        'metadata': {'intent_type': 'NEW_QUERY', 'final_agent': 'new_query_agent'},
+    } for index in range(count)]
+
+
+def load(backend, total_messages, per_session, batch_sessions):
+    """Fill the backend; returns (session ids, seconds)"""
+    base = datetime(2024, 1, 1)
+    session_ids = []
+    started = time.perf_counter()
+    for first in range(0, total_messages // per_session, batch_sessions):
+        with backend.transaction():
+            for number in range(first, min(first + batch_sessions, total_messages // per_session)):
+                session_id = f"session-{number:08d}"
+                start = base + timedelta(seconds=number)
+                backend.create_session(session_item(session_id, start.isoformat()))
+                backend.add_messages(session_id, message_items(session_id, start, per_session), start.isoformat())
+                session_ids.append(session_id)
+    return session_ids, time.perf_counter() - started
+
+
+def timed(operation, repeats):
+    timings = []
+    for index in range(repeats):
+        started = time.perf_counter()
+        operation(index)
+        timings.append((time.perf_counter() - started) * 1e6)
+    timings.sort()
+    return statistics.median(timings), timings[int(0.95 * (len(timings) - 1))]
+
+
+def measure(backend, total_messages, per_session, batch_sessions, repeats, seed):
+    session_ids, load_seconds = load(backend, total_messages, per_session, batch_sessions)
+    rng = random.Random(seed)
+    picks = [rng.choice(session_ids) for _ in range(repeats)]
+    now = datetime(2025, 1, 1)
+
+    def write_turn(index):
+        start = now + timedelta(seconds=index)
+        items = message_items(picks[index], start, 2)
+        backend.add_messages(picks[index], items, start.isoformat())
+        backend.update_session(picks[index], {'updated_at': start.isoformat(), 'last_message_at': start.isoformat()})
+
+    history = timed(lambda index: backend.get_history(picks[index], 20), repeats)
+    turn = timed(write_turn, repeats)
+    listing = timed(lambda index: backend.list_sessions(20), max(5, repeats // 20))
+    return {"load_rate": total_messages / load_seconds, "history": history, "turn": turn, "list": listing}
+
+
+def backends(sizes_limit_dynamodb, size, directory):
+    yield "legacy dicts", LegacyDicts
+    yield "memory", MemoryBackend
+    yield "sqlite (WAL)", lambda: SQLiteBackend(os.path.join(directory, f"chat-{size}.sqlite3"))
+    if os.environ.get("DYNAMODB_ENDPOINT_URL") and size <= sizes_limit_dynamodb:
+        def dynamodb():
+            import boto3
+            from storage_backends import DynamoDBBackend
+            resource = boto3.resource("dynamodb", endpoint_url=os.environ["DYNAMODB_ENDPOINT_URL"])
+            names = []
+            for name, keys in (("bench-sessions", [("session_id", "HASH")]),
+                               ("bench-history", [("session_id", "HASH"), ("timestamp", "RANGE")])):
+                table_name = f"{name}-{uuid.uuid4().hex[:8]}"
+                resource.create_table(
+                    TableName=table_name, BillingMode="PAY_PER_REQUEST",
+                    KeySchema=[{"AttributeName": key, "KeyType": kind} for key, kind in keys],
+                    AttributeDefinitions=[{"AttributeName": key, "AttributeType": "S"} for key, _ in keys]).wait_until_exists()
+                names.append(table_name)
+            return DynamoDBBackend(resource, *names)
+        yield "dynamodb local", dynamodb
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Chat storage backend benchmark")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 100000, 1000000], help="Stored messages")
+    parser.add_argument("--per-session", type=int, default=20, help="Messages per session")
+    parser.add_argument("--batch-sessions", type=int, default=500, help="Sessions per load transaction")
+    parser.add_argument("--repeats", type=int, default=500, help="Reads / turn writes per measurement")
+    parser.add_argument("--dynamodb-max", type=int, default=100000, help="Largest size run against DynamoDB Local")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    print("🚀 Chat Storage Backend Benchmark")
+    print("=" * 78)
+    print(f"📦 {args.per_session} messages per session; history reads = latest 20 messages; "
+          f"turn = 2 messages + session update")
+    with tempfile.TemporaryDirectory() as directory:
+        for size in args.sizes:
+            print("-" * 78)
+            print(f"📊 {size:,} messages ({size // args.per_session:,} sessions)")
+            print(f"{'backend':<16}{'load msg/s':>12}{'history p50/p95 µs':>22}{'turn p50/p95 µs':>20}"
+                  f"{'list p50 µs':>13}")
+            for name, factory in backends(args.dynamodb_max, size, directory):
+                backend = factory()
+                result = measure(backend, size, args.per_session, args.batch_sessions, args.repeats, args.seed)
+                extra = ""
+                if isinstance(backend, SQLiteBackend):
+                    extra = f"   {os.path.getsize(backend.path) / 1e6:.1f} MB file"
+                print(f"{name:<16}{result['load_rate']:>12,.0f}"
+                      f"{result['history'][0]:>13,.0f} / {result['history'][1]:<7,.0f}"
+                      f"{result['turn'][0]:>11,.0f} / {result['turn'][1]:<7,.0f}"
+                      f"{result['list'][0]:>12,.0f}{extra}")
+                del backend
+                gc.collect()
+
+            # SQLite data outlives the process: a fresh backend on the same file sees every session
+            reopened = SQLiteBackend(os.path.join(directory, f"chat-{size}.sqlite3"))
+            print(f"💾 sqlite reopened: {reopened.get_status()['sessions_count']:,} sessions persisted")
+    print("=" * 78)
+
+
+if __name__ == "__main__":
+    main()
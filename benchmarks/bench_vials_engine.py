@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Benchmark the embedded VIALS query engine on typical count queries
+Runs entirely locally against synthetic VIALS data
+"""
+
+import argparse
+import statistics
+import sys
+import time
+
+# Add src directory to path
+sys.path.append('src')
+
+from vials.engine import VialsEngine
+from vials.synthetic import generate_rows
+
+TYPICAL_QUERIES = {
+    "pbmc_female_by_study": (
+        "SELECT study_id, COUNT(DISTINCT subject_id), SUM(vials_count) FROM unique_biospecimens "
+        "WHERE specimen_type = ? AND sex = ? GROUP BY study_id",
+        ("PBMC", "Female")
+    ),
+    "serum_visit_arm": (
+        "SELECT study_id, COUNT(DISTINCT subject_id), SUM(vials_count) FROM unique_biospecimens "
+        "WHERE specimen_type = ? AND visit_number = ? AND arm = ? GROUP BY study_id",
+        ("Serum", "01", "Arm 4: Placebo")
+    ),
+    "one_study_min_vials": (
+        "SELECT COUNT(DISTINCT subject_id), SUM(vials_count) FROM unique_biospecimens "
+        "WHERE study_id = ? AND vials_count >= ?",
+        ("DMID-12-0003", 3)
+    ),
+    "dedup_cte_raw_vials": (
+        "WITH unique_biospecimens AS (SELECT DISTINCT v.study_id, v.subject_id, v.visit_number, "
+        "v.vials_count, v.biospecimen_ids FROM VIALS v WHERE v.specimen_type = ? AND v.age >= ? "
+        "GROUP BY v.study_id, v.subject_id, v.visit_number, v.vials_count, v.biospecimen_ids) "
+        "SELECT study_id, COUNT(DISTINCT subject_id), SUM(vials_count) FROM unique_biospecimens GROUP BY study_id",
+        ("Plasma", 50)
+    ),
+    "date_window": (
+        "SELECT COUNT(DISTINCT subject_id), SUM(vials_count) FROM unique_biospecimens "
+        "WHERE STR_TO_DATE(collection_date, '%d-%b-%y') BETWEEN ? AND ?",
+        ("2019-01-01", "2020-06-30")
+    ),
+    "date_window_epoch_day": (
+        "SELECT COUNT(DISTINCT subject_id), SUM(vials_count) FROM unique_biospecimens "
+        "WHERE collection_day BETWEEN EPOCH_DAY(?) AND EPOCH_DAY(?)",
+        ("2019-01-01", "2020-06-30")
+    ),
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="VIALS engine count-query benchmark")
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--repeats", type=int, default=20)
+    args = parser.parse_args()
+
+    print("🚀 VIALS Engine Benchmark")
+    print("=" * 70)
+    engine = VialsEngine()
+    start = time.perf_counter()
+    engine.load_rows(generate_rows(args.rows))
+    loaded = time.perf_counter()
+    engine.finalize()
+    finalized = time.perf_counter()
+    print(f"📦 Rows: {engine.row_count}  load: {loaded - start:.2f}s  indexes+dedup table: {finalized - loaded:.2f}s")
+    print("-" * 70)
+    print(f"{'query':<24}{'p50 ms':>12}{'p95 ms':>12}{'rows':>8}")
+    for name, (sql, params) in TYPICAL_QUERIES.items():
+        timings = []
+        for _ in range(args.repeats):
+            t0 = time.perf_counter()
+            result = engine.query(sql, params)
+            timings.append((time.perf_counter() - t0) * 1000)
+        timings.sort()
+        p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+        print(f"{name:<24}{statistics.median(timings):>12.2f}{p95:>12.2f}{result['row_count']:>8}")
+    print("=" * 70)
+
+
+if __name__ == "__main__":
+    main()
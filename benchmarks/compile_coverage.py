@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""
+Report what fraction of recorded organize states compile to SQL without the LLM
+
+Input is JSONL with one organize state per line, either bare or wrapped as
+{"organize_state": {...}} (the ("query", "history") store records).
+"""
+
+import argparse
+import json
+import sys
+from collections import Counter
+
+# Add src directory to path
+sys.path.append('src')
+
+from vials.compiler import compile_organize_state
+
+
+def load_states(path):
+    with open(path, encoding="utf-8") as handle:
+        for line in handle:
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            yield record.get("organize_state", record)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Organize-state compiler coverage report")
+    parser.add_argument("path", nargs="?", default="benchmarks/data/organize_states.jsonl")
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+
+    total = compiled = 0
+    unhandled_fields = Counter()
+    for state in load_states(args.path):
+        total += 1
+        result = compile_organize_state(state)
+        if result.fully_compiled and result.handled:
+            compiled += 1
+        unhandled_fields.update(result.unhandled)
+        if args.verbose:
+            status = "✅" if result.fully_compiled else "🤖"
+            print(f"{status} handled={result.handled} unhandled={result.unhandled}")
+
+    print("📊 Compiler Coverage")
+    print("=" * 50)
+    print(f"Recorded queries:        {total}")
+    print(f"Compiled without LLM:    {compiled} ({compiled / max(total, 1):.0%})")
+    print(f"Needing LLM SQL agent:   {total - compiled}")
+    if unhandled_fields:
+        print("Most common unhandled fields:")
+        for field, count in unhandled_fields.most_common(10):
+            print(f"   {field}: {count}")
+
+
+if __name__ == "__main__":
+    main()
@@ -5,8 +5,14 @@ Check DynamoDB data directly
 
 import boto3
 import json
+import sys
 from datetime import datetime
 
+# Add src directory to path
+sys.path.append('src')
+
+from history_format import decode_messages
+
 def check_dynamodb_data():
     """Check data in DynamoDB tables"""
     session = boto3.Session()
@@ -30,7 +36,8 @@ def check_dynamodb_data():
     response = history_table.scan(Limit=10)
     
     print(f"✅ Found {response['Count']} messages:")
-    for item in response['Items']:
+    # Compact (v2) items are expanded back to role/content
+    for item in decode_messages(response['Items']):
         print(f"   Session: {item['session_id']}")
         print(f"   Role: {item['role']}")
         print(f"   Content: {item['content'][:50]}...")
@@ -1,16 +1,28 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, Header, HTTPException, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from starlette.concurrency import run_in_threadpool
 from pydantic import BaseModel
 from typing import List, Tuple, Optional, Dict, Any
 import json
 import os
 import sys
+import time
 
 # Add src directory to path
 sys.path.append('src')
 
 from agent import ChatAgent
 from dynamodb_manager import db_manager
+from idempotency import IdempotencyConflict, chat_request_key, idempotency_store
+from langgraph_workflow_optimized import models, speculator
+from metrics import metrics
+from responses import (delta_etag, encode_body, etag_matches, get_status as response_status, session_etag,
+                       sessions_etag, since_timestamp)
+from result_cache import result_cache
+from vials.refinement import refinement_store
+
+# dev: single uvicorn process with auto-reload; prod: pre-forked workers (prefork_server.py)
+SERVER_MODE = os.environ.get("SERVER_MODE", "dev").lower()
 
 app = FastAPI(title="AI Chat Assistant - Local Dev", version="1.0.0")
 
@@ -21,12 +33,14 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag"],
 )
 
 # Request models
 class ChatRequest(BaseModel):
     message: str
     session_id: Optional[str] = None
+    idempotency_key: Optional[str] = None
 
 class SessionResponse(BaseModel):
     session_id: str
@@ -54,7 +68,7 @@ class ChatResponse(BaseModel):
 # Initialize agent with LangGraph workflow
 try:
     print("🚀 Initializing LangGraph Agent...")
-    agent = ChatAgent()
+    agent = ChatAgent(session_store=db_manager)
     print("✅ LangGraph Agent initialized successfully")
 except Exception as e:
     print(f"❌ Error initializing LangGraph agent: {e}")
@@ -62,13 +76,29 @@ except Exception as e:
     traceback.print_exc()
     agent = None
 
+def api_response(request: Request, payload: Any, status_code: int = 200, etag: Optional[str] = None) -> Response:
+    """JSON through the response layer shared with lambda_function (DynamoDB types, gzip/br per Accept-Encoding)"""
+    body, encoding = encode_body(payload, request.headers.get("accept-encoding"))
+    headers = {"Vary": "Accept-Encoding"}
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    if etag:
+        headers.update({"ETag": etag, "Cache-Control": "no-cache"})
+    return Response(content=body, status_code=status_code, media_type="application/json", headers=headers)
+
+def not_modified(request: Request, etag: str) -> Optional[Response]:
+    """304 when the client's If-None-Match still matches"""
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "no-cache", "Vary": "Accept-Encoding"})
+    return None
+
 @app.get("/")
 async def root():
     """Health check endpoint"""
     return {"message": "AI Chat Assistant Local Server is running!", "status": "healthy"}
 
 @app.post("/chat", response_model=ChatResponse)
-async def chat(request: ChatRequest):
+async def chat(request: ChatRequest, http_response: Response, idempotency_key: Optional[str] = Header(None)):
     """Chat endpoint - simulate Lambda function functionality with DynamoDB integration"""
     if not agent:
         raise HTTPException(status_code=500, detail="Agent not initialized")
@@ -76,112 +106,132 @@ async def chat(request: ChatRequest):
     try:
         print(f"📨 Received chat request: {request.message}")
         
-        # Get or create session ID
-        session_id = request.session_id
-        if not session_id:
-            # Create new session
-            session_id = db_manager.create_session(metadata={
-                'user_agent': 'local_development',
-                'source_ip': '127.0.0.1'
-            })
-            print(f"🆕 Created new session: {session_id}")
-        else:
-            print(f"🔄 Using existing session: {session_id}")
-        
-        # Get chat history from DynamoDB
-        chat_history_messages = db_manager.get_chat_history(session_id, limit=20)
-        print(f"📚 Loaded {len(chat_history_messages)} messages from session {session_id}")
-        
-        # Debug: Print recent messages
-        for i, msg in enumerate(chat_history_messages[-5:]):  # Show last 5 messages
-            print(f"   Message {i+1}: {msg['role']} - {msg['content'][:50]}...")
-        
-        # Convert to format expected by agent
-        chat_history = []
-        for msg in chat_history_messages:
-            if msg['role'] == 'user':
-                chat_history.append(('human', msg['content']))
-            elif msg['role'] == 'assistant':
-                chat_history.append(('assistant', msg['content']))
-        
-        print(f"🔄 Converted {len(chat_history)} messages for agent")
-        
-        # Call agent to process request
-        print("🔄 Calling ChatAgent.query...")
-        response, workflow_info = agent.query_with_path(request.message, chat_history, session_id)
-        print(f"✅ ChatAgent response: {response[:100]}...")
-        
-        # Save user message to DynamoDB
-        db_manager.add_chat_message(
-            session_id=session_id,
-            role='user',
-            content=request.message,
-            metadata={
-                'workflow_path': workflow_info.get('path', []),
-                'intent_type': workflow_info.get('intent_type'),
-                'final_agent': workflow_info.get('final_agent')
-            }
-        )
+        def run_turn():
+            """One chat turn: history, agent, persistence; returns the response fields"""
+            # Get or create session ID
+            session_id = request.session_id
+            if not session_id:
+                # Create new session
+                session_id = db_manager.create_session(metadata={
+                    'user_agent': 'local_development',
+                    'source_ip': '127.0.0.1'
+                })
+                print(f"🆕 Created new session: {session_id}")
+            else:
+                print(f"🔄 Using existing session: {session_id}")
         
-        # Save assistant response to DynamoDB
-        db_manager.add_chat_message(
-            session_id=session_id,
-            role='assistant',
-            content=response,
-            metadata={
+            # Get chat history from DynamoDB
+            chat_history_messages = db_manager.get_chat_history(session_id, limit=20)
+            print(f"📚 Loaded {len(chat_history_messages)} messages from session {session_id}")
+        
+            # Debug: Print recent messages
+            for i, msg in enumerate(chat_history_messages[-5:]):  # Show last 5 messages
+                print(f"   Message {i+1}: {msg['role']} - {msg['content'][:50]}...")
+        
+            # Convert to format expected by agent
+            chat_history = []
+            for msg in chat_history_messages:
+                if msg['role'] == 'user':
+                    chat_history.append(('human', msg['content']))
+                elif msg['role'] == 'assistant':
+                    chat_history.append(('assistant', msg['content']))
+        
+            print(f"🔄 Converted {len(chat_history)} messages for agent")
+        
+            # Call agent to process request
+            print("🔄 Calling ChatAgent.query...")
+            started = time.perf_counter()
+            response, workflow_info = agent.query_with_path(request.message, chat_history, session_id)
+            duration_ms = (time.perf_counter() - started) * 1000
+            print(f"✅ ChatAgent response: {response[:100]}...")
+        
+            # Save the exchange and the session's latest activity in one write
+            turn_metadata = {
                 'workflow_path': workflow_info.get('path', []),
                 'intent_type': workflow_info.get('intent_type'),
                 'final_agent': workflow_info.get('final_agent')
             }
-        )
+            # The organize state goes with the session so the next turn continues it in any worker
+            session_fields = {'last_message_at': workflow_info.get('timestamp')}
+            if workflow_info.get('organize_state'):
+                session_fields['organize_state'] = workflow_info['organize_state']
+            db_manager.add_chat_turn(session_id, request.message, response, turn_metadata, duration_ms=duration_ms,
+                                     **session_fields)
         
-        # Update session with latest activity
-        db_manager.update_session(session_id, last_message_at=workflow_info.get('timestamp'))
-        
-        return ChatResponse(
-            response=response,
-            session_id=session_id,
-            workflow_path=workflow_info.get("path", []),
-            intent_type=workflow_info.get("intent_type"),
-            final_agent=workflow_info.get("final_agent")
+            return {
+                "response": response,
+                "session_id": session_id,
+                "workflow_path": workflow_info.get("path", []),
+                "intent_type": workflow_info.get("intent_type"),
+                "final_agent": workflow_info.get("final_agent")
+            }
+
+        # Duplicate submissions (double-clicks, client retries) share one execution and its stored response
+        key = chat_request_key(request.session_id, request.message, request.idempotency_key or idempotency_key)
+        # The graph blocks for seconds; run it on the worker's threadpool so the event loop keeps serving
+        result, outcome = await run_in_threadpool(
+            idempotency_store.execute, key, run_turn,
+            cacheable=lambda result: result.get("intent_type") not in ("ERROR", "UNAVAILABLE")
         )
+        if outcome != "executed":
+            http_response.headers["Idempotent-Replayed"] = "true"
+        return ChatResponse(**result)
         
+    except IdempotencyConflict as e:
+        raise HTTPException(status_code=409, detail=str(e), headers={"Retry-After": str(int(e.retry_after))})
     except Exception as e:
         print(f"❌ Error processing chat request: {e}")
         import traceback
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=f"Error processing request: {str(e)}")
 
+# Handlers that only do blocking storage I/O are plain defs: FastAPI runs them in its threadpool, off the event loop
 @app.get("/sessions")
-async def list_sessions(limit: int = 20):
+def list_sessions(request: Request, limit: int = 20):
     """List all sessions"""
     try:
         sessions = db_manager.list_sessions(limit=limit)
-        return {
+        tag = sessions_etag(sessions, limit)
+        return not_modified(request, tag) or api_response(request, {
             "sessions": sessions,
             "count": len(sessions)
-        }
+        }, etag=tag)
     except Exception as e:
         print(f"Error listing sessions: {e}")
         raise HTTPException(status_code=500, detail=f"Error listing sessions: {str(e)}")
 
 @app.get("/sessions/{session_id}")
-async def get_session(session_id: str, limit: int = 50):
-    """Get session details and history"""
+def get_session(request: Request, session_id: str, limit: int = 50, since: Optional[str] = None):
+    """Get session details and history (only the messages after `since` when given)"""
     try:
         # Get session details
         session = db_manager.get_session(session_id)
         if not session:
             raise HTTPException(status_code=404, detail="Session not found")
         
+        try:
+            since = since_timestamp(since)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="since must be an ISO timestamp")
+        
+        # Unchanged since the client's copy: answered from the session item, no history read
+        tag = session_etag(session, limit, since)
+        unchanged = not_modified(request, tag)
+        if unchanged:
+            return unchanged
+        
         # Get chat history
-        chat_history = db_manager.get_chat_history(session_id, limit=limit)
+        chat_history = db_manager.get_chat_history(session_id, limit=limit, since=since)
         
-        return {
+        body = {
             "session": session,
             "chat_history": chat_history,
             "message_count": len(chat_history)
         }
+        if since:
+            body["since"] = since
+            tag = delta_etag(session, limit, since, chat_history)
+        return api_response(request, body, etag=tag)
     except HTTPException:
         raise
     except Exception as e:
@@ -189,7 +239,7 @@ async def get_session(session_id: str, limit: int = 50):
         raise HTTPException(status_code=500, detail=f"Error getting session: {str(e)}")
 
 @app.delete("/sessions/{session_id}")
-async def delete_session(session_id: str):
+def delete_session(session_id: str):
     """Delete session and all messages"""
     try:
         # Check if session exists
@@ -199,6 +249,8 @@ async def delete_session(session_id: str):
         
         # Delete session and all messages
         db_manager.delete_session(session_id)
+        if agent:
+            agent.forget_session(session_id)
         
         return {
             "message": "Session deleted successfully",
@@ -210,23 +262,56 @@ async def delete_session(session_id: str):
         print(f"Error deleting session: {e}")
         raise HTTPException(status_code=500, detail=f"Error deleting session: {str(e)}")
 
+@app.post("/sessions/{session_id}/restore")
+async def restore_session(request: Request, session_id: str):
+    """Rehydrate an archived session"""
+    try:
+        session = await run_in_threadpool(db_manager.restore_session, session_id)
+        if not session:
+            raise HTTPException(status_code=404, detail="Session not found in the archive")
+        if agent:
+            agent.forget_session(session_id)
+        
+        return api_response(request, {
+            "message": "Session restored",
+            "session": session
+        })
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Error restoring session: {e}")
+        raise HTTPException(status_code=500, detail=f"Error restoring session: {str(e)}")
+
 @app.get("/health")
-async def health_check():
+def health_check(request: Request):
     """Health check"""
     db_status = db_manager.get_status()
-    return {
+    return api_response(request, {
         "status": "healthy",
         "agent_status": "initialized" if agent else "error",
         "environment": "local_development",
-        "dynamodb_status": db_status
-    }
+        "server_mode": SERVER_MODE,
+        "worker_pid": os.getpid(),
+        "dynamodb_status": db_status,
+        "result_cache": result_cache.get_status(),
+        "refinement_store": refinement_store.get_status(),
+        "idempotency": idempotency_store.get_status(),
+        "models": models.get_status(),
+        "speculation": speculator.get_status() if speculator else None,
+        "responses": response_status(),
+        "metrics": metrics.snapshot()
+    })
 
 if __name__ == "__main__":
-    import uvicorn
-    print("🚀 Starting AI Chat Assistant Local Server with LangGraph and DynamoDB...")
-    print("📍 API will be available at: http://localhost:5000")
-    print("📖 API documentation at: http://localhost:5000/docs")
-    print("🔗 Frontend should connect to: http://localhost:5000/chat")
-    print("🗄️ DynamoDB tables: ai-chat-session-dev, ai-chat-history-dev")
-    
-    uvicorn.run("local_server:app", host="0.0.0.0", port=5000, reload=True) 
\ No newline at end of file
+    if SERVER_MODE == "prod":
+        import prefork_server
+        prefork_server.run(app)
+    else:
+        import uvicorn
+        print("🚀 Starting AI Chat Assistant Local Server with LangGraph and DynamoDB...")
+        print("📍 API will be available at: http://localhost:5000")
+        print("📖 API documentation at: http://localhost:5000/docs")
+        print("🔗 Frontend should connect to: http://localhost:5000/chat")
+        print("🗄️ DynamoDB tables: ai-chat-session-dev, ai-chat-history-dev")
+        
+        uvicorn.run("local_server:app", host="0.0.0.0", port=5000, reload=True)
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+Long-running server mode for local_server: pre-forked gunicorn + uvicorn workers
+
+The master imports local_server (agent, compiled LangGraph workflow), loads
+the VIALS engine and freezes the GC before forking, so every worker shares
+those pages copy-on-write instead of rebuilding them. After the fork each
+worker drops the boto3 clients inherited from the master and opens its own
+connection pools, shared by all request threads in that worker. SIGTERM
+stops accepting connections and drains in-flight chats for up to
+SERVER_GRACEFUL_TIMEOUT seconds before workers are killed.
+
+Selected with SERVER_MODE=prod (see local_server.py); settings come from
+SERVER_* environment variables (see ServerSettings.from_env).
+"""
+
+import gc
+import os
+import sys
+import time
+from typing import Any, Dict, NamedTuple
+
+# Add src directory to path
+sys.path.append('src')
+
+try:
+    from gunicorn.app.base import BaseApplication
+except ImportError:
+    BaseApplication = None
+
+
+class ServerSettings(NamedTuple):
+    host: str = "0.0.0.0"
+    port: int = 5000
+    workers: int = 4
+    graceful_timeout: int = 30
+    timeout: int = 60
+    keepalive: int = 5
+    backlog: int = 2048
+    max_requests: int = 0
+
+    @classmethod
+    def from_env(cls) -> "ServerSettings":
+        """Defaults overridden by SERVER_<FIELD> (e.g. SERVER_WORKERS=8, SERVER_PORT=8080)"""
+        values = {}
+        for field, default in cls._field_defaults.items():
+            raw = os.environ.get(f"SERVER_{field.upper()}")
+            if raw:
+                values[field] = type(default)(raw)
+        return cls(**values)
+
+    def gunicorn_options(self) -> Dict[str, Any]:
+        return {
+            "bind": f"{self.host}:{self.port}",
+            "workers": self.workers,
+            "worker_class": "uvicorn.workers.UvicornWorker",
+            "preload_app": True,
+            "graceful_timeout": self.graceful_timeout,
+            "timeout": self.timeout,
+            "keepalive": self.keepalive,
+            "backlog": self.backlog,
+            "max_requests": self.max_requests,
+            "max_requests_jitter": self.max_requests // 10,
+            "post_fork": post_fork,
+            "worker_int": worker_int,
+            "worker_exit": worker_exit,
+        }
+
+
+def warm_up():
+    """Load everything workers can share before forking, then move it out of the GC's reach"""
+    from vials.engine import get_engine
+
+    started = time.perf_counter()
+    engine = get_engine()
+    if engine is not None:
+        print(f"📦 VIALS engine preloaded: {engine.row_count} rows")
+    gc.collect()
+    # Objects allocated so far are never scanned again, so collections in workers do not touch (copy) their pages
+    gc.freeze()
+    print(f"🧊 Preloaded in {(time.perf_counter() - started) * 1000:.0f} ms; {gc.get_freeze_count()} objects frozen")
+
+
+def reset_worker_state():
+    """Per-worker connection pools and metrics; nothing socket-backed may be shared across the fork"""
+    from bedrock_client import reset_clients
+    from dynamodb_manager import db_manager
+    from idempotency import idempotency_store
+    from langgraph_workflow_optimized import models
+    from metrics import metrics
+    from result_cache import result_cache
+
+    reset_clients()
+    models.reset()
+    db_manager.reconnect()
+    result_cache.reset_connections()
+    idempotency_store.reset_connections()
+    metrics.reset()
+
+
+def post_fork(server, worker):
+    reset_worker_state()
+    print(f"👷 Worker {worker.pid} ready")
+
+
+def worker_int(worker):
+    print(f"🛑 Worker {worker.pid} interrupted")
+
+
+def worker_exit(server, worker):
+    print(f"👋 Worker {worker.pid} drained and exited")
+
+
+if BaseApplication is not None:
+    class PreforkApplication(BaseApplication):
+        """gunicorn application serving an already imported (preloaded) ASGI app"""
+
+        def __init__(self, app, options: Dict[str, Any]):
+            self.application = app
+            self.options = options
+            super().__init__()
+
+        def load_config(self):
+            for key, value in self.options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            return self.application
+
+
+def run(app, settings: ServerSettings = None):
+    """Serve `app` with pre-forked workers until SIGTERM/SIGINT"""
+    if BaseApplication is None:
+        raise SystemExit("❌ SERVER_MODE=prod needs gunicorn: pip install -r requirements-dev.txt")
+    settings = settings or ServerSettings.from_env()
+
+    from dynamodb_manager import db_manager
+    if not db_manager.backend.shared and settings.workers > 1:
+        print(f"⚠️ Chat storage is in-memory: each of the {settings.workers} workers keeps its own sessions, "
+              "so a session only resolves on the worker that created it. "
+              "Use STORAGE_BACKEND=sqlite or DynamoDB for shared sessions.")
+
+    warm_up()
+    print(f"🚀 Serving on {settings.host}:{settings.port} with {settings.workers} pre-forked worker(s), "
+          f"graceful drain {settings.graceful_timeout}s")
+    PreforkApplication(app, settings.gunicorn_options()).run()
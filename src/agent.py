@@ -3,15 +3,58 @@ import os
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 from langgraph_workflow_optimized import graph
 from langchain_core.messages import HumanMessage, AIMessage
-from typing import List, Tuple, Any
+from bedrock_client import BedrockUnavailableError
+from vials.refinement import refinement_store
+from collections import OrderedDict
+from typing import List, Tuple, Any, Optional
+import copy
+import json
+import threading
 import uuid
 
 class ChatAgent:
     """Chat agent using LangGraph workflow"""
     
-    def __init__(self):
+    def __init__(self, session_store=None):
         self.graph = graph
         self.session_threads = {}  # Store thread_id for each session
+        # The organize state carried into a session's next turn is saved with the session (`organize_state`,
+        # JSON) so any container continues it; this LRU of (JSON, parsed state) only saves re-parsing
+        self.session_store = session_store
+        self.session_organize = OrderedDict()
+        self.max_sessions = refinement_store.max_sessions
+        self.lock = threading.Lock()
+    
+    def get_organize(self, session_id: str) -> Optional[dict]:
+        """The session's latest organize state, as stored with the session (the LRU alone without a store)"""
+        stored = None
+        if self.session_store is not None:
+            session = self.session_store.get_session(session_id)
+            stored = session.get("organize_state") if session else None
+            if not stored:
+                return None
+        with self.lock:
+            cached = self.session_organize.get(session_id)
+            if cached is not None and (stored is None or cached[0] == stored):
+                self.session_organize.move_to_end(session_id)
+                return cached[1]
+        organize = json.loads(stored)
+        self.remember_organize(session_id, stored, organize)
+        return organize
+
+    def remember_organize(self, session_id: str, stored: str, organize: dict):
+        with self.lock:
+            self.session_organize[session_id] = (stored, organize)
+            self.session_organize.move_to_end(session_id)
+            while len(self.session_organize) > self.max_sessions:
+                self.session_organize.popitem(last=False)
+
+    def forget_session(self, session_id: str):
+        """Drop the state carried between a session's turns (on delete, or when it is restored from the archive)"""
+        with self.lock:
+            self.session_organize.pop(session_id, None)
+            self.session_threads.pop(session_id, None)
+        refinement_store.forget(session_id)
     
     def query(self, user_input: str, chat_history: List[Tuple[str, str]] = None) -> str:
         """Query the agent with user input using LangGraph workflow"""
@@ -73,6 +116,9 @@ class ChatAgent:
             print("⚠️ No valid response found in result")
             return "I'm sorry, I couldn't generate a response. Please try again."
             
+        except BedrockUnavailableError as e:
+            print(f"⚠️ Bedrock unavailable in ChatAgent.query: {str(e)}")
+            return e.user_message
         except Exception as e:
             print(f"❌ Error in ChatAgent.query: {str(e)}")
             import traceback
@@ -96,17 +142,19 @@ class ChatAgent:
             # Add current user input
             messages.append(HumanMessage(content=user_input))
             
-            # Initialize state
+            # Initialize state, continuing from the session's previous organize state
+            organize = self.get_organize(session_id) if session_id else None
             state = {
                 "messages": messages,
                 "next": None,
                 "message_type": None,
                 "short_mem": {"user_queries": [], "system_resps": []},
-                "organize": {
+                "organize": copy.deepcopy(organize) if organize else {
                     "conditions": [],
                     "filters": [],
                     "query_type": None
-                }
+                },
+                "session_id": session_id
             }
             
             print(f"🚀 Starting LangGraph workflow with path tracking...")
@@ -139,6 +187,11 @@ class ChatAgent:
             )
             
             print(f"✅ LangGraph workflow completed")
+            organize_state = None
+            if session_id and result.get("organize"):
+                # Saved with the turn by the caller (session field `organize_state`)
+                organize_state = json.dumps(result["organize"], default=str)
+                self.remember_organize(session_id, organize_state, result["organize"])
             
             # Extract the response from the final message
             response = "I'm sorry, I couldn't generate a response. Please try again."
@@ -153,11 +206,15 @@ class ChatAgent:
                 "path": workflow_path,
                 "intent_type": result.get("message_type"),
                 "final_agent": result.get("next"),
-                "final_state": result
+                "final_state": result,
+                "organize_state": organize_state
             }
             
             return response, workflow_info
             
+        except BedrockUnavailableError as e:
+            print(f"⚠️ Bedrock unavailable in ChatAgent.query_with_path: {str(e)}")
+            return e.user_message, {"path": [], "intent_type": "UNAVAILABLE", "final_agent": None}
         except Exception as e:
             print(f"❌ Error in ChatAgent.query_with_path: {str(e)}")
             import traceback
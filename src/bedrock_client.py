@@ -0,0 +1,363 @@
+"""
+Managed Bedrock runtime client shared by every ChatBedrock in the process
+
+- botocore: tuned connection pool, connect/read timeouts, adaptive retry mode
+- admission: client-side token bucket (AIMD) that halves its rate on every
+  ThrottlingException and creeps back up on successes, so a burst queues
+  briefly in-process instead of cascading into server-side throttles
+- retries: full-jitter exponential backoff, bounded by a per-call deadline
+  and by the request's deadline (request_deadline), which the Lambda handler
+  derives from the invocation's remaining time so every LLM call of a turn
+  shares one budget; an attempt only starts on a client whose read timeout
+  fits what is left (shorter-timeout clients are opened on demand)
+- circuit breaker: after consecutive throttles/outages it fails fast with a
+  friendly message (BedrockUnavailableError.user_message) and lets one probe
+  call through per cooldown
+
+Settings come from BEDROCK_* environment variables (see BedrockSettings.from_env).
+"""
+
+import contextlib
+import contextvars
+import functools
+import os
+import random
+import threading
+import time
+from typing import Any, Callable, Dict, Iterator, NamedTuple, Optional
+
+import boto3
+from botocore.config import Config
+from botocore.exceptions import ClientError, ConnectionError as BotoConnectionError, ReadTimeoutError
+
+from metrics import metrics
+
+# Error codes that mean "slow down": the token bucket backs off
+THROTTLE_CODES = {"ThrottlingException", "TooManyRequestsException", "ServiceQuotaExceededException"}
+
+# Error codes worth retrying that are not throttles
+TRANSIENT_CODES = {"ServiceUnavailableException", "InternalServerException", "ModelNotReadyException",
+                   "ModelTimeoutException"}
+
+# Operations routed through admission, retries and the breaker
+GUARDED_OPERATIONS = ("invoke_model", "invoke_model_with_response_stream", "converse", "converse_stream")
+
+
+class BedrockSettings(NamedTuple):
+    region: str = "us-east-1"
+    max_pool_connections: int = 50
+    connect_timeout: float = 2.0
+    read_timeout: float = 20.0
+    min_read_timeout: float = 2.0
+    sdk_max_attempts: int = 1
+    max_retries: int = 2
+    call_deadline: float = 25.0
+    response_reserve: float = 3.0
+    rate: float = 10.0
+    burst: int = 10
+    min_rate: float = 0.5
+    backoff_base: float = 0.25
+    backoff_cap: float = 4.0
+    breaker_failures: int = 5
+    breaker_cooldown: float = 20.0
+
+    @classmethod
+    def from_env(cls) -> "BedrockSettings":
+        """Defaults overridden by BEDROCK_<FIELD> (e.g. BEDROCK_RATE=20, BEDROCK_CALL_DEADLINE=12)"""
+        values = {}
+        for field, default in cls._field_defaults.items():
+            raw = os.environ.get(f"BEDROCK_{field.upper()}")
+            if raw:
+                values[field] = type(default)(raw)
+        return cls(**values)
+
+    def botocore_config(self) -> Config:
+        return Config(
+            max_pool_connections=self.max_pool_connections,
+            connect_timeout=self.connect_timeout,
+            read_timeout=self.read_timeout,
+            retries={"mode": "adaptive", "max_attempts": self.sdk_max_attempts},
+            tcp_keepalive=True,
+        )
+
+
+# time.monotonic() by which the current request's Bedrock calls must finish (None outside request_deadline)
+_request_deadline: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar("bedrock_request_deadline",
+                                                                                   default=None)
+
+
+@contextlib.contextmanager
+def request_deadline(seconds: Optional[float]) -> Iterator[None]:
+    """Bound every guarded call made in this block (and in graph nodes it runs) by `seconds` from now"""
+    token = _request_deadline.set(None if seconds is None else time.monotonic() + seconds)
+    try:
+        yield
+    finally:
+        _request_deadline.reset(token)
+
+
+def remaining_budget() -> Optional[float]:
+    """Seconds left before the current request's deadline (None outside request_deadline)"""
+    deadline = _request_deadline.get()
+    return None if deadline is None else max(0.0, deadline - time.monotonic())
+
+
+def lambda_budget(context: Any, settings: Optional[BedrockSettings] = None) -> Optional[float]:
+    """Seconds a Lambda invocation can spend on Bedrock: its remaining time less response_reserve"""
+    if context is None or not hasattr(context, "get_remaining_time_in_millis"):
+        return None
+    settings = settings or BedrockSettings.from_env()
+    return max(0.0, context.get_remaining_time_in_millis() / 1000 - settings.response_reserve)
+
+
+class BedrockUnavailableError(RuntimeError):
+    """Bedrock is throttling or down and the call was shed; user_message is safe to show"""
+
+    user_message = ("The assistant is receiving more requests than it can handle right now. "
+                    "Please try again in a few seconds.")
+
+    def __init__(self, reason: str, retry_after: Optional[float] = None):
+        super().__init__(reason)
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """Client-side request admission: `rate` tokens/s up to `burst`, halved on throttles (AIMD)"""
+
+    def __init__(self, rate: float, burst: int, min_rate: float = 0.5, clock: Callable[[], float] = time.monotonic,
+                 sleep: Callable[[float], None] = time.sleep):
+        self.max_rate = rate
+        self.rate = rate
+        self.burst = burst
+        self.min_rate = min_rate
+        self.tokens = float(burst)
+        self.clock = clock
+        self.sleep = sleep
+        self.updated = clock()
+        self.lock = threading.Lock()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, timeout: float) -> bool:
+        """Take one token, waiting at most `timeout` seconds; False when the wait would exceed it"""
+        deadline = self.clock() + timeout
+        while True:
+            with self.lock:
+                now = self.clock()
+                self._refill(now)
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return True
+                wait = (1 - self.tokens) / self.rate
+            if now + wait > deadline:
+                return False
+            self.sleep(wait)
+
+    def on_throttle(self):
+        """Multiplicative decrease, and drop any saved-up burst"""
+        with self.lock:
+            self.rate = max(self.min_rate, self.rate / 2)
+            self.tokens = min(self.tokens, 0.0)
+        metrics.increment("bedrock.bucket.backoffs")
+
+    def on_success(self):
+        """Additive increase back towards the configured rate"""
+        with self.lock:
+            self.rate = min(self.max_rate, self.rate + self.max_rate / 20)
+
+
+class CircuitBreaker:
+    """closed -> open after `failure_threshold` consecutive failures -> half_open probe after `cooldown`"""
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, failure_threshold: int, cooldown: float, clock: Callable[[], float] = time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.clock = clock
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probe_in_flight = False
+        self.lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """Whether a call may proceed (one probe at a time once the cooldown has elapsed)"""
+        with self.lock:
+            if self.state == self.OPEN and self.clock() - self.opened_at >= self.cooldown:
+                self.state = self.HALF_OPEN
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.HALF_OPEN and not self.probe_in_flight:
+                self.probe_in_flight = True
+                return True
+            return False
+
+    def retry_after(self) -> float:
+        with self.lock:
+            return max(0.0, self.cooldown - (self.clock() - self.opened_at))
+
+    def release(self):
+        """The allowed call ended without a verdict on Bedrock health (e.g. a validation error)"""
+        with self.lock:
+            self.probe_in_flight = False
+
+    def record_success(self):
+        with self.lock:
+            if self.state != self.CLOSED:
+                print("✅ Bedrock circuit breaker closed")
+            self.state = self.CLOSED
+            self.failures = 0
+            self.probe_in_flight = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            self.probe_in_flight = False
+            if self.state == self.HALF_OPEN or (self.state == self.CLOSED and self.failures >= self.failure_threshold):
+                self.state = self.OPEN
+                self.opened_at = self.clock()
+                metrics.increment("bedrock.breaker.opened")
+                print(f"⚠️ Bedrock circuit breaker opened after {self.failures} consecutive failures")
+
+    def get_status(self) -> Dict[str, Any]:
+        with self.lock:
+            return {"state": self.state, "consecutive_failures": self.failures}
+
+
+def classify_error(error: Exception) -> Optional[str]:
+    """'throttle', 'transient' or None (not retryable, e.g. a validation error)"""
+    if isinstance(error, ClientError):
+        code = error.response.get("Error", {}).get("Code", "")
+        if code in THROTTLE_CODES:
+            return "throttle"
+        if code in TRANSIENT_CODES:
+            return "transient"
+        return None
+    if isinstance(error, (ReadTimeoutError, BotoConnectionError)):
+        return "transient"
+    return None
+
+
+class GuardedBedrockClient:
+    """
+    Wraps a bedrock-runtime client (or a stub with the same methods): guarded
+    operations go through the token bucket, the breaker and deadline-bounded
+    jittered retries; every other attribute is passed through.
+    """
+
+    def __init__(self, client: Any, settings: BedrockSettings, bucket: Optional[TokenBucket] = None,
+                 breaker: Optional[CircuitBreaker] = None, sleep: Callable[[float], None] = time.sleep,
+                 client_for_timeout: Optional[Callable[[float], Any]] = None):
+        self.client = client
+        self.client_for_timeout = client_for_timeout
+        self.settings = settings
+        self.bucket = bucket or TokenBucket(settings.rate, settings.burst, settings.min_rate)
+        self.breaker = breaker or CircuitBreaker(settings.breaker_failures, settings.breaker_cooldown)
+        self.sleep = sleep
+        self.random = random.Random()
+
+    def __getattr__(self, name: str):
+        if name in GUARDED_OPERATIONS:
+            return functools.partial(self.call, name)
+        return getattr(self.client, name)
+
+    def backoff(self, attempt: int) -> float:
+        """Full jitter: uniform(0, min(cap, base * 2^attempt))"""
+        return self.random.uniform(0, min(self.settings.backoff_cap, self.settings.backoff_base * 2 ** attempt))
+
+    def client_within(self, remaining: float) -> Optional[Any]:
+        """
+        The raw client for an attempt that must end within `remaining` seconds:
+        the main one when its connect + read timeouts fit, else one with a read
+        timeout cut down to a multiple of min_read_timeout, or None (no time).
+        """
+        available = remaining - self.settings.connect_timeout
+        if available >= self.settings.read_timeout:
+            return self.client
+        step = self.settings.min_read_timeout
+        if self.client_for_timeout is None or available < step:
+            return None
+        return self.client_for_timeout(step * int(available / step))
+
+    def call(self, operation: str, **kwargs):
+        deadline = time.monotonic() + self.settings.call_deadline
+        request_deadline = _request_deadline.get()
+        if request_deadline is not None:
+            deadline = min(deadline, request_deadline)
+        attempt = 0
+        while True:
+            if time.monotonic() >= deadline:
+                metrics.increment("bedrock.deadline_exceeded")
+                raise BedrockUnavailableError("No time left in the request for a Bedrock call")
+            if not self.breaker.allow():
+                metrics.increment("bedrock.breaker.rejected")
+                raise BedrockUnavailableError("Bedrock circuit breaker is open", self.breaker.retry_after())
+            if not self.bucket.acquire(max(0.0, deadline - time.monotonic())):
+                self.breaker.release()
+                metrics.increment("bedrock.admission.timeouts")
+                raise BedrockUnavailableError("Timed out waiting for Bedrock request capacity")
+            # The request's budget also bounds the attempt itself, through the client's read timeout
+            client = self.client if request_deadline is None else self.client_within(deadline - time.monotonic())
+            if client is None:
+                self.breaker.release()
+                metrics.increment("bedrock.deadline_exceeded")
+                raise BedrockUnavailableError("Not enough time left in the request for a Bedrock call")
+
+            start = time.perf_counter()
+            try:
+                result = getattr(client, operation)(**kwargs)
+            except Exception as e:
+                kind = classify_error(e)
+                if kind is None:
+                    self.breaker.release()
+                    raise
+                metrics.increment(f"bedrock.{kind}s")
+                if kind == "throttle":
+                    self.bucket.on_throttle()
+                self.breaker.record_failure()
+                delay = self.backoff(attempt)
+                attempt += 1
+                if attempt > self.settings.max_retries or time.monotonic() + delay >= deadline:
+                    raise BedrockUnavailableError(f"Bedrock {operation} failed after {attempt} attempt(s): {e}") from e
+                metrics.increment("bedrock.retries")
+                self.sleep(delay)
+                continue
+
+            self.bucket.on_success()
+            self.breaker.record_success()
+            metrics.observe(f"bedrock.{operation}_ms", (time.perf_counter() - start) * 1000)
+            return result
+
+    def get_status(self) -> Dict[str, Any]:
+        return {"breaker": self.breaker.get_status(), "admission_rate": round(self.bucket.rate, 2)}
+
+
+_clients: Dict[BedrockSettings, GuardedBedrockClient] = {}
+_clients_lock = threading.Lock()
+
+
+def bedrock_runtime_client(settings: Optional[BedrockSettings] = None) -> GuardedBedrockClient:
+    """Process-wide guarded bedrock-runtime client (one pool, bucket and breaker per settings)"""
+    settings = settings or BedrockSettings.from_env()
+    with _clients_lock:
+        client = _clients.get(settings)
+        if client is None:
+            def open_client(read_timeout: float):
+                return boto3.Session().client("bedrock-runtime", region_name=settings.region,
+                                              config=settings._replace(read_timeout=read_timeout).botocore_config())
+
+            client = _clients[settings] = GuardedBedrockClient(
+                open_client(settings.read_timeout), settings,
+                client_for_timeout=functools.lru_cache(maxsize=None)(open_client))
+            print(f"🔌 Bedrock client: pool {settings.max_pool_connections}, "
+                  f"timeouts {settings.connect_timeout}s/{settings.read_timeout}s, admission {settings.rate}/s")
+        return client
+
+
+def reset_clients():
+    """Forget the process-wide clients so the next call opens a new pool (e.g. in a forked worker)"""
+    with _clients_lock:
+        _clients.clear()
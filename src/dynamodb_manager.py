@@ -1,44 +1,88 @@
 import boto3
-import json
+from botocore.config import Config
 import os
-from datetime import datetime
-from typing import List, Dict, Any, Optional
+from datetime import datetime, timedelta
+from typing import List, Dict, Any, Optional, Tuple
 import uuid
 
+from session_archive import RetentionPolicy, SessionArchiver
+from session_cache import SessionCache
+from storage_backends import DynamoDBBackend, MemoryBackend, SQLiteBackend, StorageBackend
+
 class DynamoDBManager:
-    """DynamoDB manager for chat sessions and history"""
+    """Chat sessions and history, kept by the backend selected with STORAGE_BACKEND (see storage_backends.py)"""
     
-    def __init__(self):
-        # Use AWS session with proper configuration
-        self.session = boto3.Session()
-        self.dynamodb = self.session.resource('dynamodb')
+    def __init__(self, backend=None):
+        # A backend name, or a StorageBackend instance (benchmarks)
+        self.backend_name = backend.name if isinstance(backend, StorageBackend) else (
+            backend or os.environ.get('STORAGE_BACKEND') or 'dynamodb').lower()
+        # DYNAMODB_ENDPOINT_URL points at DynamoDB Local (e.g. http://localhost:8000) for development and load tests
+        self.endpoint_url = os.environ.get('DYNAMODB_ENDPOINT_URL') or None
+        # One connection pool per process, sized for the threads serving requests in it
+        self.config = Config(max_pool_connections=int(os.environ.get('DYNAMODB_MAX_POOL_CONNECTIONS', '50')))
+        self.session = None
+        self.dynamodb = None
         
         # Get table names from environment or use defaults
         self.session_table_name = os.environ.get('SESSION_TABLE', 'ai-chat-session-dev')
         self.history_table_name = os.environ.get('HISTORY_TABLE', 'ai-chat-history-dev')
         
-        # Local storage for development when DynamoDB is not available
-        self.local_sessions = {}
-        self.local_messages = {}
+        # TTL (expires_at) stamped on session items, archival and restore (see session_archive.py)
+        self.retention = RetentionPolicy.from_env()
+        self.archiver = SessionArchiver(self)
+        
+        # Local storage for development when DynamoDB is not available (and for writes DynamoDB rejects)
+        self.fallback = MemoryBackend()
+        
+        if isinstance(backend, StorageBackend):
+            self.backend = backend
+        elif self.backend_name == 'dynamodb':
+            self.backend = self._connect_dynamodb()
+        elif self.backend_name == 'sqlite':
+            self.backend = SQLiteBackend()
+            print(f"✅ Using SQLite chat storage: {self.backend.path}")
+        elif self.backend_name == 'memory':
+            self.backend = self.fallback
+            print("✅ Using in-memory chat storage")
+        else:
+            raise ValueError(f"Unknown STORAGE_BACKEND {self.backend_name!r} (expected dynamodb, sqlite or memory)")
+        self.use_local = self.backend is self.fallback
+        
+        # Session items and recent history of warm sessions (see session_cache.py); memory needs no cache
+        self.cache = SessionCache(max_sessions=0 if self.use_local else None)
+    
+    def _connect_dynamodb(self):
+        """DynamoDB tables, or the in-memory fallback when they are unreachable"""
+        # Use AWS session with proper configuration
+        self.session = boto3.Session()
+        self.dynamodb = self.session.resource('dynamodb', endpoint_url=self.endpoint_url, config=self.config)
         
-        # Test AWS credentials first
-        self._test_aws_credentials()
+        # Test AWS credentials first (DynamoDB Local accepts any credentials)
+        if not self.endpoint_url:
+            self._test_aws_credentials()
         
         try:
-            self.session_table = self.dynamodb.Table(self.session_table_name)
-            self.history_table = self.dynamodb.Table(self.history_table_name)
+            backend = DynamoDBBackend(self.dynamodb, self.session_table_name, self.history_table_name)
             
             # Test table access
-            self._test_table_access()
+            self._test_table_access(backend)
             
-            self.use_local = False
             print(f"✅ Connected to DynamoDB tables: {self.session_table_name}, {self.history_table_name}")
+            return backend
         except Exception as e:
             print(f"❌ Error connecting to DynamoDB: {e}")
             print("   Using local storage for development")
-            self.session_table = None
-            self.history_table = None
-            self.use_local = True
+            return self.fallback
+    
+    def reconnect(self):
+        """Open fresh connections (a forked server worker must not reuse its parent's sockets)"""
+        if isinstance(self.backend, DynamoDBBackend):
+            self.session = boto3.Session()
+            self.dynamodb = self.session.resource('dynamodb', endpoint_url=self.endpoint_url, config=self.config)
+            self.backend.connect(self.dynamodb)
+        else:
+            self.backend.reconnect()
+        self.cache.clear()
     
     def _test_aws_credentials(self):
         """Test AWS credentials"""
@@ -50,11 +94,11 @@ class DynamoDBManager:
             print(f"❌ AWS credentials error: {e}")
             print("   Please check your AWS credentials configuration")
     
-    def _test_table_access(self):
+    def _test_table_access(self, backend: DynamoDBBackend):
         """Test access to DynamoDB tables"""
         try:
             # Test session table access
-            self.session_table.load()
+            backend.session_table.load()
             print(f"✅ Session table '{self.session_table_name}' accessible")
         except Exception as e:
             print(f"❌ Cannot access session table '{self.session_table_name}': {e}")
@@ -62,7 +106,7 @@ class DynamoDBManager:
         
         try:
             # Test history table access
-            self.history_table.load()
+            backend.history_table.load()
             print(f"✅ History table '{self.history_table_name}' accessible")
         except Exception as e:
             print(f"❌ Cannot access history table '{self.history_table_name}': {e}")
@@ -82,198 +126,157 @@ class DynamoDBManager:
             'message_count': 0,
             'metadata': metadata or {}
         }
+        expires_at = self.retention.expires_at()
+        if expires_at:
+            session_item['expires_at'] = expires_at
         
-        if self.use_local:
-            # Store locally
-            self.local_sessions[session_id] = session_item
-            print(f"✅ Created local session: {session_id}")
-        else:
-            # Store in DynamoDB
-            try:
-                self.session_table.put_item(Item=session_item)
-                print(f"✅ Created DynamoDB session: {session_id}")
-            except Exception as e:
-                print(f"❌ Error creating DynamoDB session: {e}")
-                print(f"   Error details: {type(e).__name__}: {str(e)}")
-                # Fallback to local storage
-                self.local_sessions[session_id] = session_item
-                print(f"✅ Created local session (fallback): {session_id}")
+        try:
+            self.backend.create_session(session_item)
+            self.cache.created(session_item)
+            print(f"✅ Created {self.backend.name} session: {session_id}")
+        except Exception as e:
+            print(f"❌ Error creating {self.backend.name} session: {e}")
+            print(f"   Error details: {type(e).__name__}: {str(e)}")
+            # Fallback to local storage
+            self.fallback.create_session(session_item)
+            print(f"✅ Created local session (fallback): {session_id}")
         
         return session_id
     
     def get_session(self, session_id: str) -> Optional[Dict[str, Any]]:
         """Get session information"""
-        if self.use_local:
-            return self.local_sessions.get(session_id)
-        
         try:
-            response = self.session_table.get_item(Key={'session_id': session_id})
-            return response.get('Item')
+            return self.cache.get_session(session_id, lambda: self.backend.get_session(session_id),
+                                          lambda: self.backend.count_messages(session_id))
         except Exception as e:
             print(f"❌ Error getting session {session_id}: {e}")
             return None
     
     def update_session(self, session_id: str, **kwargs):
         """Update session information"""
-        timestamp = datetime.utcnow().isoformat()
-        
-        if self.use_local:
-            if session_id in self.local_sessions:
-                self.local_sessions[session_id]['updated_at'] = timestamp
-                for key, value in kwargs.items():
-                    self.local_sessions[session_id][key] = value
-        else:
-            try:
-                update_expression = "SET updated_at = :updated_at"
-                expression_values = {':updated_at': timestamp}
-                
-                for key, value in kwargs.items():
-                    update_expression += f", {key} = :{key}"
-                    expression_values[f':{key}'] = value
-                
-                self.session_table.update_item(
-                    Key={'session_id': session_id},
-                    UpdateExpression=update_expression,
-                    ExpressionAttributeValues=expression_values
-                )
-            except Exception as e:
-                print(f"❌ Error updating session {session_id}: {e}")
+        fields = {'updated_at': datetime.utcnow().isoformat(), **kwargs}
+        expires_at = self.retention.expires_at()
+        if expires_at:
+            fields['expires_at'] = expires_at
+        try:
+            self.backend.update_session(session_id, fields)
+            self.cache.updated(session_id, fields)
+        except Exception as e:
+            self.cache.invalidate(session_id)
+            print(f"❌ Error updating session {session_id}: {e}")
     
     def add_chat_message(self, session_id: str, role: str, content: str, metadata: Dict[str, Any] = None) -> str:
         """Add a chat message to history"""
-        timestamp = datetime.utcnow().isoformat()
-        message_id = str(uuid.uuid4())
-        
-        message_item = {
+        return self.add_chat_messages(session_id, [(role, content, metadata)])[0]
+    
+    def add_chat_turn(self, session_id: str, request: str, response: str, metadata: Dict[str, Any] = None,
+                      duration_ms: Optional[int] = None, **session_fields) -> List[str]:
+        """
+        Store one exchange (user request + assistant response) with its intent
+        and timing, and update the session with `session_fields` in the same
+        write; with turn items this is one history item. Returns the message ids.
+        """
+        metadata = dict(metadata or {})
+        if duration_ms is not None:
+            metadata['duration_ms'] = int(duration_ms)
+        return self.add_chat_messages(session_id, [('user', request, metadata), ('assistant', response, metadata)],
+                                      **session_fields)
+
+    def add_chat_messages(self, session_id: str,
+                          messages: List[Tuple[str, str, Optional[Dict[str, Any]]]],
+                          **session_fields) -> List[str]:
+        """Add (role, content, metadata) messages, e.g. a whole turn, in one write; returns their ids"""
+        now = datetime.utcnow()
+        # One microsecond apart so messages written together keep their order and distinct keys
+        items = [{
             'session_id': session_id,
-            'timestamp': timestamp,
-            'message_id': message_id,
+            'timestamp': (now + timedelta(microseconds=index)).isoformat(timespec='microseconds'),
+            'message_id': str(uuid.uuid4()),
             'role': role,  # 'user' or 'assistant'
             'content': content,
             'metadata': metadata or {}
-        }
+        } for index, (role, content, metadata) in enumerate(messages)]
+        # The newest message's timestamp is part of the session ETag (responses.session_etag)
+        session_fields = dict(session_fields, last_message_timestamp=items[-1]['timestamp'])
+        expires_at = self.retention.expires_at()
+        if expires_at:
+            # Activity pushes the session's TTL back; history items have none (the archival job deletes them)
+            session_fields = dict(session_fields, expires_at=expires_at)
         
-        if self.use_local:
-            # Store locally
-            if session_id not in self.local_messages:
-                self.local_messages[session_id] = []
-            self.local_messages[session_id].append(message_item)
-            
-            # Update session message count
-            if session_id in self.local_sessions:
-                self.local_sessions[session_id]['message_count'] = len(self.local_messages[session_id])
-        else:
-            # Store in DynamoDB
-            try:
-                self.history_table.put_item(Item=message_item)
-                
-                # Update session message count
-                self.update_session(session_id, message_count=self.get_session_message_count(session_id) + 1)
-            except Exception as e:
-                print(f"❌ Error adding chat message to DynamoDB: {e}")
-                print(f"   Error details: {type(e).__name__}: {str(e)}")
-                # Fallback to local storage
-                if session_id not in self.local_messages:
-                    self.local_messages[session_id] = []
-                self.local_messages[session_id].append(message_item)
+        try:
+            self.backend.add_messages(session_id, items, updated_at=now.isoformat(), session_fields=session_fields)
+            self.cache.appended(session_id, [dict(item) for item in items],
+                                dict(session_fields, updated_at=now.isoformat()))
+        except Exception as e:
+            self.cache.invalidate(session_id)
+            print(f"❌ Error adding chat messages to {self.backend.name}: {e}")
+            print(f"   Error details: {type(e).__name__}: {str(e)}")
+            # Fallback to local storage
+            self.fallback.add_messages(session_id, items, updated_at=now.isoformat(), session_fields=session_fields)
         
-        return message_id
+        return [item['message_id'] for item in items]
     
-    def get_chat_history(self, session_id: str, limit: int = 50) -> List[Dict[str, Any]]:
-        """Get chat history for a session"""
-        if self.use_local:
-            messages = self.local_messages.get(session_id, [])
-            # Sort by timestamp and limit
-            messages.sort(key=lambda x: x['timestamp'])
-            return messages[-limit:] if limit > 0 else messages
-        
+    def get_chat_history(self, session_id: str, limit: int = 50, since: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Get chat history for a session (the latest `limit` messages, oldest first; only newer than `since`)"""
         try:
-            print(f"🔍 Querying DynamoDB for session: {session_id}")
-            response = self.history_table.query(
-                KeyConditionExpression='session_id = :session_id',
-                ExpressionAttributeValues={':session_id': session_id},
-                ScanIndexForward=False,  # Most recent first
-                Limit=limit
-            )
-            
-            # Reverse to get chronological order
-            messages = response.get('Items', [])
-            print(f"📊 DynamoDB returned {len(messages)} messages for session {session_id}")
-            messages.reverse()
-            return messages
+            return self.cache.get_history(session_id, limit, lambda n: self.backend.get_history(session_id, n),
+                                          lambda: self.backend.count_messages(session_id), since=since,
+                                          load_since=lambda n: self.backend.get_history(session_id, n, since=since))
         except Exception as e:
             print(f"❌ Error getting chat history for session {session_id}: {e}")
             return []
     
     def get_session_message_count(self, session_id: str) -> int:
         """Get the number of messages in a session"""
-        if self.use_local:
-            return len(self.local_messages.get(session_id, []))
-        
         try:
-            response = self.history_table.query(
-                KeyConditionExpression='session_id = :session_id',
-                ExpressionAttributeValues={':session_id': session_id},
-                Select='COUNT'
-            )
-            return response.get('Count', 0)
+            return self.backend.count_messages(session_id)
         except Exception as e:
             print(f"❌ Error getting message count for session {session_id}: {e}")
             return 0
     
     def delete_session(self, session_id: str):
         """Delete a session and all its messages"""
-        if self.use_local:
-            # Delete from local storage
-            if session_id in self.local_sessions:
-                del self.local_sessions[session_id]
-            if session_id in self.local_messages:
-                del self.local_messages[session_id]
-            print(f"✅ Deleted local session: {session_id}")
-        else:
-            try:
-                # Delete all messages in the session
-                messages = self.get_chat_history(session_id, limit=1000)
-                for message in messages:
-                    self.history_table.delete_item(
-                        Key={
-                            'session_id': session_id,
-                            'timestamp': message['timestamp']
-                        }
-                    )
-                
-                # Delete the session
-                self.session_table.delete_item(Key={'session_id': session_id})
-                print(f"✅ Deleted DynamoDB session: {session_id}")
-            except Exception as e:
-                print(f"❌ Error deleting session {session_id}: {e}")
+        self.cache.invalidate(session_id)
+        try:
+            self.backend.delete_session(session_id)
+            print(f"✅ Deleted {self.backend.name} session: {session_id}")
+        except Exception as e:
+            print(f"❌ Error deleting session {session_id}: {e}")
+    
+    def restore_session(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """Rehydrate an archived session (no-op for a live one); returns the session, or None if not archived"""
+        session = self.get_session(session_id)
+        if session:
+            return session
+        self.cache.invalidate(session_id)
+        try:
+            return self.archiver.restore(session_id)
+        except Exception as e:
+            print(f"❌ Error restoring session {session_id}: {e}")
+            raise
     
     def list_sessions(self, limit: int = 20) -> List[Dict[str, Any]]:
         """List recent sessions"""
-        if self.use_local:
-            sessions = list(self.local_sessions.values())
-            # Sort by updated_at and limit
-            sessions.sort(key=lambda x: x['updated_at'], reverse=True)
-            return sessions[:limit]
-        
         try:
-            response = self.session_table.scan(
-                Limit=limit,
-                ProjectionExpression='session_id, created_at, updated_at, message_count'
-            )
-            return response.get('Items', [])
+            return self.backend.list_sessions(limit)
         except Exception as e:
             print(f"❌ Error listing sessions: {e}")
             return []
     
     def get_status(self) -> Dict[str, Any]:
-        """Get DynamoDB connection status"""
+        """Get storage connection status"""
         return {
+            'backend': self.backend.name,
             'connected': not self.use_local,
+            'shared': self.backend.shared,
+            'endpoint_url': self.endpoint_url,
             'session_table': self.session_table_name,
             'history_table': self.history_table_name,
-            'local_sessions_count': len(self.local_sessions),
-            'local_messages_count': sum(len(messages) for messages in self.local_messages.values())
+            'retention_ttl_days': self.retention.ttl_days,
+            'archive': self.archiver.store.describe(),
+            'session_cache': self.cache.get_status(),
+            **self.fallback.get_status(),
+            **self.backend.get_status()
         }
 
 # Global instance
@@ -0,0 +1,167 @@
+"""
+Compact, versioned history item format for the DynamoDB history table
+
+Version 1 (no `v` attribute) is the original item: message_id, role, content
+and the full metadata map on every message. Version 2 keeps the table keys
+(session_id, timestamp) and shortens everything else:
+
+    v   2
+    i   message_id
+    r   role: "u" (user) / "a" (assistant), other roles verbatim
+    c   content, or
+    z   zlib-compressed UTF-8 content (Binary) when the text is longer than
+        HISTORY_COMPRESS_THRESHOLD bytes and compression actually helps
+    m   metadata with short keys (wp / it / fa / ms), stored once per turn on
+        its last message
+    s   1 on the other messages of the turn: metadata is on the next message
+
+Version 3 stores a whole exchange (user message + assistant response) as one
+item keyed by the user message's timestamp, halving the items written and
+read per conversation:
+
+    v   3
+    iq / ia   message ids of the request and the response
+    q / qz    request content (plain / compressed, as c / z above)
+    a / az    response content
+    m         turn metadata: workflow path, intent, final agent, duration (ms)
+
+Writes that are not a user/assistant pair still use version 2 items. An
+`expires_at` attribute (items written before history lost its TTL, see
+session_archive.py) is kept as is in every version. Reads
+expand turn items back into the role/content messages ChatAgent uses.
+
+HISTORY_ITEM_VERSION picks the format written (default 3; 1 or 2 while older
+readers are still deployed); every version is always readable.
+"""
+
+import os
+import zlib
+from datetime import datetime, timedelta
+from decimal import Decimal
+from typing import Any, Dict, List
+
+ITEM_VERSION = int(os.environ.get("HISTORY_ITEM_VERSION", "3"))
+COMPRESS_THRESHOLD = int(os.environ.get("HISTORY_COMPRESS_THRESHOLD", "1024"))
+
+ROLE_CODES = {"user": "u", "assistant": "a"}
+ROLE_NAMES = {code: role for role, code in ROLE_CODES.items()}
+METADATA_CODES = {"workflow_path": "wp", "intent_type": "it", "final_agent": "fa", "duration_ms": "ms"}
+METADATA_NAMES = {code: name for name, code in METADATA_CODES.items()}
+
+
+def _binary_bytes(value) -> bytes:
+    # boto3 returns Binary attributes wrapped in boto3.dynamodb.types.Binary
+    return bytes(getattr(value, "value", value))
+
+
+def encode_content(content: str, threshold: int = COMPRESS_THRESHOLD) -> Dict[str, Any]:
+    """{'c': text} or, for long text that shrinks, {'z': compressed bytes}"""
+    raw = content.encode("utf-8")
+    if len(raw) > threshold:
+        compressed = zlib.compress(raw, 6)
+        if len(compressed) < len(raw):
+            return {"z": compressed}
+    return {"c": content}
+
+
+def _encode_metadata(metadata: Dict[str, Any]) -> Dict[str, Any]:
+    return {METADATA_CODES.get(key, key): value for key, value in metadata.items()}
+
+
+def _decode_metadata(metadata: Dict[str, Any]) -> Dict[str, Any]:
+    # Numbers come back from DynamoDB as Decimal; durations are whole milliseconds
+    return {METADATA_NAMES.get(key, key): int(value) if isinstance(value, Decimal) else value
+            for key, value in metadata.items()}
+
+
+def _decode_content(item: Dict[str, Any], plain: str, compressed: str) -> str:
+    if compressed in item:
+        return zlib.decompress(_binary_bytes(item[compressed])).decode("utf-8")
+    return item.get(plain, "")
+
+
+def is_turn(items: List[Dict[str, Any]]) -> bool:
+    return len(items) == 2 and items[0]["role"] == "user" and items[1]["role"] == "assistant"
+
+
+def encode_turn(request: Dict[str, Any], response: Dict[str, Any],
+                threshold: int = COMPRESS_THRESHOLD) -> Dict[str, Any]:
+    """One version 3 item for a user message and the assistant response to it"""
+    item = {"session_id": request["session_id"], "timestamp": request["timestamp"], "v": 3,
+            "iq": request["message_id"], "ia": response["message_id"]}
+    for prefix, message in (("q", request), ("a", response)):
+        for key, value in encode_content(message["content"], threshold).items():
+            item[prefix if key == "c" else prefix + "z"] = value
+    metadata = response.get("metadata") or request.get("metadata") or {}
+    if metadata:
+        item["m"] = _encode_metadata(metadata)
+    if "expires_at" in response:
+        item["expires_at"] = response["expires_at"]
+    return item
+
+
+def encode_messages(items: List[Dict[str, Any]], version: int = ITEM_VERSION,
+                    threshold: int = COMPRESS_THRESHOLD) -> List[Dict[str, Any]]:
+    """Stored items for messages written together (one turn); version 1 returns them unchanged"""
+    if version < 2:
+        return items
+    if version >= 3 and is_turn(items):
+        return [encode_turn(items[0], items[1], threshold)]
+    stored = []
+    last = len(items) - 1
+    for index, item in enumerate(items):
+        compact = {"session_id": item["session_id"], "timestamp": item["timestamp"], "v": 2,
+                   "i": item["message_id"], "r": ROLE_CODES.get(item["role"], item["role"])}
+        compact.update(encode_content(item["content"], threshold))
+        if "expires_at" in item:
+            compact["expires_at"] = item["expires_at"]
+        if index == last:
+            metadata = item.get("metadata") or {}
+            if metadata:
+                compact["m"] = _encode_metadata(metadata)
+        else:
+            compact["s"] = 1
+        stored.append(compact)
+    return stored
+
+
+def response_timestamp(timestamp: str) -> str:
+    """The assistant message of a turn item sorts one microsecond after the request"""
+    return (datetime.fromisoformat(timestamp) + timedelta(microseconds=1)).isoformat(timespec="microseconds")
+
+
+def decode_messages(stored: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Messages in the original shape from stored items of any version, oldest first"""
+    messages = []
+    # Walk newest first so a message flagged `s` can take the metadata of the one after it
+    following_metadata: Dict[str, Any] = {}
+    for item in reversed(stored):
+        version = int(item.get("v", 1))
+        if version < 2:
+            messages.append(item)
+            following_metadata = {}
+        elif version >= 3:
+            metadata = _decode_metadata(item.get("m") or {})
+            messages.append({"session_id": item["session_id"], "timestamp": response_timestamp(item["timestamp"]),
+                             "message_id": item.get("ia"), "role": "assistant",
+                             "content": _decode_content(item, "a", "az"), "metadata": metadata})
+            messages.append({"session_id": item["session_id"], "timestamp": item["timestamp"],
+                             "message_id": item.get("iq"), "role": "user",
+                             "content": _decode_content(item, "q", "qz"), "metadata": dict(metadata)})
+            following_metadata = {}
+        else:
+            if item.get("s"):
+                metadata = dict(following_metadata)
+            else:
+                metadata = _decode_metadata(item.get("m") or {})
+            following_metadata = metadata
+            messages.append({
+                "session_id": item["session_id"],
+                "timestamp": item["timestamp"],
+                "message_id": item.get("i"),
+                "role": ROLE_NAMES.get(item.get("r"), item.get("r")),
+                "content": _decode_content(item, "c", "z"),
+                "metadata": metadata,
+            })
+    messages.reverse()
+    return messages
@@ -0,0 +1,233 @@
+"""
+Idempotent /chat: duplicate submissions share one graph execution
+
+A request's key is the client's idempotency key (Idempotency-Key header or
+`idempotency_key` in the body) or, for an existing session, a hash of
+session_id plus the message. Only one request per key runs at a time:
+- in-process: identical in-flight requests wait on the first one's future
+- across containers: the first request claims the key with a conditional
+  write to IDEMPOTENCY_TABLE, stores the finished response, and a retry
+  landing elsewhere returns that response without another LLM call
+
+Derived keys only dedupe within IDEMPOTENCY_WINDOW_SECONDS, so a user who
+deliberately repeats a message later still gets a fresh answer.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from metrics import metrics
+
+IN_PROGRESS = "IN_PROGRESS"
+COMPLETED = "COMPLETED"
+
+
+class IdempotencyConflict(RuntimeError):
+    """Another container is still running the same request"""
+
+    def __init__(self, key: str, retry_after: float):
+        super().__init__(f"Request {key[:12]} is already being processed")
+        self.retry_after = retry_after
+
+
+def chat_request_key(session_id: Optional[str], message: str, client_key: Optional[str] = None) -> Optional[str]:
+    """Idempotency key for a chat turn (None: a new session without a client key is never deduplicated)"""
+    if client_key:
+        source = f"client\n{session_id or ''}\n{client_key}"
+    elif session_id:
+        source = f"derived\n{session_id}\n{message.strip()}"
+    else:
+        return None
+    return hashlib.sha256(source.encode("utf-8")).hexdigest()
+
+
+class IdempotencyStore:
+    """
+    Completed responses in an in-process LRU in front of an optional DynamoDB
+    table (conditional claim + completion), plus in-flight futures for
+    coalescing within the process.
+    """
+
+    def __init__(self, table_name: Optional[str] = None, window_seconds: Optional[int] = None,
+                 lock_seconds: int = 60, wait_seconds: float = 20.0, max_entries: int = 1024):
+        self.table_name = table_name if table_name is not None else os.environ.get("IDEMPOTENCY_TABLE")
+        self.window_seconds = window_seconds or int(os.environ.get("IDEMPOTENCY_WINDOW_SECONDS", "120"))
+        self.lock_seconds = lock_seconds
+        self.wait_seconds = wait_seconds
+        self.max_entries = max_entries
+        self.completed: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self.in_flight: Dict[str, Future] = {}
+        self.lock = threading.Lock()
+        self._table = None
+        self._table_disabled = not self.table_name
+
+    def _get_table(self):
+        if self._table is None and not self._table_disabled:
+            try:
+                import boto3
+                endpoint_url = os.environ.get("DYNAMODB_ENDPOINT_URL") or None
+                self._table = boto3.resource("dynamodb", endpoint_url=endpoint_url).Table(self.table_name)
+            except Exception as e:
+                print(f"⚠️ Idempotency DynamoDB tier disabled: {e}")
+                self._table_disabled = True
+        return self._table
+
+    def reset_connections(self):
+        """Drop the DynamoDB handle so this process opens its own (e.g. after fork)"""
+        self._table = None
+
+    def _local_get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self.lock:
+            entry = self.completed.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= time.time():
+                del self.completed[key]
+                return None
+            self.completed.move_to_end(key)
+            return entry[1]
+
+    def _local_put(self, key: str, result: Dict[str, Any], expires_at: float):
+        with self.lock:
+            self.completed[key] = (expires_at, result)
+            self.completed.move_to_end(key)
+            while len(self.completed) > self.max_entries:
+                self.completed.popitem(last=False)
+
+    def _claim(self, key: str) -> Tuple[bool, Optional[Dict[str, Any]]]:
+        """
+        Conditionally claim the key: (True, None) when this call now owns it,
+        (False, item) when another request holds it, (False, None) when
+        running without the table (none configured, or it failed).
+        """
+        table = self._get_table()
+        if table is None:
+            return False, None
+        from botocore.exceptions import ClientError
+        now = int(time.time())
+        try:
+            table.put_item(
+                Item={"idempotency_key": key, "status": IN_PROGRESS, "locked_until": now + self.lock_seconds,
+                      "expires_at": now + self.window_seconds},
+                ConditionExpression="attribute_not_exists(idempotency_key) OR expires_at < :now "
+                                    "OR (#status = :in_progress AND locked_until < :now)",
+                ExpressionAttributeNames={"#status": "status"},
+                ExpressionAttributeValues={":now": now, ":in_progress": IN_PROGRESS},
+            )
+            return True, None
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") != "ConditionalCheckFailedException":
+                print(f"⚠️ Idempotency claim failed, running without it: {e}")
+                return False, None
+        try:
+            return False, table.get_item(Key={"idempotency_key": key}, ConsistentRead=True).get("Item")
+        except Exception as e:
+            print(f"⚠️ Idempotency read failed, running without it: {e}")
+            return False, None
+
+    def _wait_for_other(self, key: str) -> Dict[str, Any]:
+        """Poll until the container holding the claim stores its response; 409 (IdempotencyConflict) otherwise"""
+        table = self._get_table()
+        deadline = time.monotonic() + self.wait_seconds
+        while time.monotonic() < deadline:
+            time.sleep(0.25)
+            try:
+                item = table.get_item(Key={"idempotency_key": key}, ConsistentRead=True).get("Item")
+            except Exception as e:
+                # Transient read errors: poll again until the deadline
+                metrics.increment("idempotency.poll_errors")
+                print(f"⚠️ Idempotency poll failed, retrying: {e}")
+                continue
+            if item is None:
+                break
+            if item.get("status") == COMPLETED:
+                return json.loads(item["response"])
+        raise IdempotencyConflict(key, retry_after=2.0)
+
+    def _complete(self, key: str, result: Dict[str, Any]):
+        expires_at = int(time.time()) + self.window_seconds
+        self._local_put(key, result, expires_at)
+        table = self._get_table()
+        if table is not None:
+            try:
+                table.put_item(Item={"idempotency_key": key, "status": COMPLETED, "expires_at": expires_at,
+                                     "response": json.dumps(result, default=str)})
+            except Exception as e:
+                print(f"⚠️ Idempotency completion write failed: {e}")
+
+    def _release(self, key: str):
+        """Drop a claim whose request failed so a retry can run it"""
+        table = self._get_table()
+        if table is not None:
+            try:
+                table.delete_item(Key={"idempotency_key": key},
+                                  ConditionExpression="#status = :in_progress",
+                                  ExpressionAttributeNames={"#status": "status"},
+                                  ExpressionAttributeValues={":in_progress": IN_PROGRESS})
+            except Exception as e:
+                print(f"⚠️ Idempotency release failed: {e}")
+
+    def execute(self, key: Optional[str], fn: Callable[[], Dict[str, Any]],
+                cacheable: Callable[[Dict[str, Any]], bool] = lambda result: True) -> Tuple[Dict[str, Any], str]:
+        """
+        Run fn at most once per key; returns (result, outcome) with outcome
+        'executed', 'coalesced' (shared an in-flight run) or 'replayed' (stored response).
+        Results failing `cacheable` are shared with waiters but not stored.
+        """
+        if key is None:
+            return fn(), "executed"
+        stored = self._local_get(key)
+        if stored is not None:
+            metrics.increment("idempotency.replayed")
+            return stored, "replayed"
+
+        with self.lock:
+            future = self.in_flight.get(key)
+            owner = future is None
+            if owner:
+                future = self.in_flight[key] = Future()
+        if not owner:
+            metrics.increment("idempotency.coalesced")
+            return future.result(), "coalesced"
+
+        claimed = False
+        try:
+            claimed, item = self._claim(key)
+            if item is not None and item.get("status") == COMPLETED and int(item.get("expires_at", 0)) > time.time():
+                result, outcome = json.loads(item["response"]), "replayed"
+                self._local_put(key, result, int(item["expires_at"]))
+                metrics.increment("idempotency.replayed")
+            elif item is not None:
+                result, outcome = self._wait_for_other(key), "replayed"
+                metrics.increment("idempotency.replayed")
+            else:
+                result, outcome = fn(), "executed"
+                if cacheable(result):
+                    self._complete(key, result)
+                elif claimed:
+                    self._release(key)
+            future.set_result(result)
+            return result, outcome
+        except BaseException as e:
+            # Only this call's own claim: another container's in-flight claim must survive our failure
+            if claimed:
+                self._release(key)
+            future.set_exception(e)
+            raise
+        finally:
+            with self.lock:
+                self.in_flight.pop(key, None)
+
+    def get_status(self) -> Dict[str, Any]:
+        return {"table": self.table_name, "completed_entries": len(self.completed),
+                "in_flight": len(self.in_flight), "window_seconds": self.window_seconds}
+
+
+# Global instance
+idempotency_store = IdempotencyStore()
@@ -0,0 +1,176 @@
+import json
+import re
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+
+class IncrementalJSONExtractor:
+    """
+    Incremental extractor for top-level JSON objects embedded in LLM output.
+
+    Text is consumed chunk by chunk in a single forward scan (a small brace/string
+    state machine that jumps between structural characters), so total work is
+    linear in the input size no matter how the response is split.
+    Prose, markdown code fences and stray closing braces outside an object are skipped.
+    A backtick outside a string cannot be JSON, so an unbalanced `{` in prose is
+    dropped when a code fence opens and the fenced object is still found.
+    Raw newlines / tabs inside JSON strings (common in model output) are escaped
+    while scanning, so no second pass over the candidate is needed.
+    """
+
+    _STRUCTURE = re.compile(r'[{}"`]')
+    _STRING_SPECIAL = re.compile(r'["\\\n\r\t]')
+    _CONTROL_ESCAPES = {"\n": "\\n", "\r": "\\r", "\t": "\\t"}
+
+    def __init__(self, max_objects: Optional[int] = None, max_object_chars: int = 10_000_000):
+        self.max_objects = max_objects
+        self.max_object_chars = max_object_chars
+        self._buffer: List[str] = []
+        self._buffer_len = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._objects: List[Dict[str, Any]] = []
+
+    @property
+    def objects(self) -> List[Dict[str, Any]]:
+        """All complete objects extracted so far, in order of appearance"""
+        return self._objects
+
+    @property
+    def done(self) -> bool:
+        """True once max_objects objects have been extracted"""
+        return self.max_objects is not None and len(self._objects) >= self.max_objects
+
+    def first(self) -> Optional[Dict[str, Any]]:
+        """Return the first complete object, or None if none has closed yet"""
+        return self._objects[0] if self._objects else None
+
+    def feed(self, chunk: str) -> List[Dict[str, Any]]:
+        """Consume a chunk of text and return the objects completed by it"""
+        completed = []
+        pos = 0
+        length = len(chunk)
+        while pos < length and not self.done:
+            if self._depth == 0:
+                # Outside any object: jump straight to the next opening brace
+                start = chunk.find("{", pos)
+                if start < 0:
+                    break
+                self._depth = 1
+                self._buffer.append("{")
+                self._buffer_len = 1
+                pos = start + 1
+            elif self._in_string:
+                if self._escape:
+                    self._escape = False
+                    self._append(chunk[pos])
+                    pos += 1
+                    continue
+                match = self._STRING_SPECIAL.search(chunk, pos)
+                end = match.start() if match else length
+                self._append(chunk[pos:end])
+                if not match:
+                    pos = end
+                    continue
+                char = match.group()
+                if char == "\\":
+                    self._escape = True
+                    self._append(char)
+                elif char == '"':
+                    self._in_string = False
+                    self._append(char)
+                else:
+                    # Raw control character inside a string: escape it in place
+                    self._append(self._CONTROL_ESCAPES[char])
+                pos = end + 1
+            else:
+                match = self._STRUCTURE.search(chunk, pos)
+                end = match.end() if match else length
+                self._append(chunk[pos:end])
+                pos = end
+                if not match:
+                    continue
+                char = match.group()
+                if char == '"':
+                    self._in_string = True
+                elif char == "`":
+                    # Code fence inside a candidate: the candidate was prose, resume scanning after it
+                    self._reset()
+                elif char == "{":
+                    self._depth += 1
+                else:
+                    self._depth -= 1
+                    if self._depth == 0:
+                        parsed = self._close_candidate()
+                        if parsed is not None:
+                            completed.append(parsed)
+                            self._objects.append(parsed)
+
+            if self._buffer_len > self.max_object_chars:
+                # Runaway candidate (unbalanced output); drop it and resume scanning
+                self._reset()
+        return completed
+
+    def _append(self, text: str):
+        self._buffer.append(text)
+        self._buffer_len += len(text)
+
+    def _close_candidate(self) -> Optional[Dict[str, Any]]:
+        candidate = "".join(self._buffer)
+        self._reset()
+        try:
+            parsed = json.loads(candidate)
+        except json.JSONDecodeError:
+            return None
+        return parsed if isinstance(parsed, dict) else None
+
+    def _reset(self):
+        self._buffer.clear()
+        self._buffer_len = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+
+
+def extract_first_json(text: str) -> Optional[Dict[str, Any]]:
+    """Extract the first complete top-level JSON object from a full response"""
+    return first_json_from_stream([text])
+
+
+def first_json_from_stream(chunks: Iterable[Any]) -> Optional[Dict[str, Any]]:
+    """
+    Consume streamed chunks (strings or message chunks with .content) and return
+    as soon as the first top-level object closes. The remaining stream is not read.
+    """
+    extractor = IncrementalJSONExtractor(max_objects=1)
+    for chunk in chunks:
+        found = extractor.feed(chunk_text(chunk))
+        if found:
+            return found[0]
+    return None
+
+
+def iter_json_objects(chunks: Iterable[Any]) -> Iterator[Dict[str, Any]]:
+    """Yield every top-level JSON object from a stream as soon as it closes"""
+    extractor = IncrementalJSONExtractor()
+    for chunk in chunks:
+        for obj in extractor.feed(chunk_text(chunk)):
+            yield obj
+
+
+def chunk_text(chunk: Any) -> str:
+    """Normalize a streamed chunk (str, AIMessageChunk, Bedrock content blocks) to text"""
+    if isinstance(chunk, str):
+        return chunk
+    content = getattr(chunk, "content", chunk)
+    if isinstance(content, str):
+        return content
+    if isinstance(content, list):
+        parts = []
+        for block in content:
+            if isinstance(block, str):
+                parts.append(block)
+            elif isinstance(block, dict) and block.get("type") == "text":
+                parts.append(block.get("text", ""))
+        return "".join(parts)
+    return str(content)
@@ -1,28 +1,45 @@
 import json
 import boto3
 import os
+import time
 from agent import ChatAgent
+from bedrock_client import lambda_budget, request_deadline
 from dynamodb_manager import db_manager
+from idempotency import IdempotencyConflict, chat_request_key, idempotency_store
+from responses import (delta_etag, etag_matches, header, lambda_response, request_body, session_etag,
+                       sessions_etag, since_timestamp)
+from vials.engine import get_engine
 
 # Global agent instance for reuse across invocations
 agent = None
 
+# Load VIALS into the embedded query engine at cold start
+get_engine()
+
 def get_agent():
     """Get or create agent instance"""
     global agent
     if agent is None:
-        agent = ChatAgent()
+        agent = ChatAgent(session_store=db_manager)
     return agent
 
 def lambda_handler(event, context):
     """Lambda function handler for chat API and session management using LangGraph workflow with DynamoDB integration"""
+    # Handlers return payloads as 'body'; they are serialized (DynamoDB types included) and compressed here
+    # All Bedrock calls of this invocation share what is left of the Lambda timeout
+    with request_deadline(lambda_budget(context)):
+        return lambda_response(route_request(event), event)
+
+def route_request(event):
+    """Dispatch an API Gateway event to its handler"""
     
     # Set CORS headers
     headers = {
         'Content-Type': 'application/json',
         'Access-Control-Allow-Origin': '*',
-        'Access-Control-Allow-Headers': 'Content-Type,X-Amz-Date,Authorization,X-Api-Key,X-Amz-Security-Token',
-        'Access-Control-Allow-Methods': 'GET,POST,OPTIONS,DELETE'
+        'Access-Control-Allow-Headers': 'Content-Type,X-Amz-Date,Authorization,X-Api-Key,X-Amz-Security-Token,Idempotency-Key,If-None-Match',
+        'Access-Control-Allow-Methods': 'GET,POST,OPTIONS,DELETE',
+        'Access-Control-Expose-Headers': 'ETag'
     }
     
     try:
@@ -31,7 +48,7 @@ def lambda_handler(event, context):
             return {
                 'statusCode': 200,
                 'headers': headers,
-                'body': json.dumps({'message': 'OK'})
+                'body': {'message': 'OK'}
             }
         
         # Route based on path and method
@@ -46,13 +63,15 @@ def lambda_handler(event, context):
             return handle_get_session(event, headers)
         elif resource == '/sessions/{session_id}' and method == 'DELETE':
             return handle_delete_session(event, headers)
+        elif resource == '/sessions/{session_id}/restore' and method == 'POST':
+            return handle_restore_session(event, headers)
         elif path == '/chat' and method == 'POST':
             return handle_chat_request(event, headers)
         else:
             return {
                 'statusCode': 404,
                 'headers': headers,
-                'body': json.dumps({'error': 'Endpoint not found'})
+                'body': {'error': 'Endpoint not found'}
             }
         
     except Exception as e:
@@ -60,7 +79,7 @@ def lambda_handler(event, context):
         return {
             'statusCode': 500,
             'headers': headers,
-            'body': json.dumps({'error': f'Internal server error: {str(e)}'})
+            'body': {'error': f'Internal server error: {str(e)}'}
         }
 
 def handle_chat_request(event, headers):
@@ -68,12 +87,12 @@ def handle_chat_request(event, headers):
     try:
         # Parse request body
         if 'body' in event and event['body']:
-            body = json.loads(event['body'])
+            body = json.loads(request_body(event))
         else:
             return {
                 'statusCode': 400,
                 'headers': headers,
-                'body': json.dumps({'error': 'Request body is required'})
+                'body': {'error': 'Request body is required'}
             }
         
         # Extract user message
@@ -82,71 +101,29 @@ def handle_chat_request(event, headers):
             return {
                 'statusCode': 400,
                 'headers': headers,
-                'body': json.dumps({'error': 'Message is required'})
+                'body': {'error': 'Message is required'}
             }
         
-        # Get or create session ID
+        # Duplicate submissions (double-clicks, client retries) share one execution and its stored response
         session_id = body.get('session_id')
-        if not session_id:
-            # Create new session
-            session_id = db_manager.create_session(metadata={
-                'user_agent': event.get('headers', {}).get('User-Agent', ''),
-                'source_ip': event.get('requestContext', {}).get('identity', {}).get('sourceIp', '')
-            })
-        
-        # Get chat history from DynamoDB
-        chat_history_messages = db_manager.get_chat_history(session_id, limit=20)
-        
-        # Convert to format expected by agent
-        chat_history = []
-        for msg in chat_history_messages:
-            if msg['role'] == 'user':
-                chat_history.append(('human', msg['content']))
-            elif msg['role'] == 'assistant':
-                chat_history.append(('assistant', msg['content']))
-        
-        # Get agent and process message using LangGraph workflow with path tracking
-        chat_agent = get_agent()
-        response, workflow_info = chat_agent.query_with_path(user_message, chat_history, session_id)
-        
-        # Save user message to DynamoDB
-        db_manager.add_chat_message(
-            session_id=session_id,
-            role='user',
-            content=user_message,
-            metadata={
-                'workflow_path': workflow_info.get('path', []),
-                'intent_type': workflow_info.get('intent_type'),
-                'final_agent': workflow_info.get('final_agent')
-            }
+        client_key = body.get('idempotency_key') or header(event, 'Idempotency-Key')
+        key = chat_request_key(session_id, user_message, client_key)
+        result, outcome = idempotency_store.execute(
+            key,
+            lambda: run_chat_turn(event, session_id, user_message),
+            cacheable=lambda result: result.get('intent_type') not in ('ERROR', 'UNAVAILABLE')
         )
         
-        # Save assistant response to DynamoDB
-        db_manager.add_chat_message(
-            session_id=session_id,
-            role='assistant',
-            content=response,
-            metadata={
-                'workflow_path': workflow_info.get('path', []),
-                'intent_type': workflow_info.get('intent_type'),
-                'final_agent': workflow_info.get('final_agent')
-            }
-        )
-        
-        # Update session with latest activity
-        db_manager.update_session(session_id, last_message_at=workflow_info.get('timestamp'))
-        
         return {
             'statusCode': 200,
-            'headers': headers,
-            'body': json.dumps({
-                'response': response,
-                'session_id': session_id,
-                'workflow_path': workflow_info.get('path', []),
-                'intent_type': workflow_info.get('intent_type'),
-                'final_agent': workflow_info.get('final_agent'),
-                'message': user_message
-            })
+            'headers': dict(headers, **({'Idempotent-Replayed': 'true'} if outcome != 'executed' else {})),
+            'body': result
+        }
+    except IdempotencyConflict as e:
+        return {
+            'statusCode': 409,
+            'headers': dict(headers, **{'Retry-After': str(int(e.retry_after))}),
+            'body': {'error': str(e)}
         }
     except Exception as e:
         print(f"Error in handle_chat_request: {str(e)}")
@@ -155,9 +132,58 @@ def handle_chat_request(event, headers):
         return {
             'statusCode': 500,
             'headers': headers,
-            'body': json.dumps({'error': f'Internal server error: {str(e)}'})
+            'body': {'error': f'Internal server error: {str(e)}'}
         }
 
+def run_chat_turn(event, session_id, user_message):
+    """Run one chat turn through the agent, persist it and return the response body"""
+    # Get or create session ID
+    if not session_id:
+        # Create new session
+        session_id = db_manager.create_session(metadata={
+            'user_agent': event.get('headers', {}).get('User-Agent', ''),
+            'source_ip': event.get('requestContext', {}).get('identity', {}).get('sourceIp', '')
+        })
+    
+    # Get chat history from DynamoDB
+    chat_history_messages = db_manager.get_chat_history(session_id, limit=20)
+    
+    # Convert to format expected by agent
+    chat_history = []
+    for msg in chat_history_messages:
+        if msg['role'] == 'user':
+            chat_history.append(('human', msg['content']))
+        elif msg['role'] == 'assistant':
+            chat_history.append(('assistant', msg['content']))
+    
+    # Get agent and process message using LangGraph workflow with path tracking
+    chat_agent = get_agent()
+    started = time.perf_counter()
+    response, workflow_info = chat_agent.query_with_path(user_message, chat_history, session_id)
+    duration_ms = (time.perf_counter() - started) * 1000
+    
+    # Save the exchange and the session's latest activity in one write
+    turn_metadata = {
+        'workflow_path': workflow_info.get('path', []),
+        'intent_type': workflow_info.get('intent_type'),
+        'final_agent': workflow_info.get('final_agent')
+    }
+    # The organize state goes with the session so the next turn continues it in any container
+    session_fields = {'last_message_at': workflow_info.get('timestamp')}
+    if workflow_info.get('organize_state'):
+        session_fields['organize_state'] = workflow_info['organize_state']
+    db_manager.add_chat_turn(session_id, user_message, response, turn_metadata, duration_ms=duration_ms,
+                             **session_fields)
+    
+    return {
+        'response': response,
+        'session_id': session_id,
+        'workflow_path': workflow_info.get('path', []),
+        'intent_type': workflow_info.get('intent_type'),
+        'final_agent': workflow_info.get('final_agent'),
+        'message': user_message
+    }
+
 def handle_list_sessions(event, headers):
     """Handle GET /sessions - list all sessions"""
     try:
@@ -166,21 +192,25 @@ def handle_list_sessions(event, headers):
         limit = int(query_params.get('limit', 20))
         
         sessions = db_manager.list_sessions(limit=limit)
+        tag = sessions_etag(sessions, limit)
+        headers = {**headers, 'ETag': tag, 'Cache-Control': 'no-cache'}
+        if etag_matches(header(event, 'If-None-Match'), tag):
+            return {'statusCode': 304, 'headers': headers, 'body': None}
         
         return {
             'statusCode': 200,
             'headers': headers,
-            'body': json.dumps({
+            'body': {
                 'sessions': sessions,
                 'count': len(sessions)
-            })
+            }
         }
     except Exception as e:
         print(f"Error listing sessions: {e}")
         return {
             'statusCode': 500,
             'headers': headers,
-            'body': json.dumps({'error': f'Error listing sessions: {str(e)}'})
+            'body': {'error': f'Error listing sessions: {str(e)}'}
         }
 
 def handle_get_session(event, headers):
@@ -194,7 +224,7 @@ def handle_get_session(event, headers):
             return {
                 'statusCode': 400,
                 'headers': headers,
-                'body': json.dumps({'error': 'Session ID is required'})
+                'body': {'error': 'Session ID is required'}
             }
         
         # Get session details
@@ -203,29 +233,48 @@ def handle_get_session(event, headers):
             return {
                 'statusCode': 404,
                 'headers': headers,
-                'body': json.dumps({'error': 'Session not found'})
+                'body': {'error': 'Session not found'}
             }
         
-        # Get chat history
         query_params = event.get('queryStringParameters', {}) or {}
         limit = int(query_params.get('limit', 50))
-        chat_history = db_manager.get_chat_history(session_id, limit=limit)
+        try:
+            since = since_timestamp(query_params.get('since'))
+        except ValueError:
+            return {
+                'statusCode': 400,
+                'headers': headers,
+                'body': {'error': 'since must be an ISO timestamp'}
+            }
+        
+        # Unchanged since the client's copy: answered from the session item, no history read
+        tag = session_etag(session, limit, since)
+        headers = {**headers, 'ETag': tag, 'Cache-Control': 'no-cache'}
+        if etag_matches(header(event, 'If-None-Match'), tag):
+            return {'statusCode': 304, 'headers': headers, 'body': None}
+        
+        # Get chat history (only the messages after ?since= when given)
+        chat_history = db_manager.get_chat_history(session_id, limit=limit, since=since)
         
+        body = {
+            'session': session,
+            'chat_history': chat_history,
+            'message_count': len(chat_history)
+        }
+        if since:
+            body['since'] = since
+            headers['ETag'] = delta_etag(session, limit, since, chat_history)
         return {
             'statusCode': 200,
             'headers': headers,
-            'body': json.dumps({
-                'session': session,
-                'chat_history': chat_history,
-                'message_count': len(chat_history)
-            })
+            'body': body
         }
     except Exception as e:
         print(f"Error getting session: {e}")
         return {
             'statusCode': 500,
             'headers': headers,
-            'body': json.dumps({'error': f'Error getting session: {str(e)}'})
+            'body': {'error': f'Error getting session: {str(e)}'}
         }
 
 def handle_delete_session(event, headers):
@@ -239,7 +288,7 @@ def handle_delete_session(event, headers):
             return {
                 'statusCode': 400,
                 'headers': headers,
-                'body': json.dumps({'error': 'Session ID is required'})
+                'body': {'error': 'Session ID is required'}
             }
         
         # Check if session exists
@@ -248,24 +297,65 @@ def handle_delete_session(event, headers):
             return {
                 'statusCode': 404,
                 'headers': headers,
-                'body': json.dumps({'error': 'Session not found'})
+                'body': {'error': 'Session not found'}
             }
         
         # Delete session and all messages
         db_manager.delete_session(session_id)
+        if agent is not None:
+            agent.forget_session(session_id)
         
         return {
             'statusCode': 200,
             'headers': headers,
-            'body': json.dumps({
+            'body': {
                 'message': 'Session deleted successfully',
                 'session_id': session_id
-            })
+            }
         }
     except Exception as e:
         print(f"Error deleting session: {e}")
         return {
             'statusCode': 500,
             'headers': headers,
-            'body': json.dumps({'error': f'Error deleting session: {str(e)}'})
-        } 
\ No newline at end of file
+            'body': {'error': f'Error deleting session: {str(e)}'}
+        }
+
+def handle_restore_session(event, headers):
+    """Handle POST /sessions/{session_id}/restore - rehydrate a session from the archive"""
+    try:
+        path_params = event.get('pathParameters', {}) or {}
+        session_id = path_params.get('session_id')
+        
+        if not session_id:
+            return {
+                'statusCode': 400,
+                'headers': headers,
+                'body': {'error': 'Session ID is required'}
+            }
+        
+        session = db_manager.restore_session(session_id)
+        if not session:
+            return {
+                'statusCode': 404,
+                'headers': headers,
+                'body': {'error': 'Session not found in the archive'}
+            }
+        if agent is not None:
+            agent.forget_session(session_id)
+        
+        return {
+            'statusCode': 200,
+            'headers': headers,
+            'body': {
+                'message': 'Session restored',
+                'session': session
+            }
+        }
+    except Exception as e:
+        print(f"Error restoring session: {e}")
+        return {
+            'statusCode': 500,
+            'headers': headers,
+            'body': {'error': f'Error restoring session: {str(e)}'}
+        }
@@ -1,8 +1,8 @@
+import time
 from dotenv import load_dotenv
 from typing import Annotated, Dict, Any
 from langgraph.graph import StateGraph, START, END
 from langgraph.graph.message import add_messages
-from langchain_aws import ChatBedrock
 from typing_extensions import TypedDict
 from langgraph.checkpoint.memory import MemorySaver
 from langgraph.store.memory import InMemoryStore
@@ -14,6 +14,9 @@ from nodes.new_query_agent import new_query_agent
 from nodes.adjust_filter_agent import adjust_filter_agent
 from nodes.other_agent import other_agent
 from nodes.condition_organizer import condition_organizer
+from metrics import metrics
+from model_registry import ModelRegistry
+from speculation import Speculator
 
 # Simple reducer functions
 def merge_dicts(state, new_data):
@@ -39,12 +42,11 @@ def trim_messages(state):
 
 load_dotenv()
 
-# Initialize the LLM
-llm = ChatBedrock(
-    model_id="anthropic.claude-3-5-sonnet-20240620-v1:0",
-    region_name="us-east-1",
-    model_kwargs={"temperature": 0.0}
-)
+# Per-node models (Bedrock unless LLM_BACKEND selects the fake / record / replay backend), created on first use
+models = ModelRegistry()
+
+# Opt-in (SPECULATIVE_ORGANIZER=1): start condition_organizer while the intent is still being classified
+speculator = Speculator.from_env(condition_organizer, models.specs["condition_organizer"].model_id)
 
 # Define the state type
 class ShortMem(TypedDict):
@@ -62,6 +64,8 @@ class State(TypedDict):
     message_type: str | None
     short_mem: Annotated[ShortMem, merge_dicts]
     organize: OrganizeState
+    session_id: str | None
+    speculation: str | None
 
 # Create the optimized graph
 graph_builder = StateGraph(State)
@@ -69,37 +73,51 @@ graph_builder = StateGraph(State)
 # Add nodes with debugging
 def intent_recognizer_node(state, *, store=None):
     print(f"🔄 Intent Recognizer Node - Processing message: {state['messages'][-1].content[:50]}...")
-    result = intent_recognizer(state, llm, store)
+    speculation_id = speculator.start(state, models.llm("condition_organizer"), store) if speculator else None
+    try:
+        result = intent_recognizer(state, models.llm("intent_recognizer"), store)
+    except Exception:
+        if speculator:
+            speculator.resolve(speculation_id, None)
+        raise
+    if speculator:
+        result["speculation"] = speculator.resolve(speculation_id, result.get("message_type"))
     print(f"✅ Intent Recognizer Result: {result}")
     return result
 
 def general_agent_node(state, *, store=None):
     print(f"🔄 General Agent Node - Processing...")
-    result = general_agent(state, llm, store)
+    result = general_agent(state, models.llm("general_agent"), store)
     print(f"✅ General Agent Result: {result}")
     return result
 
 def new_query_agent_node(state, *, store=None):
     print(f"🔄 New Query Agent Node - Processing...")
-    result = new_query_agent(state, llm, store)
+    result = new_query_agent(state, models.llm("new_query_agent"), store)
     print(f"✅ New Query Agent Result: {result}")
     return result
 
 def adjust_filter_agent_node(state, *, store=None):
     print(f"🔄 Adjust Filter Agent Node - Processing...")
-    result = adjust_filter_agent(state, llm, store)
+    result = adjust_filter_agent(state, models.llm("adjust_filter_agent"), store)
     print(f"✅ Adjust Filter Agent Result: {result}")
     return result
 
 def other_agent_node(state, *, store=None):
     print(f"🔄 Other Agent Node - Processing...")
-    result = other_agent(state, llm, store)
+    result = other_agent(state, models.llm("other_agent"), store)
     print(f"✅ Other Agent Result: {result}")
     return result
 
 def condition_organizer_node(state, *, store=None):
     print(f"🔄 Condition Organizer Node - Processing...")
-    result = condition_organizer(state, llm, store)
+    result = speculator.take(state.get("speculation")) if speculator else None
+    if result is None:
+        result = condition_organizer(state, models.llm("condition_organizer"), store)
+    else:
+        print(f"🔮 Using speculative condition_organizer result")
+        result["message_type"] = state.get("message_type")
+    result["speculation"] = None
     print(f"✅ Condition Organizer Result: {result}")
     
     # Determine next step based on original message type
@@ -115,13 +133,26 @@ def condition_organizer_node(state, *, store=None):
     
     return result
 
+def timed_node(name, node):
+    """Wrap a node so each run is observed as node.<name>_ms (failures counted as node.<name>.errors)"""
+    def run(state, *, store=None):
+        start = time.perf_counter()
+        try:
+            return node(state, store=store)
+        except Exception:
+            metrics.increment(f"node.{name}.errors")
+            raise
+        finally:
+            metrics.observe(f"node.{name}_ms", (time.perf_counter() - start) * 1000)
+    return run
+
 # Add nodes to graph
-graph_builder.add_node("intent_recognizer", intent_recognizer_node)
-graph_builder.add_node("general_agent", general_agent_node)
-graph_builder.add_node("new_query_agent", new_query_agent_node)
-graph_builder.add_node("adjust_filter_agent", adjust_filter_agent_node)
-graph_builder.add_node("other_agent", other_agent_node)
-graph_builder.add_node("condition_organizer", condition_organizer_node)
+graph_builder.add_node("intent_recognizer", timed_node("intent_recognizer", intent_recognizer_node))
+graph_builder.add_node("general_agent", timed_node("general_agent", general_agent_node))
+graph_builder.add_node("new_query_agent", timed_node("new_query_agent", new_query_agent_node))
+graph_builder.add_node("adjust_filter_agent", timed_node("adjust_filter_agent", adjust_filter_agent_node))
+graph_builder.add_node("other_agent", timed_node("other_agent", other_agent_node))
+graph_builder.add_node("condition_organizer", timed_node("condition_organizer", condition_organizer_node))
 
 # Add edges - direct routing from smart_router!
 graph_builder.add_edge(START, "intent_recognizer")
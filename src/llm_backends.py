@@ -0,0 +1,485 @@
+"""
+Pluggable chat-model backends, selected with LLM_BACKEND:
+
+- bedrock (default): ChatBedrock, needs AWS credentials
+- fake:    FakeChatModel, a deterministic offline stand-in with configurable
+           latency distribution, tokens/sec and canned or rule-based outputs
+           (FAKE_LLM_CONFIG=path/to/config.json, see FakeChatModel.from_config)
+- record:  ChatBedrock, with every response captured under LLM_RECORDINGS_DIR
+- replay:  serve the responses captured by record mode from LLM_RECORDINGS_DIR
+           (LLM_REPLAY_FALLBACK=fake answers misses with the fake model,
+           LLM_REPLAY_TIMING=1 reproduces the recorded latency)
+
+All backends support what the graph nodes use: invoke, stream, bind_tools and
+with_structured_output.
+"""
+
+import hashlib
+import json
+import math
+import os
+import random
+import re
+import threading
+import time
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from langchain_core.messages import (
+    AIMessage, AIMessageChunk, BaseMessage, HumanMessage, SystemMessage, ToolMessage,
+    message_to_dict, messages_from_dict,
+)
+
+from metrics import metrics
+
+BEDROCK_MODEL_ID = "anthropic.claude-3-5-sonnet-20240620-v1:0"
+
+DEFAULT_RECORDINGS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "llm_recordings")
+
+# Rough characters per output token, for pacing fake output at tokens_per_second
+CHARS_PER_TOKEN = 4
+STREAM_CHUNK_TOKENS = 4
+
+
+def as_messages(value) -> List[BaseMessage]:
+    if isinstance(value, str):
+        return [HumanMessage(content=value)]
+    if hasattr(value, "to_messages"):
+        return value.to_messages()
+    return list(value)
+
+
+def message_text(message: BaseMessage) -> str:
+    content = message.content
+    if isinstance(content, str):
+        return content
+    return "".join(block.get("text", "") if isinstance(block, dict) else str(block) for block in content)
+
+
+# ---------------------------------------------------------------- fake model
+
+class LatencyModel:
+    """Time-to-first-token distribution (ms): fixed | uniform | normal | lognormal"""
+
+    def __init__(self, distribution: str = "fixed", seed: int = 0, scale: float = 1.0, **params):
+        self.distribution = distribution
+        self.params = params
+        self.scale = scale
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+
+    def sample_ms(self) -> float:
+        params = self.params
+        with self.lock:
+            if self.distribution == "uniform":
+                value = self.random.uniform(params.get("low_ms", 0), params.get("high_ms", 0))
+            elif self.distribution == "normal":
+                value = self.random.gauss(params.get("mean_ms", 0), params.get("stddev_ms", 0))
+            elif self.distribution == "lognormal":
+                value = params.get("median_ms", 0) * math.exp(self.random.gauss(0, params.get("sigma", 0.0)))
+            else:
+                value = params.get("ms", 0)
+        return max(0.0, value) * self.scale
+
+
+def _extract_current_conditions(system_prompt: str) -> Dict[str, Any]:
+    """Organize state the condition organizer passes back in its system prompt"""
+    marker = "Current conditions list:"
+    if marker not in system_prompt:
+        return {}
+    try:
+        return json.loads(system_prompt.split(marker, 1)[1].strip())
+    except json.JSONDecodeError:
+        return {}
+
+
+# Phrases the fake condition organizer recognizes: (pattern, field, value builder)
+ORGANIZE_PATTERNS = [
+    (r"\b(PBMCs?|plasma|serum|urine|nasal swabs?|paxgene)\b", "specimen_type",
+     lambda match: {"pbmcs": "PBMC", "pbmc": "PBMC", "nasal swabs": "Nasal Swab", "paxgene": "PAXgene"}.get(
+         match.group(1).lower(), match.group(1).title())),
+    (r"\b(female|male)s?\b", "sex", lambda match: match.group(1).title()),
+    (r"\bvisits? ((?:\d+(?:,\s*|\s+and\s+|\s*-\s*)?)+)", "visit_number",
+     lambda match: "Visits " + ", ".join(f"{int(number):02d}" for number in re.findall(r"\d+", match.group(1)))),
+    (r"\b(?:aged?|ages?) (\d+)\s*(?:-|to)\s*(\d+)", "age", lambda match: f"{match.group(1)}-{match.group(2)}"),
+    (r"\bat least (\d+) (?:vials?|aliquots?) per subject\b", "minimum_vials_per_subject",
+     lambda match: int(match.group(1))),
+    (r"\b(?:collected )?(?:in|during) (20\d\d)\b", "collection_date", lambda match: match.group(1)),
+]
+
+
+def organize_reply(messages: List[BaseMessage]) -> str:
+    """Rule-based condition organizer output: previous criteria updated with the phrases in the user message"""
+    system_prompt = next((message_text(message) for message in messages if isinstance(message, SystemMessage)), "")
+    user_text = message_text(messages[-1])
+    state = _extract_current_conditions(system_prompt)
+    criteria = dict(state.get("eligibility_criteria") or {})
+    for field, entry in criteria.items():
+        if isinstance(entry, dict):
+            criteria[field] = dict(entry, state="unchanged")
+    for pattern, field, build in ORGANIZE_PATTERNS:
+        match = re.search(pattern, user_text, re.IGNORECASE)
+        if not match:
+            continue
+        previous = criteria.get(field, {}).get("value") if isinstance(criteria.get(field), dict) else None
+        criteria[field] = {
+            "value": build(match),
+            "state": "updated" if previous is not None else "new",
+            "previous_value": previous,
+            "modification_source": match.group(0),
+        }
+    reply = {
+        "eligibility_criteria": criteria,
+        "selection_requirements": state.get("selection_requirements") or {"quantity_limits": {}, "prioritization_rules": []},
+    }
+    return json.dumps(reply, indent=2)
+
+
+# Built-in rule handlers: name -> fn(messages) returning text
+HANDLERS: Dict[str, Callable[[List[BaseMessage]], str]] = {"organize": organize_reply}
+
+# Default rules, first match wins. "system" / "match" are regexes searched in the
+# system prompt / last user message; the output is "response" (text, {input} is
+# replaced by the user message), "handler" (HANDLERS), "structured" (dict for
+# with_structured_output) or "tool_call" ({"name", "args"} when tools are bound).
+DEFAULT_RULES = [
+    {"system": r"intent.router", "match": r"\b(instead|change|only|also|remove|narrow|exclude|adjust|switch)\b",
+     "structured": {"message_type": "ADJUST_FILTER"}},
+    {"system": r"intent.router",
+     "match": r"\b(vials?|samples?|specimens?|subjects?|aliquots?|plasma|serum|pbmcs?|study|studies|visits?)\b",
+     "structured": {"message_type": "NEW_QUERY"}},
+    {"system": r"intent.router", "match": r"\b(how|what|where|when|who|hours|contact|policy|request)\b",
+     "structured": {"message_type": "GENERAL"}},
+    {"system": r"intent.router", "structured": {"message_type": "OTHER"}},
+    {"system": r"Biospecimen Query Organizer", "handler": "organize"},
+    {"system": r"RESULT SUMMARIZER|Biospecimen Query Analyzer",
+     "response": "Here is a summary of the matching biospecimens. The per-study subject and vial counts are "
+                 "listed above; let me know if you would like to narrow the criteria further."},
+    {"response": "Thanks for your message. This is a simulated response to \"{input}\"."},
+]
+
+
+class FakeChatModel:
+    """Deterministic offline chat model with configurable latency, throughput and rule-based outputs"""
+
+    def __init__(self, rules: Optional[List[Dict[str, Any]]] = None, latency: Optional[LatencyModel] = None,
+                 tokens_per_second: Optional[float] = None, tools: Optional[List[str]] = None):
+        self.rules = [dict(rule) for rule in (rules if rules is not None else DEFAULT_RULES)]
+        for rule in self.rules:
+            rule["_system"] = re.compile(rule["system"], re.IGNORECASE) if rule.get("system") else None
+            rule["_match"] = re.compile(rule["match"], re.IGNORECASE) if rule.get("match") else None
+        self.latency = latency or LatencyModel()
+        self.tokens_per_second = tokens_per_second
+        self.tools = tools or []
+
+    @classmethod
+    def from_config(cls, path: Optional[str] = None) -> "FakeChatModel":
+        """
+        Build from a JSON config (FAKE_LLM_CONFIG), e.g.
+        {"latency": {"distribution": "lognormal", "median_ms": 600, "sigma": 0.35},
+         "tokens_per_second": 80, "seed": 7, "rules": [...]}
+        Config rules are tried before DEFAULT_RULES. FAKE_LLM_LATENCY_SCALE
+        multiplies every delay (0 = instant).
+        """
+        config = {}
+        if path:
+            with open(path, encoding="utf-8") as handle:
+                config = json.load(handle)
+        scale = float(os.environ.get("FAKE_LLM_LATENCY_SCALE", "1"))
+        latency = LatencyModel(seed=config.get("seed", 0), scale=scale, **config.get("latency", {}))
+        tokens_per_second = config.get("tokens_per_second")
+        if tokens_per_second and scale > 0:
+            tokens_per_second = tokens_per_second / scale
+        elif scale == 0:
+            tokens_per_second = None
+        return cls(config.get("rules", []) + DEFAULT_RULES, latency, tokens_per_second)
+
+    def _rule(self, messages: List[BaseMessage], require: str) -> Dict[str, Any]:
+        system_prompt = "\n".join(message_text(message) for message in messages if isinstance(message, SystemMessage))
+        user_text = message_text(messages[-1]) if messages else ""
+        for rule in self.rules:
+            if require not in rule and not (require == "response" and "handler" in rule):
+                continue
+            if rule["_system"] and not rule["_system"].search(system_prompt):
+                continue
+            if rule["_match"] and not rule["_match"].search(user_text):
+                continue
+            return rule
+        return {}
+
+    def _reply_text(self, messages: List[BaseMessage]) -> str:
+        rule = self._rule(messages, "response")
+        if "handler" in rule:
+            return HANDLERS[rule["handler"]](messages)
+        return rule.get("response", "").replace("{input}", message_text(messages[-1]) if messages else "")
+
+    def _generation_seconds(self, text: str) -> float:
+        if not self.tokens_per_second:
+            return 0.0
+        return len(text) / CHARS_PER_TOKEN / self.tokens_per_second
+
+    def _usage(self, messages: List[BaseMessage], text: str) -> Dict[str, int]:
+        input_tokens = sum(len(message_text(message)) for message in messages) // CHARS_PER_TOKEN
+        output_tokens = len(text) // CHARS_PER_TOKEN
+        return {"input_tokens": input_tokens, "output_tokens": output_tokens,
+                "total_tokens": input_tokens + output_tokens}
+
+    def invoke(self, value, config=None, **kwargs) -> AIMessage:
+        messages = as_messages(value)
+        time.sleep(self.latency.sample_ms() / 1000)
+        if self.tools and not any(isinstance(message, ToolMessage) for message in messages):
+            rule = self._rule(messages, "tool_call")
+            if rule.get("tool_call", {}).get("name") in self.tools:
+                call = rule["tool_call"]
+                return AIMessage(content="", tool_calls=[{"name": call["name"], "args": call.get("args", {}),
+                                                         "id": f"fake-{len(messages)}"}])
+        text = self._reply_text(messages)
+        time.sleep(self._generation_seconds(text))
+        metrics.increment("llm.fake.calls")
+        return AIMessage(content=text, usage_metadata=self._usage(messages, text))
+
+    def stream(self, value, config=None, **kwargs) -> Iterator[AIMessageChunk]:
+        messages = as_messages(value)
+        time.sleep(self.latency.sample_ms() / 1000)
+        text = self._reply_text(messages)
+        step = CHARS_PER_TOKEN * STREAM_CHUNK_TOKENS
+        chunk_seconds = self._generation_seconds(text[:step])
+        metrics.increment("llm.fake.calls")
+        for start in range(0, len(text), step):
+            time.sleep(chunk_seconds)
+            yield AIMessageChunk(content=text[start:start + step])
+
+    def bind_tools(self, tools, **kwargs) -> "FakeChatModel":
+        bound = FakeChatModel.__new__(FakeChatModel)
+        bound.__dict__.update(self.__dict__)
+        bound.tools = [getattr(tool, "name", str(tool)) for tool in tools]
+        return bound
+
+    def with_structured_output(self, schema, **kwargs) -> "_FakeStructured":
+        return _FakeStructured(self, schema)
+
+
+class _FakeStructured:
+    def __init__(self, model: FakeChatModel, schema):
+        self.model = model
+        self.schema = schema
+
+    def invoke(self, value, config=None, **kwargs):
+        messages = as_messages(value)
+        time.sleep(self.model.latency.sample_ms() / 1000)
+        data = self.model._rule(messages, "structured").get("structured", {})
+        metrics.increment("llm.fake.calls")
+        return self.schema.model_validate(data)
+
+
+# ---------------------------------------------------------------- record / replay
+
+def _message_key(message: BaseMessage) -> Dict[str, Any]:
+    """Fields of a message that determine the model's answer (ids and metadata excluded)"""
+    key = {"type": message.type, "content": message.content}
+    if getattr(message, "tool_calls", None):
+        key["tool_calls"] = [{"name": call["name"], "args": call["args"]} for call in message.tool_calls]
+    if isinstance(message, ToolMessage):
+        key["tool_call_id"] = message.tool_call_id
+    return key
+
+
+def request_key(kind: str, messages: List[BaseMessage], tools: Optional[List[str]] = None) -> str:
+    """Stable hash of one model request"""
+    payload = {"kind": kind, "tools": sorted(tools or []), "messages": [_message_key(message) for message in messages]}
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+
+class RecordingStore:
+    """One JSON file per request key under a directory"""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.json")
+
+    def save(self, key: str, record: Dict[str, Any]):
+        temp_path = self.path(key) + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as handle:
+            json.dump(record, handle, indent=2, default=str)
+        os.replace(temp_path, self.path(key))
+
+    def load(self, key: str) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self.path(key), encoding="utf-8") as handle:
+                return json.load(handle)
+        except FileNotFoundError:
+            return None
+
+
+class RecordingChatModel:
+    """Wraps a real chat model and saves every response keyed by request_key"""
+
+    def __init__(self, model, store: RecordingStore, tools: Optional[List[str]] = None):
+        self.model = model
+        self.store = store
+        self.tools = tools or []
+
+    def _save(self, kind: str, messages: List[BaseMessage], started: float, **record):
+        key = request_key(kind, messages, self.tools)
+        record.update({"kind": kind, "tools": self.tools, "latency_ms": (time.perf_counter() - started) * 1000,
+                       "request_preview": message_text(messages[-1])[:200] if messages else ""})
+        self.store.save(key, record)
+        metrics.increment("llm.record.saved")
+
+    def invoke(self, value, config=None, **kwargs) -> AIMessage:
+        messages = as_messages(value)
+        started = time.perf_counter()
+        reply = self.model.invoke(messages, config, **kwargs)
+        self._save("invoke", messages, started, response=message_to_dict(reply))
+        return reply
+
+    def stream(self, value, config=None, **kwargs) -> Iterator[Any]:
+        messages = as_messages(value)
+        started = time.perf_counter()
+        parts, first_chunk_ms = [], None
+        try:
+            for chunk in self.model.stream(messages, config, **kwargs):
+                if first_chunk_ms is None:
+                    first_chunk_ms = (time.perf_counter() - started) * 1000
+                parts.append(chunk.content if isinstance(chunk.content, str) else message_text(chunk))
+                yield chunk
+        finally:
+            # Also saved when the consumer stops early: replay serves what was consumed
+            self._save("stream", messages, started, chunks=parts, first_chunk_ms=first_chunk_ms)
+
+    def bind_tools(self, tools, **kwargs) -> "RecordingChatModel":
+        names = [getattr(tool, "name", str(tool)) for tool in tools]
+        return RecordingChatModel(self.model.bind_tools(tools, **kwargs), self.store, names)
+
+    def with_structured_output(self, schema, **kwargs) -> "_RecordingStructured":
+        return _RecordingStructured(self, schema, self.model.with_structured_output(schema, **kwargs))
+
+
+class _RecordingStructured:
+    def __init__(self, parent: RecordingChatModel, schema, runnable):
+        self.parent = parent
+        self.schema = schema
+        self.runnable = runnable
+
+    def invoke(self, value, config=None, **kwargs):
+        messages = as_messages(value)
+        started = time.perf_counter()
+        result = self.runnable.invoke(messages, config, **kwargs)
+        self.parent._save(f"structured:{self.schema.__name__}", messages, started, response=result.model_dump())
+        return result
+
+
+class ReplayMiss(LookupError):
+    """Raised in replay mode when no recording matches the request"""
+
+
+class ReplayChatModel:
+    """Serves responses captured by RecordingChatModel"""
+
+    def __init__(self, store: RecordingStore, fallback=None, timing: bool = False, tools: Optional[List[str]] = None):
+        self.store = store
+        self.fallback = fallback
+        self.timing = timing
+        self.tools = tools or []
+
+    def _record(self, kind: str, messages: List[BaseMessage]) -> Optional[Dict[str, Any]]:
+        record = self.store.load(request_key(kind, messages, self.tools))
+        if record is None:
+            metrics.increment("llm.replay.misses")
+            if self.fallback is None:
+                raise ReplayMiss(f"No recording for {kind} request: {message_text(messages[-1])[:80]!r}")
+            return None
+        metrics.increment("llm.replay.hits")
+        return record
+
+    def _fallback(self):
+        return self.fallback.bind_tools(self.tools) if self.tools else self.fallback
+
+    def invoke(self, value, config=None, **kwargs) -> AIMessage:
+        messages = as_messages(value)
+        record = self._record("invoke", messages)
+        if record is None:
+            return self._fallback().invoke(messages)
+        if self.timing:
+            time.sleep(record["latency_ms"] / 1000)
+        return messages_from_dict([record["response"]])[0]
+
+    def stream(self, value, config=None, **kwargs) -> Iterator[AIMessageChunk]:
+        messages = as_messages(value)
+        record = self._record("stream", messages)
+        if record is None:
+            yield from self._fallback().stream(messages)
+            return
+        chunks = record["chunks"]
+        if self.timing:
+            time.sleep((record.get("first_chunk_ms") or 0) / 1000)
+        per_chunk = max(record["latency_ms"] - (record.get("first_chunk_ms") or 0), 0) / 1000 / max(len(chunks), 1)
+        for text in chunks:
+            if self.timing:
+                time.sleep(per_chunk)
+            yield AIMessageChunk(content=text)
+
+    def bind_tools(self, tools, **kwargs) -> "ReplayChatModel":
+        names = [getattr(tool, "name", str(tool)) for tool in tools]
+        return ReplayChatModel(self.store, self.fallback, self.timing, names)
+
+    def with_structured_output(self, schema, **kwargs) -> "_ReplayStructured":
+        return _ReplayStructured(self, schema)
+
+
+class _ReplayStructured:
+    def __init__(self, parent: ReplayChatModel, schema):
+        self.parent = parent
+        self.schema = schema
+
+    def invoke(self, value, config=None, **kwargs):
+        messages = as_messages(value)
+        record = self.parent._record(f"structured:{self.schema.__name__}", messages)
+        if record is None:
+            return self.parent.fallback.with_structured_output(self.schema).invoke(messages)
+        if self.parent.timing:
+            time.sleep(record["latency_ms"] / 1000)
+        return self.schema.model_validate(record["response"])
+
+
+# ---------------------------------------------------------------- selection
+
+def bedrock_llm(model_id: Optional[str] = None, max_tokens: Optional[int] = None, temperature: float = 0.0):
+    """The production Bedrock chat model, on the shared guarded runtime client (see bedrock_client)"""
+    from langchain_aws import ChatBedrock
+    from bedrock_client import BedrockSettings, bedrock_runtime_client
+    settings = BedrockSettings.from_env()
+    return ChatBedrock(
+        model_id=model_id or BEDROCK_MODEL_ID,
+        region_name=settings.region,
+        client=bedrock_runtime_client(settings),
+        max_tokens=max_tokens,
+        model_kwargs={"temperature": temperature}
+    )
+
+
+def create_llm(backend: Optional[str] = None, model_id: Optional[str] = None, max_tokens: Optional[int] = None,
+               temperature: float = 0.0):
+    """
+    Chat model for the backend named by `backend` or LLM_BACKEND (bedrock | fake | record | replay).
+    model_id / max_tokens / temperature configure the Bedrock model (ignored by fake and replay).
+    """
+    backend = (backend or os.environ.get("LLM_BACKEND") or "bedrock").lower()
+    recordings_dir = os.environ.get("LLM_RECORDINGS_DIR") or DEFAULT_RECORDINGS_DIR
+    if backend == "fake":
+        model = FakeChatModel.from_config(os.environ.get("FAKE_LLM_CONFIG"))
+    elif backend == "record":
+        model = RecordingChatModel(bedrock_llm(model_id, max_tokens, temperature), RecordingStore(recordings_dir))
+    elif backend == "replay":
+        fallback = FakeChatModel.from_config(os.environ.get("FAKE_LLM_CONFIG")) \
+            if os.environ.get("LLM_REPLAY_FALLBACK", "").lower() == "fake" else None
+        timing = os.environ.get("LLM_REPLAY_TIMING", "").lower() in ("1", "true", "yes")
+        model = ReplayChatModel(RecordingStore(recordings_dir), fallback, timing)
+    elif backend == "bedrock":
+        model = bedrock_llm(model_id, max_tokens, temperature)
+    else:
+        raise ValueError(f"Unknown LLM_BACKEND {backend!r} (expected bedrock, fake, record or replay)")
+    print(f"🤖 LLM backend: {backend}" + (f" ({model_id})" if model_id and backend in ("bedrock", "record") else ""))
+    return model
@@ -0,0 +1,57 @@
+import threading
+from collections import defaultdict
+from typing import Any, Dict
+
+
+class Metrics:
+    """In-process counters and timing observations, exposed through health endpoints and logs"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = defaultdict(float)
+        self.observations = defaultdict(list)
+        self.max_observations = 10000
+
+    def increment(self, name: str, value: float = 1):
+        """Add to a counter"""
+        with self.lock:
+            self.counters[name] += value
+
+    def observe(self, name: str, value: float):
+        """Record one observation (e.g. a latency in ms) for percentile summaries"""
+        with self.lock:
+            values = self.observations[name]
+            values.append(value)
+            if len(values) > self.max_observations:
+                del values[:len(values) - self.max_observations]
+
+    def ratio(self, hits: str, misses: str) -> float:
+        """hits / (hits + misses) for two counters"""
+        with self.lock:
+            total = self.counters[hits] + self.counters[misses]
+            return self.counters[hits] / total if total else 0.0
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Counters plus count/avg/p50/p95/p99 of each observation series"""
+        with self.lock:
+            summary = {}
+            for name, values in self.observations.items():
+                if not values:
+                    continue
+                ordered = sorted(values)
+                summary[name] = {
+                    "count": len(ordered),
+                    "avg": round(sum(ordered) / len(ordered), 3),
+                    "p50": round(ordered[int(0.50 * (len(ordered) - 1))], 3),
+                    "p95": round(ordered[int(0.95 * (len(ordered) - 1))], 3),
+                    "p99": round(ordered[int(0.99 * (len(ordered) - 1))], 3),
+                }
+            return {"counters": dict(self.counters), "observations": summary}
+
+    def reset(self):
+        with self.lock:
+            self.counters.clear()
+            self.observations.clear()
+
+# Global instance
+metrics = Metrics()
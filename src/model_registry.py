@@ -0,0 +1,179 @@
+"""
+Per-node model registry: which model, max_tokens and temperature each graph node uses
+
+Cheap classification and deflection (intent_recognizer, other_agent) default
+to Haiku; nodes that organize criteria, drive SQL tools or summarize results
+stay on the CLAUDE_MODEL_ID model. Each node is overridable with
+
+    MODEL_<NODE>_ID, MODEL_<NODE>_MAX_TOKENS, MODEL_<NODE>_TEMPERATURE
+
+(e.g. MODEL_INTENT_RECOGNIZER_ID; template.yaml maps its parameters onto
+these). Chat models are created on first use and shared by every node with
+the same (model_id, max_tokens, temperature). Each call is metered per node:
+llm.<node>_ms, llm.<node>.input_tokens / output_tokens and llm.<node>.cost_usd.
+"""
+
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional
+
+from llm_backends import CHARS_PER_TOKEN, as_messages, create_llm, message_text
+from metrics import metrics
+
+SONNET = "anthropic.claude-3-5-sonnet-20240620-v1:0"
+HAIKU = "anthropic.claude-3-haiku-20240307-v1:0"
+
+# On-demand USD per 1k (input, output) tokens
+MODEL_PRICES = {
+    SONNET: (0.003, 0.015),
+    "anthropic.claude-3-5-sonnet-20241022-v2:0": (0.003, 0.015),
+    "anthropic.claude-3-5-haiku-20241022-v1:0": (0.0008, 0.004),
+    HAIKU: (0.00025, 0.00125),
+}
+
+class ModelSpec(NamedTuple):
+    model_id: str
+    max_tokens: int
+    temperature: float = 0.0
+
+
+def default_specs() -> Dict[str, ModelSpec]:
+    primary = os.environ.get("CLAUDE_MODEL_ID") or SONNET
+    return {
+        "intent_recognizer": ModelSpec(HAIKU, 256),
+        "condition_organizer": ModelSpec(primary, 1024),
+        "new_query_agent": ModelSpec(primary, 1024),
+        "adjust_filter_agent": ModelSpec(primary, 1024),
+        "general_agent": ModelSpec(primary, 1024),
+        "other_agent": ModelSpec(HAIKU, 512),
+    }
+
+
+def load_specs() -> Dict[str, ModelSpec]:
+    """Default specs with MODEL_<NODE>_* environment overrides applied"""
+    specs = default_specs()
+    for node, spec in specs.items():
+        prefix = f"MODEL_{node.upper()}"
+        specs[node] = ModelSpec(
+            os.environ.get(f"{prefix}_ID") or spec.model_id,
+            int(os.environ.get(f"{prefix}_MAX_TOKENS") or spec.max_tokens),
+            float(os.environ.get(f"{prefix}_TEMPERATURE") or spec.temperature),
+        )
+    return specs
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN
+
+
+def call_cost(model_id: str, input_tokens: int, output_tokens: int) -> float:
+    input_price, output_price = MODEL_PRICES.get(model_id, (0.0, 0.0))
+    return input_tokens / 1000 * input_price + output_tokens / 1000 * output_price
+
+
+class MeteredChatModel:
+    """Forwards to a node's chat model and records latency, tokens and cost under the node name"""
+
+    def __init__(self, model, node: str, spec: ModelSpec):
+        self.model = model
+        self.node = node
+        self.spec = spec
+
+    def _meter(self, messages: List[Any], started: float, usage: Optional[Dict[str, int]], output_text: str):
+        input_tokens = (usage or {}).get("input_tokens") or sum(estimate_tokens(message_text(m)) for m in messages)
+        output_tokens = (usage or {}).get("output_tokens") or estimate_tokens(output_text)
+        prefix = f"llm.{self.node}"
+        metrics.observe(f"{prefix}_ms", (time.perf_counter() - started) * 1000)
+        metrics.increment(f"{prefix}.calls")
+        metrics.increment(f"{prefix}.input_tokens", input_tokens)
+        metrics.increment(f"{prefix}.output_tokens", output_tokens)
+        metrics.increment(f"{prefix}.cost_usd", call_cost(self.spec.model_id, input_tokens, output_tokens))
+
+    def invoke(self, value, config=None, **kwargs):
+        messages = as_messages(value)
+        started = time.perf_counter()
+        reply = self.model.invoke(messages, config, **kwargs)
+        tool_text = json.dumps(getattr(reply, "tool_calls", None) or [], default=str)
+        self._meter(messages, started, getattr(reply, "usage_metadata", None), message_text(reply) + tool_text)
+        return reply
+
+    def stream(self, value, config=None, **kwargs) -> Iterator[Any]:
+        messages = as_messages(value)
+        started = time.perf_counter()
+        parts, usage = [], None
+        try:
+            for chunk in self.model.stream(messages, config, **kwargs):
+                parts.append(message_text(chunk))
+                usage = getattr(chunk, "usage_metadata", None) or usage
+                yield chunk
+        finally:
+            self._meter(messages, started, usage, "".join(parts))
+
+    def bind_tools(self, tools, **kwargs) -> "MeteredChatModel":
+        return MeteredChatModel(self.model.bind_tools(tools, **kwargs), self.node, self.spec)
+
+    def with_structured_output(self, schema, **kwargs) -> "_MeteredStructured":
+        return _MeteredStructured(self, self.model.with_structured_output(schema, **kwargs))
+
+
+class _MeteredStructured:
+    def __init__(self, parent: MeteredChatModel, runnable):
+        self.parent = parent
+        self.runnable = runnable
+
+    def invoke(self, value, config=None, **kwargs):
+        messages = as_messages(value)
+        started = time.perf_counter()
+        result = self.runnable.invoke(messages, config, **kwargs)
+        output = result.model_dump_json() if hasattr(result, "model_dump_json") else json.dumps(result, default=str)
+        self.parent._meter(messages, started, None, output)
+        return result
+
+
+class ModelRegistry:
+    """Node -> metered chat model, built lazily and shared per ModelSpec"""
+
+    def __init__(self, specs: Optional[Dict[str, ModelSpec]] = None, backend: Optional[str] = None):
+        self.specs = specs or load_specs()
+        self.backend = backend
+        self.models: Dict[ModelSpec, Any] = {}
+        self.nodes: Dict[str, MeteredChatModel] = {}
+        self.lock = threading.Lock()
+
+    def llm(self, node: str) -> MeteredChatModel:
+        metered = self.nodes.get(node)
+        if metered is not None:
+            return metered
+        spec = self.specs[node]
+        with self.lock:
+            model = self.models.get(spec)
+            if model is None:
+                model = self.models[spec] = create_llm(self.backend, spec.model_id, spec.max_tokens,
+                                                       spec.temperature)
+            metered = self.nodes[node] = MeteredChatModel(model, node, spec)
+        return metered
+
+    def reset(self):
+        """Drop the built chat models; they are rebuilt (with fresh clients) on next use"""
+        with self.lock:
+            self.models.clear()
+            self.nodes.clear()
+
+    def get_status(self) -> Dict[str, Any]:
+        """Per-node model and call/token/cost totals"""
+        counters = metrics.snapshot()["counters"]
+        status = {}
+        for node, spec in self.specs.items():
+            prefix = f"llm.{node}"
+            status[node] = {
+                "model_id": spec.model_id,
+                "max_tokens": spec.max_tokens,
+                "temperature": spec.temperature,
+                "calls": int(counters.get(f"{prefix}.calls", 0)),
+                "input_tokens": int(counters.get(f"{prefix}.input_tokens", 0)),
+                "output_tokens": int(counters.get(f"{prefix}.output_tokens", 0)),
+                "cost_usd": round(counters.get(f"{prefix}.cost_usd", 0.0), 6),
+            }
+        return status
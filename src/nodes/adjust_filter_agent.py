@@ -1,9 +1,14 @@
 from datetime import datetime
+import json
 from langchain_core.messages import SystemMessage, HumanMessage, AIMessage
 import sys
 import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from utils import extract_prompt_content
+from json_extractor import chunk_text
+from vials.engine import get_engine, QueryError
+from vials.compiler import compile_organize_state
+from vials.planner import execute_compiled
 
 def adjust_filter_agent(state, llm, store):
     system_prompt = extract_prompt_content("src/nodes/prompts/AdjustFilter.md")
@@ -14,25 +19,37 @@ def adjust_filter_agent(state, llm, store):
     
     # Prepare context with organized conditions
     conditions_context = ""
-    if organize_state.get("conditions") or organize_state.get("filters"):
+    if organize_state.get("eligibility_criteria") or organize_state.get("conditions") or organize_state.get("filters"):
         conditions_context = f"\n\nCurrent Search Conditions:\n{str(organize_state)}"
 
+    # Re-evaluate the adjusted criteria; a narrowing only filters the session's previous result rows
+    query_result, route = None, None
+    engine = get_engine()
+    compiled = compile_organize_state(organize_state)
+    if engine is not None and compiled.handled and compiled.fully_compiled:
+        try:
+            query_result, route = execute_compiled(compiled, engine, session_id=state.get("session_id"), refine=True)
+            conditions_context += f"\n\nUpdated Query Results:\n{json.dumps(query_result, default=str)}"
+        except QueryError as e:
+            print(f"⚠️ Adjusted query failed: {e}")
+
     messages = [
         SystemMessage(content=system_prompt + conditions_context),
         HumanMessage(content=last_message.content)
     ]
-    reply = llm.invoke(messages)
+    reply_content = chunk_text(llm.invoke(messages))
 
     # Write to long-term memory including organize state
     if store:
         store.put(("filter", "history"), datetime.utcnow().isoformat(), {
             "request": last_message.content,
-            "response": reply.content,
-            "organize_state": organize_state
+            "response": reply_content,
+            "organize_state": organize_state,
+            "route": route
         })
 
     return {
-        "messages": [AIMessage(content=reply.content)],
+        "messages": [AIMessage(content=reply_content)],
         "organize": organize_state,  # Preserve the organize state
         "short_mem": {}
-    } 
\ No newline at end of file
+    } 
@@ -1,38 +1,149 @@
 from datetime import datetime
-from langchain_core.messages import SystemMessage, HumanMessage, AIMessage
+import json
+from langchain_core.messages import SystemMessage, HumanMessage, AIMessage, ToolMessage
 import sys
 import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from utils import extract_prompt_content
+from json_extractor import chunk_text
+from vials.engine import get_engine, QueryError
+from vials.compiler import compile_organize_state
+from vials.planner import execute_compiled
+from vials.refinement import CandidateSet, refinement_store
+from vials.selection import has_selection, select_for_compiled
+from vials.tools import sql_query_executor
+from result_cache import result_cache, make_cache_key
+
+# Upper bound on SQL tool round trips per turn
+MAX_TOOL_ROUNDS = 4
+
+# Biospecimen IDs quoted back to the LLM for the wrap-up (the full list goes to the store)
+MAX_IDS_IN_PROMPT = 50
 
 def new_query_agent(state, llm, store):
-    system_prompt = extract_prompt_content("src/nodes/prompts/NewQueryAgent-RequestOrganization.md")
     last_message = state["messages"][-1]
-    
+
     # Get the organize state from condition_organizer
     organize_state = state.get("organize", {})
-    
+
     # Prepare context with organized conditions
     conditions_context = ""
-    if organize_state.get("conditions") or organize_state.get("filters"):
+    if organize_state.get("eligibility_criteria") or organize_state.get("conditions") or organize_state.get("filters"):
         conditions_context = f"\n\nOrganized Search Conditions from previous step:\n{str(organize_state)}"
 
-    messages = [
-        SystemMessage(content=system_prompt + conditions_context),
-        HumanMessage(content=last_message.content)
-    ]
-    reply = llm.invoke(messages)
+    engine = get_engine()
+
+    # Identical (or reordered) condition sets reuse the stored answer for this dataset version
+    cache_key = None
+    if engine is not None and organize_state.get("eligibility_criteria"):
+        result_cache.check_version(engine.version)
+        cache_key = make_cache_key("new_query", organize_state, engine.version)
+        cached = result_cache.get(cache_key)
+        if cached is not None:
+            print("⚡ Result cache hit for organize state")
+            remember_candidates(state.get("session_id"), compile_organize_state(organize_state), engine)
+            return {
+                "messages": [AIMessage(content=cached["response"])],
+                "organize": organize_state,
+                "short_mem": {}
+            }
+
+    compiled = compile_organize_state(organize_state)
+    query_result = None
+    selection = None
+    if engine is not None and compiled.handled and compiled.fully_compiled:
+        # Every criterion maps to VIALS columns: answer from the cube or the compiled query
+        try:
+            query_result, route = execute_compiled(compiled, engine, session_id=state.get("session_id"))
+        except QueryError as e:
+            print(f"⚠️ Compiled query failed, falling back to SQL agent: {e}")
+
+    if query_result is not None:
+        # The LLM only writes the natural-language wrap-up
+        print(f"⚡ Compiled organize state to SQL ({len(compiled.handled)} criteria)")
+        system_prompt = extract_prompt_content("src/nodes/prompts/NewQueryAgent-Summary.md")
+        results_context = json.dumps(query_result, default=str)
+        selection_requirements = organize_state.get("selection_requirements")
+        if has_selection(selection_requirements) and engine.columnar is not None:
+            selection = select_for_compiled(engine.columnar, compiled, selection_requirements)
+        if selection is not None:
+            results_context += "\n\nSelected Biospecimens:\n" + json.dumps({
+                "selected_subjects": selection.subjects,
+                "selected_vials": selection.vials_selected,
+                "per_study": selection.per_study,
+                "biospecimen_ids": selection.biospecimen_ids[:MAX_IDS_IN_PROMPT],
+                "applied_requirements": selection.applied,
+                "requirements_not_applied": selection.unhandled
+            }, default=str)
+        messages = [
+            SystemMessage(content=system_prompt + conditions_context + f"\n\nQuery Results:\n{results_context}"),
+            HumanMessage(content=last_message.content)
+        ]
+        reply_content = chunk_text(llm.invoke(messages))
+        executed_queries = [compiled.sql]
+    elif engine is not None:
+        # Answer from the VIALS data through the SQL Query Executor tool
+        if compiled.unhandled:
+            print(f"🔄 Fields not compilable, using SQL agent: {compiled.unhandled}")
+        system_prompt = extract_prompt_content("src/nodes/prompts/NewQueryAgent-SQLAgent.md")
+        messages = [
+            SystemMessage(content=system_prompt + conditions_context),
+            HumanMessage(content=last_message.content)
+        ]
+        reply_content, executed_queries = run_sql_tool_loop(llm, messages)
+    else:
+        system_prompt = extract_prompt_content("src/nodes/prompts/NewQueryAgent-RequestOrganization.md")
+        messages = [
+            SystemMessage(content=system_prompt + conditions_context),
+            HumanMessage(content=last_message.content)
+        ]
+        reply_content = chunk_text(llm.invoke(messages))
+        executed_queries = []
+
+    if cache_key is not None:
+        result_cache.put(cache_key, {"response": reply_content, "sql": executed_queries})
 
     # Write to long-term memory including organize state
     if store:
         store.put(("query", "history"), datetime.utcnow().isoformat(), {
             "query": last_message.content,
-            "response": reply.content,
-            "organize_state": organize_state
+            "response": reply_content,
+            "organize_state": organize_state,
+            "sql": executed_queries,
+            "compiled": query_result is not None,
+            "selected_biospecimen_ids": selection.biospecimen_ids if selection is not None else []
         })
 
     return {
-        "messages": [AIMessage(content=reply.content)],
+        "messages": [AIMessage(content=reply_content)],
         "organize": organize_state,  # Preserve the organize state
         "short_mem": {}
-    } 
\ No newline at end of file
+    }
+
+def remember_candidates(session_id, compiled, engine):
+    """Record the session's candidate set for a cached answer, as execute_compiled would, so ADJUST_FILTER narrows it"""
+    if not session_id:
+        return
+    if compiled.handled and compiled.fully_compiled:
+        refinement_store.remember(session_id, CandidateSet.pending(compiled, engine.version))
+    else:
+        refinement_store.forget(session_id)
+
+def run_sql_tool_loop(llm, messages):
+    """Let the LLM call the SQL Query Executor until it produces a final answer"""
+    llm_with_tools = llm.bind_tools([sql_query_executor])
+    executed_queries = []
+    reply = None
+    for _ in range(MAX_TOOL_ROUNDS):
+        reply = llm_with_tools.invoke(messages)
+        if not getattr(reply, "tool_calls", None):
+            return chunk_text(reply), executed_queries
+        messages.append(reply)
+        for tool_call in reply.tool_calls:
+            executed_queries.append(tool_call["args"].get("query"))
+            result = sql_query_executor.invoke(tool_call["args"])
+            messages.append(ToolMessage(content=result, tool_call_id=tool_call["id"]))
+
+    # Out of tool rounds: ask for a final answer from what was retrieved
+    reply = llm.invoke(messages)
+    return chunk_text(reply), executed_queries
@@ -0,0 +1,206 @@
+"""
+JSON response bodies for lambda_function and local_server
+
+DynamoDB items carry Decimal numbers (message_count, durations, TTLs),
+Binary values and sets; `dumps` converts them on the fly through the
+encoder's `default` hook instead of a pre-pass over the payload, and uses
+orjson when it is installed (stdlib json otherwise, same output shape).
+
+Bodies larger than RESPONSE_COMPRESS_THRESHOLD bytes (default 1024) are
+compressed for clients that accept it: br when the brotli package is
+installed, else gzip. Through API Gateway a compressed body is returned
+base64-encoded with isBase64Encoded, which needs binary media types on the
+REST API (BinaryMediaTypes in template.yaml); with those set, request
+bodies also arrive base64-encoded (see `request_body`).
+
+The session endpoints answer conditional GETs: a session's ETag is derived
+from its updated_at and message_count (every write bumps both), so it is
+known from the session item alone and an If-None-Match match is answered
+304 before any history is read. The normalized ?limit= and ?since= are part
+of the ETag, so a copy of one page or delta never validates another (full
+responses and deltas carry the ETag of the client's next ?since= poll, with
+the newest message's timestamp kept on the session item). ETags are weak:
+the same state may go out gzip-, br- or un-encoded.
+"""
+
+import base64
+import gzip
+import hashlib
+import json
+import os
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESS_THRESHOLD = int(os.environ.get("RESPONSE_COMPRESS_THRESHOLD", "1024"))
+GZIP_LEVEL = 5       # within 3% of -6 on session bodies at two thirds of the time
+BROTLI_QUALITY = 5  # about gzip's speed, smaller output
+
+
+def _default(value: Any) -> Any:
+    """Types DynamoDB (and the app) put in payloads that JSON has no encoding for"""
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    if isinstance(value, (set, frozenset)):
+        return sorted(value, key=str)
+    if isinstance(value, (bytes, bytearray)):
+        return base64.b64encode(value).decode("ascii")
+    if hasattr(value, "value") and isinstance(value.value, (bytes, bytearray)):
+        # boto3.dynamodb.types.Binary
+        return base64.b64encode(value.value).decode("ascii")
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return str(value)
+
+
+def dumps(payload: Any) -> bytes:
+    """Compact UTF-8 JSON"""
+    if orjson is not None:
+        return orjson.dumps(payload, default=_default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(payload, default=_default, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def accepted_encodings(accept_encoding: Optional[str]) -> Dict[str, float]:
+    """Accept-Encoding as {coding: q}"""
+    encodings = {}
+    for part in (accept_encoding or "").split(","):
+        coding, _, params = part.strip().partition(";")
+        if not coding:
+            continue
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        encodings[coding.strip().lower()] = quality
+    return encodings
+
+
+def choose_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    encodings = accepted_encodings(accept_encoding)
+    wildcard = encodings.get("*", 0.0)
+    if brotli is not None and encodings.get("br", wildcard) > 0:
+        return "br"
+    if encodings.get("gzip", wildcard) > 0:
+        return "gzip"
+    return None
+
+
+def encode_body(payload: Any, accept_encoding: Optional[str] = None,
+                threshold: int = COMPRESS_THRESHOLD) -> Tuple[bytes, Optional[str]]:
+    """(body bytes, Content-Encoding or None)"""
+    body = payload if isinstance(payload, bytes) else dumps(payload)
+    if len(body) <= threshold:
+        return body, None
+    encoding = choose_encoding(accept_encoding)
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY), "br"
+    if encoding == "gzip":
+        return gzip.compress(body, GZIP_LEVEL), "gzip"
+    return body, None
+
+
+def etag(*parts: Any) -> str:
+    """Weak ETag over `parts`"""
+    digest = hashlib.blake2b("\x1f".join(str(part) for part in parts).encode("utf-8"), digest_size=8)
+    return f'W/"{digest.hexdigest()}"'
+
+
+def _session_state(session: Dict[str, Any]) -> Tuple[Any, ...]:
+    return session.get("session_id"), session.get("updated_at"), int(session.get("message_count") or 0)
+
+
+def session_etag(session: Dict[str, Any], limit: int, since: Optional[str] = None) -> str:
+    """
+    ETag of GET /sessions/{id}?limit=&since=: changes with every write to the
+    session. Without since it is that of ?since=<newest message>, the poll a
+    client sends after a full load, so that poll can be answered 304.
+    """
+    if since is None:
+        since = since_timestamp(session.get("last_message_timestamp"))
+    return etag(*_session_state(session), limit, since or "")
+
+
+def delta_etag(session: Dict[str, Any], limit: int, since: str, messages: List[Dict[str, Any]]) -> str:
+    """ETag of a ?since= delta: that of the client's next poll (?since=<last message sent>) while nothing changes"""
+    if messages:
+        since = since_timestamp(messages[-1]["timestamp"])
+    return session_etag(session, limit, since)
+
+
+def sessions_etag(sessions: Iterable[Dict[str, Any]], limit: int) -> str:
+    """ETag of a GET /sessions?limit= listing"""
+    return etag(limit, *(part for session in sessions for part in _session_state(session)))
+
+
+def etag_matches(if_none_match: Optional[str], current: str) -> bool:
+    """If-None-Match against the current ETag (weak comparison)"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    opaque = current[2:] if current.startswith("W/") else current
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if (candidate[2:] if candidate.startswith("W/") else candidate) == opaque:
+            return True
+    return False
+
+
+def since_timestamp(value: Optional[str]) -> Optional[str]:
+    """A `?since=` message timestamp in the stored format; ValueError if it is not an ISO timestamp"""
+    if not value:
+        return None
+    return datetime.fromisoformat(value).isoformat(timespec="microseconds")
+
+
+def header(event: Dict[str, Any], name: str) -> Optional[str]:
+    """Case-insensitive API Gateway request header"""
+    for key, value in (event.get("headers") or {}).items():
+        if key.lower() == name.lower():
+            return value
+    return None
+
+
+def request_body(event: Dict[str, Any]) -> Optional[str]:
+    """The request body as text, decoding API Gateway's base64 for binary media types"""
+    body = event.get("body")
+    if body and event.get("isBase64Encoded"):
+        return base64.b64decode(body).decode("utf-8")
+    return body
+
+
+def lambda_response(response: Dict[str, Any], event: Dict[str, Any]) -> Dict[str, Any]:
+    """Serialize (and compress) a handler's {'statusCode', 'headers', 'body': payload} for API Gateway"""
+    payload = response.get("body")
+    if payload is None:
+        # 304 Not Modified (and other bodiless responses)
+        return dict(response, headers=dict(response.get("headers") or {}, Vary="Accept-Encoding"), body="")
+    if isinstance(payload, str):
+        payload = payload.encode("utf-8")
+    body, encoding = encode_body(payload, header(event, "Accept-Encoding"))
+    headers = dict(response.get("headers") or {}, Vary="Accept-Encoding")
+    if encoding is None:
+        return dict(response, headers=headers, body=body.decode("utf-8"))
+    headers["Content-Encoding"] = encoding
+    return dict(response, headers=headers, body=base64.b64encode(body).decode("ascii"), isBase64Encoded=True)
+
+
+def get_status() -> Dict[str, Any]:
+    return {
+        "json_encoder": "orjson" if orjson is not None else "json",
+        "encodings": (["br"] if brotli is not None else []) + ["gzip"],
+        "compress_threshold": COMPRESS_THRESHOLD,
+    }
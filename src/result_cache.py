@@ -0,0 +1,182 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from metrics import metrics
+from vials.compiler import FIELD_ALIASES
+
+# Organize-state entry keys that describe how a value changed, not what it is
+STATE_KEYS = {"state", "previous_value", "modification_source", "original_text", "removal_source"}
+
+
+def _normalize_value(value: Any) -> Any:
+    """Normalize a criterion value so equivalent phrasings compare equal"""
+    if isinstance(value, bool) or value is None:
+        return value
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, str):
+        text = re.sub(r"\s+", " ", value.strip().lower())
+        if re.fullmatch(r"-?\d+(?:\.\d+)?", text):
+            return float(text)
+        return text
+    if isinstance(value, (list, tuple, set)):
+        items = [_normalize_value(item) for item in value]
+        return sorted(items, key=lambda item: json.dumps(item, sort_keys=True, default=str))
+    if isinstance(value, dict):
+        return {str(key).lower(): _normalize_value(item) for key, item in value.items() if key not in STATE_KEYS}
+    return str(value)
+
+
+def _normalize_fields(fields: Dict[str, Any]) -> Dict[str, Any]:
+    normalized = {}
+    for name, entry in (fields or {}).items():
+        if isinstance(entry, dict) and entry.get("state") == "removed":
+            continue
+        value = entry.get("value") if isinstance(entry, dict) and "value" in entry else entry
+        key = name.strip().lower()
+        normalized[FIELD_ALIASES.get(key, key)] = _normalize_value(value)
+    return normalized
+
+
+def canonicalize_criteria(organize_state: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Canonical form of an organize state: fields sorted and alias-resolved, values
+    normalized, and new/unchanged/updated state flags and source phrases dropped.
+    """
+    organize_state = organize_state or {}
+    selection = organize_state.get("selection_requirements") or {}
+    rules = sorted(selection.get("prioritization_rules") or [], key=lambda rule: rule.get("priority", 0))
+    return {
+        "eligibility_criteria": _normalize_fields(organize_state.get("eligibility_criteria")),
+        "quantity_limits": _normalize_fields(selection.get("quantity_limits")),
+        "prioritization_rules": [
+            [_normalize_value(rule.get("rule")), _normalize_value(rule.get("direction"))]
+            for rule in rules if rule.get("state") != "removed"
+        ],
+    }
+
+
+def make_cache_key(kind: str, organize_state: Dict[str, Any], dataset_version: Optional[str]) -> str:
+    """Cache key over the canonical criteria and the VIALS dataset version stamp"""
+    payload = json.dumps(
+        {"kind": kind, "version": dataset_version, "criteria": canonicalize_criteria(organize_state)},
+        sort_keys=True, default=str
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResultCache:
+    """
+    Two-tier query result cache: an in-process LRU in front of a shared
+    DynamoDB table (RESULT_CACHE_TABLE). Entries carry the dataset version and
+    are dropped when VIALS is reloaded with a new version.
+    """
+
+    def __init__(self, max_entries: int = 512, ttl_seconds: int = 24 * 3600, table_name: Optional[str] = None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.table_name = table_name if table_name is not None else os.environ.get("RESULT_CACHE_TABLE")
+        self.entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self.lock = threading.Lock()
+        self.dataset_version = None
+        self._table = None
+        self._table_disabled = not self.table_name
+
+    def _get_table(self):
+        if self._table is None and not self._table_disabled:
+            try:
+                import boto3
+                endpoint_url = os.environ.get("DYNAMODB_ENDPOINT_URL") or None
+                self._table = boto3.resource("dynamodb", endpoint_url=endpoint_url).Table(self.table_name)
+            except Exception as e:
+                print(f"⚠️ Result cache DynamoDB tier disabled: {e}")
+                self._table_disabled = True
+        return self._table
+
+    def reset_connections(self):
+        """Drop the DynamoDB handle so this process opens its own (e.g. after fork)"""
+        self._table = None
+
+    def check_version(self, dataset_version: Optional[str]):
+        """Invalidate the local tier when the dataset version stamp changes"""
+        with self.lock:
+            if dataset_version != self.dataset_version:
+                if self.dataset_version is not None:
+                    print(f"🔄 VIALS dataset version changed ({self.dataset_version} -> {dataset_version}); clearing result cache")
+                    metrics.increment("result_cache.invalidations")
+                self.entries.clear()
+                self.dataset_version = dataset_version
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        now = time.time()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry["expires_at"] > now:
+                self.entries.move_to_end(key)
+                metrics.increment("result_cache.hits.lru")
+                return entry["value"]
+            if entry is not None:
+                del self.entries[key]
+
+        table = self._get_table()
+        if table is not None:
+            try:
+                item = table.get_item(Key={"cache_key": key}).get("Item")
+                if item and int(item.get("expires_at", 0)) > now and item.get("dataset_version") == self.dataset_version:
+                    value = json.loads(item["value"])
+                    self._put_local(key, value, int(item["expires_at"]))
+                    metrics.increment("result_cache.hits.dynamodb")
+                    return value
+            except Exception as e:
+                print(f"⚠️ Result cache DynamoDB read failed: {e}")
+
+        metrics.increment("result_cache.misses")
+        return None
+
+    def put(self, key: str, value: Dict[str, Any]):
+        expires_at = int(time.time()) + self.ttl_seconds
+        self._put_local(key, value, expires_at)
+        table = self._get_table()
+        if table is not None:
+            try:
+                table.put_item(Item={
+                    "cache_key": key,
+                    "value": json.dumps(value, default=str),
+                    "dataset_version": self.dataset_version,
+                    "expires_at": expires_at
+                })
+            except Exception as e:
+                print(f"⚠️ Result cache DynamoDB write failed: {e}")
+
+    def _put_local(self, key: str, value: Dict[str, Any], expires_at: int):
+        with self.lock:
+            self.entries[key] = {"value": value, "expires_at": expires_at}
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def get_status(self) -> Dict[str, Any]:
+        """Hit ratios per tier for health checks"""
+        counters = metrics.snapshot()["counters"]
+        lru_hits = counters.get("result_cache.hits.lru", 0)
+        dynamodb_hits = counters.get("result_cache.hits.dynamodb", 0)
+        misses = counters.get("result_cache.misses", 0)
+        lookups = lru_hits + dynamodb_hits + misses
+        return {
+            "entries": len(self.entries),
+            "dataset_version": self.dataset_version,
+            "dynamodb_table": None if self._table_disabled else self.table_name,
+            "lookups": int(lookups),
+            "hit_ratio": round((lru_hits + dynamodb_hits) / lookups, 4) if lookups else 0.0,
+            "lru_hit_ratio": round(lru_hits / lookups, 4) if lookups else 0.0,
+            "dynamodb_hit_ratio": round(dynamodb_hits / lookups, 4) if lookups else 0.0
+        }
+
+# Global instance
+result_cache = ResultCache()
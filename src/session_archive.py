@@ -0,0 +1,287 @@
+"""
+Session retention: DynamoDB TTL on session items, archival of
+expiring sessions, restore on demand
+
+With RETENTION_TTL_DAYS set, every session item carries an `expires_at`
+epoch (the session table's TTL attribute), pushed back on each turn, so a
+session idle for that many days expires as a whole. History items have no
+TTL: a long-running session keeps all its turns, and they are only deleted
+together with the session, by the archival job, after it archived them.
+
+The archival job (scheduled Lambda `lambda_handler`, or
+`python src/session_archive.py`) pages through sessions whose TTL falls
+within RETENTION_ARCHIVE_LEAD_DAYS and writes them, with their history, to
+RETENTION_ARCHIVE_URI as gzip-compressed JSONL:
+
+    sessions/date=<archive date>/part-<run>-<page>.jsonl.gz   one line per session
+    index/<session_id>.json                                   part holding the session
+
+The URI is s3://bucket/prefix, or a directory (default data/session_archive)
+standing in for the bucket during development and tests. Archived sessions
+whose TTL falls before the job's next run are deleted with their history
+(unless a turn was written since the scan read them), so the job, not DynamoDB TTL, removes them (SQLite and memory have no TTL);
+the session table's TTL is only a backstop for when the job stops running.
+`restore` rehydrates an archived session with a fresh TTL.
+"""
+
+import gzip
+import json
+import os
+import sys
+import time
+import uuid
+from datetime import datetime, timezone
+from decimal import Decimal
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional
+
+from metrics import metrics
+
+# Outside src/ so archives written during development are never packaged into the Lambda bundle
+DEFAULT_ARCHIVE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data",
+                                   "session_archive")
+
+DAY_SECONDS = 24 * 3600
+RUN_INTERVAL = DAY_SECONDS  # the stack schedules the job daily
+
+
+class RetentionPolicy(NamedTuple):
+    ttl_days: int = 0           # 0: no expires_at is written, sessions are kept forever
+    archive_lead_days: int = 2  # archive sessions this long before their TTL (DynamoDB deletes within ~48h of it)
+    archive_uri: str = ""
+    page_size: int = 100        # sessions per archive part
+
+    @classmethod
+    def from_env(cls) -> "RetentionPolicy":
+        """Defaults overridden by RETENTION_<FIELD> (e.g. RETENTION_TTL_DAYS=90)"""
+        values = {}
+        for field, default in cls._field_defaults.items():
+            raw = os.environ.get(f"RETENTION_{field.upper()}")
+            if raw:
+                values[field] = type(default)(raw)
+        return cls(**values)
+
+    def expires_at(self, now: Optional[float] = None) -> Optional[int]:
+        """TTL epoch for an item written now, or None when retention is off"""
+        if self.ttl_days <= 0:
+            return None
+        return int(now if now is not None else time.time()) + self.ttl_days * DAY_SECONDS
+
+
+class LocalArchiveStore:
+    """A directory standing in for the archive bucket: same keys, same objects"""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, *key.split("/"))
+
+    def put(self, key: str, body: bytes):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path + ".tmp", "wb") as f:
+            f.write(body)
+        os.replace(path + ".tmp", path)
+
+    def get(self, key: str) -> Optional[bytes]:
+        try:
+            with open(self._path(key), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def describe(self) -> str:
+        return self.directory
+
+
+class S3ArchiveStore:
+    """Objects under s3://bucket/prefix"""
+
+    def __init__(self, bucket: str, prefix: str = ""):
+        self.bucket = bucket
+        self.prefix = prefix.strip("/")
+        self._client = None
+
+    def _get_client(self):
+        if self._client is None:
+            import boto3
+            self._client = boto3.client("s3")
+        return self._client
+
+    def _key(self, key: str) -> str:
+        return f"{self.prefix}/{key}" if self.prefix else key
+
+    def put(self, key: str, body: bytes):
+        self._get_client().put_object(Bucket=self.bucket, Key=self._key(key), Body=body)
+
+    def get(self, key: str) -> Optional[bytes]:
+        client = self._get_client()
+        try:
+            return client.get_object(Bucket=self.bucket, Key=self._key(key))["Body"].read()
+        except client.exceptions.NoSuchKey:
+            return None
+
+    def describe(self) -> str:
+        return f"s3://{self.bucket}/{self.prefix}"
+
+
+def archive_store(uri: str):
+    """S3 store for s3://bucket/prefix, otherwise a local directory"""
+    if uri.startswith("s3://"):
+        bucket, _, prefix = uri[len("s3://"):].partition("/")
+        return S3ArchiveStore(bucket, prefix)
+    return LocalArchiveStore(uri or DEFAULT_ARCHIVE_DIR)
+
+
+def _json_default(value):
+    # DynamoDB returns numbers as Decimal
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    return str(value)
+
+
+def _turn_batches(messages: List[Dict[str, Any]]) -> Iterator[List[Dict[str, Any]]]:
+    """Messages regrouped into user/assistant pairs (stored as turn items), anything else alone"""
+    index = 0
+    while index < len(messages):
+        pair = messages[index:index + 2]
+        if len(pair) == 2 and pair[0]["role"] == "user" and pair[1]["role"] == "assistant":
+            yield pair
+            index += 2
+        else:
+            yield pair[:1]
+            index += 1
+
+
+def _utc_isoformat(moment: datetime) -> str:
+    # Stored timestamps are naive UTC ISO strings, as written by DynamoDBManager
+    return moment.astimezone(timezone.utc).replace(tzinfo=None).isoformat()
+
+
+class SessionArchiver:
+    """Archival job and restore for the sessions of a DynamoDBManager"""
+
+    def __init__(self, manager, policy: Optional[RetentionPolicy] = None, store=None):
+        self.manager = manager
+        self.policy = policy or manager.retention
+        self.store = store or archive_store(self.policy.archive_uri)
+
+    def run(self, now: Optional[float] = None, dry_run: bool = False) -> Dict[str, int]:
+        """Archive sessions expiring within the lead time; delete archived sessions expiring before the next run"""
+        now = int(now if now is not None else time.time())
+        backend = self.manager.backend
+        before = now + self.policy.archive_lead_days * DAY_SECONDS
+        started = datetime.fromtimestamp(now, timezone.utc)
+        run_id = f"{started.strftime('%H%M%S')}-{uuid.uuid4().hex[:8]}"
+        date = started.strftime("%Y-%m-%d")
+        stats = {"scanned": 0, "archived": 0, "messages": 0, "deleted": 0, "parts": 0}
+
+        for page_number, page in enumerate(backend.expiring_sessions(before, self.policy.page_size)):
+            stats["scanned"] += len(page)
+            # Sessions archived since their last update only need deleting once they expire
+            pending = [session for session in page
+                       if str(session.get("archived_at", "")) < str(session.get("updated_at", ""))]
+            if pending and not dry_run:
+                key = f"sessions/date={date}/part-{run_id}-{page_number:05d}.jsonl.gz"
+                lines = []
+                for session in pending:
+                    messages = backend.get_history(session["session_id"], 0)
+                    stats["messages"] += len(messages)
+                    lines.append(json.dumps({"session": session, "messages": messages}, default=_json_default,
+                                            separators=(",", ":")))
+                self.store.put(key, gzip.compress(("\n".join(lines) + "\n").encode("utf-8"), 6))
+                archived_at = _utc_isoformat(started)
+                for session in pending:
+                    self.store.put(f"index/{session['session_id']}.json",
+                                   json.dumps({"key": key, "archived_at": archived_at}).encode("utf-8"))
+                    backend.update_session(session["session_id"], {"archived_at": archived_at, "archive_key": key})
+                stats["parts"] += 1
+            stats["archived"] += len(pending)
+
+            # Deleted ahead of their TTL so DynamoDB never drops a session item and leaves its history behind.
+            # Only as seen in the scan: a turn written since then pushed the TTL back and must not be lost
+            for session in page:
+                if int(session.get("expires_at", now + RUN_INTERVAL)) < now + RUN_INTERVAL and not dry_run:
+                    if backend.delete_session(session["session_id"], updated_at=session["updated_at"]):
+                        self.manager.cache.invalidate(session["session_id"])
+                        stats["deleted"] += 1
+
+        metrics.increment("retention.archived_sessions", stats["archived"])
+        metrics.increment("retention.deleted_sessions", stats["deleted"])
+        return stats
+
+    def load(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """The archived record ({'session', 'messages'}) of a session, or None"""
+        index = self.store.get(f"index/{session_id}.json")
+        if index is None:
+            return None
+        body = self.store.get(json.loads(index)["key"])
+        if body is None:
+            return None
+        for line in gzip.decompress(body).decode("utf-8").splitlines():
+            record = json.loads(line)
+            if record["session"]["session_id"] == session_id:
+                return record
+        return None
+
+    def restore(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """Write an archived session and its history back with a fresh TTL; returns the session or None"""
+        record = self.load(session_id)
+        if record is None:
+            return None
+        backend = self.manager.backend
+        now = _utc_isoformat(datetime.now(timezone.utc))
+        expires_at = self.policy.expires_at()
+        session = dict(record["session"], updated_at=now, restored_at=now, message_count=0)
+        session.pop("expires_at", None)
+        if expires_at:
+            session["expires_at"] = expires_at
+        with backend.transaction():
+            backend.create_session(session)
+            for batch in _turn_batches(record["messages"]):
+                # Archives written before history items lost their TTL may still carry expires_at
+                items = [{key: value for key, value in message.items() if key != "expires_at"} for message in batch]
+                backend.add_messages(session_id, items, updated_at=now)
+        metrics.increment("retention.restored_sessions")
+        print(f"♻️ Restored session {session_id}: {len(record['messages'])} messages")
+        return backend.get_session(session_id)
+
+
+def lambda_handler(event, context):
+    """Scheduled archival job"""
+    from dynamodb_manager import db_manager
+
+    stats = db_manager.archiver.run(dry_run=bool((event or {}).get("dry_run")))
+    print(f"📦 Session archival: {stats}")
+    return stats
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Archive sessions expiring under the retention policy")
+    parser.add_argument("--dry-run", action="store_true", help="Count expiring sessions without writing")
+    parser.add_argument("--restore", metavar="SESSION_ID", help="Restore one archived session instead")
+    parser.add_argument("--enable-ttl", action="store_true",
+                        help="Turn on DynamoDB TTL (expires_at) for the session table (and off for history) first")
+    args = parser.parse_args()
+
+    sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+    from dynamodb_manager import db_manager
+
+    if args.enable_ttl:
+        client = db_manager.dynamodb.meta.client
+        client.update_time_to_live(TableName=db_manager.session_table_name, TimeToLiveSpecification={
+            "AttributeName": "expires_at", "Enabled": True})
+        print(f"⏳ TTL enabled on {db_manager.session_table_name}")
+        # History items written by earlier versions carry expires_at; they must not expire on their own
+        status = client.describe_time_to_live(TableName=db_manager.history_table_name)["TimeToLiveDescription"]
+        if status.get("TimeToLiveStatus") in ("ENABLED", "ENABLING"):
+            client.update_time_to_live(TableName=db_manager.history_table_name, TimeToLiveSpecification={
+                "AttributeName": "expires_at", "Enabled": False})
+            print(f"⏳ TTL disabled on {db_manager.history_table_name}")
+    if args.restore:
+        restored = db_manager.restore_session(args.restore)
+        print(f"♻️ {args.restore}: {'restored' if restored else 'no archive found'}")
+    else:
+        print(f"📦 Archiving to {db_manager.archiver.store.describe()}: {db_manager.archiver.run(dry_run=args.dry_run)}")
@@ -0,0 +1,180 @@
+"""
+In-process read-through cache of session items and their recent history
+
+Consecutive turns of a session usually reach the same warm container, so
+DynamoDBManager keeps the session item and the last SESSION_CACHE_MESSAGES
+messages of up to SESSION_CACHE_SIZE sessions. Writes made through the
+manager update entries in place. Before an entry is served it is checked
+against the stored message_count (count_messages: one small GetItem on
+DynamoDB, no history Query); a turn written by another container changes
+the count and the entry is re-read. An entry checked within the last
+SESSION_CACHE_TRUST_SECONDS is served without checking again, which covers
+the get_session + get_chat_history pair of one request.
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional
+
+from metrics import metrics
+
+
+class _Entry:
+    __slots__ = ("session", "messages", "message_count", "complete", "checked_at")
+
+    def __init__(self, session: Optional[Dict[str, Any]], messages: List[Dict[str, Any]], message_count: int,
+                 complete: bool):
+        self.session = session
+        self.messages = messages      # latest messages, oldest first
+        self.message_count = message_count
+        self.complete = complete      # messages is the whole history
+        self.checked_at = time.monotonic()
+
+
+class SessionCache:
+    """Bounded LRU of session entries; all methods are thread-safe"""
+
+    def __init__(self, max_sessions: Optional[int] = None, max_messages: Optional[int] = None,
+                 trust_seconds: Optional[float] = None):
+        self.max_sessions = max_sessions if max_sessions is not None else int(
+            os.environ.get("SESSION_CACHE_SIZE", "256"))
+        self.max_messages = max_messages if max_messages is not None else int(
+            os.environ.get("SESSION_CACHE_MESSAGES", "50"))
+        self.trust_seconds = trust_seconds if trust_seconds is not None else float(
+            os.environ.get("SESSION_CACHE_TRUST_SECONDS", "1.0"))
+        self.entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self.lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_sessions > 0
+
+    def _checked(self, session_id: str, count: Callable[[], int]) -> Optional[_Entry]:
+        """The entry, if it still matches the stored message_count"""
+        with self.lock:
+            entry = self.entries.get(session_id)
+            if entry is None:
+                return None
+            self.entries.move_to_end(session_id)
+            if time.monotonic() - entry.checked_at < self.trust_seconds:
+                return entry
+            cached_count = entry.message_count
+        metrics.increment("session_cache.checks")
+        stored_count = count()
+        with self.lock:
+            if stored_count != cached_count or self.entries.get(session_id) is not entry:
+                # Written elsewhere (another container) since we cached it
+                self.entries.pop(session_id, None)
+                metrics.increment("session_cache.stale")
+                return None
+            entry.checked_at = time.monotonic()
+            return entry
+
+    def _put(self, session_id: str, entry: _Entry):
+        # Caller holds the lock
+        self.entries[session_id] = entry
+        self.entries.move_to_end(session_id)
+        while len(self.entries) > self.max_sessions:
+            self.entries.popitem(last=False)
+
+    def get_session(self, session_id: str, load: Callable[[], Optional[Dict[str, Any]]],
+                    count: Callable[[], int]) -> Optional[Dict[str, Any]]:
+        """Cached session item, or `load()` it (a fresh item also re-validates the cached history)"""
+        if not self.enabled:
+            return load()
+        entry = self._checked(session_id, count)
+        if entry is not None and entry.session is not None:
+            metrics.increment("session_cache.hits")
+            return dict(entry.session)
+        metrics.increment("session_cache.misses")
+        session = load()
+        if session is not None:
+            with self.lock:
+                entry = self.entries.get(session_id)
+                message_count = int(session.get("message_count", 0))
+                if entry is not None and entry.message_count == message_count:
+                    entry.session = dict(session)
+                    entry.checked_at = time.monotonic()
+                else:
+                    self._put(session_id, _Entry(dict(session), [], message_count, message_count == 0))
+        return session
+
+    def get_history(self, session_id: str, limit: int, load: Callable[[int], List[Dict[str, Any]]],
+                    count: Callable[[], int], since: Optional[str] = None,
+                    load_since: Optional[Callable[[int], List[Dict[str, Any]]]] = None) -> List[Dict[str, Any]]:
+        """
+        Latest `limit` messages from the cached tail, or `load(n)` and cache
+        them. With `since`, only the messages after it: served from the tail
+        when the tail reaches back that far, else `load_since(n)` (not cached).
+        """
+        if since is not None:
+            return self._history_since(session_id, limit, since, load_since, count)
+        if not self.enabled or limit <= 0 or limit > self.max_messages:
+            return load(limit)
+        entry = self._checked(session_id, count)
+        if entry is not None and (entry.complete or len(entry.messages) >= limit):
+            metrics.increment("session_cache.hits")
+            return entry.messages[-limit:]
+        metrics.increment("session_cache.misses")
+        messages = load(self.max_messages)
+        # A short read is the whole history; a full one needs the stored count to validate later
+        message_count = len(messages) if len(messages) < self.max_messages else count()
+        with self.lock:
+            session = entry.session if entry is not None else None
+            self._put(session_id, _Entry(session, messages, message_count, len(messages) < self.max_messages))
+        return messages[-limit:]
+
+    def _history_since(self, session_id: str, limit: int, since: str,
+                       load_since: Callable[[int], List[Dict[str, Any]]],
+                       count: Callable[[], int]) -> List[Dict[str, Any]]:
+        entry = self._checked(session_id, count) if self.enabled else None
+        if entry is not None and (entry.complete or (entry.messages and entry.messages[0]["timestamp"] <= since)):
+            metrics.increment("session_cache.hits")
+            newer = [message for message in entry.messages if message["timestamp"] > since]
+            return newer[-limit:] if limit > 0 else newer
+        if self.enabled:
+            metrics.increment("session_cache.misses")
+        return load_since(limit)
+
+    def created(self, session: Dict[str, Any]):
+        """A session this process just created: empty and complete"""
+        if self.enabled:
+            with self.lock:
+                self._put(session["session_id"], _Entry(dict(session), [], 0, True))
+
+    def appended(self, session_id: str, items: List[Dict[str, Any]], session_fields: Dict[str, Any]):
+        """Messages written through this process: extend the tail and the session in place"""
+        with self.lock:
+            entry = self.entries.get(session_id)
+            if entry is None:
+                return
+            entry.messages = (entry.messages + items)[-self.max_messages:]
+            entry.complete = entry.complete and entry.message_count + len(items) <= self.max_messages
+            entry.message_count += len(items)
+            if entry.session is not None:
+                entry.session.update(session_fields, message_count=entry.message_count)
+
+    def updated(self, session_id: str, fields: Dict[str, Any]):
+        with self.lock:
+            entry = self.entries.get(session_id)
+            if entry is not None and entry.session is not None:
+                entry.session.update(fields)
+
+    def invalidate(self, session_id: str):
+        with self.lock:
+            self.entries.pop(session_id, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def get_status(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "sessions": len(self.entries),
+            "max_sessions": self.max_sessions,
+            "max_messages": self.max_messages,
+            "hit_rate": metrics.ratio("session_cache.hits", "session_cache.misses"),
+        }
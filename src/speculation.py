@@ -0,0 +1,197 @@
+"""
+Speculative execution of condition_organizer alongside intent recognition
+
+NEW_QUERY and ADJUST_FILTER turns run intent_recognizer -> condition_organizer,
+two model calls in sequence. The organizer's output does not depend on the
+intent, so with SPECULATIVE_ORGANIZER=1 it is started on a worker thread as
+soon as the turn begins. When the intent comes back in SPECULATIVE_INTENTS
+(default NEW_QUERY,ADJUST_FILTER) the organizer node takes the speculative
+result; otherwise the run is cancelled (its stream stops at the next chunk)
+and discarded. Long-term store writes are deferred until the result is used.
+The run sees the turn's context variables (the Bedrock request deadline), and
+waiting for it never outlasts that deadline.
+
+Metrics: speculation.started / hits / misses / errors / timeouts, speculation.saved_ms and
+speculation.wait_ms per hit, speculation.wasted_input_tokens /
+wasted_output_tokens / wasted_cost_usd for discarded runs.
+"""
+
+import contextvars
+import copy
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Any, Callable, Dict, Iterator, Optional
+
+from bedrock_client import remaining_budget
+from llm_backends import CHARS_PER_TOKEN, as_messages, message_text
+from metrics import metrics
+from model_registry import call_cost
+
+# Intents the graph routes through condition_organizer; only these can use a speculative result
+ORGANIZER_INTENTS = ("NEW_QUERY", "ADJUST_FILTER")
+
+
+class DeferredStore:
+    """Buffers store.put calls so a discarded speculation leaves no trace in long-term memory"""
+
+    def __init__(self, store):
+        self.store = store
+        self.puts = []
+
+    def put(self, namespace, key, value):
+        self.puts.append((namespace, key, value))
+
+    def commit(self):
+        if self.store is not None:
+            for namespace, key, value in self.puts:
+                self.store.put(namespace, key, value)
+        self.puts = []
+
+
+class CancellableLLM:
+    """Forwards invoke/stream, stops streaming once cancelled and counts the characters sent and received"""
+
+    def __init__(self, llm, cancelled: threading.Event):
+        self.llm = llm
+        self.cancelled = cancelled
+        self.input_chars = 0
+        self.output_chars = 0
+
+    def invoke(self, value, config=None, **kwargs):
+        messages = as_messages(value)
+        self.input_chars += sum(len(message_text(message)) for message in messages)
+        reply = self.llm.invoke(messages, config, **kwargs)
+        self.output_chars += len(message_text(reply))
+        return reply
+
+    def stream(self, value, config=None, **kwargs) -> Iterator[Any]:
+        messages = as_messages(value)
+        self.input_chars += sum(len(message_text(message)) for message in messages)
+        chunks = self.llm.stream(messages, config, **kwargs)
+        try:
+            for chunk in chunks:
+                if self.cancelled.is_set():
+                    return
+                self.output_chars += len(message_text(chunk))
+                yield chunk
+        finally:
+            if hasattr(chunks, "close"):
+                chunks.close()
+
+
+class SpeculativeRun:
+    def __init__(self, llm: CancellableLLM, store: DeferredStore, cancelled: threading.Event):
+        self.llm = llm
+        self.store = store
+        self.cancelled = cancelled
+        self.future = None
+        self.run_ms = None
+        self.discarded = False
+
+
+class Speculator:
+    """Starts a node function speculatively and hands its result over (hit) or discards it (miss)"""
+
+    def __init__(self, node: Callable[..., Dict[str, Any]], intents, model_id: str = "", max_workers: int = 8):
+        self.node = node
+        self.intents = set(intents)
+        self.model_id = model_id
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="speculate")
+        self.runs: Dict[str, SpeculativeRun] = {}
+        self.lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, node, model_id: str = "") -> Optional["Speculator"]:
+        """None unless SPECULATIVE_ORGANIZER is enabled"""
+        if os.environ.get("SPECULATIVE_ORGANIZER", "").lower() not in ("1", "true", "yes"):
+            return None
+        configured = os.environ.get("SPECULATIVE_INTENTS", ",".join(ORGANIZER_INTENTS)).split(",")
+        intents = [intent.strip().upper() for intent in configured if intent.strip().upper() in ORGANIZER_INTENTS]
+        max_workers = int(os.environ.get("SPECULATIVE_WORKERS", "8"))
+        print(f"🔮 Speculative condition_organizer enabled for {', '.join(intents)}")
+        return cls(node, intents, model_id, max_workers)
+
+    def start(self, state: Dict[str, Any], llm, store) -> str:
+        """Run the node on a private copy of the state; returns the speculation id"""
+        cancelled = threading.Event()
+        run = SpeculativeRun(CancellableLLM(llm, cancelled), DeferredStore(store), cancelled)
+        speculative_state = dict(state, organize=copy.deepcopy(state.get("organize")))
+        speculation_id = str(uuid.uuid4())
+
+        def execute():
+            started = time.perf_counter()
+            try:
+                return self.node(speculative_state, run.llm, run.store)
+            finally:
+                run.run_ms = (time.perf_counter() - started) * 1000
+
+        with self.lock:
+            self.runs[speculation_id] = run
+        # Run in a copy of this turn's context so the request deadline applies to its model calls
+        run.future = self.executor.submit(contextvars.copy_context().run, execute)
+        run.future.add_done_callback(lambda _: self._finished(run))
+        metrics.increment("speculation.started")
+        return speculation_id
+
+    def resolve(self, speculation_id: Optional[str], message_type: Optional[str]) -> Optional[str]:
+        """Keep the speculation when the intent is speculated (returns its id), otherwise cancel it"""
+        if speculation_id is None:
+            return None
+        if message_type in self.intents:
+            metrics.increment("speculation.hits")
+            return speculation_id
+        with self.lock:
+            run = self.runs.pop(speculation_id, None)
+        if run is not None:
+            metrics.increment("speculation.misses")
+            run.discarded = True
+            run.cancelled.set()
+            if run.future.cancel():
+                metrics.increment("speculation.cancelled_before_start")
+        return None
+
+    def take(self, speculation_id: Optional[str]) -> Optional[Dict[str, Any]]:
+        """Wait for a kept speculation and return the node result (None: run the node normally)"""
+        with self.lock:
+            run = self.runs.pop(speculation_id, None) if speculation_id else None
+        if run is None:
+            return None
+        waited = time.perf_counter()
+        try:
+            result = run.future.result(timeout=remaining_budget())
+        except FutureTimeoutError:
+            print("⚠️ Speculative condition_organizer still running at the request deadline; discarding it")
+            metrics.increment("speculation.timeouts")
+            run.discarded = True
+            run.cancelled.set()
+            return None
+        except Exception as e:
+            print(f"⚠️ Speculative condition_organizer failed, running it again: {e}")
+            metrics.increment("speculation.errors")
+            return None
+        wait_ms = (time.perf_counter() - waited) * 1000
+        run.store.commit()
+        metrics.observe("speculation.wait_ms", wait_ms)
+        metrics.observe("speculation.saved_ms", max(0.0, (run.run_ms or 0.0) - wait_ms))
+        return result
+
+    def _finished(self, run: SpeculativeRun):
+        if not run.discarded:
+            return
+        input_tokens = run.llm.input_chars // CHARS_PER_TOKEN
+        output_tokens = run.llm.output_chars // CHARS_PER_TOKEN
+        metrics.increment("speculation.wasted_input_tokens", input_tokens)
+        metrics.increment("speculation.wasted_output_tokens", output_tokens)
+        metrics.increment("speculation.wasted_cost_usd", call_cost(self.model_id, input_tokens, output_tokens))
+
+    def get_status(self) -> Dict[str, Any]:
+        counters = metrics.snapshot()["counters"]
+        return {
+            "intents": sorted(self.intents),
+            "hit_rate": round(metrics.ratio("speculation.hits", "speculation.misses"), 3),
+            "in_flight": len(self.runs),
+            "wasted_cost_usd": round(counters.get("speculation.wasted_cost_usd", 0.0), 6),
+        }
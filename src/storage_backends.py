@@ -0,0 +1,531 @@
+"""
+Session/history storage backends behind DynamoDBManager, selected with STORAGE_BACKEND:
+
+- dynamodb (default): SESSION_TABLE / HISTORY_TABLE (DYNAMODB_ENDPOINT_URL for
+            DynamoDB Local); falls back to memory when the tables are unreachable
+- sqlite:   one file (SQLITE_PATH) shared by every process on the host: WAL
+            journal, history clustered on (session_id, timestamp), sessions
+            indexed on updated_at, each turn written in one transaction
+- memory:   per-process dicts, nothing survives a restart
+
+Backends store plain items shaped like the DynamoDB tables (session items
+keyed by session_id, message items keyed by (session_id, timestamp));
+DynamoDBManager builds the items, timestamps and ids.
+"""
+
+import bisect
+import contextlib
+import itertools
+import json
+import math
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Iterator, List, Optional
+
+from history_format import ITEM_VERSION, decode_messages, encode_messages
+
+# Outside src/ so a development database is never packaged into the Lambda bundle
+DEFAULT_SQLITE_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data",
+                                   "chat_storage.sqlite3")
+
+# Session columns with their own SQLite column; other update_session fields go to `attributes`
+SESSION_COLUMNS = ("session_id", "created_at", "updated_at", "message_count", "metadata")
+
+
+class StorageBackend:
+    """
+    Interface implemented by every backend. add_messages writes a batch of
+    messages for one session and bumps its message_count and updated_at
+    (plus any `session_fields`) in the same write; get_history returns the
+    latest `limit` messages oldest first, only those newer than `since`
+    (a message timestamp) when it is given.
+    """
+
+    name = "base"
+    # Whether other processes see the same data (prefork workers need this for sessions to resolve)
+    shared = False
+
+    def create_session(self, item: Dict[str, Any]):
+        raise NotImplementedError
+
+    def get_session(self, session_id: str) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def update_session(self, session_id: str, fields: Dict[str, Any]):
+        raise NotImplementedError
+
+    def add_messages(self, session_id: str, items: List[Dict[str, Any]], updated_at: str,
+                     session_fields: Optional[Dict[str, Any]] = None):
+        raise NotImplementedError
+
+    def get_history(self, session_id: str, limit: int, since: Optional[str] = None) -> List[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def count_messages(self, session_id: str) -> int:
+        raise NotImplementedError
+
+    def delete_session(self, session_id: str, updated_at: Optional[str] = None) -> bool:
+        """
+        Delete a session and its history; with `updated_at`, only if the
+        session was not written since it was read at that updated_at.
+        Returns whether the session was deleted.
+        """
+        raise NotImplementedError
+
+    def list_sessions(self, limit: int) -> List[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def expiring_sessions(self, before: int, page_size: int) -> Iterator[List[Dict[str, Any]]]:
+        """Pages of sessions whose `expires_at` TTL is earlier than `before` (epoch seconds)"""
+        raise NotImplementedError
+
+    def transaction(self) -> contextlib.AbstractContextManager:
+        """Group several writes into one commit where the backend supports it"""
+        return contextlib.nullcontext()
+
+    def reconnect(self):
+        """Drop connections inherited across a fork"""
+
+    def get_status(self) -> Dict[str, Any]:
+        return {}
+
+
+class MemoryBackend(StorageBackend):
+    """
+    Per-process dicts. Each session's messages are kept in timestamp order as
+    they are added, and sessions in updated_at order (every update moves the
+    session to the end), so reads and listings never sort.
+    """
+
+    name = "memory"
+
+    def __init__(self):
+        self.sessions: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self.messages: Dict[str, List[Dict[str, Any]]] = {}
+        self.lock = threading.Lock()
+
+    def create_session(self, item):
+        with self.lock:
+            self.sessions[item['session_id']] = item
+            self.sessions.move_to_end(item['session_id'])
+
+    def get_session(self, session_id):
+        return self.sessions.get(session_id)
+
+    def update_session(self, session_id, fields):
+        with self.lock:
+            if session_id in self.sessions:
+                self.sessions[session_id].update(fields)
+                if 'updated_at' in fields:
+                    self.sessions.move_to_end(session_id)
+
+    def add_messages(self, session_id, items, updated_at, session_fields=None):
+        with self.lock:
+            messages = self.messages.setdefault(session_id, [])
+            for item in items:
+                if messages and item['timestamp'] < messages[-1]['timestamp']:
+                    bisect.insort(messages, item, key=lambda message: message['timestamp'])
+                else:
+                    messages.append(item)
+            if session_id in self.sessions:
+                self.sessions[session_id].update(session_fields or {})
+                self.sessions[session_id]['message_count'] = len(messages)
+                self.sessions[session_id]['updated_at'] = updated_at
+                self.sessions.move_to_end(session_id)
+
+    def get_history(self, session_id, limit, since=None):
+        messages = self.messages.get(session_id, [])
+        if since is not None:
+            messages = messages[bisect.bisect_right(messages, since, key=lambda message: message['timestamp']):]
+        return messages[-limit:] if limit > 0 else list(messages)
+
+    def count_messages(self, session_id):
+        return len(self.messages.get(session_id, []))
+
+    def delete_session(self, session_id, updated_at=None):
+        with self.lock:
+            session = self.sessions.get(session_id)
+            if updated_at is not None and (session is None or session.get('updated_at') != updated_at):
+                return False
+            self.sessions.pop(session_id, None)
+            self.messages.pop(session_id, None)
+            return True
+
+    def list_sessions(self, limit):
+        with self.lock:
+            return [self.sessions[session_id] for session_id in itertools.islice(reversed(self.sessions), limit)]
+
+    def expiring_sessions(self, before, page_size):
+        with self.lock:
+            # Copies: the archival job compares what it saw against the live session when deleting
+            expiring = [dict(session) for session in self.sessions.values()
+                        if 'expires_at' in session and int(session['expires_at']) < before]
+        for first in range(0, len(expiring), page_size):
+            yield expiring[first:first + page_size]
+
+    def get_status(self):
+        return {
+            'local_sessions_count': len(self.sessions),
+            'local_messages_count': sum(len(messages) for messages in self.messages.values()),
+        }
+
+
+class DynamoDBBackend(StorageBackend):
+    """
+    Session and history tables; message_count is an atomic counter, bulk
+    writes use batch_writer. History items are written in the compact format
+    of history_format.py (HISTORY_ITEM_VERSION) and read back in any version.
+    With turn items (version 3) a chat turn is one PutItem plus one UpdateItem,
+    and a history page of N messages reads about N / 2 items.
+    """
+
+    name = "dynamodb"
+    shared = True
+
+    def __init__(self, dynamodb, session_table_name: str, history_table_name: str, item_version: int = ITEM_VERSION):
+        self.session_table_name = session_table_name
+        self.history_table_name = history_table_name
+        self.item_version = item_version
+        self.connect(dynamodb)
+
+    def connect(self, dynamodb):
+        self.session_table = dynamodb.Table(self.session_table_name)
+        self.history_table = dynamodb.Table(self.history_table_name)
+
+    def create_session(self, item):
+        self.session_table.put_item(Item=item)
+
+    def get_session(self, session_id):
+        return self.session_table.get_item(Key={'session_id': session_id}).get('Item')
+
+    def update_session(self, session_id, fields):
+        update_expression = "SET " + ", ".join(f"#{key} = :{key}" for key in fields)
+        self.session_table.update_item(
+            Key={'session_id': session_id},
+            UpdateExpression=update_expression,
+            ExpressionAttributeNames={f"#{key}": key for key in fields},
+            ExpressionAttributeValues={f":{key}": value for key, value in fields.items()}
+        )
+
+    def add_messages(self, session_id, items, updated_at, session_fields=None):
+        message_count = len(items)
+        items = encode_messages(items, self.item_version)
+        if len(items) == 1:
+            self.history_table.put_item(Item=items[0])
+        else:
+            with self.history_table.batch_writer() as batch:
+                for item in items:
+                    batch.put_item(Item=item)
+        fields = dict(session_fields or {}, updated_at=updated_at)
+        self.session_table.update_item(
+            Key={'session_id': session_id},
+            UpdateExpression="SET " + ", ".join(f"#{key} = :{key}" for key in fields) +
+                             " ADD message_count :message_count",
+            ExpressionAttributeNames={f"#{key}": key for key in fields},
+            ExpressionAttributeValues={**{f":{key}": value for key, value in fields.items()},
+                                       ':message_count': message_count}
+        )
+
+    @staticmethod
+    def _messages_in(item: Dict[str, Any]) -> int:
+        return 2 if int(item.get('v', 1)) >= 3 else 1
+
+    def get_history(self, session_id, limit, since=None):
+        query = {
+            'KeyConditionExpression': 'session_id = :session_id',
+            'ExpressionAttributeValues': {':session_id': session_id},
+            'ScanIndexForward': False,  # Most recent first
+        }
+        if since is not None:
+            # A turn item is keyed by its user message, so `since` at that message still reads the item
+            query['KeyConditionExpression'] += ' AND #timestamp >= :since'
+            query['ExpressionAttributeNames'] = {'#timestamp': 'timestamp'}
+            query['ExpressionAttributeValues'][':since'] = since
+        stored = []
+        found = 0
+        # Turn items hold two messages each, so ask for half as many items while the pages are turns
+        turns = self.item_version >= 3
+        while True:
+            if limit > 0:
+                remaining = limit - found
+                query['Limit'] = math.ceil(remaining / 2) if turns else remaining
+            response = self.history_table.query(**query)
+            page = response.get('Items', [])
+            stored.extend(page)
+            found += sum(self._messages_in(item) for item in page)
+            turns = any(self._messages_in(item) == 2 for item in page)
+            if (limit > 0 and found >= limit) or 'LastEvaluatedKey' not in response:
+                break
+            query['ExclusiveStartKey'] = response['LastEvaluatedKey']
+        # Reverse to get chronological order
+        stored.reverse()
+        messages = decode_messages(stored)
+        if since is not None:
+            messages = [message for message in messages if message['timestamp'] > since]
+        return messages[-limit:] if limit > 0 else messages
+
+    def count_messages(self, session_id):
+        # message_count is kept per message whatever the item version; count items only for sessions without it
+        session = self.session_table.get_item(Key={'session_id': session_id},
+                                              ProjectionExpression='message_count').get('Item')
+        if session and 'message_count' in session:
+            return int(session['message_count'])
+        query = {
+            'KeyConditionExpression': 'session_id = :session_id',
+            'ExpressionAttributeValues': {':session_id': session_id},
+            'ProjectionExpression': '#v',
+            'ExpressionAttributeNames': {'#v': 'v'},
+        }
+        count = 0
+        while True:
+            response = self.history_table.query(**query)
+            count += sum(self._messages_in(item) for item in response.get('Items', []))
+            if 'LastEvaluatedKey' not in response:
+                return count
+            query['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+    def delete_session(self, session_id, updated_at=None):
+        if updated_at is not None:
+            # Session item first, conditionally: a turn written since it was read keeps the session and its history
+            from botocore.exceptions import ClientError
+            try:
+                self.session_table.delete_item(Key={'session_id': session_id},
+                                               ConditionExpression='updated_at = :updated_at',
+                                               ExpressionAttributeValues={':updated_at': updated_at})
+            except ClientError as e:
+                if e.response.get('Error', {}).get('Code') == 'ConditionalCheckFailedException':
+                    return False
+                raise
+        query = {
+            'KeyConditionExpression': 'session_id = :session_id',
+            'ExpressionAttributeValues': {':session_id': session_id},
+            'ProjectionExpression': '#timestamp',
+            'ExpressionAttributeNames': {'#timestamp': 'timestamp'},
+        }
+        with self.history_table.batch_writer() as batch:
+            while True:
+                response = self.history_table.query(**query)
+                for item in response.get('Items', []):
+                    batch.delete_item(Key={'session_id': session_id, 'timestamp': item['timestamp']})
+                if 'LastEvaluatedKey' not in response:
+                    break
+                query['ExclusiveStartKey'] = response['LastEvaluatedKey']
+        if updated_at is None:
+            self.session_table.delete_item(Key={'session_id': session_id})
+        return True
+
+    def list_sessions(self, limit):
+        response = self.session_table.scan(
+            Limit=limit,
+            ProjectionExpression='session_id, created_at, updated_at, message_count'
+        )
+        return response.get('Items', [])
+
+    def expiring_sessions(self, before, page_size):
+        scan = {
+            'FilterExpression': 'expires_at < :before',
+            'ExpressionAttributeValues': {':before': before},
+            'Limit': page_size,
+        }
+        while True:
+            response = self.session_table.scan(**scan)
+            if response.get('Items'):
+                yield response['Items']
+            if 'LastEvaluatedKey' not in response:
+                return
+            scan['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+    def get_status(self):
+        return {'session_table': self.session_table_name, 'history_table': self.history_table_name,
+                'history_item_version': self.item_version}
+
+
+class SQLiteBackend(StorageBackend):
+    """
+    One SQLite file in WAL mode: readers never block the writer, so several
+    server workers can share it. Each thread has its own connection; writes
+    run in BEGIN IMMEDIATE transactions, and `transaction()` batches many
+    writes into one commit.
+    """
+
+    name = "sqlite"
+    shared = True
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS sessions (
+            session_id TEXT PRIMARY KEY,
+            created_at TEXT NOT NULL,
+            updated_at TEXT NOT NULL,
+            message_count INTEGER NOT NULL DEFAULT 0,
+            metadata TEXT NOT NULL DEFAULT '{}',
+            attributes TEXT NOT NULL DEFAULT '{}'
+        );
+        CREATE INDEX IF NOT EXISTS sessions_updated_at ON sessions (updated_at);
+        CREATE TABLE IF NOT EXISTS messages (
+            session_id TEXT NOT NULL,
+            timestamp TEXT NOT NULL,
+            message_id TEXT NOT NULL,
+            role TEXT NOT NULL,
+            content TEXT NOT NULL,
+            metadata TEXT NOT NULL DEFAULT '{}',
+            PRIMARY KEY (session_id, timestamp)
+        ) WITHOUT ROWID;
+    """
+
+    def __init__(self, path: Optional[str] = None, busy_timeout_ms: int = 5000):
+        self.path = path or os.environ.get("SQLITE_PATH") or DEFAULT_SQLITE_PATH
+        self.busy_timeout_ms = busy_timeout_ms
+        self.local = threading.local()
+        self.pid = os.getpid()
+        if self.path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self._connection().executescript(self.SCHEMA)
+
+    def _connection(self) -> sqlite3.Connection:
+        if self.pid != os.getpid():
+            self.reconnect()
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            # Autocommit mode: transactions are explicit (BEGIN IMMEDIATE in _write)
+            conn = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(f"PRAGMA busy_timeout={self.busy_timeout_ms}")
+            self.local.conn = conn
+            self.local.depth = 0
+        return conn
+
+    @contextlib.contextmanager
+    def _write(self) -> Iterator[sqlite3.Connection]:
+        conn = self._connection()
+        if self.local.depth:
+            # Inside transaction(): the outermost block commits
+            yield conn
+            return
+        conn.execute("BEGIN IMMEDIATE")
+        self.local.depth = 1
+        try:
+            yield conn
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            self.local.depth = 0
+
+    def transaction(self):
+        return self._write()
+
+    def reconnect(self):
+        # Connections must not cross a fork: start a fresh thread-local set in this process
+        self.local = threading.local()
+        self.pid = os.getpid()
+
+    @staticmethod
+    def _session(row: sqlite3.Row) -> Dict[str, Any]:
+        session = json.loads(row['attributes'])
+        session.update(session_id=row['session_id'], created_at=row['created_at'], updated_at=row['updated_at'],
+                       message_count=row['message_count'], metadata=json.loads(row['metadata']))
+        return session
+
+    @staticmethod
+    def _message(row: sqlite3.Row) -> Dict[str, Any]:
+        return {'session_id': row['session_id'], 'timestamp': row['timestamp'], 'message_id': row['message_id'],
+                'role': row['role'], 'content': row['content'], 'metadata': json.loads(row['metadata'])}
+
+    def create_session(self, item):
+        attributes = {key: value for key, value in item.items() if key not in SESSION_COLUMNS}
+        with self._write() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO sessions (session_id, created_at, updated_at, message_count, metadata, "
+                "attributes) VALUES (?, ?, ?, ?, ?, ?)",
+                (item['session_id'], item['created_at'], item['updated_at'], item.get('message_count', 0),
+                 json.dumps(item.get('metadata') or {}, default=str), json.dumps(attributes, default=str)))
+
+    def get_session(self, session_id):
+        row = self._connection().execute("SELECT * FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+        return self._session(row) if row else None
+
+    def update_session(self, session_id, fields):
+        columns = {key: value for key, value in fields.items() if key in SESSION_COLUMNS}
+        attributes = {key: value for key, value in fields.items() if key not in SESSION_COLUMNS}
+        if 'metadata' in columns:
+            columns['metadata'] = json.dumps(columns['metadata'], default=str)
+        assignments = [f"{key} = ?" for key in columns]
+        values = list(columns.values())
+        if attributes:
+            assignments.append("attributes = json_patch(attributes, ?)")
+            values.append(json.dumps(attributes, default=str))
+        if not assignments:
+            return
+        with self._write() as conn:
+            conn.execute(f"UPDATE sessions SET {', '.join(assignments)} WHERE session_id = ?", values + [session_id])
+
+    def add_messages(self, session_id, items, updated_at, session_fields=None):
+        rows = [(item['session_id'], item['timestamp'], item['message_id'], item['role'], item['content'],
+                 json.dumps(item.get('metadata') or {}, default=str)) for item in items]
+        with self._write() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO messages (session_id, timestamp, message_id, role, content, metadata) "
+                "VALUES (?, ?, ?, ?, ?, ?)", rows)
+            conn.execute("UPDATE sessions SET message_count = message_count + ?, updated_at = ? WHERE session_id = ?",
+                         (len(rows), updated_at, session_id))
+            if session_fields:
+                self.update_session(session_id, session_fields)
+
+    def get_history(self, session_id, limit, since=None):
+        conn = self._connection()
+        where, params = "session_id = ?", (session_id,)
+        if since is not None:
+            where, params = "session_id = ? AND timestamp > ?", (session_id, since)
+        if limit > 0:
+            rows = conn.execute(f"SELECT * FROM messages WHERE {where} ORDER BY timestamp DESC LIMIT ?",
+                                params + (limit,)).fetchall()
+            rows.reverse()
+        else:
+            rows = conn.execute(f"SELECT * FROM messages WHERE {where} ORDER BY timestamp", params).fetchall()
+        return [self._message(row) for row in rows]
+
+    def count_messages(self, session_id):
+        # Kept by add_messages in the same transaction, like DynamoDB's message_count: no scan of the history
+        row = self._connection().execute("SELECT message_count FROM sessions WHERE session_id = ?",
+                                         (session_id,)).fetchone()
+        return row[0] if row else 0
+
+    def delete_session(self, session_id, updated_at=None):
+        with self._write() as conn:
+            if updated_at is None:
+                conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+            elif not conn.execute("DELETE FROM sessions WHERE session_id = ? AND updated_at = ?",
+                                  (session_id, updated_at)).rowcount:
+                return False
+            conn.execute("DELETE FROM messages WHERE session_id = ?", (session_id,))
+            return True
+
+    def list_sessions(self, limit):
+        rows = self._connection().execute("SELECT * FROM sessions ORDER BY updated_at DESC LIMIT ?",
+                                          (limit,)).fetchall()
+        return [self._session(row) for row in rows]
+
+    def expiring_sessions(self, before, page_size):
+        # expires_at lives in the attributes JSON; the archival job is a batch scan, so no index
+        last = ""
+        while True:
+            rows = self._connection().execute(
+                "SELECT * FROM sessions WHERE session_id > ? AND json_extract(attributes, '$.expires_at') < ? "
+                "ORDER BY session_id LIMIT ?", (last, before, page_size)).fetchall()
+            if not rows:
+                return
+            yield [self._session(row) for row in rows]
+            last = rows[-1]['session_id']
+
+    def get_status(self):
+        conn = self._connection()
+        return {
+            'path': self.path,
+            'journal_mode': conn.execute("PRAGMA journal_mode").fetchone()[0],
+            'sessions_count': conn.execute("SELECT COUNT(*) FROM sessions").fetchone()[0],
+        }
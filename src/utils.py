@@ -1,12 +1,12 @@
 import random
 import string
 import json
-import re
 from typing import Dict, Any, List, Optional
 from dotenv import load_dotenv
 import os
 import uuid
 from datetime import datetime
+from json_extractor import extract_first_json
 
 load_dotenv()
 
@@ -32,16 +32,10 @@ def extract_JSON_from_response(response: str) -> Dict[str, Any]:
         conditions = json.loads(response)
         return conditions
     except json.JSONDecodeError:
-        # If that fails, try to extract JSON from within the response text
-        try:
-            # Look for JSON-like structure between curly braces
-            json_match = re.search(r'\{.*\}', response, re.DOTALL)
-            if json_match:
-                json_str = json_match.group(0)
-                conditions = json.loads(json_str)
-                return conditions
-        except (json.JSONDecodeError, AttributeError):
-            pass
+        # If that fails, scan for the first complete {...} inside the response text
+        conditions = extract_first_json(response)
+        if conditions is not None:
+            return conditions
         
         # If JSON extraction fails completely, return empty dict
         print("Warning: Could not parse JSON from response")
@@ -51,38 +45,14 @@ def extract_JSON_from_response(response: str) -> Dict[str, Any]:
 def extract_JSON_from_response_Langchain(response: str):
     """
     Try to extract and parse JSON from the LLM response.
-    1. Find ```json ... ``` code block; if not found, then find {...}
-    2. Replace \n with \\n
+    Code fences and surrounding prose are skipped, and raw newlines inside
+    JSON strings are escaped while scanning (single linear pass).
     """
-    # remove ```json ... ```
-    code_block = re.search(r"```json(.*?)```", response, flags=re.DOTALL | re.IGNORECASE)
-    if code_block:
-        candidate = code_block.group(1).strip()
-    else:
-        # Backtrack: Find the outermost {...}
-        brace_match = re.search(r"\{.*\}", response, flags=re.DOTALL)
-        if not brace_match:
-            print("Warning: No JSON object found in response")
-            return {}
-        candidate = brace_match.group(0)
-
-    # Replace \n with \\n
-    def _escape_newlines(match: re.Match):
-        return match.group(0).replace("\n", "\\n")
-
-    candidate = re.sub(
-        r'"(?:[^"\\]|\\.)*"',     # non-greedy match a valid JSON string
-        _escape_newlines,
-        candidate,
-        flags=re.DOTALL
-    )
-
-    # Parse the JSON
-    try:
-        return json.loads(candidate)
-    except json.JSONDecodeError as e:
-        print("Warning: Still failed to parse JSON ->", e)
+    conditions = extract_first_json(response)
+    if conditions is None:
+        print("Warning: No JSON object found in response")
         return {}
+    return conditions
     
 
 def load_and_escape_prompt(prompt_path: str) -> str:
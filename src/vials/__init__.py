@@ -0,0 +1 @@
+# VIALS biospecimen data package: schema, loaders and the embedded query engine
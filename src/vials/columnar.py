@@ -0,0 +1,402 @@
+"""
+Columnar in-memory VIALS store
+
+Every text column is dictionary-encoded into a compact integer code array,
+numeric columns are typed NumPy arrays, and each value of the low-cardinality
+categorical columns gets a packed bitmap (1 bit per row). Multi-criteria
+filters become bitwise AND/OR over bitmaps instead of row scans.
+biospecimen_ids is kept only as interned group codes plus packed integer IDs
+(vials.ids); the strings are rebuilt for output. collection_date is also held
+as epoch days with a sorted range index, so a date window is two binary
+searches instead of parsing every row's string (the date strings are not kept).
+Only COLUMNAR_COLUMNS are held: everything else is only read through the
+SQLite engine, which keeps the full table anyway.
+"""
+
+import sys
+import time
+from array import array
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+
+from vials.ids import BiospecimenIdIndex
+from vials.schema import COLUMN_TYPES, coerce_value, epoch_day
+
+# Categorical columns with one bitmap per distinct value
+BITMAP_COLUMNS = [
+    "study_id", "specimen_type", "status", "arm", "sex", "race", "ethnicity", "visit_number",
+    "consent_future_use_specimens", "consent_future_use_genetic_testing", "test_short_name",
+]
+
+# Columns the columnar path filters, dedups, groups, ranks or counts on (vials.compiler predicates,
+# grouping columns and vials.selection); a predicate on any other column falls back to the row engine
+COLUMNAR_COLUMNS = BITMAP_COLUMNS + ["subject_id", "vials_count", "biospecimen_ids", "collection_date", "age",
+                                     "numeric_results"]
+
+# Sentinel for NULL in integer columns (ages and vial counts are never negative)
+INT_NULL = -1
+
+# Sentinel for a missing date in epoch-day columns (any negative day is a real date)
+DAY_NULL = np.iinfo(np.int32).min
+
+# What the row engine's dedup step groups on (vials.compiler.DEDUP_COLUMNS), biospecimen_ids last
+GROUP_KEY_COLUMNS = ["study_id", "subject_id", "visit_number", "vials_count"]
+
+# Predicate column -> (range-indexed column, bound parser); predicates keep ISO date bounds
+RANGE_COLUMNS = {"collection_date": ("collection_day", epoch_day)}
+
+
+class DictionaryColumn:
+    """Dictionary-encoded text column: values[codes[row]]"""
+
+    def __init__(self, values: List[Any], codes: np.ndarray):
+        self.values = values
+        self.codes = codes
+        self.lookup = {value: code for code, value in enumerate(values)}
+
+    def codes_for(self, values: Sequence[Any]) -> List[int]:
+        return [self.lookup[value] for value in values if value in self.lookup]
+
+    def decode(self, rows: np.ndarray) -> List[Any]:
+        values = self.values
+        return [values[code] for code in self.codes[rows]]
+
+    @property
+    def nbytes(self) -> int:
+        return self.codes.nbytes + sum(sys.getsizeof(value) for value in self.values)
+
+
+class RangeIndex:
+    """Integer column plus its rows sorted by value: a range query is two binary searches"""
+
+    def __init__(self, data: np.ndarray, null: int):
+        self.data = data
+        self.null = null
+        order = np.argsort(data, kind="stable")
+        self.order = order[data[order] != null].astype(np.int32)
+        self.sorted = data[self.order]
+
+    def rows_between(self, low: Optional[int], high: Optional[int]) -> np.ndarray:
+        """Row indices with low <= value <= high (None = open), in value order"""
+        start = 0 if low is None else np.searchsorted(self.sorted, low, side="left")
+        end = len(self.sorted) if high is None else np.searchsorted(self.sorted, high, side="right")
+        return self.order[start:end]
+
+    def mask_between(self, rows: np.ndarray, low: Optional[int], high: Optional[int]) -> np.ndarray:
+        """Boolean mask over `rows` (gathers, for small candidate sets)"""
+        values = self.data[rows]
+        mask = values != self.null
+        if low is not None:
+            mask &= values >= low
+        if high is not None:
+            mask &= values <= high
+        return mask
+
+    @property
+    def nbytes(self) -> int:
+        return self.data.nbytes + self.order.nbytes + self.sorted.nbytes
+
+
+def pack_mask(mask: np.ndarray) -> np.ndarray:
+    """Boolean row mask -> packed bitmap"""
+    return np.packbits(mask)
+
+
+def unpack_bitmap(bitmap: np.ndarray, n_rows: int) -> np.ndarray:
+    """Packed bitmap -> boolean row mask"""
+    return np.unpackbits(bitmap, count=n_rows).view(bool)
+
+
+class ColumnarVials:
+    """Columnar VIALS table with dictionary-encoded text and per-value bitmap indexes"""
+
+    def __init__(self):
+        self.n_rows = 0
+        self.text_columns: Dict[str, DictionaryColumn] = {}
+        self.numeric_columns: Dict[str, np.ndarray] = {}
+        self.bitmaps: Dict[str, Dict[int, np.ndarray]] = {}
+        self.range_indexes: Dict[str, RangeIndex] = {}
+        self.build_seconds = 0.0
+        # Interned biospecimen_ids: group code per row and the packed IDs of each group
+        self.group_codes = np.zeros(0, dtype=np.int32)
+        self.biospecimen_ids = BiospecimenIdIndex().finalize()
+        # Group index: representative row per biospecimen group, dense (study, subject) pair per group
+        self.group_rows = np.zeros(0, dtype=np.int64)
+        self.group_pairs = np.zeros(0, dtype=np.int64)
+        self.pair_studies = np.zeros(0, dtype=np.int64)
+
+    # ---------------------------------------------------------------- building
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[Dict[str, Any]]) -> "ColumnarVials":
+        """Build from VIALS records (dicts keyed by column name)"""
+        store = cls()
+        start = time.perf_counter()
+        dictionaries = {}
+        buffers = {}
+        for name in COLUMNAR_COLUMNS:
+            column_type = COLUMN_TYPES[name]
+            if column_type == "TEXT":
+                dictionaries[name] = {}
+                buffers[name] = array("i")
+            elif column_type == "INTEGER":
+                buffers[name] = array("i")
+            else:
+                buffers[name] = array("f")
+
+        for row in rows:
+            for name in COLUMNAR_COLUMNS:
+                value = coerce_value(name, row.get(name))
+                column_type = COLUMN_TYPES[name]
+                if column_type == "TEXT":
+                    lookup = dictionaries[name]
+                    code = lookup.get(value)
+                    if code is None:
+                        code = len(lookup)
+                        lookup[value] = code
+                    buffers[name].append(code)
+                elif column_type == "INTEGER":
+                    buffers[name].append(INT_NULL if value is None else int(value))
+                else:
+                    buffers[name].append(float("nan") if value is None else float(value))
+            store.n_rows += 1
+
+        for name in COLUMNAR_COLUMNS:
+            column_type = COLUMN_TYPES[name]
+            if column_type == "TEXT":
+                values = list(dictionaries[name])
+                codes = np.frombuffer(buffers[name], dtype=np.int32)
+                # Narrowest code width that fits the dictionary
+                dtype = np.uint8 if len(values) <= 0xFF else np.uint16 if len(values) <= 0xFFFF else np.int32
+                store.text_columns[name] = DictionaryColumn(values, codes.astype(dtype))
+            elif column_type == "INTEGER":
+                store.numeric_columns[name] = np.frombuffer(buffers[name], dtype=np.int32).copy()
+            else:
+                store.numeric_columns[name] = np.frombuffer(buffers[name], dtype=np.float32).copy()
+
+        # One group per distinct dedup key, as in the SQL dedup: rows with NULL or empty
+        # biospecimen_ids only share a group within the same subject, visit and vial count
+        ids_column = store.text_columns.pop("biospecimen_ids")
+        key = np.stack([store.text_columns[name].codes.astype(np.int64) if name in store.text_columns
+                        else store.numeric_columns[name].astype(np.int64) for name in GROUP_KEY_COLUMNS]
+                       + [ids_column.codes.astype(np.int64)], axis=1)
+        if store.n_rows:
+            _, first_rows, inverse = np.unique(key, axis=0, return_index=True, return_inverse=True)
+        else:
+            first_rows, inverse = np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        store.group_codes = inverse.reshape(-1).astype(np.int32)
+        store.biospecimen_ids = BiospecimenIdIndex.from_values(
+            [ids_column.values[code] for code in ids_column.codes[first_rows]], keep_lookup=False, distinct=False)
+        store.build_bitmaps()
+        store.build_range_indexes()
+        store.build_group_index()
+        store.build_seconds = time.perf_counter() - start
+        return store
+
+    @classmethod
+    def from_engine(cls, engine) -> "ColumnarVials":
+        """Build from the rows already loaded into the SQLite engine"""
+        cursor = engine.conn.execute(f"SELECT {', '.join(COLUMNAR_COLUMNS)} FROM VIALS")
+        return cls.from_rows(dict(zip(COLUMNAR_COLUMNS, row)) for row in cursor)
+
+    def build_bitmaps(self):
+        """One packed bitmap per distinct value of each BITMAP_COLUMNS column"""
+        for name in BITMAP_COLUMNS:
+            column = self.text_columns[name]
+            order = np.argsort(column.codes, kind="stable")
+            boundaries = np.searchsorted(column.codes[order], np.arange(len(column.values) + 1))
+            bitmaps = {}
+            for code in range(len(column.values)):
+                mask = np.zeros(self.n_rows, dtype=bool)
+                mask[order[boundaries[code]:boundaries[code + 1]]] = True
+                bitmaps[code] = pack_mask(mask)
+            self.bitmaps[name] = bitmaps
+
+    def build_range_indexes(self):
+        """Epoch days per row (parsed once per distinct date string) and their sorted range index"""
+        dates = self.text_columns.pop("collection_date")
+        days_by_code = np.array([DAY_NULL if day is None else day for day in map(epoch_day, dates.values)],
+                                dtype=np.int32)
+        self.range_indexes["collection_day"] = RangeIndex(days_by_code[dates.codes], DAY_NULL)
+
+    def _range_bounds(self, column, value):
+        """(range index, low, high) for a between predicate on a range-indexed column"""
+        indexed, parse = RANGE_COLUMNS[column]
+        low, high = value
+        return (self.range_indexes[indexed],
+                None if low is None else parse(low), None if high is None else parse(high))
+
+    def build_group_index(self):
+        """Precompute the dedup step so counting scatters flags instead of sorting"""
+        _, self.group_rows = np.unique(self.group_codes, return_index=True)
+        n_subjects = len(self.text_columns["subject_id"].values)
+        pair_keys = (self.text_columns["study_id"].codes[self.group_rows].astype(np.int64) * n_subjects
+                     + self.text_columns["subject_id"].codes[self.group_rows])
+        unique_pairs, self.group_pairs = np.unique(pair_keys, return_inverse=True)
+        self.pair_studies = unique_pairs // n_subjects
+
+    # ---------------------------------------------------------------- filtering
+
+    def predicate_bitmap(self, predicate) -> Optional[np.ndarray]:
+        """Packed bitmap of the rows satisfying one predicate, or None if unsupported"""
+        column, op, value = predicate
+        if op == "in" and column in self.bitmaps:
+            result = np.zeros((self.n_rows + 7) // 8, dtype=np.uint8)
+            for code in self.text_columns[column].codes_for(value):
+                np.bitwise_or(result, self.bitmaps[column][code], out=result)
+            return result
+        if op == "in" and column in self.text_columns:
+            text = self.text_columns[column]
+            return pack_mask(np.isin(text.codes, text.codes_for(value)))
+        if op == "between" and column in self.numeric_columns:
+            data = self.numeric_columns[column]
+            low, high = value
+            mask = data != INT_NULL if data.dtype == np.int32 else ~np.isnan(data)
+            if low is not None:
+                mask &= data >= low
+            if high is not None:
+                mask &= data <= high
+            return pack_mask(mask)
+        if op == "between" and column in RANGE_COLUMNS:
+            index, low, high = self._range_bounds(column, value)
+            mask = np.zeros(self.n_rows, dtype=bool)
+            mask[index.rows_between(low, high)] = True
+            return pack_mask(mask)
+        return None
+
+    def filter_bitmap(self, predicates: Sequence) -> Optional[np.ndarray]:
+        """AND of all predicate bitmaps, or None if any predicate is unsupported"""
+        result = np.full((self.n_rows + 7) // 8, 0xFF, dtype=np.uint8)
+        for predicate in predicates:
+            bitmap = self.predicate_bitmap(predicate)
+            if bitmap is None:
+                return None
+            np.bitwise_and(result, bitmap, out=result)
+        return result
+
+    def filter_rows(self, predicates: Sequence) -> Optional[np.ndarray]:
+        """Row indices matching all predicates"""
+        bitmap = self.filter_bitmap(predicates)
+        if bitmap is None:
+            return None
+        return np.flatnonzero(unpack_bitmap(bitmap, self.n_rows))
+
+    def filter_subset(self, rows: np.ndarray, predicates: Sequence) -> Optional[np.ndarray]:
+        """Rows of an existing candidate set that match all predicates (gathers, no bitmaps)"""
+        keep = np.ones(len(rows), dtype=bool)
+        for column, op, value in predicates:
+            if op == "in" and column in self.text_columns:
+                text = self.text_columns[column]
+                allowed = np.zeros(len(text.values), dtype=bool)
+                allowed[text.codes_for(value)] = True
+                keep &= allowed[text.codes[rows]]
+            elif op == "between" and column in self.numeric_columns:
+                data = self.numeric_columns[column][rows]
+                low, high = value
+                keep &= data != INT_NULL if data.dtype == np.int32 else ~np.isnan(data)
+                if low is not None:
+                    keep &= data >= low
+                if high is not None:
+                    keep &= data <= high
+            elif op == "between" and column in RANGE_COLUMNS:
+                index, low, high = self._range_bounds(column, value)
+                keep &= index.mask_between(rows, low, high)
+            else:
+                return None
+        return rows[keep]
+
+    # ---------------------------------------------------------------- counting
+
+    def unique_groups(self, rows: np.ndarray) -> np.ndarray:
+        """One representative row per biospecimen group (the dedup CTE) with any row among rows"""
+        flags = np.zeros(len(self.group_rows), dtype=bool)
+        flags[self.group_codes[rows]] = True
+        return self.group_rows[flags]
+
+    def _group_key(self, rows: np.ndarray, columns: Sequence[str]) -> np.ndarray:
+        key = np.zeros(len(rows), dtype=np.int64)
+        for name in columns:
+            if name in self.text_columns:
+                codes = self.text_columns[name].codes[rows].astype(np.int64)
+                radix = len(self.text_columns[name].values)
+            else:
+                codes = self.numeric_columns[name][rows].astype(np.int64)
+                radix = int(codes.max()) + 2 if len(codes) else 1
+            key = key * radix + codes
+        return key
+
+    def apply_group_rules(self, groups: np.ndarray, group_minimums=(), all_visits=()) -> np.ndarray:
+        """Apply SUM(vials_count) >= N per grouping and the all-timepoints rule, vectorized"""
+        vials = np.maximum(self.numeric_columns["vials_count"], 0)
+        for group_minimum in group_minimums:
+            if len(groups) == 0:
+                break
+            _, inverse = np.unique(self._group_key(groups, group_minimum.columns), return_inverse=True)
+            totals = np.bincount(inverse, weights=vials[groups])
+            groups = groups[totals[inverse] >= group_minimum.minimum]
+        if all_visits and len(groups):
+            # Subjects available at every visit: AND of one subject bitmap per visit
+            subjects = self.text_columns["subject_id"].codes[groups]
+            visits = self.text_columns["visit_number"].codes[groups]
+            qualified = np.ones(len(self.text_columns["subject_id"].values), dtype=bool)
+            for code in self.text_columns["visit_number"].codes_for(all_visits):
+                present = np.zeros_like(qualified)
+                present[subjects[visits == code]] = True
+                qualified &= present
+            if len(self.text_columns["visit_number"].codes_for(all_visits)) < len(set(all_visits)):
+                qualified[:] = False
+            groups = groups[qualified[subjects]]
+        return groups
+
+    def counts_by_study(self, groups: np.ndarray) -> List[Dict[str, Any]]:
+        """Distinct subjects and SUM(vials_count) per study over deduplicated groups"""
+        if len(groups) == 0:
+            return []
+        study = self.text_columns["study_id"]
+        study_codes = study.codes[groups]
+        vials = np.bincount(study_codes, weights=np.maximum(self.numeric_columns["vials_count"][groups], 0),
+                            minlength=len(study.values))
+        pair_flags = np.zeros(len(self.pair_studies), dtype=bool)
+        pair_flags[self.group_pairs[self.group_codes[groups]]] = True
+        subjects = np.bincount(self.pair_studies[pair_flags], minlength=len(study.values))
+        results = [
+            {"study_id": study.values[code], "subjects_count": int(subjects[code]), "total_biospecimens": int(vials[code])}
+            for code in range(len(study.values)) if subjects[code] > 0
+        ]
+        return sorted(results, key=lambda row: str(row["study_id"]))
+
+    def execute_compiled(self, compiled) -> Optional[List[Dict[str, Any]]]:
+        """Answer a CompiledQuery, or None when a predicate needs the row engine"""
+        if compiled.unhandled:
+            return None
+        rows = self.filter_rows(compiled.predicates)
+        if rows is None:
+            return None
+        return self.counts_for_rows(rows, compiled)
+
+    def counts_for_rows(self, rows: np.ndarray, compiled) -> List[Dict[str, Any]]:
+        """Dedup, group rules and per-study counts over rows already matching the predicates"""
+        return self.counts_for_groups(self.unique_groups(rows), compiled)
+
+    def counts_for_groups(self, groups: np.ndarray, compiled) -> List[Dict[str, Any]]:
+        """Group rules and per-study counts over deduplicated groups matching the predicates"""
+        return self.counts_by_study(self.apply_group_rules(groups, compiled.group_minimums, compiled.all_visits))
+
+    # ---------------------------------------------------------------- status
+
+    def memory_bytes(self) -> int:
+        total = sum(column.nbytes for column in self.text_columns.values())
+        total += sum(data.nbytes for data in self.numeric_columns.values())
+        total += self.group_codes.nbytes + self.biospecimen_ids.memory_bytes()
+        total += sum(index.nbytes for index in self.range_indexes.values())
+        total += sum(bitmap.nbytes for bitmaps in self.bitmaps.values() for bitmap in bitmaps.values())
+        return total
+
+    def get_status(self) -> Dict[str, Any]:
+        return {
+            "rows": self.n_rows,
+            "memory_bytes": self.memory_bytes(),
+            "bitmaps": sum(len(bitmaps) for bitmaps in self.bitmaps.values()),
+            "build_seconds": round(self.build_seconds, 3)
+        }
@@ -0,0 +1,487 @@
+"""
+Deterministic compiler from the condition_organizer organize state to parameterized VIALS SQL
+
+Known eligibility fields are mapped to predicates on VIALS columns and compiled
+into the mandatory dedup-CTE counting query. Fields the compiler cannot map are
+reported in `unhandled` so the caller can fall back to the LLM SQL agent.
+"""
+
+import re
+from datetime import date
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+from vials.schema import epoch_day
+
+# Values meaning "no constraint on this field" ("none" is not one: it may mean "no X", so it falls back to the LLM)
+WILDCARD_VALUES = {"any", "all", "n/a", "doesn't matter", "does not matter", "no preference", "either"}
+
+# Lower-cased user terms -> VIALS.specimen_type values
+SPECIMEN_TYPE_SYNONYMS = {
+    "pbmc": ["PBMC", "Cryopreserved PBMCs"],
+    "pbmcs": ["PBMC", "Cryopreserved PBMCs"],
+    "cryopreserved pbmc": ["Cryopreserved PBMCs"],
+    "cryopreserved pbmcs": ["Cryopreserved PBMCs"],
+    "plasma": ["Plasma"],
+    "serum": ["Serum"],
+    "sera": ["Serum"],
+    "urine": ["Urine"],
+    "nasal swab": ["Nasal Swab"],
+    "nasal swabs": ["Nasal Swab"],
+    "nasal lavage": ["Nasal Lavage Fluid Supernatant", "Cryopreserved Nasal Lavage Fluid Cells"],
+    "nasal lavage fluid supernatant": ["Nasal Lavage Fluid Supernatant"],
+    "cryopreserved nasal lavage fluid cells": ["Cryopreserved Nasal Lavage Fluid Cells"],
+    "tempus": ["Tempus Blood RNA Tube"],
+    "tempus blood rna tube": ["Tempus Blood RNA Tube"],
+    "paxgene": ["PAXgene", "PAXGene Blood RNA Tube"],
+    "paxgene blood rna tube": ["PAXGene Blood RNA Tube"],
+    "rna": ["Tempus Blood RNA Tube", "PAXgene", "PAXGene Blood RNA Tube"],
+}
+
+SEX_SYNONYMS = {
+    "female": "Female", "f": "Female", "women": "Female", "woman": "Female", "females": "Female",
+    "male": "Male", "m": "Male", "men": "Male", "man": "Male", "males": "Male",
+}
+
+# Organize-state field names (lower-cased) -> compiler handler name
+FIELD_ALIASES = {
+    "specimen_type": "specimen_type", "specimen_types": "specimen_type", "specimen": "specimen_type",
+    "sample_type": "specimen_type", "biospecimen_type": "specimen_type",
+    "sex": "sex", "gender": "sex",
+    "age": "age", "age_range": "age", "age_group": "age",
+    "arm": "arm", "arms": "arm", "study_arm": "arm", "cohort": "arm", "treatment_arm": "arm",
+    "visit_number": "visit_number", "visit": "visit_number", "visits": "visit_number",
+    "timepoint": "visit_number", "timepoints": "visit_number", "time_point": "visit_number",
+    "study_id": "study_id", "study": "study_id", "studies": "study_id", "protocol": "study_id",
+    "collection_date": "collection_date", "date_range": "collection_date",
+    "collection_date_range": "collection_date", "collection_period": "collection_date",
+    "consent": "consent", "consent_future_use_specimens": "consent_specimens",
+    "consent_future_use_genetic_testing": "consent_genetic", "genetic_consent": "consent_genetic",
+    "status": "status", "availability": "status", "specimen_status": "status",
+    "race": "race", "ethnicity": "ethnicity",
+    "vials_count": "vials_count", "minimum_vials": "vials_count", "minimum_aliquots": "vials_count",
+}
+
+# Grouping words in minimum_<specimen>_per_<...> field names -> VIALS columns
+GROUPING_COLUMNS = {
+    "subject": "subject_id", "participant": "subject_id", "patient": "subject_id", "donor": "subject_id",
+    "visit": "visit_number", "timepoint": "visit_number", "time_point": "visit_number", "day": "visit_number",
+    "arm": "arm", "cohort": "arm", "group": "arm",
+    "study": "study_id",
+}
+
+MONTHS = {name: index for index, name in enumerate(
+    ["jan", "feb", "mar", "apr", "may", "jun", "jul", "aug", "sep", "oct", "nov", "dec"], start=1)}
+
+# Columns of the mandatory dedup CTE
+# biospecimen_group is the interned integer key of biospecimen_ids (see vials.ids)
+DEDUP_COLUMNS = ["study_id", "subject_id", "visit_number", "vials_count", "biospecimen_group"]
+
+
+class Predicate(NamedTuple):
+    """Row-level condition on one VIALS column. op is 'in' (tuple of values) or 'between' ((low, high), None = open)"""
+    column: str
+    op: str
+    value: Any
+
+
+class GroupMinimum(NamedTuple):
+    """Group-level eligibility: SUM(vials_count) >= minimum within each group of columns"""
+    columns: Tuple[str, ...]
+    minimum: int
+
+
+class CompiledQuery(NamedTuple):
+    sql: str
+    params: List[Any]
+    predicates: List[Predicate]
+    group_minimums: List[GroupMinimum]
+    all_visits: Tuple[str, ...]
+    handled: List[str]
+    unhandled: List[str]
+
+    @property
+    def fully_compiled(self) -> bool:
+        """True when every active eligibility field was compiled (no LLM SQL needed)"""
+        return not self.unhandled
+
+
+# ------------------------------------------------------------------ value parsing
+
+def _criterion_value(criterion: Any) -> Tuple[Any, Optional[str]]:
+    """Split an organize-state entry into (value, state)"""
+    if isinstance(criterion, dict) and "value" in criterion:
+        return criterion.get("value"), criterion.get("state")
+    return criterion, None
+
+
+def _is_wildcard(value: Any) -> bool:
+    if value is None:
+        return True
+    if isinstance(value, str):
+        return value.strip().lower() in WILDCARD_VALUES
+    if isinstance(value, (list, tuple)):
+        return all(_is_wildcard(item) for item in value)
+    return False
+
+
+def _without_wildcards(value: Any) -> Any:
+    """A list minus its wildcard items (['plasma', 'any'] constrains to plasma); other values unchanged"""
+    if isinstance(value, (list, tuple)):
+        return [item for item in value if not _is_wildcard(item)]
+    return value
+
+
+def _as_list(value: Any, split_words: bool = True) -> List[Any]:
+    """Lists pass through; strings are split on commas (and on and/or/'/' when split_words)"""
+    if isinstance(value, (list, tuple, set)):
+        return list(value)
+    separator = r"\s*(?:,|\band\b|\bor\b|&|/)\s*" if split_words else r"\s*,\s*"
+    if isinstance(value, str):
+        return [part for part in re.split(separator, value) if part]
+    return [value]
+
+
+def _parse_specimen_types(value: Any) -> Optional[Tuple[str, ...]]:
+    types = []
+    for item in _as_list(value):
+        key = str(item).strip().lower()
+        if key not in SPECIMEN_TYPE_SYNONYMS:
+            return None
+        for specimen_type in SPECIMEN_TYPE_SYNONYMS[key]:
+            if specimen_type not in types:
+                types.append(specimen_type)
+    return tuple(types)
+
+
+def _parse_sex(value: Any) -> Optional[Tuple[str, ...]]:
+    sexes = []
+    for item in _as_list(value):
+        sex = SEX_SYNONYMS.get(str(item).strip().lower())
+        if sex is None:
+            return None
+        if sex not in sexes:
+            sexes.append(sex)
+    return tuple(sexes)
+
+
+def _parse_number_range(value: Any) -> Optional[Tuple[Optional[float], Optional[float]]]:
+    """Parse '18-45', '>= 18', 'under 65', 'adults', {'min': 18, 'max': 45} or 30 into (low, high)"""
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return (value, value)
+    if isinstance(value, dict):
+        low = value.get("min", value.get("gte", value.get("from")))
+        high = value.get("max", value.get("lte", value.get("to")))
+        if low is None and high is None:
+            return None
+        return (low, high)
+    if not isinstance(value, str):
+        return None
+    text = value.strip().lower()
+    if text in ("adult", "adults"):
+        return (18, None)
+    if text in ("elderly", "older adults", "seniors"):
+        return (65, None)
+    match = re.fullmatch(r"(\d+(?:\.\d+)?)\s*(?:-|–|to)\s*(\d+(?:\.\d+)?)(?:\s*(?:years?|yrs?|y/?o)(?:\s*old)?)?", text)
+    if match:
+        return (float(match.group(1)), float(match.group(2)))
+    match = re.fullmatch(r"(>=|≥|at least|min(?:imum)?|over|above|older than|>|\+)?\s*(\d+(?:\.\d+)?)\s*(\+|and (?:over|above|older))?(?:\s*(?:years?|yrs?)(?:\s*old)?)?", text)
+    if match and (match.group(1) or match.group(3)):
+        number = float(match.group(2))
+        strict = match.group(1) in (">", "over", "above", "older than")
+        return (number + 1 if strict else number, None)
+    match = re.fullmatch(r"(<=|≤|at most|max(?:imum)?|under|below|younger than|<)\s*(\d+(?:\.\d+)?)(?:\s*(?:years?|yrs?)(?:\s*old)?)?", text)
+    if match:
+        number = float(match.group(2))
+        strict = match.group(1) in ("<", "under", "below", "younger than")
+        return (None, number - 1 if strict else number)
+    if re.fullmatch(r"\d+(?:\.\d+)?", text):
+        return (float(text), float(text))
+    return None
+
+
+def _parse_visits(value: Any) -> Optional[Tuple[str, ...]]:
+    """Normalize 'Visit01 (Day1)', 'V7', 'visit 7', 7 or '07' to zero-padded visit numbers"""
+    visits = []
+    for item in _as_list(value):
+        text = str(item).strip().lower()
+        match = (re.match(r"^(?:visits?|v|visno)\s*0*(\d+)", text)
+                 or re.fullmatch(r"0*(\d+)", text))
+        if not match:
+            return None
+        visit = f"{int(match.group(1)):02d}"
+        if visit not in visits:
+            visits.append(visit)
+    return tuple(visits)
+
+
+def _parse_date(text: str, end: bool = False) -> Optional[date]:
+    """First (or with `end`, last) day the text denotes; None if unrecognized or not a calendar date"""
+    try:
+        return _date_from_text(text, end)
+    except ValueError:
+        # e.g. 31-Feb-19 or 2019-13-01
+        return None
+
+
+def _shift_days(day: date, days: int) -> Optional[date]:
+    try:
+        return date.fromordinal(day.toordinal() + days)
+    except ValueError:
+        return None
+
+
+def _date_from_text(text: str, end: bool) -> Optional[date]:
+    text = text.strip().lower()
+    match = re.fullmatch(r"(\d{4})-(\d{1,2})-(\d{1,2})", text)
+    if match:
+        return date(int(match.group(1)), int(match.group(2)), int(match.group(3)))
+    match = re.fullmatch(r"(\d{1,2})-([a-z]{3})-(\d{2,4})", text)
+    if match and match.group(2) in MONTHS:
+        year = int(match.group(3))
+        year = year + 2000 if year < 100 else year
+        return date(year, MONTHS[match.group(2)], int(match.group(1)))
+    match = re.fullmatch(r"([a-z]{3})[a-z]*\.?\s+(\d{4})", text)
+    if match and match.group(1) in MONTHS:
+        year, month = int(match.group(2)), MONTHS[match.group(1)]
+        if end:
+            next_month = date(year + month // 12, month % 12 + 1, 1)
+            return date.fromordinal(next_month.toordinal() - 1)
+        return date(year, month, 1)
+    match = re.fullmatch(r"(\d{4})", text)
+    if match:
+        year = int(match.group(1))
+        return date(year, 12, 31) if end else date(year, 1, 1)
+    return None
+
+
+def _parse_date_range(value: Any) -> Optional[Tuple[Optional[str], Optional[str]]]:
+    """Parse date windows into inclusive ISO (start, end) bounds; None = open"""
+    if isinstance(value, dict):
+        start = value.get("start", value.get("from", value.get("after")))
+        end = value.get("end", value.get("to", value.get("before")))
+        start_date = _parse_date(str(start)) if start else None
+        end_date = _parse_date(str(end), end=True) if end else None
+        if (start and not start_date) or (end and not end_date) or not (start_date or end_date):
+            return None
+        return (start_date.isoformat() if start_date else None, end_date.isoformat() if end_date else None)
+    if isinstance(value, (list, tuple)) and len(value) == 2:
+        return _parse_date_range({"start": value[0], "end": value[1]})
+    if not isinstance(value, str):
+        return None
+    text = value.strip().lower()
+    match = re.fullmatch(r"(?:between\s+|from\s+)?(.+?)\s+(?:to|and|through|until|-)\s+(.+)", text)
+    if match:
+        return _parse_date_range({"start": match.group(1), "end": match.group(2)})
+    match = re.fullmatch(r"(after|since|from|on or after|>=?)\s+(.+)", text)
+    if match:
+        start = _parse_date(match.group(2), end=match.group(1) in ("after", ">"))
+        if start and match.group(1) in ("after", ">"):
+            start = _shift_days(start, 1)
+        return (start.isoformat(), None) if start else None
+    match = re.fullmatch(r"(before|until|on or before|<=?)\s+(.+)", text)
+    if match:
+        end = _parse_date(match.group(2), end=match.group(1) not in ("before", "<"))
+        if end and match.group(1) in ("before", "<"):
+            end = _shift_days(end, -1)
+        return (None, end.isoformat()) if end else None
+    single_start, single_end = _parse_date(text), _parse_date(text, end=True)
+    if single_start and single_end:
+        return (single_start.isoformat(), single_end.isoformat())
+    return None
+
+
+def _parse_consent(value: Any) -> Optional[str]:
+    if isinstance(value, bool):
+        return "Yes" if value else "No"
+    text = str(value).strip().lower()
+    if text in ("no", "false", "not consented", "without consent"):
+        return "No"
+    if text in ("yes", "true", "consented") or "consent" in text or "future use" in text:
+        return "Yes"
+    return None
+
+
+def _parse_strings(value: Any) -> Tuple[str, ...]:
+    return tuple(str(item).strip() for item in _as_list(value, split_words=False) if str(item).strip())
+
+
+def _parse_grouping(field_name: str) -> Optional[Tuple[str, ...]]:
+    """minimum_vials_per_subject_visit_arm -> ('subject_id', 'visit_number', 'arm')"""
+    match = re.fullmatch(r"minimum_(?:vials|aliquots|biospecimens|samples|specimens)_per_(.+)", field_name)
+    if not match:
+        return None
+    return grouping_columns(match.group(1))
+
+
+def grouping_columns(suffix: str) -> Optional[Tuple[str, ...]]:
+    """subject_visit_arm -> ('subject_id', 'visit_number', 'arm'); None if a word is not a grouping"""
+    columns = []
+    for word in suffix.split("_"):
+        column = GROUPING_COLUMNS.get(word.rstrip("s")) or GROUPING_COLUMNS.get(word)
+        if column is None:
+            if word in ("point",):
+                continue
+            return None
+        if column not in columns:
+            columns.append(column)
+    return tuple(columns)
+
+
+# ------------------------------------------------------------------ compilation
+
+def compile_criteria(eligibility_criteria: Dict[str, Any]):
+    """Map eligibility fields to predicates; returns (predicates, group_minimums, all_visits, handled, unhandled)"""
+    predicates: List[Predicate] = []
+    group_minimums: List[GroupMinimum] = []
+    all_visits: Tuple[str, ...] = ()
+    handled, unhandled = [], []
+
+    for field_name, criterion in (eligibility_criteria or {}).items():
+        value, state = _criterion_value(criterion)
+        if state == "removed":
+            continue
+        key = field_name.strip().lower()
+        value = _without_wildcards(value)
+        if _is_wildcard(value):
+            handled.append(field_name)
+            continue
+
+        grouping = _parse_grouping(key)
+        if grouping is not None:
+            try:
+                group_minimums.append(GroupMinimum(grouping, int(float(value))))
+                handled.append(field_name)
+            except (TypeError, ValueError):
+                unhandled.append(field_name)
+            continue
+
+        kind = FIELD_ALIASES.get(key)
+        predicate = None
+        if kind == "specimen_type":
+            parsed = _parse_specimen_types(value)
+            predicate = Predicate("specimen_type", "in", parsed) if parsed else None
+        elif kind == "sex":
+            parsed = _parse_sex(value)
+            predicate = Predicate("sex", "in", parsed) if parsed else None
+        elif kind == "age":
+            parsed = _parse_number_range(value)
+            predicate = Predicate("age", "between", parsed) if parsed else None
+        elif kind == "vials_count":
+            parsed = _parse_number_range(value)
+            if parsed and parsed[0] == parsed[1] and isinstance(value, (int, float)):
+                # A bare number means "at least N vials"
+                parsed = (parsed[0], None)
+            predicate = Predicate("vials_count", "between", parsed) if parsed else None
+        elif kind == "visit_number":
+            parsed = _parse_visits(value)
+            if parsed:
+                predicate = Predicate("visit_number", "in", parsed)
+                if len(parsed) > 1:
+                    # Multiple timepoints: subjects must have samples at ALL of them
+                    all_visits = parsed
+        elif kind == "collection_date":
+            parsed = _parse_date_range(value)
+            predicate = Predicate("collection_date", "between", parsed) if parsed else None
+        elif kind in ("consent", "consent_specimens", "consent_genetic"):
+            parsed = _parse_consent(value)
+            genetic = kind == "consent_genetic" or "genetic" in str(value).lower()
+            column = "consent_future_use_genetic_testing" if genetic else "consent_future_use_specimens"
+            predicate = Predicate(column, "in", (parsed,)) if parsed else None
+        elif kind in ("arm", "study_id", "status", "race", "ethnicity"):
+            parsed = _parse_strings(value)
+            predicate = Predicate(kind, "in", parsed) if parsed else None
+
+        if predicate is None:
+            unhandled.append(field_name)
+        else:
+            predicates.append(predicate)
+            handled.append(field_name)
+
+    return predicates, group_minimums, all_visits, handled, unhandled
+
+
+def predicate_sql(predicate: Predicate, alias: str = "") -> Tuple[str, List[Any]]:
+    """Render one predicate as a parameterized SQL condition"""
+    column = f"{alias}{predicate.column}"
+    if predicate.column == "collection_date":
+        # ISO bounds -> the indexed epoch-day column parsed at ingestion
+        column = f"{alias}collection_day"
+        predicate = predicate._replace(value=tuple(epoch_day(bound) for bound in predicate.value))
+    if predicate.op == "in":
+        values = list(predicate.value)
+        if len(values) == 1:
+            return f"{column} = ?", values
+        return f"{column} IN ({', '.join('?' for _ in values)})", values
+    low, high = predicate.value
+    if low is not None and high is not None:
+        return f"{column} BETWEEN ? AND ?", [low, high]
+    if low is not None:
+        return f"{column} >= ?", [low]
+    return f"{column} <= ?", [high]
+
+
+def compile_organize_state(organize_state: Dict[str, Any]) -> CompiledQuery:
+    """
+    Compile an organize state into the dedup-CTE counting query:
+    per-study distinct subjects and SUM(vials_count) over unique biospecimen groups.
+    """
+    predicates, group_minimums, all_visits, handled, unhandled = compile_criteria(
+        (organize_state or {}).get("eligibility_criteria", {})
+    )
+
+    conditions, params = [], []
+    for predicate in predicates:
+        condition, values = predicate_sql(predicate, alias="v.")
+        conditions.append(condition)
+        params.extend(values)
+    where_sql = " AND ".join(conditions) if conditions else "1=1"
+
+    # Include all relevant grouping fields in the dedup CTE
+    columns = list(DEDUP_COLUMNS)
+    for group_minimum in group_minimums:
+        columns.extend(column for column in group_minimum.columns if column not in columns)
+    dedup_columns = ", ".join(f"v.{column}" for column in columns)
+    ctes = [
+        "unique_biospecimens AS (\n"
+        f"    SELECT DISTINCT {dedup_columns}\n"
+        "    FROM VIALS v\n"
+        f"    WHERE {where_sql}\n"
+        f"    GROUP BY {dedup_columns}\n"
+        ")"
+    ]
+    source = "unique_biospecimens"
+
+    for index, group_minimum in enumerate(group_minimums):
+        group_columns = ", ".join(group_minimum.columns)
+        ctes.append(
+            f"qualified_{index} AS (\n"
+            f"    SELECT u.* FROM {source} u\n"
+            f"    JOIN (SELECT {group_columns} FROM {source} GROUP BY {group_columns} "
+            f"HAVING SUM(vials_count) >= ?) g USING ({group_columns})\n"
+            ")"
+        )
+        params.append(group_minimum.minimum)
+        source = f"qualified_{index}"
+
+    if all_visits:
+        ctes.append(
+            "all_visits AS (\n"
+            f"    SELECT * FROM {source} WHERE subject_id IN (\n"
+            f"        SELECT subject_id FROM {source} GROUP BY subject_id "
+            "HAVING COUNT(DISTINCT visit_number) = ?)\n"
+            ")"
+        )
+        params.append(len(all_visits))
+        source = "all_visits"
+
+    sql = (
+        "WITH " + ",\n".join(ctes) + "\n"
+        "SELECT study_id, COUNT(DISTINCT subject_id) AS subjects_count, "
+        "SUM(vials_count) AS total_biospecimens\n"
+        f"FROM {source}\n"
+        "GROUP BY study_id\n"
+        "ORDER BY study_id"
+    )
+    return CompiledQuery(sql, params, predicates, group_minimums, all_visits, handled, unhandled)
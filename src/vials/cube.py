@@ -0,0 +1,243 @@
+"""
+Pre-aggregated biospecimen count cube
+
+Built once at data load from the deduplicated biospecimen groups. Each cell of
+study_id x specimen_type x visit_number x arm x sex x age_band holds the
+deduplicated SUM(vials_count) and the sorted set of distinct subjects, so
+requests whose criteria fall entirely on cube dimensions are answered without
+touching the row engine.
+"""
+
+import time
+from array import array
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+CUBE_DIMENSIONS = ("study_id", "specimen_type", "visit_number", "arm", "sex", "age_band")
+
+# Inclusive age bands; the last band is open-ended
+AGE_BANDS = [(0, 17), (18, 44), (45, 64), (65, None)]
+AGE_BAND_LABELS = [f"{low}-{high}" if high is not None else f"{low}+" for low, high in AGE_BANDS]
+UNKNOWN_AGE_BAND = "unknown"
+
+
+def age_band(age: Any) -> str:
+    """Map an age to its band label"""
+    if age is None or age == "":
+        return UNKNOWN_AGE_BAND
+    age = float(age)
+    for (low, high), label in zip(AGE_BANDS, AGE_BAND_LABELS):
+        if age >= low and (high is None or age <= high):
+            return label
+    return UNKNOWN_AGE_BAND
+
+
+def age_bands_for_range(low: Optional[float], high: Optional[float]) -> Optional[List[str]]:
+    """Bands exactly covering [low, high], or None when the range splits a band"""
+    low = 0 if low is None else low
+    selected = []
+    for (band_low, band_high), label in zip(AGE_BANDS, AGE_BAND_LABELS):
+        band_top = float("inf") if band_high is None else band_high
+        query_top = float("inf") if high is None else high
+        if band_top < low or band_low > query_top:
+            continue
+        if band_low < low or band_top > query_top:
+            # Range boundary falls inside this band: not answerable from the cube
+            return None
+        selected.append(label)
+    return selected
+
+
+class _Dictionary:
+    """Value <-> integer code mapping for one dimension"""
+
+    def __init__(self):
+        self.values: List[Any] = []
+        self.codes: Dict[Any, int] = {}
+
+    def encode(self, value: Any) -> int:
+        code = self.codes.get(value)
+        if code is None:
+            code = len(self.values)
+            self.codes[value] = code
+            self.values.append(value)
+        return code
+
+
+class CountCube:
+    """Deduplicated count cube with a CSR layout of distinct subjects per cell"""
+
+    def __init__(self):
+        self.dictionaries = {dimension: _Dictionary() for dimension in CUBE_DIMENSIONS}
+        self.subjects = _Dictionary()
+        self.cell_keys = np.zeros((0, len(CUBE_DIMENSIONS)), dtype=np.int32)
+        self.cell_vials = np.zeros(0, dtype=np.int64)
+        self.cell_offsets = np.zeros(1, dtype=np.int64)
+        self.cell_subjects = np.zeros(0, dtype=np.int32)
+        self.subject_study = np.zeros(0, dtype=np.int32)
+        self.group_count = 0
+        self.build_seconds = 0.0
+        self._value_masks: Dict[Tuple[str, int], np.ndarray] = {}
+
+    # ---------------------------------------------------------------- building
+
+    @classmethod
+    def build(cls, groups: Iterable[Dict[str, Any]]) -> "CountCube":
+        """
+        Build from deduplicated biospecimen groups (dicts with the cube dimensions,
+        age, subject_id and vials_count). Rows are encoded into compact typed arrays
+        first, then aggregated in vectorized passes.
+        """
+        cube = cls()
+        start = time.perf_counter()
+        encoders = [cube.dictionaries[dimension].encode for dimension in CUBE_DIMENSIONS[:-1]]
+        band_encoder = cube.dictionaries["age_band"].encode
+        columns = [array("i") for _ in CUBE_DIMENSIONS]
+        subject_codes = array("i")
+        vials = array("q")
+        subject_study = array("i")
+        for group in groups:
+            for column, encode, dimension in zip(columns, encoders, CUBE_DIMENSIONS):
+                column.append(encode(group.get(dimension)))
+            columns[-1].append(band_encoder(age_band(group.get("age"))))
+            # Subjects are per study: the same subject_id in two studies counts in both, as in SQL
+            subject = cube.subjects.encode((group.get("study_id"), group.get("subject_id")))
+            subject_codes.append(subject)
+            if subject == len(subject_study):
+                subject_study.append(columns[0][-1])
+            vials.append(int(group.get("vials_count") or 0))
+
+        cube.group_count = len(vials)
+        if cube.group_count:
+            subjects = np.frombuffer(subject_codes, dtype=np.int32)
+            vials_counts = np.frombuffer(vials, dtype=np.int64)
+
+            # Mixed-radix cell code over all dimensions -> one 1-D unique instead of a row-wise one
+            radices = [len(cube.dictionaries[dimension].values) for dimension in CUBE_DIMENSIONS]
+            cell_codes = np.zeros(cube.group_count, dtype=np.int64)
+            for column, radix in zip(columns, radices):
+                cell_codes = cell_codes * radix + np.frombuffer(column, dtype=np.int32)
+            unique_codes, cell_index = np.unique(cell_codes, return_inverse=True)
+            del cell_codes
+            keys = np.zeros((len(unique_codes), len(CUBE_DIMENSIONS)), dtype=np.int32)
+            remainder = unique_codes
+            for position in range(len(CUBE_DIMENSIONS) - 1, -1, -1):
+                keys[:, position] = remainder % radices[position]
+                remainder = remainder // radices[position]
+            cube.cell_keys = keys
+            cube.cell_vials = np.bincount(cell_index, weights=vials_counts, minlength=len(cube.cell_keys)).astype(np.int64)
+
+            # Distinct (cell, subject) pairs in cell order -> CSR offsets
+            pairs = np.unique(cell_index.astype(np.int64) * len(cube.subjects.values) + subjects)
+            pair_cells = pairs // len(cube.subjects.values)
+            cube.cell_subjects = (pairs % len(cube.subjects.values)).astype(np.int32)
+            cube.cell_offsets = np.concatenate([[0], np.cumsum(np.bincount(pair_cells, minlength=len(cube.cell_keys)))])
+
+            cube.subject_study = np.frombuffer(subject_study, dtype=np.int32).copy()
+        cube.build_seconds = time.perf_counter() - start
+        return cube
+
+    @classmethod
+    def from_engine(cls, engine) -> "CountCube":
+        """Build from the engine's materialized unique_biospecimens table"""
+        cursor = engine.conn.execute(
+            "SELECT study_id, specimen_type, visit_number, arm, sex, age, subject_id, SUM(vials_count) "
+            "FROM (SELECT DISTINCT study_id, subject_id, visit_number, vials_count, biospecimen_group, "
+            "specimen_type, arm, sex, age FROM unique_biospecimens) "
+            "GROUP BY study_id, specimen_type, visit_number, arm, sex, age, subject_id"
+        )
+        names = ("study_id", "specimen_type", "visit_number", "arm", "sex", "age", "subject_id", "vials_count")
+        return cls.build(dict(zip(names, row)) for row in cursor)
+
+    # ---------------------------------------------------------------- querying
+
+    def cell_mask(self, filters: Dict[str, Sequence[Any]]) -> Optional[np.ndarray]:
+        """Boolean mask over cells for {dimension: allowed values}; None if a dimension is unknown"""
+        mask = np.ones(len(self.cell_keys), dtype=bool)
+        for dimension, values in filters.items():
+            if dimension not in self.dictionaries:
+                return None
+            dictionary = self.dictionaries[dimension]
+            allowed = np.zeros(len(self.cell_keys), dtype=bool)
+            for value in values:
+                if value in dictionary.codes:
+                    allowed |= self._value_mask(dimension, dictionary.codes[value])
+            mask &= allowed
+        return mask
+
+    def _value_mask(self, dimension: str, code: int) -> np.ndarray:
+        """Cached bitmap of the cells holding one dimension value"""
+        key = (dimension, code)
+        value_mask = self._value_masks.get(key)
+        if value_mask is None:
+            value_mask = self.cell_keys[:, CUBE_DIMENSIONS.index(dimension)] == code
+            self._value_masks[key] = value_mask
+        return value_mask
+
+    def counts_by_study(self, filters: Dict[str, Sequence[Any]]) -> List[Dict[str, Any]]:
+        """Per-study distinct subjects and biospecimens for the selected cells"""
+        mask = self.cell_mask(filters)
+        if mask is None or not mask.any():
+            return []
+        study_codes = self.cell_keys[:, 0]
+        n_studies = len(self.dictionaries["study_id"].values)
+        vials = np.bincount(study_codes[mask], weights=self.cell_vials[mask], minlength=n_studies)
+
+        # Gather the CSR slices of the selected cells and flag their subjects
+        selected = np.flatnonzero(mask)
+        starts = self.cell_offsets[selected]
+        lengths = self.cell_offsets[selected + 1] - starts
+        ends = np.cumsum(lengths)
+        if ends[-1] * 4 > len(self.cell_subjects):
+            # Broad selection: one boolean pass is cheaper than building index ranges
+            members = self.cell_subjects[np.repeat(mask, np.diff(self.cell_offsets))]
+        else:
+            members = self.cell_subjects[np.arange(ends[-1]) + np.repeat(starts - (ends - lengths), lengths)]
+        flags = np.zeros(len(self.subject_study), dtype=bool)
+        flags[members] = True
+        subjects = np.bincount(self.subject_study[flags], minlength=n_studies)
+
+        study_values = self.dictionaries["study_id"].values
+        results = [
+            {"study_id": study_values[code], "subjects_count": int(subjects[code]), "total_biospecimens": int(vials[code])}
+            for code in range(n_studies) if subjects[code] > 0
+        ]
+        return sorted(results, key=lambda row: str(row["study_id"]))
+
+    def memory_bytes(self) -> int:
+        """Approximate footprint of the aggregated arrays"""
+        arrays = [self.cell_keys, self.cell_vials, self.cell_offsets, self.cell_subjects, self.subject_study]
+        return sum(arr.nbytes for arr in arrays + list(self._value_masks.values()))
+
+    def get_status(self) -> Dict[str, Any]:
+        return {
+            "cells": int(len(self.cell_keys)),
+            "groups": self.group_count,
+            "subjects": len(self.subjects.values),
+            "memory_bytes": self.memory_bytes(),
+            "build_seconds": round(self.build_seconds, 3)
+        }
+
+
+def cube_filters(compiled) -> Optional[Dict[str, Tuple[Any, ...]]]:
+    """
+    Translate a CompiledQuery into cube dimension filters, or None when any
+    part of the request needs row-level evaluation.
+    """
+    if compiled.unhandled or compiled.group_minimums or compiled.all_visits:
+        return None
+    filters = {}
+    for predicate in compiled.predicates:
+        if predicate.column == "age" and predicate.op == "between":
+            bands = age_bands_for_range(*predicate.value)
+            if bands is None:
+                return None
+            filters["age_band"] = tuple(bands)
+        elif predicate.column in CUBE_DIMENSIONS and predicate.op == "in":
+            if predicate.column in filters:
+                return None
+            filters[predicate.column] = tuple(predicate.value)
+        else:
+            return None
+    return filters
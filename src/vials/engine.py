@@ -0,0 +1,281 @@
+import csv
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+from vials.columnar import ColumnarVials
+from vials.cube import CountCube
+from vials.ids import BiospecimenIdIndex
+from vials.schema import (
+    VIALS_COLUMNS, COLUMN_NAMES, SPECIMEN_COLUMNS, INDEXED_COLUMNS, DERIVED_COLUMNS, GROUP_KEY_COLUMN,
+    coerce_value, date_values, epoch_day,
+)
+
+# Optional dependency: Parquet loading
+try:
+    import pyarrow.dataset as ds
+    from vials.ingest import partitioning
+except ImportError:
+    ds = None
+
+DEFAULT_DATA_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "vials_fixture.csv")
+
+# MySQL date format directives used in prompts -> Python strptime directives
+_MYSQL_DATE_DIRECTIVES = {"%d": "%d", "%b": "%b", "%y": "%y", "%Y": "%Y", "%m": "%m", "%M": "%B", "%e": "%d"}
+
+
+def _str_to_date(value, mysql_format):
+    """SQLite implementation of MySQL STR_TO_DATE returning ISO dates (comparable as text)"""
+    if value is None or mysql_format is None:
+        return None
+    python_format = mysql_format
+    for directive, replacement in _MYSQL_DATE_DIRECTIVES.items():
+        python_format = python_format.replace(directive, replacement)
+    try:
+        return datetime.strptime(str(value).strip(), python_format).date().isoformat()
+    except ValueError:
+        return None
+
+
+def _arrow_values(array) -> List[Any]:
+    """Python values of an Arrow column; dictionary columns decode through their (small) dictionary"""
+    if hasattr(array, "dictionary"):
+        values = array.dictionary.to_pylist() + [None]
+        return [values[code] for code in array.indices.fill_null(len(values) - 1).to_pylist()]
+    return array.to_pylist()
+
+
+class QueryError(Exception):
+    """Raised when a query is rejected or fails in the VIALS engine"""
+
+
+class VialsEngine:
+    """
+    Embedded in-process SQL engine over the VIALS biospecimen table.
+
+    VIALS is loaded into an in-memory SQLite database at cold start. The dedup
+    step of the mandatory counting methodology is pre-materialized as the
+    `unique_biospecimens` table (one row per biospecimen group, assay columns
+    dropped) so count queries do not need to repeat the DISTINCT/GROUP BY.
+    collection_date/collection_time are parsed once into the indexed epoch
+    columns collection_day/collection_epoch, so date windows are range scans.
+    """
+
+    def __init__(self, max_rows: int = 200, timeout_ms: int = 5000):
+        self.max_rows = max_rows
+        self.timeout_ms = timeout_ms
+        self.conn = sqlite3.connect(":memory:", check_same_thread=False)
+        self.conn.create_function("STR_TO_DATE", 2, _str_to_date, deterministic=True)
+        # EPOCH_DAY('2019-01-01') -> integer comparable with collection_day (constant-folded per query)
+        self.conn.create_function("EPOCH_DAY", 1, epoch_day, deterministic=True)
+        self.lock = threading.Lock()
+        self.row_count = 0
+        self.source = None
+        self.version = None
+        self.load_seconds = 0.0
+        self.cube = None
+        self.columnar = None
+        self.biospecimen_ids = BiospecimenIdIndex()
+        self.biospecimen_groups = 0
+        column_sql = ", ".join(f"{name} {column_type}" for name, column_type in VIALS_COLUMNS + DERIVED_COLUMNS)
+        self.conn.execute(f"CREATE TABLE VIALS ({column_sql})")
+
+    # ---------------------------------------------------------------- loading
+
+    def load_rows(self, rows: Iterable[Dict[str, Any]], batch_size: int = 5000):
+        """Insert VIALS records (dicts keyed by column name) in batches"""
+        columns = COLUMN_NAMES + [name for name, _ in DERIVED_COLUMNS]
+        insert_sql = f"INSERT INTO VIALS ({', '.join(columns)}) VALUES ({', '.join('?' for _ in columns)})"
+        intern = self.biospecimen_ids.intern
+        batch = []
+        with self.lock:
+            for row in rows:
+                values = [coerce_value(name, row.get(name)) for name in COLUMN_NAMES]
+                values.append(intern(row.get("biospecimen_ids")))
+                values.extend(date_values(row))
+                batch.append(values)
+                if len(batch) >= batch_size:
+                    self.conn.executemany(insert_sql, batch)
+                    self.row_count += len(batch)
+                    batch = []
+            if batch:
+                self.conn.executemany(insert_sql, batch)
+                self.row_count += len(batch)
+            self.conn.commit()
+
+    def load_csv(self, path: str):
+        """Load a VIALS CSV export"""
+        with open(path, newline="", encoding="utf-8") as handle:
+            self.load_rows(csv.DictReader(handle))
+
+    def load_parquet(self, path: str, batch_size: int = 5000):
+        """
+        Load a VIALS Parquet file or a study_id-partitioned dataset directory
+        (see vials.ingest), streaming record batches. Dates normalized at
+        ingestion are used as-is.
+        """
+        if ds is None:
+            raise ImportError("pyarrow is required to load Parquet VIALS data")
+        dataset = ds.dataset(path, format="parquet", partitioning=partitioning(), exclude_invalid_files=True)
+        if "collection_day" in dataset.schema.names:
+            self.load_arrow(dataset.to_batches(batch_size=batch_size))
+            return
+        for batch in dataset.to_batches(batch_size=batch_size):
+            self.load_rows(batch.to_pylist(), batch_size=batch_size)
+
+    def load_arrow(self, batches: Iterable[Any]):
+        """Insert already-normalized Arrow record batches (vials.ingest output) column-wise, without coercion"""
+        columns = COLUMN_NAMES + [name for name, _ in DERIVED_COLUMNS]
+        insert_sql = f"INSERT INTO VIALS ({', '.join(columns)}) VALUES ({', '.join('?' for _ in columns)})"
+        intern = self.biospecimen_ids.intern
+        with self.lock:
+            for batch in batches:
+                data = {name: _arrow_values(batch.column(index)) for index, name in enumerate(batch.schema.names)}
+                data[GROUP_KEY_COLUMN[0]] = [intern(value) for value in data["biospecimen_ids"]]
+                missing = [None] * batch.num_rows
+                self.conn.executemany(insert_sql, zip(*(data.get(name, missing) for name in columns)))
+                self.row_count += batch.num_rows
+            self.conn.commit()
+
+    def load(self, path: str):
+        """Load VIALS from CSV or Parquet (by extension / directory) and build indexes"""
+        start = time.perf_counter()
+        if os.path.isdir(path) or path.endswith(".parquet"):
+            self.load_parquet(path)
+        else:
+            self.load_csv(path)
+        self.finalize()
+        self.cube = CountCube.from_engine(self)
+        self.columnar = ColumnarVials.from_engine(self)
+        # The interning table (every biospecimen_ids string) is only needed while loading;
+        # the columnar store keeps its own packed id index
+        self.biospecimen_groups = self.biospecimen_ids.group_count
+        self.biospecimen_ids = None
+        self.source = path
+        self.version = self._compute_version(path)
+        self.load_seconds = time.perf_counter() - start
+        print(f"✅ Loaded {self.row_count} VIALS rows from {path} in {self.load_seconds:.2f}s")
+        return self
+
+    def finalize(self):
+        """Build indexes and the materialized dedup table after loading"""
+        with self.lock:
+            for column in INDEXED_COLUMNS:
+                self.conn.execute(f"CREATE INDEX IF NOT EXISTS idx_vials_{column} ON VIALS ({column})")
+            self.conn.execute("DROP TABLE IF EXISTS unique_biospecimens")
+            self.conn.execute(
+                f"CREATE TABLE unique_biospecimens AS "
+                f"SELECT DISTINCT {', '.join(SPECIMEN_COLUMNS + [name for name, _ in DERIVED_COLUMNS])} FROM VIALS"
+            )
+            for column in INDEXED_COLUMNS:
+                self.conn.execute(
+                    f"CREATE INDEX IF NOT EXISTS idx_unique_{column} ON unique_biospecimens ({column})"
+                )
+            self.conn.execute("ANALYZE")
+            self.conn.commit()
+
+    def _compute_version(self, path: str) -> str:
+        """Version stamp of the loaded dataset (changes whenever VIALS is reloaded from new data)"""
+        digest = hashlib.sha1()
+        digest.update(os.path.abspath(path).encode())
+        manifest = os.path.join(path, "_manifest.json")
+        try:
+            # A dataset directory changes with its manifest (rewritten by every ingestion run)
+            stat = os.stat(manifest if os.path.isfile(manifest) else path)
+            digest.update(f"{stat.st_size}:{stat.st_mtime_ns}".encode())
+        except OSError:
+            pass
+        digest.update(str(self.row_count).encode())
+        return digest.hexdigest()[:16]
+
+    # ---------------------------------------------------------------- querying
+
+    def query(self, sql: str, params: Sequence[Any] = (), max_rows: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Execute a read-only query and return columns, rows and truncation info.
+        Any statement that would modify the database is rejected by the authorizer.
+        """
+        limit = max_rows or self.max_rows
+        deadline = time.perf_counter() + self.timeout_ms / 1000
+
+        def authorizer(action, *args):
+            if action in (sqlite3.SQLITE_SELECT, sqlite3.SQLITE_READ, sqlite3.SQLITE_FUNCTION, sqlite3.SQLITE_RECURSIVE):
+                return sqlite3.SQLITE_OK
+            return sqlite3.SQLITE_DENY
+
+        def progress():
+            # Non-zero return aborts the running statement
+            return 1 if time.perf_counter() > deadline else 0
+
+        with self.lock:
+            self.conn.set_authorizer(authorizer)
+            self.conn.set_progress_handler(progress, 10000)
+            try:
+                cursor = self.conn.execute(sql, tuple(params))
+                columns = [description[0] for description in cursor.description or []]
+                rows = cursor.fetchmany(limit + 1)
+            except sqlite3.Error as e:
+                raise QueryError(str(e)) from e
+            finally:
+                self.conn.set_authorizer(None)
+                self.conn.set_progress_handler(None, 0)
+
+        truncated = len(rows) > limit
+        return {
+            "columns": columns,
+            "rows": [list(row) for row in rows[:limit]],
+            "row_count": min(len(rows), limit),
+            "truncated": truncated
+        }
+
+    def count_by_study(self, where_sql: str = "1=1", params: Sequence[Any] = ()) -> List[Dict[str, Any]]:
+        """Subjects and biospecimens per study over the deduplicated biospecimen groups"""
+        result = self.query(
+            "SELECT study_id, COUNT(DISTINCT subject_id) AS subjects_count, "
+            "SUM(vials_count) AS total_biospecimens "
+            f"FROM unique_biospecimens WHERE {where_sql} GROUP BY study_id ORDER BY study_id",
+            params,
+            max_rows=1000
+        )
+        return [dict(zip(result["columns"], row)) for row in result["rows"]]
+
+    def get_status(self) -> Dict[str, Any]:
+        """Engine status for health checks"""
+        return {
+            "source": self.source,
+            "version": self.version,
+            "rows": self.row_count,
+            "load_seconds": round(self.load_seconds, 3),
+            "cube": self.cube.get_status() if self.cube is not None else None,
+            "columnar": self.columnar.get_status() if self.columnar is not None else None,
+            "biospecimen_groups": (self.biospecimen_groups if self.biospecimen_ids is None
+                                   else self.biospecimen_ids.group_count)
+        }
+
+
+# Global instance, loaded lazily once per container (cold start)
+_engine = None
+_engine_loaded = False  # Load attempted: a missing file or failed load is not retried every turn
+_engine_lock = threading.Lock()
+
+
+def get_engine() -> Optional[VialsEngine]:
+    """Get or load the VIALS engine from VIALS_DATA_PATH (defaults to the bundled fixture)"""
+    global _engine, _engine_loaded
+    if not _engine_loaded:
+        with _engine_lock:
+            if not _engine_loaded:
+                path = os.environ.get("VIALS_DATA_PATH") or DEFAULT_DATA_PATH
+                if not os.path.exists(path):
+                    print(f"⚠️ VIALS data not found at {path}; SQL Query Executor disabled")
+                else:
+                    try:
+                        _engine = VialsEngine().load(path)
+                    except Exception as e:
+                        print(f"❌ Error loading VIALS data from {path}: {e}")
+                _engine_loaded = True
+    return _engine
@@ -0,0 +1,180 @@
+"""
+Interned integer representation of VIALS.biospecimen_ids
+
+Each distinct biospecimen_ids list is interned to a group id at ingestion
+(the integer key the dedup step groups on), and every biospecimen ID in it is
+packed into an int64: prefix/width code in the high bits, numeric part in the
+low bits ("BS000000123" -> code("BS", 9) << 44 | 123). IDs that do not follow
+the prefix+digits pattern are interned through a lookup table instead. The
+per-group ID lists are kept in CSR form (offsets + flat dense int32 IDs), so
+dedup, intersection and counting are integer/bitmap operations and strings
+are only rebuilt for output.
+"""
+
+import re
+from array import array
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+NUMBER_BITS = 44
+NUMBER_MASK = (1 << NUMBER_BITS) - 1
+ID_PATTERN = re.compile(r"([^\d,]*?)(\d+)")
+
+# Prefix code reserved for IDs interned through the fallback table
+FALLBACK_PREFIX = 0
+
+
+def split_ids(text) -> List[str]:
+    """biospecimen_ids text -> individual IDs"""
+    if text is None:
+        return []
+    return [item.strip() for item in str(text).split(",") if item.strip()]
+
+
+class BiospecimenIdIndex:
+    """Group interner plus CSR of packed integer biospecimen IDs per group"""
+
+    def __init__(self):
+        self.group_lookup: Dict[str, int] = {}
+        self.prefixes: List[Optional[Tuple[str, int]]] = [None]
+        self.prefix_lookup: Dict[Tuple[str, int], int] = {}
+        self.fallback_lookup: Dict[str, int] = {}
+        self.fallback_values: List[str] = []
+        self._offsets = array("q", [0])
+        self._keys = array("q")
+        self.offsets = None
+        self.ids = None
+        self.keys = None
+
+    # ---------------------------------------------------------------- ingestion
+
+    def _encode(self, value: str) -> int:
+        match = ID_PATTERN.fullmatch(value)
+        if match and int(match.group(2)) <= NUMBER_MASK:
+            prefix = (match.group(1), len(match.group(2)))
+            code = self.prefix_lookup.get(prefix)
+            if code is None:
+                code = len(self.prefixes)
+                self.prefix_lookup[prefix] = code
+                self.prefixes.append(prefix)
+            return (code << NUMBER_BITS) | int(match.group(2))
+        code = self.fallback_lookup.get(value)
+        if code is None:
+            code = len(self.fallback_values)
+            self.fallback_lookup[value] = code
+            self.fallback_values.append(value)
+        return (FALLBACK_PREFIX << NUMBER_BITS) | code
+
+    def intern(self, text) -> Optional[int]:
+        """Group id for one biospecimen_ids list (identical lists share an id); None for NULL or empty ids"""
+        if text is None:
+            return None
+        key = str(text).strip()
+        if not key:
+            return None
+        group = self.group_lookup.get(key)
+        if group is None:
+            group = self._append(key)
+            self.group_lookup[key] = group
+        return group
+
+    def _append(self, key: str) -> int:
+        """A new group holding the IDs of `key`"""
+        group = len(self._offsets) - 1
+        self._keys.extend(self._encode(value) for value in split_ids(key))
+        self._offsets.append(len(self._keys))
+        self.offsets = None
+        return group
+
+    @classmethod
+    def from_values(cls, values: Iterable, keep_lookup: bool = True, distinct: bool = True) -> "BiospecimenIdIndex":
+        """
+        Index a sequence of distinct biospecimen_ids lists; group ids follow the
+        input order. With distinct=False every value gets its own group even
+        when lists repeat (e.g. NULL ids of different subjects). Without
+        keep_lookup the text keys are dropped once indexed.
+        """
+        index = cls()
+        for value in values:
+            text = "" if value is None else str(value).strip()
+            if distinct and text:
+                index.intern(text)
+            else:
+                index._append(text)
+        index.finalize()
+        if not keep_lookup:
+            index.group_lookup = {}
+            index._keys = array("q")
+        return index
+
+    def finalize(self) -> "BiospecimenIdIndex":
+        """Freeze into NumPy arrays with dense int32 IDs (ranked by packed key)"""
+        self.offsets = np.frombuffer(self._offsets, dtype=np.int64).copy()
+        packed = np.frombuffer(self._keys, dtype=np.int64)
+        self.keys, dense = np.unique(packed, return_inverse=True)
+        self.ids = dense.astype(np.int32)
+        return self
+
+    # ---------------------------------------------------------------- set operations
+
+    @property
+    def group_count(self) -> int:
+        return len(self._offsets) - 1 if self.offsets is None else len(self.offsets) - 1
+
+    @property
+    def id_count(self) -> int:
+        return len(self.keys)
+
+    def _ensure_final(self):
+        if self.offsets is None:
+            self.finalize()
+
+    def members(self, groups: np.ndarray, limits: Optional[np.ndarray] = None) -> np.ndarray:
+        """Dense IDs of the given groups, concatenated; optionally only the first `limits[i]` of group i"""
+        self._ensure_final()
+        groups = np.asarray(groups, dtype=np.int64)
+        starts = self.offsets[groups]
+        lengths = self.offsets[groups + 1] - starts
+        if limits is not None:
+            lengths = np.minimum(lengths, limits)
+        ends = np.cumsum(lengths)
+        if len(ends) == 0 or ends[-1] == 0:
+            return np.zeros(0, dtype=np.int32)
+        positions = np.arange(ends[-1]) + np.repeat(starts - (ends - lengths), lengths)
+        return self.ids[positions]
+
+    def id_bitmap(self, groups: np.ndarray) -> np.ndarray:
+        """Boolean membership over all dense IDs for the given groups (distinct by construction)"""
+        flags = np.zeros(self.id_count, dtype=bool)
+        flags[self.members(groups)] = True
+        return flags
+
+    def count_distinct(self, groups: np.ndarray) -> int:
+        """Distinct biospecimens across groups"""
+        return int(np.count_nonzero(self.id_bitmap(groups)))
+
+    def intersect(self, groups_a: np.ndarray, groups_b: np.ndarray) -> np.ndarray:
+        """Dense IDs present in both group sets"""
+        return np.flatnonzero(self.id_bitmap(groups_a) & self.id_bitmap(groups_b)).astype(np.int32)
+
+    # ---------------------------------------------------------------- output
+
+    def to_strings(self, dense_ids: Sequence[int]) -> List[str]:
+        """Rebuild biospecimen ID strings (output only)"""
+        self._ensure_final()
+        keys = self.keys[np.asarray(dense_ids, dtype=np.int64)]
+        prefix_codes = (keys >> NUMBER_BITS).tolist()
+        numbers = (keys & NUMBER_MASK).tolist()
+        strings = []
+        for code, number in zip(prefix_codes, numbers):
+            if code == FALLBACK_PREFIX:
+                strings.append(self.fallback_values[number])
+            else:
+                prefix, width = self.prefixes[code]
+                strings.append(f"{prefix}{number:0{width}d}")
+        return strings
+
+    def memory_bytes(self) -> int:
+        self._ensure_final()
+        return self.offsets.nbytes + self.ids.nbytes + self.keys.nbytes
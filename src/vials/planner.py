@@ -0,0 +1,45 @@
+"""Query planner: answer compiled requests from the count cube, then the columnar store, else the row engine"""
+
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from vials.cube import cube_filters
+from vials.refinement import CandidateSet, refinement_store
+
+
+def execute_compiled(compiled, engine, session_id: Optional[str] = None, refine: bool = False) -> Tuple[List[Dict[str, Any]], str]:
+    """
+    Run a CompiledQuery and return (per-study rows, route). The route is "cube"
+    when every criterion falls on cube dimensions, "columnar" when the bitmap
+    store can evaluate every predicate, otherwise "engine".
+
+    With a session_id the session's candidate set is kept up to date: a cube
+    answer records the criteria only (materialized later if an ADJUST_FILTER
+    needs it), a columnar one the matching rows; with refine=True a narrowing
+    of the session's previous criteria only filters those rows (route "refine").
+    """
+    start = time.perf_counter()
+    cube = getattr(engine, "cube", None)
+    columnar = getattr(engine, "columnar", None)
+    filters = cube_filters(compiled) if cube is not None else None
+    rows = None
+    if filters is not None:
+        rows, route = cube.counts_by_study(filters), "cube"
+        if session_id is not None:
+            refinement_store.remember(session_id, CandidateSet.pending(compiled, engine.version))
+    elif columnar is not None and session_id is not None:
+        evaluated = refinement_store.evaluate(session_id, compiled, columnar, engine.version, refine=refine)
+        if evaluated is not None:
+            rows, route = evaluated
+            route = "refine" if route == "refine" else "columnar"
+    elif columnar is not None:
+        rows, route = columnar.execute_compiled(compiled), "columnar"
+    if rows is None:
+        result = engine.query(compiled.sql, compiled.params, max_rows=1000)
+        rows = [dict(zip(result["columns"], row)) for row in result["rows"]]
+        route = "engine"
+        if session_id is not None:
+            # The session's candidate set no longer describes its criteria
+            refinement_store.forget(session_id)
+    print(f"📐 Planner route: {route} ({(time.perf_counter() - start) * 1000:.2f} ms)")
+    return rows, route
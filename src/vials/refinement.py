@@ -0,0 +1,196 @@
+"""
+Per-session candidate sets for incremental ADJUST_FILTER evaluation
+
+After each compiled query the session keeps what matched its predicates: the
+deduplicated biospecimen groups when every predicate is specimen-level,
+otherwise the matching rows. Either is stored as an int32 id array or a
+packed bitmap, whichever is smaller. When the next turn's criteria only
+narrow the previous ones, the changed predicates are evaluated over that
+subset instead of the whole table; a widened or removed criterion falls back
+to a full evaluation.
+
+Counts answered from the cube never touch the rows, so for those only the
+criteria are kept (a "pending" set). The set is materialized by the first
+ADJUST_FILTER that needs the columnar store: its full evaluation records it.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from metrics import metrics
+from vials.columnar import unpack_bitmap
+from vials.schema import ASSAY_COLUMNS
+
+
+class CandidateSet(NamedTuple):
+    compiled: Any
+    dataset_version: Optional[str]
+    level: str                     # "groups" (group codes), "rows" (row indices) or "pending" (not materialized)
+    universe: int                  # number of groups / rows the ids index into
+    ids: Optional[np.ndarray]      # int32 ids for sparse sets
+    bitmap: Optional[np.ndarray]   # packed bitmap for dense sets
+
+    @classmethod
+    def build(cls, compiled, dataset_version, level: str, ids: np.ndarray, universe: int,
+              bitmap: Optional[np.ndarray] = None) -> "CandidateSet":
+        # An id costs 32 bits, a bitmap 1 bit per member of the universe
+        if len(ids) * 32 > universe:
+            if bitmap is None:
+                mask = np.zeros(universe, dtype=bool)
+                mask[ids] = True
+                bitmap = np.packbits(mask)
+            return cls(compiled, dataset_version, level, universe, None, bitmap)
+        return cls(compiled, dataset_version, level, universe, ids.astype(np.int32), None)
+
+    def members(self) -> np.ndarray:
+        if self.ids is not None:
+            return self.ids.astype(np.int64)
+        return np.flatnonzero(unpack_bitmap(self.bitmap, self.universe))
+
+    @classmethod
+    def pending(cls, compiled, dataset_version) -> "CandidateSet":
+        return cls(compiled, dataset_version, "pending", 0, None, None)
+
+    @property
+    def nbytes(self) -> int:
+        if self.level == "pending":
+            return 0
+        return (self.ids if self.ids is not None else self.bitmap).nbytes
+
+
+def _implies(current, previous) -> bool:
+    """True when predicate `current` selects a subset of what `previous` selected on the same column"""
+    if current.column != previous.column or current.op != previous.op:
+        return False
+    if current.op == "in":
+        return set(current.value) <= set(previous.value)
+    low, high = current.value
+    previous_low, previous_high = previous.value
+    low_ok = previous_low is None or (low is not None and low >= previous_low)
+    high_ok = previous_high is None or (high is not None and high <= previous_high)
+    return low_ok and high_ok
+
+
+def refinement_reason(previous, current) -> Optional[str]:
+    """
+    None when `current` is a strict refinement of `previous` (every previous
+    predicate is still implied), otherwise why a full evaluation is needed.
+    """
+    if current.unhandled:
+        return f"uncompiled fields {current.unhandled}"
+    for old in previous.predicates:
+        if not any(_implies(new, old) for new in current.predicates):
+            widened = [new for new in current.predicates if new.column == old.column]
+            return f"{old.column} {'widened' if widened else 'removed'}"
+    return None
+
+
+def _specimen_level(predicates) -> bool:
+    """Specimen-level predicates hold for every row of a biospecimen group or for none"""
+    return all(predicate.column not in ASSAY_COLUMNS for predicate in predicates)
+
+
+class RefinementStore:
+    """LRU of the latest candidate set per session"""
+
+    def __init__(self, max_sessions: int = 256):
+        self.max_sessions = max_sessions
+        self.sessions: "OrderedDict[str, CandidateSet]" = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, session_id: str) -> Optional[CandidateSet]:
+        with self.lock:
+            candidate = self.sessions.get(session_id)
+            if candidate is not None:
+                self.sessions.move_to_end(session_id)
+            return candidate
+
+    def remember(self, session_id: str, candidate: CandidateSet):
+        with self.lock:
+            self.sessions[session_id] = candidate
+            self.sessions.move_to_end(session_id)
+            while len(self.sessions) > self.max_sessions:
+                self.sessions.popitem(last=False)
+
+    def forget(self, session_id: str):
+        with self.lock:
+            self.sessions.pop(session_id, None)
+
+    def _refine(self, previous: CandidateSet, compiled, store):
+        """(groups, rows, row bitmap) narrowed from the previous candidate set, or None"""
+        # Unchanged predicates already hold on the previous set; only evaluate the rest
+        changed = [predicate for predicate in compiled.predicates if predicate not in previous.compiled.predicates]
+        if previous.level == "groups":
+            if not _specimen_level(changed):
+                return None
+            groups = store.filter_subset(store.group_rows[previous.members()], changed)
+            return None if groups is None else (groups, None, None)
+        if previous.bitmap is not None:
+            bitmap = store.filter_bitmap(changed)
+            if bitmap is None:
+                return None
+            np.bitwise_and(bitmap, previous.bitmap, out=bitmap)
+            return None, np.flatnonzero(unpack_bitmap(bitmap, store.n_rows)), bitmap
+        rows = store.filter_subset(previous.ids.astype(np.int64), changed)
+        return None if rows is None else (None, rows, None)
+
+    def evaluate(self, session_id: Optional[str], compiled, store, dataset_version: Optional[str],
+                 refine: bool = True) -> Optional[Tuple[List[Dict[str, Any]], str]]:
+        """
+        Per-study counts for `compiled` on the columnar store, narrowing the
+        session's previous candidate set when possible. Returns (rows, route)
+        with route "refine" or "full", or None when the store cannot evaluate
+        the criteria.
+        """
+        start = time.perf_counter()
+        if compiled.unhandled:
+            return None
+        previous = self.get(session_id) if session_id and refine else None
+        route, refined = "full", None
+        if previous is not None and previous.level == "pending":
+            print("🔁 Previous candidate set not materialized (cube answer); running full evaluation")
+        elif previous is not None and previous.dataset_version == dataset_version:
+            reason = refinement_reason(previous.compiled, compiled)
+            if reason is None:
+                refined = self._refine(previous, compiled, store)
+                route = "refine" if refined is not None else "full"
+            else:
+                print(f"🔁 Not a refinement ({reason}); running full evaluation")
+        if refined is not None:
+            groups, rows, bitmap = refined
+        else:
+            bitmap = store.filter_bitmap(compiled.predicates)
+            if bitmap is None:
+                return None
+            groups, rows = None, np.flatnonzero(unpack_bitmap(bitmap, store.n_rows))
+        if groups is None:
+            groups = store.unique_groups(rows)
+
+        results = store.counts_for_groups(groups, compiled)
+        if session_id:
+            if _specimen_level(compiled.predicates):
+                group_codes = store.group_codes[groups]
+                candidate = CandidateSet.build(compiled, dataset_version, "groups", group_codes, len(store.group_rows))
+            else:
+                candidate = CandidateSet.build(compiled, dataset_version, "rows", rows, store.n_rows, bitmap)
+            self.remember(session_id, candidate)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        metrics.increment(f"refinement.{route}")
+        metrics.observe(f"refinement.{route}_ms", elapsed_ms)
+        print(f"🎯 {route.title()} evaluation over {len(groups)} candidate groups ({elapsed_ms:.2f} ms)")
+        return results, route
+
+    def get_status(self) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                "sessions": len(self.sessions),
+                "pending": sum(candidate.level == "pending" for candidate in self.sessions.values()),
+                "memory_bytes": sum(candidate.nbytes for candidate in self.sessions.values())
+            }
+
+# Global instance
+refinement_store = RefinementStore()
@@ -0,0 +1,143 @@
+"""VIALS table layout shared by the loaders, the query engine and the prompts"""
+
+from datetime import date, datetime
+from functools import lru_cache
+from typing import Optional
+
+# (column name, SQLite type) in the order used by the VIALS exports
+VIALS_COLUMNS = [
+    # Primary Keys & Identifiers
+    ("subject_id", "TEXT"),
+    ("study_id", "TEXT"),
+    ("protocol_id", "TEXT"),
+    # Specimen Information
+    ("specimen_type", "TEXT"),
+    ("specimen_site", "TEXT"),
+    ("status", "TEXT"),
+    ("vials_count", "INTEGER"),
+    ("biospecimen_ids", "TEXT"),
+    ("purpose", "TEXT"),
+    # Visit & Collection Data
+    ("visit_number", "TEXT"),
+    ("visit_name", "TEXT"),
+    ("planned_day_of_visit", "TEXT"),
+    ("collection_date", "TEXT"),
+    ("collection_time", "TEXT"),
+    # Test & Analysis Details
+    ("test_short_name", "TEXT"),
+    ("test_name", "TEXT"),
+    ("method", "TEXT"),
+    ("non_host_organism_id", "TEXT"),
+    ("binding_agent", "TEXT"),
+    # Result Parameters
+    ("numeric_results", "REAL"),
+    ("standard_units", "TEXT"),
+    ("detection_lower_limit", "REAL"),
+    ("quantitation_lower_limit", "REAL"),
+    ("quantitation_upper_limit", "REAL"),
+    # Subject Demographics
+    ("age", "INTEGER"),
+    ("sex", "TEXT"),
+    ("race", "TEXT"),
+    ("ethnicity", "TEXT"),
+    ("arm", "TEXT"),
+    # Consent Information
+    ("consent_future_use_specimens", "TEXT"),
+    ("consent_future_use_genetic_testing", "TEXT"),
+]
+
+COLUMN_NAMES = [name for name, _ in VIALS_COLUMNS]
+COLUMN_TYPES = dict(VIALS_COLUMNS)
+
+# Assay-level columns: one VIALS row per test result, so these repeat a biospecimen group
+ASSAY_COLUMNS = [
+    "test_short_name", "test_name", "method", "non_host_organism_id", "binding_agent",
+    "numeric_results", "standard_units", "detection_lower_limit",
+    "quantitation_lower_limit", "quantitation_upper_limit",
+]
+
+# Specimen-level columns: identical for every row of the same biospecimen group
+SPECIMEN_COLUMNS = [name for name in COLUMN_NAMES if name not in ASSAY_COLUMNS]
+
+# Derived at ingestion (not in the exports): interned integer id of the biospecimen_ids
+# list, so the dedup step groups on an integer instead of comparing long text lists
+GROUP_KEY_COLUMN = ("biospecimen_group", "INTEGER")
+
+# Derived at ingestion: collection_date / collection_time parsed once into epoch integers
+# (days and seconds since 1970-01-01), so date windows are integer range scans
+DATE_COLUMNS = [("collection_day", "INTEGER"), ("collection_epoch", "INTEGER")]
+
+DERIVED_COLUMNS = [GROUP_KEY_COLUMN] + DATE_COLUMNS
+
+# Columns that get a B-tree index in the row engine
+INDEXED_COLUMNS = ["study_id", "specimen_type", "visit_number", "arm", "subject_id", "collection_day"]
+
+# Date format used by VIALS.collection_date (e.g. 15-Mar-19)
+COLLECTION_DATE_FORMAT = "%d-%b-%y"
+
+# Time formats used by VIALS.collection_time (e.g. 07:49)
+COLLECTION_TIME_FORMATS = ("%H:%M", "%H:%M:%S")
+
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+
+def coerce_value(column: str, value):
+    """Convert a raw CSV string to the column's Python type (empty -> None)"""
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = value.strip()
+        if value == "" or value.upper() in ("NULL", "NA", "N/A"):
+            return None
+    column_type = COLUMN_TYPES.get(column)
+    try:
+        if column_type == "INTEGER":
+            return int(float(value))
+        if column_type == "REAL":
+            return float(value)
+    except (TypeError, ValueError):
+        return None
+    return value
+
+
+@lru_cache(maxsize=65536)
+def epoch_day(value) -> Optional[int]:
+    """Days since 1970-01-01 for a collection_date (15-Mar-19) or ISO (2019-03-15) string"""
+    if value is None:
+        return None
+    text = str(value).strip()
+    for date_format in (COLLECTION_DATE_FORMAT, "%Y-%m-%d"):
+        try:
+            return datetime.strptime(text, date_format).date().toordinal() - EPOCH_ORDINAL
+        except ValueError:
+            continue
+    return None
+
+
+@lru_cache(maxsize=4096)
+def seconds_of_day(value) -> int:
+    """Seconds since midnight for a collection_time (07:49); 0 when missing or unparseable"""
+    text = str(value).strip() if value is not None else ""
+    for time_format in COLLECTION_TIME_FORMATS:
+        try:
+            parsed = datetime.strptime(text, time_format)
+            return parsed.hour * 3600 + parsed.minute * 60 + parsed.second
+        except ValueError:
+            continue
+    return 0
+
+
+def epoch_seconds(collection_date, collection_time) -> Optional[int]:
+    """Seconds since 1970-01-01 for a collection date and time (missing time -> midnight)"""
+    day = epoch_day(collection_date)
+    if day is None:
+        return None
+    return day * 86400 + seconds_of_day(collection_time)
+
+
+def date_values(row) -> list:
+    """DATE_COLUMNS values for one VIALS record (used as-is when already normalized at ingestion)"""
+    if "collection_day" in row:
+        return [row["collection_day"], row.get("collection_epoch")]
+    collection_date = coerce_value("collection_date", row.get("collection_date"))
+    return [epoch_day(collection_date), epoch_seconds(collection_date, row.get("collection_time"))]
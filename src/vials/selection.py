@@ -0,0 +1,277 @@
+"""
+Selection engine for `selection_requirements`
+
+Applies quantity limits (subjects to pick, vials per subject/visit/arm, total
+vials) and ordered prioritization rules to the eligible VIALS rows of the
+columnar store, using vectorized group-by and partial top-k selection, and
+returns the chosen biospecimen_ids.
+"""
+
+import re
+import time
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from vials.columnar import DAY_NULL
+from vials.compiler import grouping_columns
+
+SUBJECT_LIMIT_PATTERN = re.compile(r"(?:number_of_|num_|total_|max_)?(?:subjects?|participants?|patients?|donors?)")
+VIAL_LIMIT_PATTERN = re.compile(r"(?:number_of_|num_|total_|max_)?(?:vials?|aliquots?|biospecimens?|samples?|specimens?)")
+PER_GROUP_PATTERN = re.compile(r"(?:minimum_|max_|maximum_)?(?:vials|aliquots|biospecimens|samples|specimens)_per_(.+)")
+
+# Prioritization rule text -> ranking field, checked in order
+PRIORITY_FIELDS = [
+    (re.compile(r"titer|gmt|result|response|antibod|neutraliz|concentration|level"), "numeric_results"),
+    (re.compile(r"recent|latest|newest|earliest|collection date|collected|date"), "collection_date"),
+    (re.compile(r"\bage\b|older|younger|oldest|youngest"), "age"),
+    (re.compile(r"aliquot|vial|biospecimen|sample|specimen|volume|available"), "vials"),
+]
+ASCENDING_WORDS = re.compile(r"lowest|least|fewest|minimum|smallest|earliest|youngest|oldest collection")
+
+
+class SelectionResult(NamedTuple):
+    biospecimen_ids: List[str]
+    subjects: List[str]
+    per_study: List[Dict[str, Any]]
+    applied: List[str]
+    unhandled: List[str]
+
+    @property
+    def vials_selected(self) -> int:
+        return len(self.biospecimen_ids)
+
+
+class _Limits(NamedTuple):
+    subjects: Optional[int]
+    total_vials: Optional[int]
+    per_group: List[Tuple[Tuple[str, ...], int]]
+    applied: List[str]
+    unhandled: List[str]
+
+
+def _quantity(value: Any) -> Optional[int]:
+    if isinstance(value, dict):
+        value = value.get("value")
+    if isinstance(value, bool) or value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return int(value)
+    match = re.search(r"\d+", str(value))
+    return int(match.group()) if match else None
+
+
+def parse_quantity_limits(quantity_limits: Dict[str, Any]) -> _Limits:
+    """Split quantity_limits into subject count, total vials and per-grouping vial caps"""
+    subjects, total_vials, per_group, applied, unhandled = None, None, [], [], []
+    for name, entry in (quantity_limits or {}).items():
+        if isinstance(entry, dict) and entry.get("state") == "removed":
+            continue
+        key = name.strip().lower()
+        amount = _quantity(entry)
+        match = PER_GROUP_PATTERN.fullmatch(key)
+        columns = grouping_columns(match.group(1)) if match else None
+        if amount is None:
+            unhandled.append(name)
+        elif SUBJECT_LIMIT_PATTERN.fullmatch(key):
+            subjects = amount
+            applied.append(name)
+        elif VIAL_LIMIT_PATTERN.fullmatch(key):
+            total_vials = amount
+            applied.append(name)
+        elif columns:
+            per_group.append((columns, amount))
+            applied.append(name)
+        else:
+            unhandled.append(name)
+    # Finest grouping first, so coarser caps see what the finer ones kept
+    per_group.sort(key=lambda item: -len(item[0]))
+    return _Limits(subjects, total_vials, per_group, applied, unhandled)
+
+
+class SelectionEngine:
+    """Vectorized quantity limits and prioritization over a ColumnarVials store"""
+
+    def __init__(self, store):
+        self.store = store
+        self.subject_codes = store.text_columns["subject_id"].codes
+        self.n_subjects = len(store.text_columns["subject_id"].values)
+        self.vials = np.maximum(store.numeric_columns["vials_count"], 0).astype(np.int64)
+
+    # ---------------------------------------------------------------- ranking
+
+    def subject_scores(self, field: str, rows: np.ndarray, groups: np.ndarray, descending: bool,
+                       visit: Optional[str] = None) -> np.ndarray:
+        """Per-subject ranking score for one prioritization field (NaN when unknown)"""
+        scores = np.full(self.n_subjects, np.nan)
+        store = self.store
+        if field == "vials":
+            totals = np.bincount(self.subject_codes[groups], weights=self.vials[groups], minlength=self.n_subjects)
+            scores[totals > 0] = totals[totals > 0]
+            return scores
+        if field == "age":
+            ages = store.numeric_columns["age"][groups]
+            known = ages >= 0
+            scores[self.subject_codes[groups][known]] = ages[known]
+            return scores
+        if field == "numeric_results":
+            if visit is not None:
+                visit_codes = store.text_columns["visit_number"].codes_for([visit])
+                rows = rows[np.isin(store.text_columns["visit_number"].codes[rows], visit_codes)]
+            values = store.numeric_columns["numeric_results"][rows].astype(np.float64)
+            subjects = self.subject_codes[rows]
+        else:
+            days = store.range_indexes["collection_day"].data[groups]
+            values = np.where(days == DAY_NULL, np.nan, days.astype(np.float64))
+            subjects = self.subject_codes[groups]
+        known = ~np.isnan(values)
+        reduce = np.maximum if descending else np.minimum
+        fill = -np.inf if descending else np.inf
+        best = np.full(self.n_subjects, fill)
+        reduce.at(best, subjects[known], values[known])
+        scores[best != fill] = best[best != fill]
+        return scores
+
+    def rank_keys(self, rules: List[Dict[str, Any]], rows: np.ndarray, groups: np.ndarray):
+        """lexsort keys (most significant last) from ordered prioritization rules"""
+        keys, applied, unhandled = [], [], []
+        for rule in sorted(rules or [], key=lambda item: item.get("priority", 0)):
+            if rule.get("state") == "removed":
+                continue
+            text = f"{rule.get('rule', '')} {rule.get('original_text', '')}".lower()
+            field = next((name for pattern, name in PRIORITY_FIELDS if pattern.search(text)), None)
+            if field is None:
+                unhandled.append(rule.get("rule", ""))
+                continue
+            direction = str(rule.get("direction", "")).lower()
+            descending = not ASCENDING_WORDS.search(direction or text)
+            visit_match = re.search(r"visit\s*0*(\d+)", text)
+            visit = f"{int(visit_match.group(1)):02d}" if visit_match else None
+            scores = self.subject_scores(field, rows, groups, descending, visit)
+            key = -scores if descending else scores
+            keys.append(np.where(np.isnan(key), np.inf, key))  # unknown scores rank last
+            applied.append(rule.get("rule", field))
+        return keys[::-1], applied, unhandled
+
+    # ---------------------------------------------------------------- quantity limits
+
+    def _grouping_key(self, groups: np.ndarray, columns: Tuple[str, ...]) -> np.ndarray:
+        key = np.zeros(len(groups), dtype=np.int64)
+        for name in columns:
+            column = self.store.text_columns[name]
+            key = key * len(column.values) + column.codes[groups].astype(np.int64)
+        return key
+
+    def cap_per_group(self, groups: np.ndarray, take: np.ndarray, columns: Tuple[str, ...], cap: int) -> np.ndarray:
+        """
+        Take at most `cap` vials per grouping, largest biospecimen groups first;
+        groupings with fewer than `cap` vials are dropped entirely.
+        """
+        if len(groups) == 0:
+            return take
+        key = self._grouping_key(groups, columns)
+        order = np.lexsort((-take, key))
+        sorted_key, sorted_take = key[order], take[order]
+        starts = np.flatnonzero(np.concatenate([[True], sorted_key[1:] != sorted_key[:-1]]))
+        cumulative = np.cumsum(sorted_take)
+        before = cumulative - sorted_take
+        grouping = np.repeat(np.arange(len(starts)), np.diff(np.append(starts, len(order))))
+        before -= before[starts][grouping]
+        totals = np.add.reduceat(sorted_take, starts)
+        capped = np.clip(cap - before, 0, sorted_take)
+        capped[totals[grouping] < cap] = 0
+        result = np.empty_like(take)
+        result[order] = capped
+        return result
+
+    def top_subjects(self, candidates: np.ndarray, keys: List[np.ndarray], limit: Optional[int]) -> np.ndarray:
+        """Subject codes in priority order, partially selected when only `limit` are needed"""
+        if limit is not None and limit < len(candidates) and keys:
+            # Partial top-k on the primary key, keeping ties at the boundary for the full ordering
+            primary = keys[-1][candidates]
+            kth = np.partition(primary, limit - 1)[limit - 1]
+            candidates = candidates[primary <= kth]
+        if keys:
+            order = np.lexsort([candidates] + [key[candidates] for key in keys])
+            candidates = candidates[order]
+        return candidates if limit is None else candidates[:limit]
+
+    # ---------------------------------------------------------------- selection
+
+    def select(self, rows: np.ndarray, groups: np.ndarray, selection_requirements: Dict[str, Any]) -> SelectionResult:
+        """Apply quantity limits and prioritization to eligible rows / dedup groups"""
+        selection_requirements = selection_requirements or {}
+        limits = parse_quantity_limits(selection_requirements.get("quantity_limits"))
+        keys, applied_rules, unhandled_rules = self.rank_keys(
+            selection_requirements.get("prioritization_rules"), rows, groups
+        )
+
+        take = self.vials[groups].copy()
+        for columns, cap in limits.per_group:
+            take = self.cap_per_group(groups, take, columns, cap)
+        groups, take = groups[take > 0], take[take > 0]
+
+        subjects = self.subject_codes[groups]
+        candidates = np.flatnonzero(np.bincount(subjects, minlength=self.n_subjects))
+        chosen = self.top_subjects(candidates, keys, limits.subjects)
+
+        # Keep the chosen subjects' groups, in subject priority order
+        rank = np.full(self.n_subjects, -1, dtype=np.int64)
+        rank[chosen] = np.arange(len(chosen))
+        keep = rank[subjects] >= 0
+        groups, take = groups[keep], take[keep]
+        order = np.argsort(rank[self.subject_codes[groups]], kind="stable")
+        groups, take = groups[order], take[order]
+        if limits.total_vials is not None:
+            before = np.cumsum(take) - take
+            take = np.clip(limits.total_vials - before, 0, take)
+            groups, take = groups[take > 0], take[take > 0]
+
+        # Take the first `take` IDs of each group as integers; strings are rebuilt only for the output
+        id_index = self.store.biospecimen_ids
+        chosen_ids = id_index.members(self.store.group_codes[groups], limits=take)
+
+        subject_values = self.store.text_columns["subject_id"].values
+        selected_subjects = self.subject_codes[groups]
+        chosen = chosen[np.isin(chosen, selected_subjects)]
+        return SelectionResult(
+            biospecimen_ids=id_index.to_strings(chosen_ids),
+            subjects=[subject_values[code] for code in chosen],
+            per_study=self._per_study(groups, take),
+            applied=limits.applied + applied_rules,
+            unhandled=limits.unhandled + unhandled_rules
+        )
+
+    def _per_study(self, groups: np.ndarray, take: np.ndarray) -> List[Dict[str, Any]]:
+        study = self.store.text_columns["study_id"]
+        if len(groups) == 0:
+            return []
+        study_codes = study.codes[groups].astype(np.int64)
+        vials = np.bincount(study_codes, weights=take, minlength=len(study.values))
+        pairs = np.unique(study_codes * self.n_subjects + self.subject_codes[groups])
+        subjects = np.bincount(pairs // self.n_subjects, minlength=len(study.values))
+        return [
+            {"study_id": study.values[code], "selected_subjects": int(subjects[code]), "selected_vials": int(vials[code])}
+            for code in range(len(study.values)) if subjects[code] > 0
+        ]
+
+
+def select_for_compiled(store, compiled, selection_requirements: Dict[str, Any]) -> Optional[SelectionResult]:
+    """Run the selection over the rows eligible for a CompiledQuery; None if the store cannot evaluate it"""
+    start = time.perf_counter()
+    if compiled.unhandled:
+        return None
+    rows = store.filter_rows(compiled.predicates)
+    if rows is None:
+        return None
+    groups = store.apply_group_rules(store.unique_groups(rows), compiled.group_minimums, compiled.all_visits)
+    result = SelectionEngine(store).select(rows, groups, selection_requirements)
+    print(f"🎯 Selected {result.vials_selected} vials from {len(result.subjects)} subjects "
+          f"({(time.perf_counter() - start) * 1000:.2f} ms)")
+    return result
+
+
+def has_selection(selection_requirements: Dict[str, Any]) -> bool:
+    """True when the organize state asks for a subset (quantity limits or prioritization)"""
+    selection_requirements = selection_requirements or {}
+    return bool(selection_requirements.get("quantity_limits") or selection_requirements.get("prioritization_rules"))
@@ -0,0 +1,130 @@
+"""
+Deterministic synthetic VIALS data for local development, fixtures and benchmarks
+
+Usage:
+    python -m vials.synthetic --rows 600 --out data/vials_fixture.csv
+"""
+
+import argparse
+import csv
+import random
+from datetime import date, timedelta
+from typing import Dict, Any, Iterator
+
+from vials.schema import COLUMN_NAMES, COLLECTION_DATE_FORMAT
+
+STUDY_IDS = [f"DMID-{number:02d}-{suffix:04d}" for number, suffix in zip(range(10, 27), range(1, 18))]
+SPECIMEN_TYPES = [
+    "Cryopreserved PBMCs", "Plasma", "Serum", "Tempus Blood RNA Tube",
+    "Nasal Lavage Fluid Supernatant", "Nasal Swab", "PBMC", "Urine", "PAXgene",
+]
+STATUSES = ["Available", "Available", "Available", "Reserved", "Depleted"]
+ARMS = [
+    "Arm 1: Vaccine 15 mcg", "Arm 2: Vaccine 45 mcg",
+    "Arm 3: Vaccine + Adjuvant", "Arm 4: Placebo",
+]
+SEXES = ["Female", "Male"]
+RACES = ["White", "Black or African American", "Asian", "American Indian or Alaska Native", "Multiple"]
+ETHNICITIES = ["Not Hispanic or Latino", "Hispanic or Latino"]
+VISITS = [("01", "Visit01 (Day1)", "1"), ("02", "Visit02 (Day8)", "8"), ("03", "Visit03 (Day22)", "22"),
+          ("04", "Visit04 (Day29)", "29"), ("05", "Visit05 (Day36)", "36"), ("06", "Visit06 (Day111)", "111"),
+          ("07", "Visit07 (Day43)", "43"), ("08", "Visit08 (Day181)", "181")]
+TESTS = [
+    ("HAI", "Microbial-induced Antibody", "Hemagglutination Inhibition Assay",
+     "Influenza A/Singapore/INFIMH-16-0019/2016 (H3N2)", "Influenza A/Singapore/INFIMH-16-0019/2016 H3 Hemagglutinin", "titer"),
+    ("MN", "Microneutralization", "Microneutralization Assay",
+     "Influenza A/Michigan/45/2015 (H1N1)", "Influenza A/Michigan/45/2015 H1 Hemagglutinin", "titer"),
+]
+
+
+def generate_rows(n_rows: int, seed: int = 7, n_studies: int = 17) -> Iterator[Dict[str, Any]]:
+    """
+    Yield n_rows VIALS records. Each biospecimen group (subject x visit x specimen)
+    is emitted once per assay result, so dedup-sensitive counting is exercised.
+    """
+    rng = random.Random(seed)
+    studies = STUDY_IDS[:n_studies]
+    base_date = date(2018, 1, 1)
+    emitted = 0
+    subject_number = 0
+    specimen_number = 0
+    while emitted < n_rows:
+        subject_number += 1
+        study_id = studies[subject_number % len(studies)]
+        subject = {
+            "subject_id": f"{study_id[-4:]}-{subject_number:07d}",
+            "study_id": study_id,
+            "protocol_id": f"{study_id}-P",
+            "age": rng.randint(18, 85),
+            "sex": rng.choice(SEXES),
+            "race": rng.choice(RACES),
+            "ethnicity": rng.choice(ETHNICITIES),
+            "arm": rng.choice(ARMS),
+            "consent_future_use_specimens": "Yes" if rng.random() < 0.85 else "No",
+            "consent_future_use_genetic_testing": "Yes" if rng.random() < 0.7 else "No",
+        }
+        enrolled = base_date + timedelta(days=rng.randint(0, 5 * 365))
+        for visit_number, visit_name, planned_day in VISITS[:rng.randint(3, len(VISITS))]:
+            collected = enrolled + timedelta(days=int(planned_day) - 1)
+            for specimen_type in rng.sample(SPECIMEN_TYPES, rng.randint(1, 3)):
+                vials_count = rng.randint(1, 8)
+                ids = ",".join(f"BS{specimen_number + i:09d}" for i in range(vials_count))
+                specimen_number += vials_count
+                group = dict(subject)
+                group.update({
+                    "specimen_type": specimen_type,
+                    "specimen_site": f"Site {rng.randint(1, 6)}",
+                    "status": rng.choice(STATUSES),
+                    "vials_count": vials_count,
+                    "biospecimen_ids": ids,
+                    "purpose": "Research",
+                    "visit_number": visit_number,
+                    "visit_name": visit_name,
+                    "planned_day_of_visit": planned_day,
+                    "collection_date": collected.strftime(COLLECTION_DATE_FORMAT),
+                    "collection_time": f"{rng.randint(7, 17):02d}:{rng.randint(0, 59):02d}",
+                })
+                for test in TESTS[:rng.randint(1, len(TESTS))]:
+                    row = dict(group)
+                    row.update({
+                        "test_short_name": test[0],
+                        "test_name": test[1],
+                        "method": test[2],
+                        "non_host_organism_id": test[3],
+                        "binding_agent": test[4],
+                        "numeric_results": float(2 ** rng.randint(2, 11) * 5),
+                        "standard_units": test[5],
+                        "detection_lower_limit": 10.0,
+                        "quantitation_lower_limit": 10.0,
+                        "quantitation_upper_limit": 10240.0,
+                    })
+                    yield row
+                    emitted += 1
+                    if emitted >= n_rows:
+                        return
+
+
+def write_csv(path: str, n_rows: int, seed: int = 7) -> int:
+    """Write a synthetic VIALS CSV export and return the number of rows written"""
+    count = 0
+    with open(path, "w", newline="", encoding="utf-8") as handle:
+        writer = csv.DictWriter(handle, fieldnames=COLUMN_NAMES)
+        writer.writeheader()
+        for row in generate_rows(n_rows, seed=seed):
+            writer.writerow(row)
+            count += 1
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic VIALS CSV export")
+    parser.add_argument("--rows", type=int, default=600)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--out", required=True)
+    args = parser.parse_args()
+    count = write_csv(args.out, args.rows, seed=args.seed)
+    print(f"✅ Wrote {count} VIALS rows to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,23 @@
+import json
+from langchain_core.tools import tool
+
+from vials.engine import get_engine, QueryError
+
+
+@tool("sql_query_executor")
+def sql_query_executor(query: str) -> str:
+    """
+    SQL Query Executor: run one read-only SQL query (SQLite dialect, STR_TO_DATE supported)
+    against the VIALS biospecimen table and return the result rows as JSON.
+    Collection dates are also stored as indexed integers: filter date windows with
+    `collection_day BETWEEN EPOCH_DAY('2019-01-01') AND EPOCH_DAY('2020-06-30')`.
+    The deduplicated biospecimen groups are also available as the table `unique_biospecimens`
+    (same columns as VIALS without the assay/result columns).
+    """
+    engine = get_engine()
+    if engine is None:
+        return json.dumps({"error": "VIALS data is not loaded"})
+    try:
+        return json.dumps(engine.query(query), default=str)
+    except QueryError as e:
+        return json.dumps({"error": str(e)})
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""
+Local testing script - JSON extraction from LLM output
+Runs under pytest or directly: python test_json_extractor.py
+"""
+
+import sys
+
+# Add src directory to path
+sys.path.append('src')
+
+from json_extractor import IncrementalJSONExtractor, extract_first_json
+
+FENCED_AFTER_STRAY_BRACE = ('I changed the set {visit 1, visit 2 to visit 3.\n'
+                            '```json\n{"eligibility_criteria": {"sex": "female"}}\n```')
+
+
+def test_fence_after_unbalanced_brace():
+    """A stray `{` in prose does not swallow the fenced object that follows"""
+    print("🧪 Testing a fenced object after an unbalanced brace...")
+    expected = {"eligibility_criteria": {"sex": "female"}}
+    assert extract_first_json(FENCED_AFTER_STRAY_BRACE) == expected
+    extractor = IncrementalJSONExtractor()
+    for start in range(0, len(FENCED_AFTER_STRAY_BRACE), 3):
+        extractor.feed(FENCED_AFTER_STRAY_BRACE[start:start + 3])
+    assert extractor.objects == [expected] and extractor.first() == expected
+    print("✅ Fenced object extracted")
+
+
+def test_backticks_inside_strings():
+    """Backticks inside JSON strings are content, not fences"""
+    print("🧪 Testing backticks inside strings...")
+    text = 'Here:\n```json\n{"note": "use ```code``` here", "n": 1}\n```'
+    assert extract_first_json(text) == {"note": "use ```code``` here", "n": 1}
+    print("✅ Backticks in strings kept")
+
+
+def main():
+    """Run every test in this file"""
+    print("🚀 JSON Extraction - Local Testing")
+    print("=" * 50)
+    failed = 0
+    for name, test in sorted(globals().items()):
+        if name.startswith("test_") and callable(test):
+            try:
+                test()
+            except Exception as e:
+                failed += 1
+                print(f"❌ {name}: {type(e).__name__}: {e}")
+    print(f"\n{'✅ All tests passed' if not failed else f'❌ {failed} failed'}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
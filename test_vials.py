@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+"""
+Local testing script - VIALS query compiler and engine
+Runs under pytest or directly: python test_vials.py
+"""
+
+import csv
+import os
+import sys
+import tempfile
+
+# Add src directory to path
+sys.path.append('src')
+
+from vials.columnar import ColumnarVials
+from vials.compiler import compile_organize_state
+from vials.cube import CountCube
+from vials.engine import VialsEngine
+from vials.ingest import ingest_csv, pa
+from vials.planner import execute_compiled
+from vials.refinement import refinement_store
+from vials.schema import COLUMN_NAMES
+from vials.synthetic import generate_rows
+
+_engine = None
+
+
+def synthetic_engine(rows=None):
+    """Engine with cube and columnar store over synthetic VIALS rows (shared unless `rows` is given)"""
+    global _engine
+    if rows is None and _engine is not None:
+        return _engine
+    engine = VialsEngine()
+    engine.load_rows(rows if rows is not None else generate_rows(3000, seed=5))
+    engine.finalize()
+    engine.cube = CountCube.from_engine(engine)
+    engine.columnar = ColumnarVials.from_engine(engine)
+    engine.version = "test"
+    if rows is None:
+        _engine = engine
+    return engine
+
+
+def sql_counts(engine, compiled):
+    result = engine.query(compiled.sql, compiled.params, max_rows=1000)
+    return sorted(tuple(row) for row in result["rows"])
+
+
+def planner_counts(rows):
+    return sorted(tuple(row.values()) for row in rows)
+
+
+def organize_state(**criteria):
+    return {"eligibility_criteria": {field: {"value": value, "state": "new"} for field, value in criteria.items()},
+            "selection_requirements": {}, "metadata": {"removed_fields": []}}
+
+
+def test_invalid_calendar_dates():
+    """Impossible dates from the LLM are reported unhandled, not raised"""
+    print("🧪 Testing invalid calendar dates...")
+    for value in ("31-Feb-19", "2019-13-01", "between 2019-02-30 and 2020"):
+        compiled = compile_organize_state(organize_state(specimen_type="PBMC", collection_date=value))
+        assert compiled.unhandled == ["collection_date"], (value, compiled.unhandled)
+        assert compiled.handled == ["specimen_type"]
+    compiled = compile_organize_state(organize_state(collection_date="between 2019-02-28 and 2020"))
+    assert compiled.fully_compiled
+    print("✅ Invalid dates fall back")
+
+
+def test_wildcard_items_in_lists():
+    """Wildcard items drop out of a list without dropping its other values; "none" is not a wildcard"""
+    print("🧪 Testing wildcard items in criteria lists...")
+    compiled = compile_organize_state(organize_state(specimen_type=["plasma", "any"]))
+    assert compiled.predicates == compile_organize_state(organize_state(specimen_type="plasma")).predicates
+    assert compiled.predicates
+    compiled = compile_organize_state(organize_state(specimen_type=["plasma", "none"]))
+    assert compiled.unhandled == ["specimen_type"], compiled.unhandled
+    compiled = compile_organize_state(organize_state(specimen_type=["any", "n/a"], gender="none"))
+    assert compiled.predicates == [] and compiled.handled == ["specimen_type"], compiled
+    assert compiled.unhandled == ["gender"], compiled.unhandled
+    print("✅ Only wildcard items are dropped")
+
+
+def test_new_query_with_session_uses_cube():
+    """A NEW_QUERY with a session_id is answered from the cube; the candidate set waits for ADJUST_FILTER"""
+    print("🧪 Testing NEW_QUERY routing with a session...")
+    engine = synthetic_engine()
+    compiled = compile_organize_state(organize_state(specimen_type="PBMC", gender="female"))
+    rows, route = execute_compiled(compiled, engine, session_id="test-session")
+    assert route == "cube", route
+    assert planner_counts(rows) == sql_counts(engine, compiled)
+    assert refinement_store.get("test-session").level == "pending"
+
+    narrowed = compile_organize_state(organize_state(specimen_type="PBMC", gender="female",
+                                                     collection_date="between 2019-01-01 and 2020-12-31"))
+    rows, route = execute_compiled(narrowed, engine, session_id="test-session", refine=True)
+    assert route == "columnar", route
+    assert planner_counts(rows) == sql_counts(engine, narrowed)
+    assert refinement_store.get("test-session").level in ("groups", "rows")
+    refinement_store.forget("test-session")
+    print("✅ Cube answers NEW_QUERY, candidate set materialized on ADJUST_FILTER")
+
+
+def test_cube_counts_subject_ids_shared_across_studies():
+    """A subject_id used by two studies counts in both studies' subject totals, as in SQL"""
+    print("🧪 Testing cube counts with subject_ids shared across studies...")
+    rows = list(generate_rows(3000, seed=11))
+    local_ids = {}
+    for row in rows:
+        # Number subjects within their study, so every study has a subject "S1", "S2", ...
+        study_subjects = local_ids.setdefault(row["study_id"], {})
+        row["subject_id"] = study_subjects.setdefault(row["subject_id"], f"S{len(study_subjects) + 1}")
+    assert len(local_ids) > 1
+    engine = synthetic_engine(rows)
+    for criteria in ({}, {"specimen_type": "PBMC"}, {"gender": "female"}, {"specimen_type": "Serum", "gender": "male"}):
+        compiled = compile_organize_state(organize_state(**criteria))
+        rows_out, route = execute_compiled(compiled, engine)
+        assert route == "cube", (criteria, route)
+        assert planner_counts(rows_out) == sql_counts(engine, compiled), criteria
+    print("✅ Cube matches SQL for shared subject_ids")
+
+
+def test_result_cache_hit_records_candidate_set():
+    """A NEW_QUERY answered from the result cache still leaves a candidate set for ADJUST_FILTER"""
+    print("🧪 Testing result cache hits with a session...")
+    from langchain_core.messages import HumanMessage
+    from nodes.new_query_agent import new_query_agent
+    from result_cache import make_cache_key, result_cache
+    from vials.engine import get_engine
+
+    engine = get_engine()
+    organize = organize_state(specimen_type="PBMC")
+    result_cache.check_version(engine.version)
+    result_cache.put(make_cache_key("new_query", organize, engine.version), {"response": "cached", "sql": []})
+    refinement_store.forget("cached-session")
+    state = {"messages": [HumanMessage(content="PBMC samples")], "organize": organize, "session_id": "cached-session"}
+    result = new_query_agent(state, llm=None, store=None)
+    assert result["messages"][0].content == "cached"
+    candidate = refinement_store.get("cached-session")
+    assert candidate is not None and candidate.level == "pending"
+    assert candidate.compiled.predicates == compile_organize_state(organize).predicates
+    refinement_store.forget("cached-session")
+    print("✅ Cache hit recorded the candidate set")
+
+
+def test_columnar_matches_sql_with_null_ids():
+    """Rows with NULL or empty biospecimen_ids dedup per subject/visit like the SQL engine"""
+    print("🧪 Testing columnar counts with NULL biospecimen_ids...")
+    rows = list(generate_rows(3000, seed=9))
+    for index, row in enumerate(rows):
+        if index % 7 == 0:
+            row["biospecimen_ids"] = None
+        elif index % 11 == 0:
+            row["biospecimen_ids"] = ""
+    engine = synthetic_engine(rows)
+    for criteria in ({}, {"specimen_type": "PBMC"}, {"gender": "female", "minimum_vials_per_subject": 3},
+                     {"visit": "V1, V2"}):
+        compiled = compile_organize_state(organize_state(**criteria))
+        assert planner_counts(engine.columnar.execute_compiled(compiled)) == sql_counts(engine, compiled), criteria
+    print("✅ NULL ids stay separate groups per subject/visit")
+
+
+def test_parquet_round_trip_keeps_study_ids():
+    """NULL and numeric-looking study_ids read back from the partitioned dataset as ingested"""
+    print("🧪 Testing study_id partitions through Parquet ingestion...")
+    if pa is None:
+        print("⏭️ pyarrow not installed")
+        return
+    rows = list(generate_rows(500, seed=13))
+    for index, row in enumerate(rows):
+        row["study_id"] = (None, "0042", "1000")[index % 3]
+    with tempfile.TemporaryDirectory() as directory:
+        csv_path = os.path.join(directory, "vials.csv")
+        with open(csv_path, "w", newline="", encoding="utf-8") as handle:
+            writer = csv.DictWriter(handle, COLUMN_NAMES)
+            writer.writeheader()
+            writer.writerows(rows)
+        ingest_csv([csv_path], os.path.join(directory, "dataset"), chunk_rows=100)
+        engine = VialsEngine()
+        engine.load_parquet(os.path.join(directory, "dataset"))
+    loaded = dict(engine.conn.execute("SELECT study_id, COUNT(*) FROM VIALS GROUP BY study_id").fetchall())
+    expected = {study_id: sum(row["study_id"] == study_id for row in rows) for study_id in (None, "0042", "1000")}
+    assert loaded == expected, loaded
+    print("✅ study_ids round-trip")
+
+
+def main():
+    """Run every test in this file"""
+    print("🚀 VIALS - Local Testing")
+    print("=" * 50)
+    failed = 0
+    for name, test in sorted(globals().items()):
+        if name.startswith("test_") and callable(test):
+            try:
+                test()
+            except Exception as e:
+                failed += 1
+                print(f"❌ {name}: {type(e).__name__}: {e}")
+    print(f"\n{'✅ All tests passed' if not failed else f'❌ {failed} failed'}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())